@@ -0,0 +1,740 @@
+from __future__ import annotations
+
+import csv
+import queue
+import select
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+from clock_sync import ClockSync, MicrosUnwrapper, SyncSample
+
+try:
+    import serial
+except Exception:
+    serial = None
+
+try:
+    import termios
+except ImportError:
+    termios = None
+
+# pyserial surfaces a vanished device as OSError subclasses, except that
+# flush() on POSIX lets termios.error (EIO) escape.
+_LINK_ERRORS = (OSError,) if termios is None else (OSError, termios.error)
+
+TTL_PROTOCOL_LEGACY = "legacy"
+TTL_PROTOCOL_V2 = "v2"
+
+
+def frame_checksum(payload: str) -> int:
+    cs = 0
+    for b in payload.encode("ascii"):
+        cs ^= b
+    return cs
+
+
+def encode_frame(*fields) -> bytes:
+    payload = ",".join(str(f) for f in fields)
+    return f"${payload}*{frame_checksum(payload):02X}\n".encode("ascii")
+
+
+def decode_frame(line) -> Optional[List[str]]:
+    if isinstance(line, (bytes, bytearray)):
+        try:
+            line = line.decode("ascii")
+        except UnicodeDecodeError:
+            return None
+    line = line.strip()
+    if not line.startswith("$") or "*" not in line:
+        return None
+    payload, _, cs_text = line[1:].rpartition("*")
+    try:
+        cs = int(cs_text, 16)
+    except ValueError:
+        return None
+    if cs != frame_checksum(payload):
+        return None
+    return payload.split(",")
+
+
+@dataclass(frozen=True)
+class TTLAck:
+    seq: int
+    pulse_index: int
+    arduino_us: int
+    host_t: float
+
+
+@dataclass(frozen=True)
+class PhotodiodeEdge:
+    """A photodiode light/dark transition; ``host_t`` is when its report was read."""
+
+    index: int
+    level: int
+    arduino_us: int
+    host_t: float
+    epoch: int
+
+
+LINK_UP = "up"
+LINK_DOWN = "down"
+LINK_DRY_RUN = "dry_run"
+
+TRAIN_QUEUED = "queued"
+TRAIN_SENT = "sent"
+TRAIN_EXPIRED = "expired"
+# Sent or expired trains whose state stays readable; older ones are forgotten.
+FINISHED_TRAINS_KEPT = 64
+
+
+@dataclass(frozen=True)
+class LinkEvent:
+    t: float
+    state: str
+    epoch: int
+    detail: str = ""
+
+
+@dataclass
+class QueuedTrain:
+    seq: int
+    count: int
+    interval_ms: float
+    width_ms: float
+    queued_t: float
+    state: str = TRAIN_QUEUED
+    sent_t: Optional[float] = None
+
+
+class ArduinoTTLSender:
+    """Serial link to ``pd_ttl.ino`` (v2 framed protocol, or legacy ``PULSE`` lines)."""
+
+    def __init__(
+        self,
+        port: Optional[str],
+        baud: int = 115200,
+        dry_run: bool = False,
+        protocol: str = "auto",
+        pulse_width_ms: float = 5.0,
+        probe_timeout_s: float = 2.5,
+        pulse_expiry_s: float = 2.0,
+        max_queued_trains: int = 16,
+        reconnect_min_s: float = 0.1,
+        reconnect_max_s: float = 5.0,
+        io_poll_s: float = 0.002,
+    ):
+        if protocol not in ("auto", TTL_PROTOCOL_V2, TTL_PROTOCOL_LEGACY):
+            raise ValueError("protocol must be auto, v2, or legacy")
+
+        self.port = port
+        self.baud = baud
+        self.dry_run = dry_run
+        self.pulse_width_ms = float(pulse_width_ms)
+        self.requested_protocol = protocol
+        self.probe_timeout_s = float(probe_timeout_s)
+        self.pulse_expiry_s = float(pulse_expiry_s)
+        self.max_queued_trains = max(1, int(max_queued_trains))
+        self.reconnect_min_s = max(0.01, float(reconnect_min_s))
+        self.reconnect_max_s = max(self.reconnect_min_s, float(reconnect_max_s))
+        self.io_poll_s = max(0.0005, float(io_poll_s))
+        self.protocol = TTL_PROTOCOL_LEGACY
+        self.pulse_count = 0
+        self.acks: Deque[TTLAck] = deque(maxlen=1024)
+        self.errors: Deque[List[str]] = deque(maxlen=64)
+        self.clock_sync = ClockSync()
+        self.clock_sync_epochs: List[ClockSync] = []
+        self.link_state = LINK_DRY_RUN if dry_run else LINK_DOWN
+        self.link_epoch = 0
+        self.link_events: List[LinkEvent] = []
+        self.reconnects = 0
+        self.expired_trains = 0
+        self.ser = None
+        self._rx = bytearray()
+        self._seq = 0
+        self._ping_seq = 0
+        self._io_lock = threading.RLock()
+        self._unwrap = MicrosUnwrapper()
+        self._new_acks: List[TTLAck] = []
+        self._new_link_events: Deque[LinkEvent] = deque()
+        self._outbox: Deque[QueuedTrain] = deque()
+        self._trains: Dict[int, QueuedTrain] = {}
+        self._finished: Deque[int] = deque()
+        self.marker_acks: Dict[int, int] = {}
+        self.photodiode_enabled = False
+        self.photodiode_edges: List[PhotodiodeEdge] = []
+        self._photodiode_reply: Optional[int] = None
+        self._pongs: Dict[int, Tuple[int, float]] = {}
+        self._sync_stop = threading.Event()
+        self._sync_thread = None
+        self._io_stop = threading.Event()
+        self._io_thread = None
+
+        if self.dry_run:
+            return
+
+        if serial is None:
+            raise RuntimeError("pyserial is required for ArduinoTTLSender when dry_run is False")
+
+        self.ser = self._open_port()
+        try:
+            self.protocol = self._negotiate(self.ser)
+        except Exception:
+            self.close()
+            raise
+        self.link_state = LINK_UP
+
+        self._io_thread = threading.Thread(target=self._io_loop, name="ttl-io", daemon=True)
+        self._io_thread.start()
+
+    def _open_port(self):
+        return serial.Serial(self.port, self.baud, timeout=0, write_timeout=0.2)
+
+    def _negotiate(self, ser) -> str:
+        if self.requested_protocol == TTL_PROTOCOL_LEGACY:
+            return TTL_PROTOCOL_LEGACY
+        if self._probe_v2(ser, self.probe_timeout_s):
+            return TTL_PROTOCOL_V2
+        if self.requested_protocol == TTL_PROTOCOL_V2:
+            raise RuntimeError("Arduino did not answer the v2 protocol probe")
+        return TTL_PROTOCOL_LEGACY
+
+    @staticmethod
+    def _probe_v2(ser, timeout_s: float) -> bool:
+        # Opening the port resets most boards, so keep asking until the
+        # bootloader hands over or the timeout expires. The port is not yet
+        # shared with other threads, so this reads it directly.
+        deadline = time.perf_counter() + max(0.0, timeout_s)
+        next_probe = 0.0
+        buf = bytearray()
+        while True:
+            now = time.perf_counter()
+            if now >= next_probe:
+                ser.write(encode_frame("V?"))
+                next_probe = now + 0.25
+            waiting = ser.in_waiting
+            if waiting:
+                buf.extend(ser.read(waiting))
+            while b"\n" in buf:
+                line, _, rest = bytes(buf).partition(b"\n")
+                buf = bytearray(rest)
+                fields = decode_frame(line)
+                if fields is not None and fields[0] == "V" and len(fields) > 1 and fields[1] == "2":
+                    return True
+            if now >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def _read_frames(self) -> List[List[str]]:
+        with self._io_lock:
+            waiting = self.ser.in_waiting
+            if waiting:
+                self._rx.extend(self.ser.read(waiting))
+
+            frames = []
+            while True:
+                nl = self._rx.find(b"\n")
+                if nl < 0:
+                    break
+                line = bytes(self._rx[:nl])
+                del self._rx[:nl + 1]
+                fields = decode_frame(line)
+                if fields is not None:
+                    frames.append(fields)
+            return frames
+
+    def _pump(self) -> None:
+        # Every reader goes through here so acks and pongs are routed to their
+        # consumers no matter which thread happened to drain the port.
+        with self._io_lock:
+            if self.ser is None:
+                return
+            host_t = time.perf_counter()
+            try:
+                frames = self._read_frames()
+            except _LINK_ERRORS as exc:
+                self._link_lost(exc)
+                return
+            for fields in frames:
+                try:
+                    if fields[0] == "A" and len(fields) == 4:
+                        ack = TTLAck(int(fields[1]), int(fields[2]), self._unwrap(int(fields[3])), host_t)
+                        self.acks.append(ack)
+                        self._new_acks.append(ack)
+                    elif fields[0] == "K" and len(fields) == 4:
+                        self.marker_acks[int(fields[1])] = self._unwrap(int(fields[3]))
+                    elif fields[0] == "S" and len(fields) == 3:
+                        self._pongs[int(fields[1])] = (self._unwrap(int(fields[2])), host_t)
+                    elif fields[0] == "L" and len(fields) == 4:
+                        self.photodiode_edges.append(PhotodiodeEdge(
+                            int(fields[1]), int(fields[2]), self._unwrap(int(fields[3])), host_t, self.link_epoch
+                        ))
+                    elif fields[0] == "D" and len(fields) == 2:
+                        self._photodiode_reply = int(fields[1])
+                    elif fields[0] == "E":
+                        self.errors.append(fields)
+                except ValueError:
+                    continue
+
+    def _write(self, data: bytes) -> bool:
+        """Write under the I/O lock; a failure marks the link down instead of raising."""
+        with self._io_lock:
+            if self.ser is None:
+                return False
+            try:
+                self.ser.write(data)
+            except _LINK_ERRORS as exc:
+                self._link_lost(exc)
+                return False
+            try:
+                self.ser.flush()
+            except _LINK_ERRORS as exc:
+                # The bytes already reached the driver; queueing them again
+                # could double a reward after the reconnect.
+                self._link_lost(exc)
+            return True
+
+    def _set_link_state(self, state: str, detail: str = "") -> None:
+        self.link_state = state
+        ev = LinkEvent(time.perf_counter(), state, self.link_epoch, detail)
+        self.link_events.append(ev)
+        self._new_link_events.append(ev)
+
+    def _link_lost(self, exc: BaseException) -> None:
+        with self._io_lock:
+            if self.ser is None:
+                return
+            try:
+                self.ser.close()
+            except Exception:
+                pass
+            self.ser = None
+            self._rx.clear()
+            self._set_link_state(LINK_DOWN, str(exc))
+
+    def _io_loop(self) -> None:
+        backoff = self.reconnect_min_s
+        while not self._io_stop.is_set():
+            if self.ser is not None:
+                self._pump()
+                self._wait_readable(0.05)
+                continue
+
+            self._expire_stale()
+            if self._io_stop.wait(backoff):
+                return
+            if self._reconnect():
+                backoff = self.reconnect_min_s
+            else:
+                backoff = min(backoff * 2.0, self.reconnect_max_s)
+
+    def _wait_readable(self, timeout_s: float) -> None:
+        # Sleep in select() where the port has a file descriptor so the idle
+        # link does not wake the interpreter every few milliseconds.
+        ser = self.ser
+        fileno = getattr(ser, "fileno", None)
+        if fileno is not None:
+            try:
+                select.select([fileno()], [], [], timeout_s)
+                return
+            except (OSError, ValueError, TypeError):
+                pass
+        self._io_stop.wait(self.io_poll_s)
+
+    def _reconnect(self) -> bool:
+        ser = None
+        try:
+            ser = self._open_port()
+            protocol = self._negotiate(ser)
+        except Exception:
+            if ser is not None:
+                try:
+                    ser.close()
+                except Exception:
+                    pass
+            return False
+
+        with self._io_lock:
+            # The board rebooted: its micros() restarted, so acks and sync
+            # samples from here on belong to a new clock epoch.
+            self.ser = ser
+            self._rx.clear()
+            self.protocol = protocol
+            self._unwrap = MicrosUnwrapper()
+            self.clock_sync_epochs.append(self.clock_sync)
+            self.clock_sync = ClockSync()
+            self.link_epoch += 1
+            self.reconnects += 1
+            self._set_link_state(LINK_UP, protocol)
+            if self.photodiode_enabled and protocol == TTL_PROTOCOL_V2:
+                # The reset board starts with edge reports off.
+                self._write(encode_frame("D", 1))
+            self._flush_outbox()
+        return True
+
+    def _expire_stale(self) -> None:
+        with self._io_lock:
+            now = time.perf_counter()
+            while self._outbox and now - self._outbox[0].queued_t > self.pulse_expiry_s:
+                self._expire(self._outbox.popleft())
+
+    def _expire(self, train: QueuedTrain) -> None:
+        train.state = TRAIN_EXPIRED
+        self.expired_trains += 1
+        self._finish(train)
+
+    def _finish(self, train: QueuedTrain) -> None:
+        # A sent or expired train is only looked up by whoever is waiting on
+        # it (RewardScheduler, right away); keep the last few, not the session.
+        self._finished.append(train.seq)
+        while len(self._finished) > FINISHED_TRAINS_KEPT:
+            seq = self._finished.popleft()
+            old = self._trains.get(seq)
+            if old is not None and old.state != TRAIN_QUEUED:
+                del self._trains[seq]
+
+    def _flush_outbox(self) -> None:
+        with self._io_lock:
+            self._expire_stale()
+            while self._outbox:
+                train = self._outbox[0]
+                if not self._write(self._train_payload(train)):
+                    return
+                self._outbox.popleft()
+                train.state = TRAIN_SENT
+                train.sent_t = time.perf_counter()
+                self._finish(train)
+
+    def _train_payload(self, train: QueuedTrain) -> bytes:
+        if self.protocol == TTL_PROTOCOL_V2:
+            return encode_frame("P", train.seq, train.count, int(train.width_ms * 1000), int(train.interval_ms * 1000))
+        return b"PULSE\n" * train.count
+
+    def _next_seq(self) -> int:
+        self._seq = (self._seq + 1) % 65536
+        return self._seq
+
+    def pulse(self) -> int:
+        return self.send_train(1)
+
+    def send_train(self, count: int = 1, interval_ms: float = 0.0, width_ms: Optional[float] = None) -> int:
+        """Send one pulse train and return its sequence number; never raises on link loss."""
+        count = max(0, int(count))
+        width_ms = self.pulse_width_ms if width_ms is None else float(width_ms)
+        seq = self._next_seq()
+        self.pulse_count += count
+
+        if self.dry_run:
+            print(f"ArduinoTTLSender dry-run: PULSE x{count}", file=sys.stderr)
+            return seq
+
+        train = QueuedTrain(seq, count, float(interval_ms), width_ms, time.perf_counter())
+        with self._io_lock:
+            # A seq reused after wrapping must not report its old train's state.
+            self._trains.pop(seq, None)
+            if not self._outbox and self._write(self._train_payload(train)):
+                return seq
+
+            self._trains[seq] = train
+            if self.pulse_expiry_s <= 0:
+                self._expire(train)
+                return seq
+            if len(self._outbox) >= self.max_queued_trains:
+                self._expire(self._outbox.popleft())
+            self._outbox.append(train)
+        return seq
+
+    def train_state(self, seq: int) -> str:
+        """``sent``, ``queued`` (waiting for the link) or ``expired``."""
+        with self._io_lock:
+            train = self._trains.get(seq)
+            if train is None:
+                return TRAIN_SENT
+            if train.state == TRAIN_QUEUED:
+                self._expire_stale()
+            return train.state
+
+    def train_sent_t(self, seq: int) -> Optional[float]:
+        with self._io_lock:
+            train = self._trains.get(seq)
+            return None if train is None else train.sent_t
+
+    def send_marker(self, seq: int, code: int) -> bool:
+        """Send an event-marker word; returns False when the firmware cannot show it."""
+        if self.ser is None or self.protocol != TTL_PROTOCOL_V2:
+            return False
+        return self._write(encode_frame("M", seq, int(code)))
+
+    def enable_photodiode(self, enabled: bool = True, timeout_s: float = 0.25) -> bool:
+        """Switch photodiode edge reports on or off; False if the firmware cannot."""
+        if self.ser is None or self.protocol != TTL_PROTOCOL_V2:
+            return False
+        want = 1 if enabled else 0
+        with self._io_lock:
+            self._photodiode_reply = None
+            if not self._write(encode_frame("D", want)):
+                return False
+        deadline = time.perf_counter() + timeout_s
+        while time.perf_counter() < deadline:
+            with self._io_lock:
+                self._pump()
+                if self._photodiode_reply == want:
+                    self.photodiode_enabled = enabled
+                    return True
+            time.sleep(0.0005)
+        return False
+
+    def poll_acks(self) -> List[TTLAck]:
+        with self._io_lock:
+            self._pump()
+            new_acks = self._new_acks
+            self._new_acks = []
+        return new_acks
+
+    def poll_link_events(self) -> List[LinkEvent]:
+        # Called from the render loop, so it must not wait on ``_io_lock``
+        # (a stuck write can hold it for the full write timeout).
+        events = []
+        while self._new_link_events:
+            events.append(self._new_link_events.popleft())
+        return events
+
+    def ping(self, timeout_s: float = 0.05) -> Optional[SyncSample]:
+        """One ping/pong exchange; the sample is also added to ``clock_sync``."""
+        if self.ser is None or self.protocol != TTL_PROTOCOL_V2:
+            return None
+
+        with self._io_lock:
+            self._ping_seq = (self._ping_seq + 1) % 65536
+            ping_seq = self._ping_seq
+            epoch = self.link_epoch
+            t_send = time.perf_counter()
+            if not self._write(encode_frame("S", ping_seq)):
+                return None
+
+        deadline = t_send + timeout_s
+        while time.perf_counter() < deadline:
+            with self._io_lock:
+                self._pump()
+                pong = self._pongs.pop(ping_seq, None)
+                if pong is not None and epoch == self.link_epoch:
+                    sample = SyncSample(host_send_t=t_send, host_recv_t=pong[1], arduino_us=pong[0])
+                    self.clock_sync.add(sample)
+                    return sample
+            time.sleep(0.0005)
+        return None
+
+    def start_clock_sync(self, interval_s: float = 2.0) -> None:
+        if self.protocol != TTL_PROTOCOL_V2 or self._sync_thread is not None:
+            return
+
+        def loop():
+            while not self._sync_stop.is_set():
+                try:
+                    self.ping()
+                except Exception:
+                    pass
+                self._sync_stop.wait(interval_s)
+
+        self._sync_thread = threading.Thread(target=loop, name="ttl-clock-sync", daemon=True)
+        self._sync_thread.start()
+
+    def close(self) -> None:
+        self._sync_stop.set()
+        self._io_stop.set()
+        for thread in (self._sync_thread, self._io_thread):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(1.0)
+        self._sync_thread = None
+        self._io_thread = None
+        with self._io_lock:
+            while self._outbox:
+                self._expire(self._outbox.popleft())
+            if self.ser is not None:
+                try:
+                    self.ser.close()
+                finally:
+                    self.ser = None
+
+
+# Event-marker words shown on the Arduino marker pins (4-bit word + strobe).
+MARKER_CODES = {
+    "TRIAL_PLACED": 1,
+    "STIM_ONSET": 2,
+    "CHOICE_LEFT": 3,
+    "CHOICE_RIGHT": 4,
+    "REWARD": 5,
+    "ITI_START": 6,
+}
+
+MARKER_TABLE_FIELDNAMES = ["marker_seq", "marker_code", "queued_rel_s", "sent_rel_s", "arduino_us", "dropped"]
+
+
+@dataclass
+class MarkerRecord:
+    seq: int
+    code: int
+    queued_t: float
+    sent_t: Optional[float] = None
+    dropped: bool = False
+
+
+class EventMarkerQueue:
+    """Event markers handed to a sender thread; ``emit`` drops instead of blocking."""
+
+    def __init__(self, ttl, maxsize: int = 64, clock=time.perf_counter):
+        self.ttl = ttl
+        self.clock = clock
+        self.records: List[MarkerRecord] = []
+        self.dropped = 0
+        self._seq = 0
+        self._closed = False
+        self._pending: "queue.Queue[Optional[MarkerRecord]]" = queue.Queue(maxsize=max(1, int(maxsize)))
+        self._thread = threading.Thread(target=self._worker, name="event-markers", daemon=True)
+        self._thread.start()
+
+    def emit(self, code: int) -> MarkerRecord:
+        self._seq = (self._seq + 1) % 65536
+        rec = MarkerRecord(seq=self._seq, code=int(code), queued_t=self.clock())
+        self.records.append(rec)
+        if self._closed:
+            rec.dropped = True
+        else:
+            try:
+                self._pending.put_nowait(rec)
+            except queue.Full:
+                rec.dropped = True
+        if rec.dropped:
+            self.dropped += 1
+        return rec
+
+    def close(self, timeout: Optional[float] = 1.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._pending.put(None)
+        self._thread.join(timeout)
+
+    def _worker(self) -> None:
+        while True:
+            rec = self._pending.get()
+            if rec is None:
+                return
+            try:
+                if self.ttl.send_marker(rec.seq, rec.code):
+                    rec.sent_t = self.clock()
+            except Exception:
+                pass
+
+
+def marker_table_path(log_path) -> Path:
+    log_path = Path(log_path)
+    return log_path.with_name(log_path.stem + "_markers.csv")
+
+
+def write_marker_table(path, records: List[MarkerRecord], marker_acks: Dict[int, int], t0: float) -> Path:
+    """One row per marker, joinable to the event log on ``marker_seq``."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(MARKER_TABLE_FIELDNAMES)
+        for rec in records:
+            w.writerow([
+                rec.seq,
+                rec.code,
+                f"{rec.queued_t - t0:.6f}",
+                "" if rec.sent_t is None else f"{rec.sent_t - t0:.6f}",
+                marker_acks.get(rec.seq, ""),
+                1 if rec.dropped else 0,
+            ])
+    return path
+
+
+PHOTODIODE_TABLE_FIELDNAMES = [
+    "flip_index", "patch_level", "flip_start_rel_s", "flip_end_rel_s",
+    "edge_index", "edge_arduino_us", "edge_rel_s", "edge_error_s", "edge_clock", "latency_s",
+]
+
+
+def photodiode_table_path(log_path) -> Path:
+    log_path = Path(log_path)
+    return log_path.with_name(log_path.stem + "_photodiode.csv")
+
+
+def photodiode_edge_times(edges: List[PhotodiodeEdge], syncs: List[ClockSync]) -> List[Tuple[float, Optional[float], str]]:
+    """``(host time, error_s, clock)`` of each edge, via its epoch's clock fit if any."""
+    out = []
+    for edge in edges:
+        sync = syncs[edge.epoch] if edge.epoch < len(syncs) else None
+        if sync is not None and sync.fit() is not None:
+            t, err = sync.to_host(edge.arduino_us)
+            out.append((t, err, "sync"))
+        else:
+            out.append((edge.host_t, None, "host_rx"))
+    return out
+
+
+def match_photodiode_edges(
+    transitions: List[Tuple[int, float, float, int]],
+    edges: List[PhotodiodeEdge],
+    edge_times: List[Tuple[float, Optional[float], str]],
+    max_latency_s: float = 0.25,
+) -> List[Optional[int]]:
+    """Index of the matching edge for each patch transition, or None."""
+    matches: List[Optional[int]] = []
+    j = 0
+    for _flip, start_t, end_t, level in transitions:
+        while j < len(edges) and edge_times[j][0] + (edge_times[j][1] or 0.0) < start_t:
+            j += 1
+        match = None
+        k = j
+        while k < len(edges) and edge_times[k][0] <= end_t + max_latency_s:
+            if edges[k].level == level:
+                match = k
+                j = k + 1
+                break
+            k += 1
+        matches.append(match)
+    return matches
+
+
+def write_photodiode_table(
+    path,
+    transitions: List[Tuple[int, float, float, int]],
+    edges: List[PhotodiodeEdge],
+    syncs: List[ClockSync],
+    t0: float,
+    max_latency_s: float = 0.25,
+) -> List[float]:
+    """One row per patch transition with its photodiode edge; returns the latencies."""
+    edge_times = photodiode_edge_times(edges, syncs)
+    matches = match_photodiode_edges(transitions, edges, edge_times, max_latency_s)
+    latencies = []
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(PHOTODIODE_TABLE_FIELDNAMES)
+        for (flip, start_t, end_t, level), k in zip(transitions, matches):
+            row = [flip, level, f"{start_t - t0:.6f}", f"{end_t - t0:.6f}"]
+            if k is None:
+                row += ["", "", "", "", "", ""]
+            else:
+                edge = edges[k]
+                t, err, source = edge_times[k]
+                latencies.append(t - end_t)
+                row += [
+                    edge.index,
+                    edge.arduino_us,
+                    f"{t - t0:.6f}",
+                    "" if err is None else f"{err:.6f}",
+                    source,
+                    f"{t - end_t:.6f}",
+                ]
+            w.writerow(row)
+    return latencies
@@ -0,0 +1,148 @@
+"""
+Audio scheduling jitter benchmark.
+
+For each mixer buffer size, re-opens the mixer (SDL dummy audio driver by
+default), plays the reward beep ``--plays`` times on a fixed period and
+records, per play:
+
+  schedule_error_ms  queued time minus the intended time (timer jitter)
+  play_call_ms       how long Channel.play() held the caller
+  busy_delay_ms      queued -> channel reported busy
+
+``--mode reserved`` uses ReservedAudioChannels (pre-warmed, dedicated
+channel), ``--mode plain`` calls Sound.play() the way the tasks used to.
+
+Example:
+  python bench_audio_jitter.py --buffers 256 512 1024 --out bench/audio.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Dict, List, Optional
+
+import bench_common
+
+bench_common.use_headless_sdl()
+
+from sound_bank import AudioPlayRecord, ReservedAudioChannels
+from task_common import make_beep_sound
+
+
+def open_mixer(buffer: int) -> None:
+    import pygame
+
+    pygame.mixer.quit()
+    pygame.mixer.pre_init(frequency=44100, size=-16, channels=2, buffer=buffer)
+    pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=buffer)
+
+
+def sleep_until(target_t: float) -> None:
+    # Coarse sleep, then spin for the last millisecond.
+    while True:
+        remaining = target_t - time.perf_counter()
+        if remaining <= 0:
+            return
+        if remaining > 0.002:
+            time.sleep(remaining - 0.001)
+
+
+def play_plain(sound) -> AudioPlayRecord:
+    rec = AudioPlayRecord("plain", time.perf_counter())
+    channel = sound.play()
+    rec.returned_t = time.perf_counter()
+    deadline = rec.queued_t + 0.1
+    while channel is not None and time.perf_counter() < deadline:
+        if channel.get_busy():
+            rec.busy_t = time.perf_counter()
+            break
+    rec.done.set()
+    return rec
+
+
+def run_buffer(args, buffer: int) -> Dict:
+    open_mixer(buffer)
+    beep = make_beep_sound(args.beep_freq, args.beep_ms, args.beep_volume)
+
+    audio = None
+    if args.mode == "reserved":
+        audio = ReservedAudioChannels()
+        audio.prewarm()
+        beep = audio.bind("reward", beep)
+
+    period_s = args.period_ms / 1000.0
+    records: List[AudioPlayRecord] = []
+    targets: List[float] = []
+    t_first = time.perf_counter() + 0.05
+    try:
+        for i in range(args.plays):
+            target = t_first + i * period_s
+            sleep_until(target)
+            rec = beep.play() if audio is not None else play_plain(beep)
+            targets.append(target)
+            records.append(rec)
+        for rec in records:
+            rec.done.wait(1.0)
+    finally:
+        if audio is not None:
+            audio.close()
+
+    schedule_error = [r.queued_t - t for r, t in zip(records, targets)]
+    play_call = [r.returned_t - r.queued_t for r in records]
+    busy_delay = [r.busy_t - r.queued_t for r in records if r.busy_t is not None]
+
+    import pygame
+
+    result = {
+        "buffer": buffer,
+        "mixer": list(pygame.mixer.get_init() or ()),
+        "never_busy": sum(1 for r in records if r.busy_t is None),
+        "schedule_error_ms": bench_common.summarize(bench_common.ms(schedule_error), n_boot=args.bootstrap),
+        "play_call_ms": bench_common.summarize(bench_common.ms(play_call), n_boot=args.bootstrap),
+        "busy_delay_ms": bench_common.summarize(bench_common.ms(busy_delay), n_boot=args.bootstrap),
+    }
+    bd = result["busy_delay_ms"]
+    print(
+        f"[INFO] buffer={buffer}: busy p50={bd['p50']:.3f}ms p99={bd['p99']:.3f}ms "
+        f"play() p99={result['play_call_ms']['p99']:.3f}ms"
+    )
+    return result
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Beep scheduling jitter under the SDL audio driver")
+    p.add_argument("--buffers", type=int, nargs="+", default=[256, 512, 1024, 2048])
+    p.add_argument("--mode", choices=["reserved", "plain"], default="reserved")
+    p.add_argument("--plays", type=int, default=500)
+    p.add_argument("--period-ms", type=float, default=20.0)
+    p.add_argument("--beep-freq", type=int, default=1000)
+    p.add_argument("--beep-ms", type=int, default=10)
+    p.add_argument("--beep-volume", type=float, default=0.6)
+    p.add_argument("--bootstrap", type=int, default=200)
+    p.add_argument("--out", type=str, default=None, help="JSON result path (stdout if omitted)")
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    import pygame
+
+    pygame.init()
+    try:
+        runs = [run_buffer(args, b) for b in args.buffers]
+        result = {
+            "benchmark": "audio_jitter",
+            "environment": bench_common.environment_info(),
+            "config": {k: v for k, v in vars(args).items() if k != "out"},
+            "runs": runs,
+        }
+    finally:
+        pygame.quit()
+    bench_common.write_json(result, args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
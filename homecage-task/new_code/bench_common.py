@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+PERCENTILES = (50, 95, 99)
+
+
+def use_headless_sdl() -> None:
+    """Select SDL's dummy drivers; must run before pygame is initialised."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Linear-interpolated percentile of an already sorted sequence."""
+    if not sorted_values:
+        return float("nan")
+    pos = (len(sorted_values) - 1) * (q / 100.0)
+    lo = int(math.floor(pos))
+    hi = min(lo + 1, len(sorted_values) - 1)
+    frac = pos - lo
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * frac
+
+
+def summarize(values: Sequence[float], n_boot: int = 200, seed: int = 0) -> Dict:
+    """Percentiles plus bootstrap 95% intervals showing how stable each one is."""
+    data = sorted(values)
+    out = {
+        "n": len(data),
+        "mean": (sum(data) / len(data)) if data else float("nan"),
+        "min": data[0] if data else float("nan"),
+        "max": data[-1] if data else float("nan"),
+    }
+    for q in PERCENTILES:
+        out[f"p{q}"] = percentile(data, q)
+
+    if len(data) >= 2 and n_boot > 0:
+        rng = random.Random(seed)
+        boots = {q: [] for q in PERCENTILES}
+        for _ in range(n_boot):
+            sample = sorted(rng.choice(data) for _ in data)
+            for q in PERCENTILES:
+                boots[q].append(percentile(sample, q))
+        for q in PERCENTILES:
+            b = sorted(boots[q])
+            out[f"p{q}_ci95"] = [percentile(b, 2.5), percentile(b, 97.5)]
+    return out
+
+
+def git_revision() -> Optional[str]:
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=str(Path(__file__).resolve().parent),
+            capture_output=True,
+            text=True,
+            timeout=5,
+        )
+    except Exception:
+        return None
+    return rev.stdout.strip() or None
+
+
+def environment_info() -> Dict:
+    info = {
+        "git_rev": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "sdl_videodriver": os.environ.get("SDL_VIDEODRIVER", ""),
+        "sdl_audiodriver": os.environ.get("SDL_AUDIODRIVER", ""),
+    }
+    try:
+        import pygame
+
+        info["pygame"] = pygame.version.ver
+        info["sdl"] = ".".join(str(v) for v in pygame.get_sdl_version())
+    except Exception:
+        pass
+    return info
+
+
+def write_json(result: Dict, out_path: Optional[str]) -> None:
+    text = json.dumps(result, indent=2, sort_keys=True)
+    if out_path:
+        path = Path(out_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text + "\n", encoding="utf-8")
+        print(f"[INFO] wrote {path}")
+    else:
+        print(text)
+
+
+def ms(values: List[float]) -> List[float]:
+    return [v * 1000.0 for v in values]
+
+
+def find_regressions(
+    current: Dict[str, Dict],
+    baseline: Dict[str, Dict],
+    metric: str = "p50",
+    threshold_pct: float = 25.0,
+    min_delta: float = 0.0,
+) -> List[Dict]:
+    """Cases whose ``metric`` grew by more than ``threshold_pct`` over the baseline.
+
+    ``current`` and ``baseline`` map case names to ``summarize`` results;
+    cases missing from either side are skipped. A growth smaller than
+    ``min_delta`` (in the metric's unit) never counts, so sub-microsecond
+    noise on very cheap cases does not fail a run.
+    """
+    out = []
+    for name in sorted(current):
+        if name not in baseline:
+            continue
+        new = current[name].get(metric)
+        old = baseline[name].get(metric)
+        if new is None or old is None or math.isnan(new) or math.isnan(old):
+            continue
+        if new > old * (1.0 + threshold_pct / 100.0) and new - old > min_delta:
+            change = (new / old - 1.0) * 100.0 if old > 0 else float("inf")
+            out.append({"case": name, "metric": metric, "baseline": old, "current": new, "change_pct": change})
+    return out
@@ -0,0 +1,273 @@
+"""
+Per-frame draw cost of every task draw path, headless.
+
+Cases (all at ``--window-w`` x ``--window-h``, 1920x1080 by default, under
+SDL's dummy video driver):
+
+  restless_bandit.draw, prl.draw
+      The task's own ``draw()`` while ``run`` plays ``--trials`` trials with
+      ``--dry-run-ttl`` and synthetic touches on the left plate. Each sample
+      is one FramePresenter ``begin()`` -> ``present()`` (or ``blank``).
+  object_explore.<tag>.draw_preview / draw_active / draw_dimmed
+      Every registered Interaction, driven by ``update(dt, now)`` at
+      ``--fps`` for ``--frames`` frames. In the ``draw_active`` case it is
+      activated at the zone centre and touched every ``--touch-every`` frames
+      on a 3x3 grid (with ``on_release`` a few frames later where the
+      interaction has one). Each sample is one draw call.
+
+Frames are only timed, never shown, so the numbers are CPU draw cost.
+
+With ``--baseline`` (a previous ``--out`` file) every case's ``--metric`` is
+compared with the baseline; the run fails (exit 1) if any case grew by more
+than ``--threshold-pct`` and by more than ``--min-delta-ms``.
+
+Example:
+  python bench_draw.py --out bench/draw_base.json
+  python bench_draw.py --baseline bench/draw_base.json --threshold-pct 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import bench_common
+
+bench_common.use_headless_sdl()
+
+import touch_task_runner as ttr
+from bench_touch_to_ttl import TouchInjector
+
+CODE_DIR = Path(__file__).resolve().parent
+TWO_CHOICE_TASKS = ("restless_bandit", "prl")
+INTERACTION_DRAWS = ("draw_preview", "draw_active", "draw_dimmed")
+
+
+def timed_presenter(samples: List[float]):
+    """A FramePresenter that appends the time from ``begin`` to the end of ``present``."""
+
+    class TimedFramePresenter(ttr.FramePresenter):
+        _draw_t0 = None
+
+        def begin(self) -> None:
+            if self._draw_t0 is None:
+                self._draw_t0 = time.perf_counter()
+            super().begin()
+
+        def blank(self, rgb) -> None:
+            self._draw_t0 = time.perf_counter()
+            super().blank(rgb)
+
+        def present(self):
+            pushed = super().present()
+            if self._draw_t0 is not None:
+                samples.append(time.perf_counter() - self._draw_t0)
+                self._draw_t0 = None
+            return pushed
+
+    return TimedFramePresenter
+
+
+def task_argv(args, task: str, out_dir: Path) -> List[str]:
+    iti = str(int(args.iti_ms))
+    argv = [
+        "--seed", str(args.seed),
+        "--out-dir", str(out_dir),
+        "--dry-run-ttl",
+        "--window-w", str(args.window_w),
+        "--window-h", str(args.window_h),
+        "--iti-min-ms", iti,
+        "--iti-max-ms", iti,
+        "--min-release-ms-after-iti-touch", "0",
+        "--max-trials", str(args.trials),
+        "--stim-dir", args.stim_dir,
+    ]
+    if task == "prl":
+        argv += [
+            "--stim-px", "240",
+            "--n-blocks", "1",
+            "--block-len-trials", str(args.trials),
+            "--reversal-min-trial", str(max(1, args.trials // 2)),
+            "--reversal-max-trial", str(max(1, args.trials // 2)),
+        ]
+    else:
+        argv += ["--images", "--n-trials", str(args.trials)]
+    if args.info:
+        argv.append("--info")
+    return argv + list(args.task_args)
+
+
+def bench_two_choice(args, task: str) -> List[float]:
+    if task == "prl":
+        import prl as module
+    else:
+        import restless_bandit as module
+
+    samples: List[float] = []
+    original = ttr.FramePresenter
+    with tempfile.TemporaryDirectory() as tmpdir:
+        task_ns = module.parse_args(task_argv(args, task, Path(tmpdir)))
+        center = (args.window_w // 2 - int(task_ns.center_offset_px), args.window_h // 2)
+        injector = TouchInjector(center, (args.window_w, args.window_h), hold_s=0.01, gap_s=0.04, start_delay_s=0.2)
+        ttr.FramePresenter = timed_presenter(samples)
+        injector.start()
+        try:
+            module.run(task_ns)
+        finally:
+            ttr.FramePresenter = original
+            injector.stop_event.set()
+            injector.join(2.0)
+    return samples
+
+
+def script_touch(interaction, frame: int, now: float, touch_every: int) -> None:
+    """Touch the zone on a 3x3 grid every ``touch_every`` frames; release 3 frames later."""
+    zr = interaction.zone_rect
+    if frame % touch_every == 0:
+        k = (frame // touch_every) % 9
+        x = zr.x + zr.w * (1 + k % 3) // 4
+        y = zr.y + zr.h * (1 + k // 3) // 4
+        interaction.on_touch(x, y, now)
+    elif frame % touch_every == 3 and hasattr(interaction, "on_release"):
+        interaction.on_release()
+
+
+def bench_interaction(args, screen, oe, tag: str, method: str) -> List[float]:
+    import pygame
+
+    sw, sh = screen.get_size()
+    size = max(50, int(args.zone_size_px))
+    zone = pygame.Rect(sw // 2 - size // 2, sh // 2 - size // 2, size, size)
+    random.seed(args.seed)
+    interaction = oe.create_interaction(tag, zone, (sw, sh))
+
+    dt = 1.0 / args.fps
+    now = 0.0
+    if method == "draw_active":
+        interaction.activate(zone.centerx, zone.centery, now)
+    draw = getattr(interaction, method)
+    samples: List[float] = []
+    for frame in range(1, args.frames + 1):
+        now += dt
+        if method == "draw_active":
+            script_touch(interaction, frame, now, args.touch_every)
+        interaction.update(dt, now)
+        screen.fill(args.bg_rgb)
+        t = time.perf_counter()
+        draw(screen)
+        samples.append(time.perf_counter() - t)
+    return samples
+
+
+def bench_object_explore(args) -> Dict[str, List[float]]:
+    import pygame
+
+    import object_explore as oe
+
+    pygame.display.init()
+    pygame.font.init()
+    try:
+        pygame.mixer.init()
+    except pygame.error as e:
+        print(f"[WARN] mixer unavailable ({e}); interaction sounds will fail", file=sys.stderr)
+    try:
+        screen = pygame.display.set_mode((args.window_w, args.window_h))
+        tags = args.interactions or sorted(oe.Interaction.REGISTRY)
+        return {
+            f"object_explore.{tag}.{method}": bench_interaction(args, screen, oe, tag, method)
+            for tag in tags
+            for method in INTERACTION_DRAWS
+        }
+    finally:
+        pygame.quit()
+
+
+def run_cases(args) -> Dict[str, Dict]:
+    raw: Dict[str, List[float]] = {}
+    for task in args.tasks:
+        if task == "object_explore":
+            raw.update(bench_object_explore(args))
+        else:
+            raw[f"{task}.draw"] = bench_two_choice(args, task)
+
+    cases = {}
+    for name, samples in raw.items():
+        summary = bench_common.summarize(bench_common.ms(samples), n_boot=args.bootstrap, seed=args.seed)
+        cases[name] = summary
+        print(f"[INFO] {name}: n={summary['n']} p50={summary['p50']:.3f}ms p95={summary['p95']:.3f}ms p99={summary['p99']:.3f}ms")
+    return cases
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Headless per-frame draw cost of every task draw path")
+    p.add_argument("--tasks", nargs="+", choices=list(TWO_CHOICE_TASKS) + ["object_explore"],
+                   default=list(TWO_CHOICE_TASKS) + ["object_explore"])
+    p.add_argument("--window-w", type=int, default=1920)
+    p.add_argument("--window-h", type=int, default=1080)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--bootstrap", type=int, default=200)
+    p.add_argument("--out", type=str, default=None, help="JSON result path (stdout if omitted)")
+
+    p.add_argument("--trials", type=int, default=100, help="trials per two-choice task run")
+    p.add_argument("--iti-ms", type=int, default=20)
+    p.add_argument("--info", action="store_true", help="draw the two-choice HUD line")
+    p.add_argument("--stim-dir", type=str, default=str(CODE_DIR / "visual_stimuli"))
+
+    p.add_argument("--interactions", nargs="+", default=None, help="object_explore tags (default: all registered)")
+    p.add_argument("--frames", type=int, default=600, help="frames per interaction draw case")
+    p.add_argument("--fps", type=float, default=60.0, help="update() rate for the interaction script")
+    p.add_argument("--touch-every", type=int, default=20, help="frames between scripted touches")
+    p.add_argument("--zone-size-px", type=int, default=280)
+    p.add_argument("--bg-rgb", type=int, nargs=3, default=[0, 0, 0])
+
+    p.add_argument("--baseline", type=str, default=None, help="earlier --out JSON to compare against")
+    p.add_argument("--metric", choices=[f"p{q}" for q in bench_common.PERCENTILES], default="p50")
+    p.add_argument("--threshold-pct", type=float, default=25.0, help="allowed growth of --metric over the baseline")
+    p.add_argument("--min-delta-ms", type=float, default=0.05, help="growth below this never counts as a regression")
+    p.add_argument("task_args", nargs=argparse.REMAINDER, help="extra two-choice task arguments after --")
+    args = p.parse_args(argv)
+    if args.task_args and args.task_args[0] == "--":
+        args.task_args = args.task_args[1:]
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    cases = run_cases(args)
+
+    result = {
+        "benchmark": "draw",
+        "environment": bench_common.environment_info(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "cases": cases,
+    }
+    regressions = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = bench_common.find_regressions(
+            cases, baseline.get("cases", {}), args.metric, args.threshold_pct, args.min_delta_ms
+        )
+        result["baseline"] = {"path": args.baseline, "git_rev": baseline.get("environment", {}).get("git_rev")}
+        result["regressions"] = regressions
+    bench_common.write_json(result, args.out)
+
+    for r in regressions:
+        print(
+            f"[WARN] {r['case']}: {r['metric']} {r['baseline']:.3f}ms -> {r['current']:.3f}ms "
+            f"(+{r['change_pct']:.0f}%, threshold {args.threshold_pct:.0f}%)",
+            file=sys.stderr,
+        )
+    missing = [name for name, s in cases.items() if s["n"] == 0]
+    if missing:
+        print(f"[WARN] no frames drawn for {', '.join(missing)}", file=sys.stderr)
+    return 1 if regressions or missing else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
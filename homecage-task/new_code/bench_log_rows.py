@@ -0,0 +1,196 @@
+"""
+Rows per second of the two-choice CSV row paths.
+
+Replays a synthetic session's ``append_log`` calls (``--rows`` events: trial
+placements, onsets, touches with input timing, reward pulses with markers,
+ITI starts) through
+
+  dict      the per-event dicts append_log used to build: an empty
+            CSV_FIELDNAMES row updated with every column, the session
+            constants and the trial context, then ``complete_csv_row`` and
+            ``csv.DictWriter.writerow``;
+  encoder   ``touch_task_runner.RowEncoder``: session constants serialised
+            once, per-event columns set by index, one ``csv.writer`` call.
+
+for restless_bandit's and prl's CSV_FIELDNAMES, ``--rounds`` times each, and
+checks both produce the same bytes (exit 1 if not).
+
+Example:
+  python bench_log_rows.py --out bench/log_rows.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import random
+import time
+from typing import Callable, Dict, List, Optional
+
+import bench_common
+import prl
+import restless_bandit
+import touch_task_runner as ttr
+
+EVENTS = ("TRIAL_PLACED", "STIM_ONSET", "TOUCH_LEFT_REWARDED", "REWARD_PULSE", "ITI_START", "TOUCH_ITI_OUTSIDE")
+EVENT_FIELDS = (
+    "iso", "rel_s", "state", "x", "y", *ttr.RECT_CSV_FIELDS,
+    "ttl_link", "ttl_link_epoch", "event", "iti_ms", "outside_in_trial",
+)
+MARKER_FIELDS = ("marker_code", "marker_seq", "marker_queued_rel_s")
+
+
+def task_layout(task: str):
+    """``(fieldnames, static columns, trial context columns)`` as the task's append_log fills them."""
+    if task == "prl":
+        static = {
+            "start_iso": "2026-01-01T10:00:00.000", "hit_margin_px": 40, "max_outside_before_fail": 3,
+            "correction_mode": 0, "seed": 1, "schedule_hash": "ab" * 32,
+        }
+        context = (
+            "stim_set", "left_label", "right_label", "left_image", "right_image", "target_image",
+            "non_target_image", "trial_index_global", "trial_index_in_set", "block_index", "trial_in_block",
+            "scheduled_reversal_trial", "is_post_reversal", "high_label", "p_high", "p_low",
+        )
+        return prl.CSV_FIELDNAMES, static, context
+    static = {
+        "start_iso": "2026-01-01T10:00:00.000", "hit_margin_px": 40, "max_outside_before_fail": 3,
+        "seed": 1, "walk_hash": "cd" * 32, "n_trials": 300,
+        "step_prob": 0.2, "step_size": 0.1, "p_floor": 0.1, "p_ceil": 0.9, "balance_tol": 0.05,
+        "double_low_thresh": 0.3, "double_low_max_run": 10, "boundary_mode": "reflect", "balance_metric": "mean",
+    }
+    return restless_bandit.CSV_FIELDNAMES, static, ("trial_index", "p_left", "p_right")
+
+
+def synthetic_events(n: int, context_fields, seed: int) -> List[Dict]:
+    rng = random.Random(seed)
+    rects = ((720, 420, 240, 240), (960, 420, 240, 240), (700, 400, 280, 280), (940, 400, 280, 280))
+    events = []
+    for i in range(n):
+        name = EVENTS[i % len(EVENTS)]
+        rel = i * 0.25 + rng.random() * 0.01
+        ev = {
+            "values": (
+                f"2026-01-01T10:{int(rel // 60) % 60:02d}:{rel % 60:06.3f}", f"{rel:.6f}", "SHOW",
+                rng.randrange(1920) if name.startswith("TOUCH") else -1, rng.randrange(1080) if name.startswith("TOUCH") else -1,
+                *(v for rect in rects for v in rect), "up", 1, name, 0, i % 3,
+            ),
+            "context": tuple(f"{rng.random():.3f}" if k % 3 else k for k in range(len(context_fields))),
+            "touch": None,
+            "extra": None,
+            "marker": None,
+        }
+        if name.startswith("TOUCH"):
+            ev["touch"] = {"sdl_ts_ms": 1000 + i, "input_rel_s": f"{rel - 0.002:.6f}"}
+            ev["extra"] = {"hit_area": "left_core", "trial_outcome": "rewarded", "p_chosen": 0.7}
+        elif name == "REWARD_PULSE":
+            ev["extra"] = {"reward_train_id": i, "reward_pulse_index": 0, "reward_emitted_rel_s": f"{rel:.6f}"}
+            ev["marker"] = (6, i, f"{rel:.6f}")
+        elif name == "ITI_START":
+            ev["extra"] = {"iti_kind": "rewarded"}
+        events.append(ev)
+    return events
+
+
+def dict_path(fieldnames, static, context_fields) -> Callable[[Dict], str]:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=fieldnames)
+
+    def append(ev) -> str:
+        row = ttr.empty_csv_row(fieldnames)
+        row.update(zip(EVENT_FIELDS, ev["values"]))
+        row.update(static)
+        row.update(zip(context_fields, ev["context"]))
+        if ev["touch"] is not None:
+            row.update(ev["touch"])
+        if ev["extra"] is not None:
+            row.update(ev["extra"])
+        if ev["marker"] is not None:
+            row.update(zip(MARKER_FIELDS, ev["marker"]))
+        writer.writerow(ttr.complete_csv_row(row, fieldnames))
+        line = out.getvalue()
+        out.seek(0)
+        out.truncate()
+        return line
+
+    return append
+
+
+def encoder_path(fieldnames, static, context_fields) -> Callable[[Dict], str]:
+    encoder = ttr.RowEncoder(fieldnames, static)
+    set_event_fields = encoder.setter(*EVENT_FIELDS)
+    set_trial_fields = encoder.setter(*context_fields)
+    set_marker_fields = encoder.setter(*MARKER_FIELDS)
+
+    def append(ev) -> str:
+        row = encoder.row()
+        set_event_fields(row, *ev["values"])
+        set_trial_fields(row, *ev["context"])
+        if ev["touch"] is not None:
+            encoder.update(row, ev["touch"])
+        if ev["extra"] is not None:
+            encoder.update(row, ev["extra"])
+        if ev["marker"] is not None:
+            set_marker_fields(row, *ev["marker"])
+        return encoder.encode(row)
+
+    return append
+
+
+def run_task(args, task: str) -> Dict:
+    fieldnames, static, context_fields = task_layout(task)
+    events = synthetic_events(args.rows, context_fields, args.seed)
+    paths = {"dict": dict_path(fieldnames, static, context_fields), "encoder": encoder_path(fieldnames, static, context_fields)}
+
+    outputs = {name: "".join(append(ev) for ev in events) for name, append in paths.items()}
+    identical = outputs["dict"] == outputs["encoder"]
+
+    cases = {}
+    for name, append in paths.items():
+        samples = []
+        for _ in range(args.rounds):
+            t = time.perf_counter()
+            for ev in events:
+                append(ev)
+            samples.append((time.perf_counter() - t) / len(events))
+        summary = bench_common.summarize([s * 1e6 for s in samples], n_boot=args.bootstrap, seed=args.seed)
+        summary["rows_per_s"] = 1e6 / summary["p50"] if summary["p50"] > 0 else float("inf")
+        cases[f"{task}.{name}"] = summary
+        print(f"[INFO] {task}.{name}: {summary['p50']:.2f}us/row, {summary['rows_per_s']:,.0f} rows/s")
+    speedup = cases[f"{task}.dict"]["p50"] / cases[f"{task}.encoder"]["p50"]
+    print(f"[INFO] {task}: encoder {speedup:.1f}x the dict path; output {'identical' if identical else 'DIFFERS'}")
+    return {"cases": cases, "speedup": speedup, "identical": identical, "bytes": len(outputs["dict"])}
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Rows per second of the two-choice CSV row paths")
+    p.add_argument("--tasks", nargs="+", choices=["restless_bandit", "prl"], default=["restless_bandit", "prl"])
+    p.add_argument("--rows", type=int, default=5000, help="events per round")
+    p.add_argument("--rounds", type=int, default=20)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--bootstrap", type=int, default=200)
+    p.add_argument("--out", type=str, default=None, help="JSON result path (stdout if omitted)")
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    tasks = {task: run_task(args, task) for task in args.tasks}
+    result = {
+        "benchmark": "log_rows",
+        "unit": "us_per_row",
+        "environment": bench_common.environment_info(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "tasks": tasks,
+    }
+    bench_common.write_json(result, args.out)
+    differs = [task for task, r in tasks.items() if not r["identical"]]
+    if differs:
+        print(f"[WARN] encoder output differs from the dict path for {', '.join(differs)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
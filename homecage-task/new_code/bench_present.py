@@ -0,0 +1,234 @@
+"""
+Presentation cost of a two-choice state change: full flip vs dirty rects,
+software drawing vs the SDL Renderer backend.
+
+Draws the restless_bandit layout (two plates, optional stimulus images and
+the --info HUD line) through a render_backend canvas and alternates
+SHOW -> ITI -> SHOW ... ``--transitions`` times per mode, timing each
+``draw`` (clear, blit, push) the way the tasks call it. Every dirty-rect
+frame can be checked pixel-for-pixel against a full redraw (``--verify``);
+renderer frames are read back and compared with a software redraw, allowing
+``--tolerance`` per channel for differences in alpha blending.
+
+Under the dummy SDL video driver ``display.update``/``flip`` do not reach a
+screen, so the timings are the CPU-side fill/blit cost; ``px_pushed``
+reports how much the display backend would have to copy. The renderer runs
+on SDL's software renderer unless ``--accelerated`` is given, so it can be
+checked without a GPU. The renderer has no dirty mode (its back buffer is
+not kept between frames); it only runs ``flip``.
+
+Example:
+  python bench_present.py --images --info --out bench/present.json
+  python bench_present.py --render renderer --accelerated --images  # on the Pi
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import bench_common
+
+bench_common.use_headless_sdl()
+
+import render_backend
+import touch_task_runner as ttr
+
+CODE_DIR = Path(__file__).resolve().parent
+
+
+class Scene:
+    def __init__(self, args, target):
+        import pygame
+
+        self.args = args
+        self.canvas = render_backend.as_canvas(target)
+        sw, sh = self.canvas.get_size()
+        specs, _offset = ttr.compute_two_choice_rects(
+            sw, sh, args.square_px, args.square_px, args.plate_px, args.plate_px,
+            args.center_offset_px, 16,
+        )
+        self.left = pygame.Rect(specs.left.x, specs.left.y, specs.left.w, specs.left.h)
+        self.right = pygame.Rect(specs.right.x, specs.right.y, specs.right.w, specs.right.h)
+        self.left_plate = pygame.Rect(specs.left_plate.x, specs.left_plate.y, specs.left_plate.w, specs.left_plate.h)
+        self.right_plate = pygame.Rect(specs.right_plate.x, specs.right_plate.y, specs.right_plate.w, specs.right_plate.h)
+        self.font = pygame.font.SysFont(None, 28) if args.info else None
+        self.images = []
+        if args.images:
+            for path in sorted(Path(args.stim_dir).glob("stim_*_r.png")) + sorted(Path(args.stim_dir).glob("stim_*_nr.png")):
+                img = self.canvas.convert(pygame.image.load(str(path)))
+                self.images.append(self.canvas.upload(pygame.transform.smoothscale(img, self.left.size)))
+            if not self.images:
+                raise SystemExit(f"no stim_*_r.png / stim_*_nr.png images in {args.stim_dir}")
+
+    def draw(self, presenter: ttr.FramePresenter, stim_on: bool, frame: int, present: bool = True) -> None:
+        # Mirrors restless_bandit.run.draw.
+        canvas = self.canvas
+        presenter.begin()
+        if stim_on:
+            canvas.draw_rect((96, 96, 96), self.left_plate)
+            canvas.draw_rect((96, 96, 96), self.right_plate)
+            if self.images:
+                canvas.blit(self.images[frame % len(self.images)], self.left)
+                canvas.blit(self.images[(frame + 1) % len(self.images)], self.right)
+            else:
+                canvas.draw_rect((255, 255, 255), self.left)
+                canvas.draw_rect((255, 255, 255), self.right)
+            presenter.mark(self.left_plate.union(self.left))
+            presenter.mark(self.right_plate.union(self.right))
+        if self.font is not None:
+            state = "SHOW" if stim_on else "ITI"
+            txt = f"State={state}  Trial={frame // 2}/{self.args.transitions // 2}  Choices={frame // 2}  Rewards={frame // 4}"
+            presenter.mark(canvas.blit(self.font.render(txt, True, (220, 220, 220)), (20, 20)))
+        if present:
+            presenter.present()
+
+
+def frame_bytes(surface) -> bytes:
+    import pygame
+
+    return pygame.image.tobytes(surface, "RGB")
+
+
+def differing_pixels(a, b, tolerance: int) -> int:
+    """Pixels of ``a`` and ``b`` with a channel more than ``tolerance`` apart."""
+    import pygame
+
+    if frame_bytes(a) == frame_bytes(b):
+        return 0
+    limit = tolerance + 1
+    w, h = a.get_size()
+    return w * h - pygame.transform.threshold(None, a, None, (limit, limit, limit, 255), None, 0, b)
+
+
+def reference_scene(args, scene: Scene) -> Scene:
+    """The same scene drawn in software on an off-screen surface."""
+    import pygame
+
+    reference = Scene(args, pygame.Surface(scene.canvas.get_size(), 0, 32))
+    if scene.canvas.backend == "software":
+        reference.images = scene.images
+    return reference
+
+
+def run_mode(args, scene: Scene, mode: str) -> Dict:
+    canvas = scene.canvas
+    presenter = ttr.FramePresenter(canvas, (0, 0, 0), mode)
+    scene.draw(presenter, True, 0)  # first frame is always a full flip
+
+    reference = None
+    if args.verify and (mode == "dirty" or canvas.backend == "renderer"):
+        reference = reference_scene(args, scene)
+    mismatches = 0
+
+    costs: Dict[str, List[float]] = {"to_show": [], "to_iti": []}
+    px_pushed = 0
+    for frame in range(1, args.transitions + 1):
+        stim_on = frame % 2 == 0
+        px_before = presenter.pixels_pushed
+        t = time.perf_counter()
+        scene.draw(presenter, stim_on, frame)
+        costs["to_show" if stim_on else "to_iti"].append(time.perf_counter() - t)
+        px_pushed += presenter.pixels_pushed - px_before
+
+        if reference is not None and frame <= args.verify:
+            reference.draw(ttr.FramePresenter(reference.canvas, (0, 0, 0), "flip"), stim_on, frame, present=False)
+            if canvas.backend == "renderer":
+                # The back buffer is undefined after present: redraw (a
+                # full frame anyway) and read it back before presenting.
+                scene.draw(presenter, stim_on, frame, present=False)
+                bad = differing_pixels(canvas.read_pixels(), reference.canvas.surface, args.tolerance)
+                presenter.present()
+            else:
+                bad = frame_bytes(canvas.surface) != frame_bytes(reference.canvas.surface)
+            if bad:
+                mismatches += 1
+
+    sw, sh = canvas.get_size()
+    result = {
+        "render": canvas.describe(),
+        "mode": mode,
+        "px_pushed_per_frame": px_pushed / max(1, args.transitions),
+        "screen_px": sw * sh,
+    }
+    for kind, values in costs.items():
+        result[f"{kind}_ms"] = bench_common.summarize(bench_common.ms(values), n_boot=args.bootstrap)
+    if reference is not None:
+        result["verified_frames"] = min(args.verify, args.transitions)
+        result["mismatched_frames"] = mismatches
+    print(
+        f"[INFO] {canvas.describe()} {mode}: to_show p50={result['to_show_ms']['p50']:.3f}ms "
+        f"to_iti p50={result['to_iti_ms']['p50']:.3f}ms "
+        f"pushed={result['px_pushed_per_frame'] / result['screen_px']:.1%} of screen"
+    )
+    return result
+
+
+def run_backend(args, render: str) -> List[Dict]:
+    import pygame
+
+    size = (args.window_w, args.window_h)
+    if render == "renderer":
+        canvas = render_backend.open_renderer(size, False, "bench_present", accelerated=args.accelerated)
+    else:
+        canvas = render_backend.SoftwareCanvas(pygame.display.set_mode(size))
+    try:
+        scene = Scene(args, canvas)
+        modes = [m for m in args.modes if canvas.partial_updates or m == "flip"]
+        if modes != list(args.modes):
+            print(f"[INFO] {canvas.describe()}: no dirty mode, running {modes}")
+        return [run_mode(args, scene, mode) for mode in modes]
+    finally:
+        canvas.close()
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Per-transition presentation cost: flip vs dirty rects, software vs renderer")
+    p.add_argument("--modes", nargs="+", choices=list(ttr.PRESENT_MODES), default=list(ttr.PRESENT_MODES))
+    p.add_argument("--render", nargs="+", choices=list(render_backend.RENDER_BACKENDS), default=list(render_backend.RENDER_BACKENDS))
+    p.add_argument("--accelerated", action="store_true", help="ask SDL for a GPU renderer (default: its software renderer)")
+    p.add_argument("--transitions", type=int, default=2000)
+    p.add_argument("--window-w", type=int, default=1920)
+    p.add_argument("--window-h", type=int, default=1080)
+    p.add_argument("--square-px", type=int, default=240)
+    p.add_argument("--plate-px", type=int, default=280)
+    p.add_argument("--center-offset-px", type=int, default=300)
+    p.add_argument("--images", action="store_true", help="blit stimulus images instead of plain squares")
+    p.add_argument("--stim-dir", type=str, default=str(CODE_DIR / "visual_stimuli"))
+    p.add_argument("--info", action="store_true", help="draw the HUD line")
+    p.add_argument("--verify", type=int, default=50, help="compare this many dirty/renderer frames with a software full redraw (0 = off)")
+    p.add_argument("--tolerance", type=int, default=8, help="per-channel difference allowed in renderer frames")
+    p.add_argument("--bootstrap", type=int, default=200)
+    p.add_argument("--out", type=str, default=None, help="JSON result path (stdout if omitted)")
+    return p.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    import pygame
+
+    pygame.display.init()
+    pygame.font.init()
+    try:
+        runs = [run for render in args.render for run in run_backend(args, render)]
+        result = {
+            "benchmark": "present",
+            "environment": dict(bench_common.environment_info(), render_drivers=render_backend.renderer_drivers()),
+            "config": {k: v for k, v in vars(args).items() if k != "out"},
+            "runs": runs,
+        }
+    finally:
+        pygame.quit()
+    bench_common.write_json(result, args.out)
+    bad = sum(r.get("mismatched_frames", 0) for r in runs)
+    if bad:
+        print(f"[WARN] {bad} frames differ from a software full redraw")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,300 @@
+"""
+End-to-end touch -> TTL latency benchmark.
+
+Runs ``restless_bandit.run`` or ``prl.run`` under SDL's dummy drivers against
+``fake_arduino.FakeArduino`` and posts synthetic FINGERDOWN/FINGERUP pairs on
+the left plate from a background thread. Latency is measured from the moment
+a touch is posted to the moment the emulator raises the first pulse of the
+resulting reward train, i.e. event queue -> trial resolution -> reward
+scheduler -> serial write -> firmware.
+
+Each touch is posted at a distinct pixel inside the plate so the logged x/y
+identify which injection a choice row came from. Rewarded rows are paired with
+emulated trains in order (one train per reward, ``--pulsecount 1``).
+
+Example:
+  python bench_touch_to_ttl.py --task restless_bandit --trials 2000 --out bench/latency.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import bench_common
+
+bench_common.use_headless_sdl()
+
+import event_log
+import log_recovery
+from fake_arduino import FakeArduino
+
+CODE_GRID = 41  # touches are spread over a CODE_GRID x CODE_GRID pixel patch
+
+
+def touch_offset(index: int) -> Tuple[int, int]:
+    code = index % (CODE_GRID * CODE_GRID)
+    half = CODE_GRID // 2
+    return (code % CODE_GRID - half, code // CODE_GRID - half)
+
+
+class TouchInjector(threading.Thread):
+    """Posts press/release pairs until stopped; records when each press was posted."""
+
+    def __init__(self, center: Tuple[int, int], screen: Tuple[int, int], hold_s: float, gap_s: float, start_delay_s: float):
+        super().__init__(name="touch-injector", daemon=True)
+        self.center = center
+        self.screen = screen
+        self.hold_s = hold_s
+        self.gap_s = gap_s
+        self.start_delay_s = start_delay_s
+        self.posted: Dict[Tuple[int, int], List[float]] = {}
+        self.count = 0
+        self.stop_event = threading.Event()
+
+    def _post(self, pygame, ev_type, x_px: int, y_px: int) -> float:
+        sw, sh = self.screen
+        ev = pygame.event.Event(
+            ev_type,
+            touch_id=1,
+            finger_id=1,
+            x=(x_px + 0.5) / sw,
+            y=(y_px + 0.5) / sh,
+            dx=0.0,
+            dy=0.0,
+            pressure=1.0,
+        )
+        t = time.perf_counter()
+        pygame.event.post(ev)
+        return t
+
+    def _wait_for_task_loop(self, pygame) -> bool:
+        """Block until the task drains a harmless KEYUP, i.e. its main loop is running.
+
+        Touches posted while the task is still opening the serial port would
+        otherwise sit in the queue and show up as multi-second outliers.
+        """
+        posted = False
+        while not self.stop_event.is_set():
+            try:
+                if not posted:
+                    pygame.event.post(pygame.event.Event(pygame.KEYUP, key=pygame.K_F15, mod=0, scancode=0, unicode=""))
+                    posted = True
+                elif not pygame.event.peek(pygame.KEYUP):
+                    return True
+            except pygame.error:
+                pass
+            self.stop_event.wait(0.01)
+        return False
+
+    def run(self) -> None:
+        import pygame
+
+        if not self._wait_for_task_loop(pygame) or self.stop_event.wait(self.start_delay_s):
+            return
+        while not self.stop_event.is_set():
+            dx, dy = touch_offset(self.count)
+            x, y = self.center[0] + dx, self.center[1] + dy
+            try:
+                t = self._post(pygame, pygame.FINGERDOWN, x, y)
+                self.posted.setdefault((x, y), []).append(t)
+                self.count += 1
+                if self.stop_event.wait(self.hold_s):
+                    return
+                self._post(pygame, pygame.FINGERUP, x, y)
+            except pygame.error:
+                return
+            self.stop_event.wait(self.gap_s)
+
+
+def find_event_log(out_dir: Path, task: str, layout: str = "wide") -> Path:
+    """The session log of the last ``<task>_log_<YYYYmmdd_HHMMSS>.csv`` run in ``layout``.
+
+    Side tables (``_sync_e<N>``, ``_markers``, ``_photodiode``, ...) share the
+    stamp but never the exact name.
+    """
+    stamped = re.compile(rf"{re.escape(task)}_log_\d{{8}}_\d{{6}}")
+    names = sorted({m.group(0) + ".csv" for p in out_dir.glob(f"{task}_log_*") if (m := stamped.match(p.name))})
+    logs = [path for path in (event_log.session_log_path(layout, out_dir / n) for n in names) if path.exists()]
+    if not logs:
+        raise RuntimeError(f"no {task} log written to {out_dir}")
+    return logs[-1]
+
+
+def pair_latencies(rows: List[dict], posted: Dict[Tuple[int, int], List[float]], pulses) -> Tuple[List[float], Dict]:
+    first_pulses = [p for p in pulses if p.pulse_index == 0]
+    rewarded = [r for r in rows if r["event"].startswith("TOUCH_") and r.get("reward_train_id")]
+
+    latencies = []
+    unmatched_touch = 0
+    for row, pulse in zip(rewarded, first_pulses):
+        key = (int(row["x"]), int(row["y"]))
+        candidates = [t for t in posted.get(key, []) if t <= pulse.host_t]
+        if not candidates:
+            unmatched_touch += 1
+            continue
+        latencies.append(pulse.host_t - candidates[-1])
+
+    counts = {
+        "rows": len(rows),
+        "rewarded": len(rewarded),
+        "trains": len(first_pulses),
+        "missing_pulses": max(0, len(rewarded) - len(first_pulses)),
+        "unmatched_touches": unmatched_touch,
+    }
+    return latencies, counts
+
+
+def task_args(args, out_dir: Path, port: str) -> List[str]:
+    iti = str(int(args.iti_ms))
+    argv = [
+        "--seed", str(args.seed),
+        "--out-dir", str(out_dir),
+        "--serial-port", port,
+        "--ttl-protocol", args.ttl_protocol,
+        "--pulse-width-ms", str(args.pulse_width_ms),
+        "--pulsecount", "1",
+        "--window-w", str(args.window_w),
+        "--window-h", str(args.window_h),
+        "--iti-min-ms", iti,
+        "--iti-max-ms", iti,
+        "--min-release-ms-after-iti-touch", "0",
+        "--max-trials", str(args.trials),
+        "--clock-sync-interval-s", str(args.clock_sync_interval_s),
+    ]
+    if args.task == "prl":
+        argv += [
+            "--stim-dir", args.stim_dir,
+            "--stim-px", "240",
+            "--n-blocks", "1",
+            "--block-len-trials", str(args.trials),
+            "--reversal-min-trial", str(max(1, args.trials // 2)),
+            "--reversal-max-trial", str(max(1, args.trials // 2)),
+        ]
+    else:
+        argv += ["--n-trials", str(args.trials)]
+    return argv + list(args.task_args)
+
+
+def run_once(args, repeat: int) -> Dict:
+    if args.task == "prl":
+        import prl as task
+    else:
+        import restless_bandit as task
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        out_dir = Path(args.keep_logs) / f"run{repeat}" if args.keep_logs else Path(tmpdir)
+        with FakeArduino(
+            firmware=args.firmware,
+            latency_s=args.latency_ms / 1000.0,
+            jitter_s=args.jitter_ms / 1000.0,
+            seed=args.seed + repeat,
+        ) as fake:
+            task_ns = task.parse_args(task_args(args, out_dir, fake.port))
+            # The left choice plate is centred center_offset_px left of the screen centre.
+            center = (args.window_w // 2 - int(task_ns.center_offset_px), args.window_h // 2)
+            injector = TouchInjector(
+                center,
+                (args.window_w, args.window_h),
+                hold_s=args.hold_ms / 1000.0,
+                gap_s=args.gap_ms / 1000.0,
+                start_delay_s=args.start_delay_s,
+            )
+            injector.start()
+            t_start = time.perf_counter()
+            try:
+                task.run(task_ns)
+            finally:
+                injector.stop_event.set()
+                injector.join(2.0)
+            wall_s = time.perf_counter() - t_start
+            pulses = list(fake.pulses)
+
+        _, rows = log_recovery.read_rows(find_event_log(out_dir, args.task, task_ns.log_layout))
+        rows = list(rows)
+
+    latencies, counts = pair_latencies(rows, injector.posted, pulses)
+    counts["injected"] = injector.count
+    summary = bench_common.summarize(bench_common.ms(latencies), n_boot=args.bootstrap, seed=args.seed + repeat)
+    print(
+        f"[INFO] run {repeat}: n={summary['n']} p50={summary['p50']:.2f}ms "
+        f"p95={summary['p95']:.2f}ms p99={summary['p99']:.2f}ms ({wall_s:.1f}s)"
+    )
+    return {"repeat": repeat, "wall_s": wall_s, "counts": counts, "latency_ms": summary, "_raw_ms": bench_common.ms(latencies)}
+
+
+def spread_across_runs(runs: List[Dict]) -> Dict:
+    out = {}
+    for q in bench_common.PERCENTILES:
+        vals = [r["latency_ms"][f"p{q}"] for r in runs if r["latency_ms"]["n"] > 0]
+        if vals:
+            out[f"p{q}"] = {"min": min(vals), "max": max(vals), "range": max(vals) - min(vals)}
+    return out
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Touch -> TTL latency benchmark against the pty fake Arduino")
+    p.add_argument("--task", choices=["restless_bandit", "prl"], default="restless_bandit")
+    p.add_argument("--trials", type=int, default=2000, help="trials per run")
+    p.add_argument("--repeats", type=int, default=1, help="independent runs; their percentile spread is reported")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", type=str, default=None, help="JSON result path (stdout if omitted)")
+    p.add_argument("--keep-logs", type=str, default=None, help="keep task CSVs under this directory")
+    p.add_argument("--include-samples", action="store_true", help="store every latency sample in the JSON")
+    p.add_argument("--bootstrap", type=int, default=200, help="bootstrap resamples for percentile intervals")
+
+    p.add_argument("--firmware", choices=["v2", "legacy"], default="v2")
+    p.add_argument("--ttl-protocol", choices=["auto", "v2", "legacy"], default="auto")
+    p.add_argument("--latency-ms", type=float, default=0.5, help="emulated firmware response latency")
+    p.add_argument("--jitter-ms", type=float, default=0.0)
+    p.add_argument("--pulse-width-ms", type=float, default=5.0)
+    p.add_argument("--clock-sync-interval-s", type=float, default=2.0)
+
+    p.add_argument("--window-w", type=int, default=1280)
+    p.add_argument("--window-h", type=int, default=720)
+    p.add_argument("--iti-ms", type=int, default=20)
+    p.add_argument("--hold-ms", type=float, default=10.0)
+    p.add_argument("--gap-ms", type=float, default=40.0)
+    p.add_argument("--start-delay-s", type=float, default=0.2, help="settle time after the task loop is up")
+    p.add_argument("--stim-dir", type=str, default=str(Path(__file__).resolve().parent / "visual_stimuli"))
+    p.add_argument("task_args", nargs=argparse.REMAINDER, help="extra task arguments after --")
+    args = p.parse_args(argv)
+    if args.task_args and args.task_args[0] == "--":
+        args.task_args = args.task_args[1:]
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    runs = [run_once(args, i) for i in range(max(1, args.repeats))]
+
+    pooled = [v for r in runs for v in r.pop("_raw_ms")]
+    pooled_summary = bench_common.summarize(pooled, n_boot=args.bootstrap, seed=args.seed)
+
+    config = {k: v for k, v in vars(args).items() if k not in ("out", "keep_logs")}
+    result = {
+        "benchmark": "touch_to_ttl",
+        "environment": bench_common.environment_info(),
+        "config": config,
+        "runs": runs,
+        "pooled_latency_ms": pooled_summary,
+        "spread_across_runs": spread_across_runs(runs),
+    }
+    if args.include_samples:
+        result["samples_ms"] = pooled
+    bench_common.write_json(result, args.out)
+
+    if not any(r["latency_ms"]["n"] for r in runs):
+        print("[WARN] no rewarded touch could be paired with a pulse", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import csv
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+SYNC_TABLE_FIELDNAMES = ["host_send_rel_s", "host_recv_rel_s", "arduino_us"]
+
+MICROS_WRAP = 1 << 32
+
+
+@dataclass(frozen=True)
+class SyncSample:
+    host_send_t: float
+    host_recv_t: float
+    arduino_us: int
+
+    @property
+    def rtt_s(self) -> float:
+        return self.host_recv_t - self.host_send_t
+
+    @property
+    def host_mid_t(self) -> float:
+        return 0.5 * (self.host_send_t + self.host_recv_t)
+
+
+@dataclass(frozen=True)
+class ClockFit:
+    offset_s: float
+    slope: float
+    error_s: float
+    n_used: int
+
+    @property
+    def drift_ppm(self) -> float:
+        return (self.slope - 1.0) * 1e6
+
+
+@dataclass
+class SessionClock:
+    """One wall-clock / ``perf_counter`` anchor pair taken at session start.
+
+    Row times are derived from the anchor instead of asking the OS for the
+    wall clock on every log call, so ``iso`` and ``rel_s`` can no longer
+    disagree (NTP slews do not leak into the session). ``sdl_ticks0`` is
+    ``pygame.time.get_ticks()`` read alongside the anchor; it maps SDL event
+    timestamps (milliseconds since SDL init) onto the same timeline, to the
+    1 ms resolution of the SDL tick counter.
+    """
+
+    wall0: float
+    t0: float
+    sdl_ticks0: Optional[int] = None
+    _iso_sec: int = field(default=-1, repr=False, compare=False)
+    _iso_prefix: str = field(default="", repr=False, compare=False)
+
+    @classmethod
+    def start(cls, sdl_ticks: Optional[int] = None) -> "SessionClock":
+        t0 = time.perf_counter()
+        wall0 = time.time()
+        return cls(wall0, t0, sdl_ticks)
+
+    def rel(self, t: float) -> float:
+        return t - self.t0
+
+    def wall(self, t: float) -> float:
+        return self.wall0 + (t - self.t0)
+
+    def iso(self, t: float) -> str:
+        """Local ISO time of ``t`` at millisecond precision (truncated, like
+        ``datetime.isoformat(timespec="milliseconds")``)."""
+        wall = self.wall(t)
+        sec = int(wall // 1)
+        if sec != self._iso_sec:
+            self._iso_prefix = datetime.fromtimestamp(sec).isoformat(timespec="seconds")
+            self._iso_sec = sec
+        return f"{self._iso_prefix}.{min(999, int((wall - sec) * 1000.0)):03d}"
+
+    def start_iso(self) -> str:
+        return self.iso(self.t0)
+
+    def start_datetime(self) -> datetime:
+        return datetime.fromtimestamp(self.wall0)
+
+    def sdl_to_host(self, ticks_ms) -> Optional[float]:
+        if self.sdl_ticks0 is None or ticks_ms is None:
+            return None
+        return self.t0 + (int(ticks_ms) - self.sdl_ticks0) / 1000.0
+
+    def input_fields(self, event, received_t: float) -> dict:
+        """``sdl_ts_ms`` / ``input_rel_s`` for a touch row.
+
+        ``input_rel_s`` comes from the event's SDL timestamp when the pygame
+        build exposes one and falls back to ``received_t`` (when the loop
+        dequeued the event) otherwise; it is never later than ``received_t``.
+        """
+        ts = getattr(event, "timestamp", None)
+        t = self.sdl_to_host(ts)
+        if t is None or t > received_t:
+            t = received_t
+        return {
+            "sdl_ts_ms": "" if ts is None else int(ts),
+            "input_rel_s": f"{self.rel(t):.6f}",
+        }
+
+
+class MicrosUnwrapper:
+    """Turn the Arduino's 32-bit ``micros()`` into a monotonic counter.
+
+    Values must be fed in arrival order; ``micros()`` wraps every ~71.6 min.
+    """
+
+    def __init__(self):
+        self._last = None
+        self._base = 0
+
+    def __call__(self, raw_us: int) -> int:
+        raw_us = int(raw_us) % MICROS_WRAP
+        if self._last is not None and raw_us < self._last and (self._last - raw_us) > MICROS_WRAP // 2:
+            self._base += MICROS_WRAP
+        self._last = raw_us
+        return self._base + raw_us
+
+
+class ClockSync:
+    """Linear host<-Arduino clock model estimated from ping/pong samples.
+
+    Only the ``best_fraction`` of samples with the shortest round trip are
+    fitted, since long round trips mostly measure USB scheduling noise.
+    """
+
+    def __init__(self, best_fraction: float = 0.5, max_samples: int = 4096):
+        self.best_fraction = min(1.0, max(0.0, float(best_fraction)))
+        self.max_samples = max(1, int(max_samples))
+        self.samples: List[SyncSample] = []
+        self._lock = threading.Lock()
+        self._fit: Optional[ClockFit] = None
+
+    def add(self, sample: SyncSample) -> None:
+        with self._lock:
+            self.samples.append(sample)
+            if len(self.samples) > self.max_samples:
+                del self.samples[0]
+            self._fit = None
+
+    def fit(self) -> Optional[ClockFit]:
+        with self._lock:
+            if self._fit is None and self.samples:
+                self._fit = _fit_samples(self.samples, self.best_fraction)
+            return self._fit
+
+    def to_host(self, arduino_us: int) -> Tuple[float, float]:
+        """Map an (unwrapped) Arduino timestamp to host time with an error bound in seconds."""
+        f = self.fit()
+        if f is None:
+            raise ValueError("no clock sync samples")
+        return (f.offset_s + f.slope * (arduino_us / 1e6), f.error_s)
+
+
+def _fit_samples(samples: List[SyncSample], best_fraction: float) -> ClockFit:
+    ranked = sorted(samples, key=lambda s: s.rtt_s)
+    n_used = max(1, int(round(len(ranked) * best_fraction)))
+    if len(ranked) >= 2:
+        n_used = max(2, n_used)
+    used = ranked[:n_used]
+
+    xs = [s.arduino_us / 1e6 for s in used]
+    ys = [s.host_mid_t for s in used]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    sxx = sum((x - x_mean) ** 2 for x in xs)
+    if sxx > 0.0:
+        slope = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / sxx
+    else:
+        slope = 1.0
+    offset = y_mean - slope * x_mean
+
+    error_s = 0.0
+    for s, x, y in zip(used, xs, ys):
+        resid = abs(y - (offset + slope * x))
+        error_s = max(error_s, 0.5 * s.rtt_s + resid)
+
+    return ClockFit(offset_s=offset, slope=slope, error_s=error_s, n_used=len(used))
+
+
+def write_sync_table(path: Path, sync: ClockSync, t0: float) -> Path:
+    """Write sync samples with host times shifted into the session's ``rel_s`` domain."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(SYNC_TABLE_FIELDNAMES)
+        for s in list(sync.samples):
+            w.writerow([f"{s.host_send_t - t0:.6f}", f"{s.host_recv_t - t0:.6f}", s.arduino_us])
+    return path
+
+
+def load_sync_table(path) -> ClockSync:
+    """Load a sync table; ``to_host`` on the result returns session ``rel_s``."""
+    sync = ClockSync()
+    with Path(path).open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            sync.add(SyncSample(
+                host_send_t=float(row["host_send_rel_s"]),
+                host_recv_t=float(row["host_recv_rel_s"]),
+                arduino_us=int(row["arduino_us"]),
+            ))
+    return sync
+
+
+def sync_table_path(log_path: Path, epoch: int = 0) -> Path:
+    """``<log>_sync.csv``; later link epochs (board reset mid-session) get ``_sync_e<N>.csv``."""
+    log_path = Path(log_path)
+    suffix = "_sync.csv" if epoch == 0 else f"_sync_e{epoch}.csv"
+    return log_path.with_name(log_path.stem + suffix)
@@ -0,0 +1,574 @@
+"""
+Binary columnar event log for the two-choice tasks (``--log-layout columnar``).
+
+Rows are collected on the log writer thread and written in chunks, column
+by column, each column in one fixed-width kind:
+
+  int    int32    integers (touch position, rects, trial and reward counters)
+  us     int64    "%.6f" seconds as integer microseconds (rel_s, *_rel_s)
+  iso    int64    millisecond ISO timestamps as ms since 1970-01-01 (naive)
+  float  float64  probabilities, reward draws
+  bool   int8     True / False
+  dict   uint16   any other text, as codes into a per-column session
+                  dictionary (event, state, hit_area, ...); code 0 is ""
+
+An empty cell is stored as the kind's null (``NULLS``: the smallest
+integer of the width, -1, NaN or code 0). A value that would not come back
+as the same CSV text (a string in an int column, an int beyond 32 bits, the
+65536th dictionary entry, ...) goes to the chunk's exceptions verbatim, so
+``to_csv`` rebuilds the wide CSV byte for byte.
+
+File layout (little-endian):
+
+  b"HCLOG01\\n"
+  chunk*  tag (b"HEAD" or b"ROWS"), payload length (u32), crc32 of the
+          payload (u32), reserved (u32), payload padded to 8 bytes
+
+HEAD is JSON: format, fieldnames, kinds and the task's info. ROWS is the
+row count (u32), the length of a JSON block (u32), one flag byte per column
+(1: the column holds one value throughout the chunk, stored once), the JSON
+(dictionary entries first used in this chunk, exceptions), then one array
+per column, each starting 8-byte aligned so the reader can map it without
+copying. Within a chunk most columns are constant (session settings,
+rects) or empty (marker, beep and reward fields between rewards), so a row
+costs only its varying columns.
+
+A chunk is written (one write + flush) once ``chunk_rows`` rows are waiting,
+when the oldest has waited ``chunk_s``, and on flush / close and before an
+fsync (see log_writer). A crash loses
+at most the chunk being collected or written; the reader stops at the first
+chunk that is cut short or fails its checksum and reports the bytes skipped.
+
+  python columnar_log.py info out/prl_log_20260101_100000.hclog
+  python columnar_log.py to-csv out/prl_log_20260101_100000.hclog
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+try:
+    import numpy
+except Exception:
+    numpy = None
+
+from log_writer import CsvLogWriter
+from touch_task_runner import RowEncoder
+
+MAGIC = b"HCLOG01\n"
+FORMAT = "hc-task-columnar/1"
+SUFFIX = ".hclog"
+KINDS = ("int", "us", "iso", "float", "bool", "dict")
+DICT_MAX = 0xFFFF
+NULLS = {"int": -(2 ** 31), "us": -(2 ** 63), "iso": -(2 ** 63), "float": float("nan"), "bool": -1, "dict": 0}
+# numpy dtype of each kind; the writer uses the matching array typecode.
+DTYPES = {"int": "<i4", "us": "<i8", "iso": "<i8", "float": "<f8", "bool": "|i1", "dict": "<u2"}
+_TYPECODES = {"int": "i", "us": "q", "iso": "q", "float": "d", "bool": "b", "dict": "H"}
+
+_CHUNK = struct.Struct("<4sIII")
+_ROWS = struct.Struct("<II")
+
+_INT_COLUMNS = frozenset({
+    "x", "y", "sdl_ts_ms", "hit_margin_px", "iti_ms", "outside_in_trial", "max_outside_before_fail",
+    "seed", "n_trials", "trial_index", "trial_index_global", "trial_index_in_set", "block_index",
+    "trial_in_block", "scheduled_reversal_trial", "correction_mode", "is_correction_trial", "chose_higher_p",
+    "reward_won", "reward_delivered", "reward_train_id", "reward_pulse_index", "reward_arduino_us",
+    "marker_code", "marker_seq", "onset_flip_index", "ttl_link_epoch", "double_low_max_run",
+})
+_FLOAT_COLUMNS = frozenset({
+    "p_left", "p_right", "p_chosen", "reward_draw", "p_high", "p_low",
+    "step_prob", "step_size", "p_floor", "p_ceil", "balance_tol", "double_low_thresh",
+})
+_BOOL_COLUMNS = frozenset({"is_post_reversal", "is_correct"})
+
+
+def column_kind(name: str) -> str:
+    """The kind a two-choice CSV column is stored as; unknown columns are ``dict``."""
+    if name in ("iso", "start_iso"):
+        return "iso"
+    if name == "rel_s" or name.endswith("_rel_s"):
+        return "us"
+    if name in _INT_COLUMNS or name.endswith(("_x", "_y", "_w", "_h")):
+        return "int"
+    if name in _FLOAT_COLUMNS:
+        return "float"
+    if name in _BOOL_COLUMNS:
+        return "bool"
+    return "dict"
+
+
+def columnar_path(log_path) -> Path:
+    return Path(log_path).with_suffix(SUFFIX)
+
+
+# Per kind: value -> stored value (or _MISS), and stored value -> CSV text.
+
+_MISS = object()
+_US_RX = re.compile(r"-?\d+\.\d{6}\Z")
+_ISO_RX = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}\Z")
+_EPOCH = datetime(1970, 1, 1)
+_MS = timedelta(milliseconds=1)
+_INT_NULL, _INT_MAX = NULLS["int"], 2 ** 31 - 1
+_LONG_NULL, _LONG_MAX = NULLS["us"], 2 ** 63 - 1
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+def _encode_int(value: Any) -> Any:
+    if type(value) is int:
+        return value if _INT_NULL < value <= _INT_MAX else _MISS
+    text = _text(value)
+    if text == "":
+        return _INT_NULL
+    try:
+        q = int(text)
+    except ValueError:
+        return _MISS
+    return q if str(q) == text and _INT_NULL < q <= _INT_MAX else _MISS
+
+
+def _format_int(q: int) -> str:
+    return "" if q == _INT_NULL else str(q)
+
+
+def _encode_us(value: Any) -> Any:
+    text = _text(value)
+    if text == "":
+        return _LONG_NULL
+    if not _US_RX.match(text):
+        return _MISS
+    q = int(text.replace(".", "", 1))
+    return q if _LONG_NULL < q <= _LONG_MAX and _format_us(q) == text else _MISS
+
+
+def _format_us(q: int) -> str:
+    if q == _LONG_NULL:
+        return ""
+    whole, frac = divmod(abs(q), 1_000_000)
+    return f"{'-' if q < 0 else ''}{whole}.{frac:06d}"
+
+
+def _encode_iso(value: Any) -> Any:
+    text = _text(value)
+    if text == "":
+        return _LONG_NULL
+    if not _ISO_RX.match(text):
+        return _MISS
+    try:
+        return (datetime.fromisoformat(text) - _EPOCH) // _MS
+    except ValueError:
+        return _MISS
+
+
+def _format_iso(q: int) -> str:
+    return "" if q == _LONG_NULL else (_EPOCH + q * _MS).isoformat(timespec="milliseconds")
+
+
+def _encode_float(value: Any) -> Any:
+    if type(value) is float:
+        return value if value == value else _MISS
+    text = _text(value)
+    if text == "":
+        return NULLS["float"]
+    try:
+        f = float(text)
+    except ValueError:
+        return _MISS
+    return f if f == f and repr(f) == text else _MISS
+
+
+def _format_float(f: float) -> str:
+    return "" if f != f else repr(f)
+
+
+def _encode_bool(value: Any) -> Any:
+    if value is True:
+        return 1
+    if value is False:
+        return 0
+    return {"": NULLS["bool"], "True": 1, "False": 0}.get(_text(value), _MISS)
+
+
+def _format_bool(q: int) -> str:
+    return "True" if q == 1 else "False" if q == 0 else ""
+
+
+_ENCODERS = {"int": _encode_int, "us": _encode_us, "iso": _encode_iso, "float": _encode_float, "bool": _encode_bool}
+_FORMATTERS = {"int": _format_int, "us": _format_us, "iso": _format_iso, "float": _format_float, "bool": _format_bool}
+
+
+def _pad(n: int) -> bytes:
+    return b"\0" * (-n % 8)
+
+
+def _frame(tag: bytes, payload: bytes) -> bytes:
+    payload += _pad(len(payload))
+    return _CHUNK.pack(tag, len(payload), zlib.crc32(payload), 0) + payload
+
+
+class ColumnarRowEncoder(RowEncoder):
+    """A ``RowEncoder`` whose ``encode`` hands the row's values to a ``ColumnarLogWriter``."""
+
+    def encode(self, row: Sequence[Any]) -> Tuple[Any, ...]:
+        return tuple(row)
+
+
+class ColumnarLogWriter(CsvLogWriter):
+    """A ``CsvLogWriter`` that writes the columnar format instead of CSV.
+
+    ``write_line`` takes one row as a sequence of ``fieldnames`` values
+    (what ``ColumnarRowEncoder.encode`` returns); ``write`` still takes a
+    dict. Values are converted on the writer thread. ``rows_written`` and
+    ``batches`` count rows and chunks on disk.
+    """
+
+    def __init__(
+        self,
+        path: os.PathLike,
+        fieldnames: Sequence[str],
+        kinds: Optional[Sequence[str]] = None,
+        info: Optional[Mapping[str, Any]] = None,
+        chunk_rows: int = 256,
+        chunk_s: float = 5.0,
+        max_queue: int = 4096,
+        fsync_s: Optional[float] = None,
+    ):
+        self.kinds = [column_kind(name) for name in fieldnames] if kinds is None else list(kinds)
+        if len(self.kinds) != len(fieldnames) or not set(self.kinds) <= set(KINDS):
+            raise ValueError(f"kinds must give one of {KINDS} per field")
+        self.info = dict(info or {})
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.chunk_s = max(0.0, float(chunk_s))
+        self._idle_s = max(0.05, self.chunk_s / 2)
+        self._pending: List[Tuple[float, Sequence[Any]]] = []
+        self._dictionaries = [{"": 0} if kind == "dict" else None for kind in self.kinds]
+        super().__init__(path, fieldnames, max_queue=max_queue, batch_rows=self.chunk_rows, fsync_s=fsync_s)
+
+    def write_line(self, values: Sequence[Any], sync: bool = False, durable: bool = False) -> None:
+        """Queue one row given as its ``fieldnames`` values, in order."""
+        if len(values) != len(self.fieldnames):
+            raise ValueError(f"row has {len(values)} values for {len(self.fieldnames)} fields")
+        super().write_line(values, sync, durable)
+
+    def _open(self) -> None:
+        self._f = self.path.open("wb")
+        header = {"format": FORMAT, "fieldnames": self.fieldnames, "kinds": self.kinds, "info": self.info}
+        self._write_bytes(MAGIC + _frame(b"HEAD", json.dumps(header).encode("utf-8")))
+
+    def _write_bytes(self, data: bytes) -> None:
+        self._f.write(data)
+        self._f.flush()
+
+    def _write_batch(self, rows) -> None:
+        for t, row, _ in rows:
+            if isinstance(row, Mapping):
+                row = [row.get(name) for name in self.fieldnames]
+            self._pending.append((t, row))
+        if len(self._pending) >= self.chunk_rows or self._pending[0][0] <= time.perf_counter() - self.chunk_s:
+            self._sync()
+
+    def _idle(self) -> None:
+        if self._pending and self._pending[0][0] <= time.perf_counter() - self.chunk_s:
+            self._sync()
+        super()._idle()
+
+    def _sync(self) -> None:
+        while self._pending:
+            rows = self._pending[:self.chunk_rows]
+            del self._pending[:self.chunk_rows]
+            self._write_chunk(rows)
+
+    def _write_chunk(self, rows) -> None:
+        t = time.perf_counter()
+        try:
+            payload, added = self._encode_chunk([row for _, row in rows])
+            self._write_bytes(_frame(b"ROWS", payload))
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+                print(f"[WARN] log writer {self.path}: {e}", file=sys.stderr)
+            return
+        # Dictionary entries only count once their chunk is on disk.
+        for dictionary, new in added:
+            dictionary.update(new)
+        end = time.perf_counter()
+        self.rows_written += len(rows)
+        self.batches += 1
+        self.write_s.append(end - t)
+        self.max_lag_s = max(self.max_lag_s, end - rows[0][0])
+
+    def _encode_chunk(self, rows: List[Sequence[Any]]):
+        arrays = []
+        flags = bytearray()
+        new_entries: Dict[str, List[str]] = {}
+        exceptions: Dict[str, List[List[Any]]] = {}
+        added = []
+        for col, (name, kind) in enumerate(zip(self.fieldnames, self.kinds)):
+            out = array(_TYPECODES[kind])
+            missed = []
+            if kind == "dict":
+                dictionary = self._dictionaries[col]
+                new: Dict[str, int] = {}
+                for i, row in enumerate(rows):
+                    text = _text(row[col])
+                    code = dictionary.get(text)
+                    if code is None:
+                        code = new.get(text)
+                    if code is None:
+                        code = len(dictionary) + len(new)
+                        if code > DICT_MAX:
+                            missed.append([i, text])
+                            code = 0
+                        else:
+                            new[text] = code
+                    out.append(code)
+                if new:
+                    new_entries[name] = list(new)
+                    added.append((dictionary, new))
+            else:
+                encode, null = _ENCODERS[kind], NULLS[kind]
+                for i, row in enumerate(rows):
+                    q = encode(row[col])
+                    if q is _MISS:
+                        missed.append([i, _text(row[col])])
+                        q = null
+                    out.append(q)
+            if missed:
+                exceptions[name] = missed
+            if sys.byteorder == "big":
+                out.byteswap()
+            data = out.tobytes()
+            first = data[:out.itemsize]
+            constant = len(rows) > 1 and data == first * len(rows)
+            flags.append(constant)
+            arrays.append(first if constant else data)
+
+        meta = {}
+        if new_entries:
+            meta["dict"] = new_entries
+        if exceptions:
+            meta["exceptions"] = exceptions
+        meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8") if meta else b""
+        fixed = _ROWS.pack(len(rows), len(meta_bytes)) + bytes(flags)
+        parts = [fixed, meta_bytes, _pad(len(fixed) + len(meta_bytes))]
+        for data in arrays:
+            parts += [data, _pad(len(data))]
+        return b"".join(parts), added
+
+
+@dataclass
+class Chunk:
+    """An intact ROWS chunk: its first row in the log, row count, JSON block,
+    and per column the array offset and whether it holds a single value."""
+
+    start: int
+    rows: int
+    meta: Dict[str, Any]
+    offsets: List[int] = field(default_factory=list)
+    constant: List[bool] = field(default_factory=list)
+
+
+class ColumnarLog:
+    """A columnar log opened for reading (memory-mapped).
+
+    ``arrays(name)`` gives one numpy array per chunk, each a view into the
+    mapped file (a read-only broadcast of the one stored value where the
+    chunk holds a single value); ``column(name)`` gives the whole column (a view if the log
+    has one chunk, else one concatenated copy). dict columns hold codes into
+    ``dictionary(name)`` and nulls are stored as described in the module
+    docstring; values kept as text are in ``exceptions(name)``. ``to_csv``
+    needs no numpy. ``torn_bytes`` counts the bytes ignored after the last
+    intact chunk.
+    """
+
+    def __init__(self, path: os.PathLike):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            if os.fstat(f.fileno()).st_size < len(MAGIC) + _CHUNK.size:
+                raise ValueError(f"{self.path}: too short for a {FORMAT} log")
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._buf[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path}: not a {FORMAT} log")
+
+        self.header: Optional[Dict[str, Any]] = None
+        self.chunks: List[Chunk] = []
+        self.rows = 0
+        pos = len(MAGIC)
+        size = len(self._buf)
+        while pos + _CHUNK.size <= size:
+            tag, length, crc, _ = _CHUNK.unpack_from(self._buf, pos)
+            start = pos + _CHUNK.size
+            if start + length > size or zlib.crc32(self._buf[start:start + length]) != crc:
+                break
+            if tag == b"HEAD" and self.header is None:
+                self._read_header(start, length)
+            elif tag == b"ROWS" and self.header is not None:
+                self._read_rows(start)
+            else:
+                break
+            pos = start + length
+        if self.header is None:
+            raise ValueError(f"{self.path}: no intact {FORMAT} header")
+        self.torn_bytes = size - pos
+
+    def _read_header(self, start: int, length: int) -> None:
+        self.header = json.loads(self._buf[start:start + length].rstrip(b"\0"))
+        if self.header.get("format") != FORMAT:
+            raise ValueError(f"{self.path}: unsupported format {self.header.get('format')!r}")
+        self.fieldnames: List[str] = self.header["fieldnames"]
+        self.kinds: List[str] = self.header["kinds"]
+        self.info: Dict[str, Any] = self.header.get("info", {})
+        self._index = {name: i for i, name in enumerate(self.fieldnames)}
+        self._dictionaries: Dict[str, List[str]] = {
+            name: [""] for name, kind in zip(self.fieldnames, self.kinds) if kind == "dict"
+        }
+
+    def _read_rows(self, start: int) -> None:
+        n, meta_len = _ROWS.unpack_from(self._buf, start)
+        pos = start + _ROWS.size
+        flags = self._buf[pos:pos + len(self.kinds)]
+        pos += len(flags)
+        meta = json.loads(self._buf[pos:pos + meta_len]) if meta_len else {}
+        pos += meta_len + len(_pad(pos - start + meta_len))
+        chunk = Chunk(self.rows, n, meta, constant=[bool(flag) for flag in flags])
+        for kind, constant in zip(self.kinds, chunk.constant):
+            chunk.offsets.append(pos)
+            nbytes = (1 if constant else n) * array(_TYPECODES[kind]).itemsize
+            pos += nbytes + len(_pad(nbytes))
+        for name, entries in meta.get("dict", {}).items():
+            self._dictionaries[name].extend(entries)
+        self.chunks.append(chunk)
+        self.rows += n
+
+    def close(self) -> None:
+        """Unmap the file; arrays from ``arrays`` / ``column`` must be released first."""
+        self._buf.close()
+
+    def __enter__(self) -> "ColumnarLog":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def kind(self, name: str) -> str:
+        return self.kinds[self._index[name]]
+
+    def dictionary(self, name: str) -> List[str]:
+        return self._dictionaries[name]
+
+    def exceptions(self, name: str) -> Dict[int, str]:
+        """``{row: text}`` for the values of ``name`` kept as text."""
+        return {
+            chunk.start + i: text for chunk in self.chunks for i, text in chunk.meta.get("exceptions", {}).get(name, ())
+        }
+
+    def arrays(self, name: str) -> List[Any]:
+        if numpy is None:
+            raise RuntimeError("numpy is required to read columns as arrays")
+        col = self._index[name]
+        dtype = numpy.dtype(DTYPES[self.kinds[col]])
+        return [
+            numpy.broadcast_to(numpy.frombuffer(self._buf, dtype, 1, chunk.offsets[col]), chunk.rows)
+            if chunk.constant[col]
+            else numpy.frombuffer(self._buf, dtype, chunk.rows, chunk.offsets[col])
+            for chunk in self.chunks
+        ]
+
+    def column(self, name: str) -> Any:
+        parts = self.arrays(name)
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return numpy.empty(0, DTYPES[self.kind(name)])
+        return numpy.concatenate(parts)
+
+    def _values(self, chunk: Chunk, col: int) -> array:
+        values = array(_TYPECODES[self.kinds[col]])
+        start = chunk.offsets[col]
+        values.frombytes(self._buf[start:start + (1 if chunk.constant[col] else chunk.rows) * values.itemsize])
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values * chunk.rows if chunk.constant[col] else values
+
+    def text_rows(self) -> Iterator[Tuple[str, ...]]:
+        """Every row as the CSV text of its fields."""
+        formatters = [
+            self._dictionaries[name].__getitem__ if kind == "dict" else _FORMATTERS[kind]
+            for name, kind in zip(self.fieldnames, self.kinds)
+        ]
+        for chunk in self.chunks:
+            columns = [list(map(fmt, self._values(chunk, col))) for col, fmt in enumerate(formatters)]
+            for name, items in chunk.meta.get("exceptions", {}).items():
+                column = columns[self._index[name]]
+                for i, text in items:
+                    column[i] = text
+            yield from zip(*columns)
+
+    def to_csv(self, out_path: Optional[os.PathLike] = None) -> Path:
+        """Write the rows as the task's wide CSV (default ``<stem>.csv`` next to the log)."""
+        out_path = Path(out_path) if out_path is not None else self.path.with_suffix(".csv")
+        with out_path.open("w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.fieldnames)
+            writer.writerows(self.text_rows())
+        return out_path
+
+    def describe(self) -> str:
+        kinds = ", ".join(f"{kind} {self.kinds.count(kind)}" for kind in KINDS if kind in self.kinds)
+        dicts = ", ".join(f"{name} {len(entries) - 1}" for name, entries in self._dictionaries.items() if len(entries) > 2)
+        lines = [
+            f"{self.path}: {self.rows} rows in {len(self.chunks)} chunks, {len(self._buf)} bytes"
+            + (f" ({self.torn_bytes} torn bytes at the end ignored)" if self.torn_bytes else ""),
+            f"  columns: {kinds}",
+        ]
+        if dicts:
+            lines.append(f"  dictionary entries: {dicts}")
+        return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Binary columnar task event logs")
+    sub = p.add_subparsers(dest="command", required=True)
+    i = sub.add_parser("info", help="row, chunk and dictionary counts")
+    i.add_argument("log", nargs="+")
+    c = sub.add_parser("to-csv", help="convert to the task's wide CSV")
+    c.add_argument("log", nargs="+")
+    c.add_argument("--out", type=str, default=None, help="output CSV (one log only; default <stem>.csv)")
+    args = p.parse_args(argv)
+
+    if args.command == "to-csv" and args.out and len(args.log) > 1:
+        p.error("--out takes a single log")
+    status = 0
+    for path in args.log:
+        try:
+            with ColumnarLog(path) as log:
+                if args.command == "info":
+                    print(log.describe())
+                else:
+                    print(f"[INFO] wrote {log.to_csv(args.out)} ({log.rows} rows)")
+                    if log.torn_bytes:
+                        print(f"[WARN] {path}: ignored {log.torn_bytes} bytes after the last intact chunk")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[ERROR] {path}: {e}", file=sys.stderr)
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
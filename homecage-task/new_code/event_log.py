@@ -0,0 +1,214 @@
+"""
+Session-header + delta layout for the two-choice event logs.
+
+Most CSV_FIELDNAMES columns never change within a session (start_iso, seed,
+walk/schedule hash, walk parameters, the rects, ...). With ``--log-layout
+delta`` a task writes them once and keeps only the varying columns per event:
+
+  <stem>_header.json   format, the wide column order, the constant columns
+                       (as their CSV text) and the events file's columns
+  <stem>_events.csv    one row per event, varying columns only, plus
+                       ``_overrides``: a JSON object of constant columns whose
+                       value differs on that row (normally empty)
+
+``expand`` streams the pair back into the wide ``<stem>.csv`` the default
+layout writes, byte for byte:
+
+  python event_log.py expand out/prl_log_20260101_100000_header.json
+
+``--log-layout columnar`` writes the binary format in columnar_log.py.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import sys
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import columnar_log
+from log_writer import CsvLogWriter
+from touch_task_runner import RowEncoder
+
+LAYOUTS = ("wide", "delta", "columnar")
+HEADER_FORMAT = "hc-task-delta/1"
+OVERRIDES = "_overrides"
+
+
+def header_path(log_path) -> Path:
+    log_path = Path(log_path)
+    return log_path.with_name(log_path.stem + "_header.json")
+
+
+def events_path(log_path) -> Path:
+    log_path = Path(log_path)
+    return log_path.with_name(log_path.stem + "_events.csv")
+
+
+def session_log_path(layout: str, log_path) -> Path:
+    """The file a session logged in ``layout`` under ``log_path`` is read from:
+    the wide CSV itself, the delta session header or the ``.hclog``."""
+    if layout == "delta":
+        return header_path(log_path)
+    if layout == "columnar":
+        return columnar_log.columnar_path(log_path)
+    if layout != "wide":
+        raise ValueError(f"log layout must be one of {LAYOUTS}")
+    return Path(log_path)
+
+
+def _csv_text(value: Any) -> str:
+    # What csv.writer writes for a value: None as "", anything else as str().
+    return "" if value is None else str(value)
+
+
+class DeltaRowEncoder(RowEncoder):
+    """A ``RowEncoder`` whose lines carry only the columns that vary.
+
+    ``static`` columns are set once, as for ``RowEncoder``; ``steady``
+    columns are still assigned on every event (the rects) but are expected
+    to keep the value given here. Both go to the session header. A row whose
+    constant columns differ (compared by value) lists them in ``_overrides``.
+    """
+
+    def __init__(self, fieldnames: Sequence[str], static: Mapping[str, Any], steady: Mapping[str, Any]):
+        super().__init__(fieldnames, static)
+        constant = {**static, **steady}
+        self.constants = {name: _csv_text(constant[name]) for name in self.fieldnames if name in constant}
+        self.columns = [name for name in self.fieldnames if name not in constant]
+        if len(self.columns) < 2 or len(self.constants) < 2:
+            raise ValueError("the delta layout needs at least two constant and two varying columns")
+        self._varying = itemgetter(*(self.index[name] for name in self.columns))
+        self._constant_names = list(self.constants)
+        self._constant = itemgetter(*(self.index[name] for name in self._constant_names))
+        reference = self.row()
+        for name, value in steady.items():
+            reference[self.index[name]] = value
+        self._expected = self._constant(reference)
+
+    def header(self) -> Dict[str, Any]:
+        return {
+            "format": HEADER_FORMAT,
+            "fieldnames": self.fieldnames,
+            "constants": self.constants,
+            "columns": self.columns + [OVERRIDES],
+        }
+
+    def encode(self, row: Sequence[Any]) -> str:
+        values = self._constant(row)
+        overrides = ""
+        if values != self._expected:
+            changed = {
+                name: _csv_text(value)
+                for name, value, expected in zip(self._constant_names, values, self._expected)
+                if value != expected
+            }
+            overrides = json.dumps(changed, separators=(",", ":"))
+        return super().encode((*self._varying(row), overrides))
+
+
+def open_event_log(
+    layout: str,
+    log_path,
+    fieldnames: Sequence[str],
+    static: Mapping[str, Any],
+    steady: Mapping[str, Any],
+    info: Optional[Mapping[str, Any]] = None,
+    fsync_s: Optional[float] = None,
+) -> Tuple[CsvLogWriter, RowEncoder]:
+    """The background writer and row encoder for a task log in ``layout``.
+
+    ``wide`` writes ``log_path`` as before. ``delta`` writes the session
+    header (with ``info``, e.g. the task name) next to it, then streams the
+    events file. ``columnar`` writes ``<stem>.hclog`` (``info`` goes in its
+    header). ``fsync_s`` is passed to the writer (see log_writer).
+    """
+    if layout == "wide":
+        return CsvLogWriter(log_path, fieldnames, fsync_s=fsync_s), RowEncoder(fieldnames, static)
+    if layout == "columnar":
+        return (
+            columnar_log.ColumnarLogWriter(
+                columnar_log.columnar_path(log_path), fieldnames, info=info, fsync_s=fsync_s
+            ),
+            columnar_log.ColumnarRowEncoder(fieldnames, static),
+        )
+    if layout != "delta":
+        raise ValueError(f"log layout must be one of {LAYOUTS}")
+    encoder = DeltaRowEncoder(fieldnames, static, steady)
+    header = dict(encoder.header(), wide=Path(log_path).name, events=events_path(log_path).name, info=dict(info or {}))
+    with header_path(log_path).open("w", encoding="utf-8") as f:
+        f.write(json.dumps(header, indent=2) + "\n")
+        if fsync_s is not None:
+            f.flush()
+            os.fsync(f.fileno())
+    return CsvLogWriter(events_path(log_path), header["columns"], fsync_s=fsync_s), encoder
+
+
+def load_header(header_file) -> Dict[str, Any]:
+    """A session header, checked to be one this module wrote."""
+    header_file = Path(header_file)
+    header = json.loads(header_file.read_text(encoding="utf-8"))
+    if header.get("format") != HEADER_FORMAT:
+        raise ValueError(f"{header_file}: not a {HEADER_FORMAT} session header")
+    return header
+
+
+def wide_rows(header: Mapping[str, Any], events: Iterable[Sequence[str]]) -> Iterator[List[str]]:
+    """Rows of the events file (after its column row) as wide CSV rows, in ``fieldnames`` order."""
+    fieldnames: List[str] = header["fieldnames"]
+    slots = [fieldnames.index(name) for name in header["columns"][:-1]]
+    template = [header["constants"].get(name, "") for name in fieldnames]
+    for values in events:
+        row = list(template)
+        for i, value in zip(slots, values):
+            row[i] = value
+        if values[-1]:
+            for name, value in json.loads(values[-1]).items():
+                row[fieldnames.index(name)] = value
+        yield row
+
+
+def expand(header_file, out_path=None) -> Path:
+    """Rebuild the wide CSV from a session header and its events file, one row at a time."""
+    header_file = Path(header_file)
+    header = load_header(header_file)
+    out_path = Path(out_path) if out_path is not None else header_file.with_name(header["wide"])
+
+    with header_file.with_name(header["events"]).open(newline="", encoding="utf-8") as src, out_path.open(
+        "w", newline="", encoding="utf-8"
+    ) as dst:
+        reader = csv.reader(src)
+        if next(reader) != header["columns"]:
+            raise ValueError(f"{src.name}: columns do not match the session header")
+        writer = csv.writer(dst)
+        writer.writerow(header["fieldnames"])
+        writer.writerows(wide_rows(header, reader))
+    return out_path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Session-header + delta event logs")
+    sub = p.add_subparsers(dest="command", required=True)
+    e = sub.add_parser("expand", help="rebuild the wide CSV from <stem>_header.json and <stem>_events.csv")
+    e.add_argument("header", nargs="+", help="session header JSON file(s)")
+    e.add_argument("--out", type=str, default=None, help="output CSV (one header only; default <stem>.csv)")
+    args = p.parse_args(argv)
+
+    if args.out and len(args.header) > 1:
+        p.error("--out takes a single header")
+    status = 0
+    for path in args.header:
+        try:
+            print(f"[INFO] wrote {expand(path, args.out)}")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[ERROR] {path}: {e}", file=sys.stderr)
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import argparse
+import heapq
+import itertools
+import os
+import random
+import select
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from arduino_link import decode_frame, encode_frame
+
+try:
+    import tty
+except ImportError:
+    tty = None
+
+MICROS_WRAP = 1 << 32
+
+
+@dataclass(frozen=True)
+class EmulatedPulse:
+    host_t: float
+    arduino_us: int
+    seq: int
+    pulse_index: int
+
+
+@dataclass(frozen=True)
+class EmulatedMarker:
+    host_t: float
+    arduino_us: int
+    seq: int
+    code: int
+
+
+@dataclass(frozen=True)
+class EmulatedEdge:
+    host_t: float
+    arduino_us: int
+    index: int
+    level: int
+
+
+class FakeArduino:
+    """Pseudo-terminal stand-in for ``pd_ttl.ino``.
+
+    Point ``ArduinoTTLSender`` (or a task's ``--serial-port``) at ``port``.
+    Responses are delayed by ``latency_s`` plus ``[0, jitter_s)``, and each
+    outgoing/incoming byte is dropped with ``drop_rate``/``rx_drop_rate``.
+    All randomness comes from ``seed``. With ``link_path`` the port is exposed
+    through a symlink that survives ``reconnect()``, like a udev alias.
+    Call ``set_light`` to drive the photodiode input.
+    """
+
+    def __init__(
+        self,
+        firmware: str = "v2",
+        latency_s: float = 0.0005,
+        jitter_s: float = 0.0,
+        drop_rate: float = 0.0,
+        rx_drop_rate: float = 0.0,
+        drift_ppm: float = 0.0,
+        pulse_width_ms: float = 5.0,
+        disconnect_after_pulses: Optional[int] = None,
+        seed: int = 0,
+        link_path: Optional[str] = None,
+        clock=time.perf_counter,
+    ):
+        if firmware not in ("v2", "legacy"):
+            raise ValueError("firmware must be v2 or legacy")
+        if tty is None or not hasattr(os, "openpty"):
+            raise RuntimeError("FakeArduino needs a POSIX pseudo-terminal")
+
+        self.firmware = firmware
+        self.latency_s = max(0.0, float(latency_s))
+        self.jitter_s = max(0.0, float(jitter_s))
+        self.drop_rate = float(drop_rate)
+        self.rx_drop_rate = float(rx_drop_rate)
+        self.drift_ppm = float(drift_ppm)
+        self.pulse_width_us = int(float(pulse_width_ms) * 1000)
+        self.disconnect_after_pulses = disconnect_after_pulses
+        self.link_path = link_path
+        self.clock = clock
+        self.rng = random.Random(seed)
+
+        self.pulses: List[EmulatedPulse] = []
+        self.markers: List[EmulatedMarker] = []
+        self.edges: List[EmulatedEdge] = []
+        self.photodiode_enabled = False
+        self.light = 0
+        self.received: List[bytes] = []
+        self.connected = False
+
+        self._boot_t = clock()
+        self._busy_until = 0.0
+        self._events = []
+        self._event_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._master = None
+        self._slave = None
+        self._slave_name = None
+        self._rx = bytearray()
+
+    @property
+    def port(self) -> str:
+        return self.link_path if self.link_path else self._slave_name
+
+    def micros(self, host_t: Optional[float] = None) -> int:
+        t = self.clock() if host_t is None else host_t
+        return int((t - self._boot_t) * (1.0 + self.drift_ppm * 1e-6) * 1e6) % MICROS_WRAP
+
+    def start(self) -> "FakeArduino":
+        self._open_pty()
+        self._thread = threading.Thread(target=self._run, name="fake-arduino", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+        self.disconnect()
+        if self.link_path and os.path.islink(self.link_path):
+            os.unlink(self.link_path)
+
+    def __enter__(self) -> "FakeArduino":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def disconnect(self) -> None:
+        """Drop the link as a USB reset would; the host side starts failing I/O."""
+        with self._lock:
+            for fd in (self._master, self._slave):
+                if fd is not None:
+                    try:
+                        os.close(fd)
+                    except OSError:
+                        pass
+            self._master = None
+            self._slave = None
+            self._events.clear()
+            self._rx.clear()
+            self.connected = False
+            self.photodiode_enabled = False
+
+    def reconnect(self) -> None:
+        """Re-enumerate on a fresh pty; ``link_path`` is repointed at it."""
+        self.disconnect()
+        self._boot_t = self.clock()
+        self._busy_until = 0.0
+        self._open_pty()
+
+    def set_light(self, level: int, host_t: Optional[float] = None) -> None:
+        """Change what the photodiode sees; reported as ``$L`` while enabled."""
+        level = 1 if level else 0
+        with self._lock:
+            if level == self.light:
+                return
+            self.light = level
+            if not self.photodiode_enabled or self._master is None:
+                return
+            now = self.clock() if host_t is None else host_t
+            edge = EmulatedEdge(now, self.micros(now), len(self.edges), level)
+            self.edges.append(edge)
+            self._send_later(now, encode_frame("L", edge.index, level, edge.arduino_us))
+
+    def _open_pty(self) -> None:
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        with self._lock:
+            self._master, self._slave = master, slave
+            self._slave_name = os.ttyname(slave)
+            self.connected = True
+        if self.link_path:
+            tmp = self.link_path + ".tmp"
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+            os.symlink(self._slave_name, tmp)
+            os.replace(tmp, self.link_path)
+
+    def _delay(self) -> float:
+        return self.latency_s + (self.rng.random() * self.jitter_s if self.jitter_s > 0 else 0.0)
+
+    def _schedule(self, due_t: float, kind: str, payload) -> None:
+        heapq.heappush(self._events, (due_t, next(self._event_ids), kind, payload))
+
+    def _send_later(self, now: float, frame: bytes) -> None:
+        self._schedule(now + self._delay(), "send", frame)
+
+    def _write(self, data: bytes) -> None:
+        if self.drop_rate > 0:
+            data = bytes(b for b in data if self.rng.random() >= self.drop_rate)
+        if data and self._master is not None:
+            try:
+                os.write(self._master, data)
+            except OSError:
+                pass
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                master = self._master
+                next_due = self._events[0][0] if self._events else None
+            if master is None:
+                self._stop.wait(0.01)
+                continue
+
+            timeout = 0.02
+            if next_due is not None:
+                timeout = min(timeout, max(0.0, next_due - self.clock()))
+            try:
+                readable, _, _ = select.select([master], [], [], timeout)
+            except (OSError, ValueError):
+                continue
+
+            with self._lock:
+                if self._master is None:
+                    continue
+                if readable:
+                    try:
+                        data = os.read(self._master, 4096)
+                    except OSError:
+                        data = b""
+                    self._feed(data)
+                drop_link = self._fire_due_events()
+            if drop_link:
+                self.disconnect()
+
+    def _feed(self, data: bytes) -> None:
+        if self.rx_drop_rate > 0:
+            data = bytes(b for b in data if self.rng.random() >= self.rx_drop_rate)
+        self._rx.extend(data)
+        while True:
+            nl = self._rx.find(b"\n")
+            if nl < 0:
+                return
+            line = bytes(self._rx[:nl]).strip()
+            del self._rx[:nl + 1]
+            if line:
+                self.received.append(line)
+                self._handle_line(line, self.clock())
+
+    def _handle_line(self, line: bytes, now: float) -> None:
+        if line == b"PULSE":
+            start = max(now, self._busy_until)
+            self._start_train(start, 0, 1, self.pulse_width_us, 0, ack=False)
+            return
+        if self.firmware != "v2" or not line.startswith(b"$"):
+            return
+
+        fields = decode_frame(line)
+        if fields is None:
+            self._send_later(now, encode_frame("E", 0, "CHECKSUM"))
+            return
+
+        if fields == ["V?"]:
+            self._send_later(now, encode_frame("V", 2))
+        elif fields[0] == "S" and len(fields) == 2:
+            self._send_later(now, encode_frame("S", fields[1], self.micros(now)))
+        elif fields[0] == "M" and len(fields) == 3:
+            seq, code = int(fields[1]), int(fields[2]) & 0x0F
+            us = self.micros(now)
+            self.markers.append(EmulatedMarker(now, us, seq, code))
+            self._send_later(now, encode_frame("K", seq, code, us))
+        elif fields[0] == "D" and len(fields) == 2:
+            self.photodiode_enabled = fields[1] != "0"
+            self._send_later(now, encode_frame("D", 1 if self.photodiode_enabled else 0))
+        elif fields[0] == "P" and len(fields) == 5:
+            seq, count, width_us, interval_us = (int(f) for f in fields[1:])
+            if now < self._busy_until:
+                self._send_later(now, encode_frame("E", seq, "BUSY"))
+                return
+            self._start_train(now, seq, count, width_us, interval_us, ack=True)
+        else:
+            self._send_later(now, encode_frame("E", 0, "UNKNOWN"))
+
+    def _start_train(self, start: float, seq: int, count: int, width_us: int, interval_us: int, ack: bool) -> None:
+        width_us = max(100, width_us)
+        interval_us = max(interval_us, width_us + 100)
+        for i in range(count):
+            self._schedule(start + i * interval_us / 1e6, "pulse", (seq, i, ack))
+        if count > 0:
+            self._busy_until = start + ((count - 1) * interval_us + width_us) / 1e6
+
+    def _fire_due_events(self) -> bool:
+        now = self.clock()
+        while self._events and self._events[0][0] <= now:
+            _due, _id, kind, payload = heapq.heappop(self._events)
+            if kind == "send":
+                self._write(payload)
+            elif kind == "pulse":
+                seq, i, ack = payload
+                t = self.clock()
+                us = self.micros(t)
+                self.pulses.append(EmulatedPulse(t, us, seq, i))
+                if ack:
+                    self._send_later(t, encode_frame("A", seq, i, us))
+                limit = self.disconnect_after_pulses
+                if limit is not None and len(self.pulses) >= limit:
+                    self.disconnect_after_pulses = None
+                    return True
+        return False
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(description="Pseudo-terminal emulator of the pd_ttl Arduino sketch")
+    p.add_argument("--firmware", choices=["v2", "legacy"], default="v2")
+    p.add_argument("--latency-ms", type=float, default=0.5)
+    p.add_argument("--jitter-ms", type=float, default=0.0)
+    p.add_argument("--drop-rate", type=float, default=0.0)
+    p.add_argument("--rx-drop-rate", type=float, default=0.0)
+    p.add_argument("--drift-ppm", type=float, default=0.0)
+    p.add_argument("--disconnect-after-pulses", type=int, default=None)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--link", type=str, default="/tmp/fake_arduino", help="stable symlink to pass as --serial-port")
+    return p.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    fake = FakeArduino(
+        firmware=args.firmware,
+        latency_s=args.latency_ms / 1000.0,
+        jitter_s=args.jitter_ms / 1000.0,
+        drop_rate=args.drop_rate,
+        rx_drop_rate=args.rx_drop_rate,
+        drift_ppm=args.drift_ppm,
+        disconnect_after_pulses=args.disconnect_after_pulses,
+        seed=args.seed,
+        link_path=str(Path(args.link).absolute()),
+    )
+    with fake:
+        print(f"[INFO] fake Arduino ({args.firmware}) on {fake.port} -> {fake._slave_name}; Ctrl-C to stop")
+        try:
+            while True:
+                time.sleep(1.0)
+                print(f"[INFO] pulses={len(fake.pulses)} connected={fake.connected}", file=sys.stderr)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+Repair task logs after a crash or power cut, and rebuild the session summary.
+
+A power cut can leave a log whose last row is cut short, or followed by
+zero bytes the filesystem allocated but never wrote, and a session that
+never reached SESSION_END has no summary row.
+
+``repair`` truncates a CSV (wide, or a delta ``_events.csv``) after its
+last complete row, or a ``.hclog`` after its last intact chunk. The bytes
+it cuts are appended to ``<name>.torn``, so nothing is thrown away. A wide
+CSV without SESSION_END then gets a reconstructed one, with stop_reason
+``recovered``. That row holds the columns that are the same on every row,
+the time of the last row and the totals where the task's own summary row
+has them (object_explore).
+
+``summary`` recomputes the counts a task prints when it stops (choices,
+rewards, ...) from the event rows. It also counts the reward pulses
+actually emitted, for water-intake accounting.
+
+  python log_recovery.py repair out/prl_log_20260101_100000.csv
+  python log_recovery.py summary --json out/erc_log_m1_20260101_100000.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import columnar_log
+import event_log
+
+RECOVERED = "recovered"
+TWO_CHOICE_OUTCOMES = ("choice", "correct", "incorrect")
+
+
+def torn_path(path) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".torn")
+
+
+def _parse_record(record: bytes) -> Optional[List[str]]:
+    if b"\0" in record:
+        return None
+    try:
+        text = record.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    rows = list(csv.reader(io.StringIO(text, newline="")))
+    return rows[0] if len(rows) == 1 else None
+
+
+def complete_csv(data: bytes) -> Tuple[int, Optional[List[str]]]:
+    """``(end, header)``: the offset just after the last complete row of
+    CSV ``data``, and its header row (None if even that is incomplete).
+
+    A row is complete when it ends in a newline outside quotes, decodes as
+    UTF-8, has no NUL bytes and has as many fields as the header; scanning
+    stops at the first row that is not.
+    """
+    end = start = pos = quotes = 0
+    header: Optional[List[str]] = None
+    while True:
+        nl = data.find(b"\n", pos)
+        if nl < 0:
+            break
+        quotes += data.count(b'"', pos, nl + 1)
+        pos = nl + 1
+        if quotes % 2:
+            continue
+        fields = _parse_record(data[start:pos])
+        if fields is None or (header is not None and len(fields) != len(header)):
+            break
+        if header is None:
+            header = fields
+        end = start = pos
+        quotes = 0
+    return end, header
+
+
+def read_rows(path) -> Tuple[List[str], Iterator[Dict[str, str]]]:
+    """``(fieldnames, rows)`` of a task log as CSV text.
+
+    Takes a wide CSV, a delta ``_header.json`` or ``_events.csv``, or a
+    ``.hclog``; a torn tail is left out.
+    """
+    path = Path(path)
+    if path.suffix == columnar_log.SUFFIX:
+        log = columnar_log.ColumnarLog(path)
+        return log.fieldnames, (dict(zip(log.fieldnames, row)) for row in log.text_rows())
+    if path.name.endswith("_events.csv"):
+        header_file = path.with_name(path.name[:-len("_events.csv")] + "_header.json")
+        if header_file.exists():
+            path = header_file
+    if path.name.endswith("_header.json"):
+        header = event_log.load_header(path)
+        columns, events = _csv_rows(path.with_name(header["events"]))
+        if columns != header["columns"]:
+            raise ValueError(f"{header['events']}: columns do not match the session header")
+        fieldnames = header["fieldnames"]
+        return fieldnames, (dict(zip(fieldnames, row)) for row in event_log.wide_rows(header, events))
+    fieldnames, rows = _csv_rows(path)
+    return fieldnames, (dict(zip(fieldnames, row)) for row in rows)
+
+
+def _csv_rows(path: Path) -> Tuple[List[str], Iterator[List[str]]]:
+    data = path.read_bytes()
+    end, header = complete_csv(data)
+    if header is None:
+        raise ValueError(f"{path}: no complete header row")
+    reader = csv.reader(io.StringIO(data[:end].decode("utf-8"), newline=""))
+    next(reader)
+    return header, reader
+
+
+def summarize(fieldnames: List[str], rows: Iterable[Mapping[str, str]]) -> Dict[str, Any]:
+    """End-of-session counts recomputed from a task log's rows.
+
+    Always: rows, duration_s (last rel_s), session_end, stop_reason. prl /
+    restless_bandit: choices, correct / incorrect (prl), outside_failures,
+    rewards (rewarded choices, less REWARD_TTL_FAIL rows, plus a trailing
+    REWARD_INTENT whose choice row was lost), reward_pulses,
+    reward_pulses_unacked and reward_pulse_failures. object_explore: trials, rewards (REWARD_TTL),
+    omissions (ERC), touches and the fov_cumul_* counts (FOV).
+    """
+    fields = set(fieldnames)
+    two_choice = "trial_outcome" in fields
+    erc = "reward_given" in fields
+    cumul = [name for name in fieldnames if name.startswith("fov_cumul_")]
+    summary: Dict[str, Any] = {"rows": 0, "duration_s": 0.0, "session_end": False, "stop_reason": ""}
+    if two_choice:
+        summary.update(
+            choices=0, outside_failures=0, rewards=0, reward_pulses=0, reward_pulses_unacked=0, reward_pulse_failures=0
+        )
+        if "is_correct" in fields:
+            summary.update(correct=0, incorrect=0)
+    if erc:
+        summary.update(trials=0, rewards=0, omissions=0)
+    if "touch_id" in fields:
+        summary["touches"] = 0
+    summary.update((name, 0) for name in cumul)
+    intent = False
+
+    for row in rows:
+        summary["rows"] += 1
+        event = row.get("event", "")
+        if row.get("rel_s"):
+            summary["duration_s"] = float(row["rel_s"])
+        if event == "SESSION_END":
+            summary["session_end"] = True
+            summary["stop_reason"] = row.get("stop_reason", "")
+        if two_choice:
+            outcome = row.get("trial_outcome", "")
+            if event == "REWARD_INTENT":
+                intent = True
+            if outcome in TWO_CHOICE_OUTCOMES:
+                intent = False
+                summary["choices"] += 1
+                if outcome in ("correct", "incorrect") and "correct" in summary:
+                    summary[outcome] += 1
+                if row.get("reward_delivered") == "1":
+                    summary["rewards"] += 1
+            elif outcome == "outside":
+                summary["outside_failures"] += 1
+            if event == "REWARD_TTL_FAIL":
+                # None of the train's pulses reached the port (task_common.RewardLedger).
+                summary["rewards"] -= 1
+            elif event == "REWARD_PULSE":
+                summary["reward_pulses"] += 1
+            elif event == "REWARD_PULSE_UNACKED":
+                summary["reward_pulses_unacked"] += 1
+            elif event.startswith("REWARD_PULSE_"):
+                summary["reward_pulse_failures"] += 1
+        if erc:
+            if event == "REWARD_TTL":
+                summary["rewards"] += 1
+            elif event == "OMISSION":
+                summary["omissions"] += 1
+            summary["trials"] = max(summary["trials"], _int(row.get("trial_num")))
+        if "touches" in summary:
+            summary["touches"] = max(summary["touches"], _int(row.get("touch_id")))
+        for name in cumul:
+            if row.get(name):
+                summary[name] = _int(row[name])
+    if intent:
+        # Cut off between the reward and its choice row: the pulses were
+        # already on their way.
+        summary["rewards"] += 1
+    return summary
+
+
+def _int(text: Optional[str]) -> int:
+    try:
+        return int(text or 0)
+    except ValueError:
+        return 0
+
+
+def describe_summary(summary: Mapping[str, Any]) -> str:
+    return "; ".join(
+        f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}" for key, value in summary.items()
+    )
+
+
+def summary_row(fieldnames: List[str], rows: List[Mapping[str, str]], summary: Mapping[str, Any]) -> Dict[str, str]:
+    """A SESSION_END row reconstructed for a log that has none."""
+    last = rows[-1] if rows else {}
+    row = {
+        name: rows[0].get(name, "") if rows and all(r.get(name) == rows[0].get(name) for r in rows) else ""
+        for name in fieldnames
+    }
+    duration = last.get("rel_s", "")
+    row.update({
+        "iso": last.get("iso", ""),
+        "rel_s": duration,
+        "event": "SESSION_END",
+        "stop_reason": RECOVERED,
+    })
+    # The totals object_explore's own summary rows carry.
+    totals = {
+        "total_trials": summary.get("trials"),
+        "trial_num": summary.get("trials"),
+        "total_touches": summary.get("touches"),
+        "touch_id": summary.get("touches"),
+        "total_rewards": summary.get("rewards"),
+        "omission_count": summary.get("omissions"),
+        "session_duration_s": duration,
+        "fov_elapsed_s": duration,
+        **{name: summary.get(name) for name in fieldnames if name.startswith("fov_cumul_")},
+    }
+    for name, value in totals.items():
+        if name in row and value is not None:
+            row[name] = str(value)
+    return {name: row[name] for name in fieldnames}
+
+
+@dataclass
+class Repair:
+    """What ``repair`` found and did to one log."""
+
+    path: Path
+    rows: int = 0
+    torn_bytes: int = 0
+    summary: Dict[str, Any] = field(default_factory=dict)
+    summary_row_added: bool = False
+    dry_run: bool = False
+
+    def describe(self) -> str:
+        verb = "would " if self.dry_run else ""
+        parts = [f"{self.path}: {self.rows} rows"]
+        if self.torn_bytes:
+            parts.append(f"{verb}cut {self.torn_bytes} torn bytes (to {torn_path(self.path).name})")
+        if self.summary_row_added:
+            parts.append(f"{verb}add a SESSION_END row (stop_reason={RECOVERED})")
+        if len(parts) == 1:
+            parts.append("intact")
+        return ", ".join(parts)
+
+
+def _cut(path: Path, end: int) -> None:
+    with path.open("r+b") as f:
+        tail = f.read()[end:]
+        with torn_path(path).open("ab") as torn:
+            torn.write(tail)
+            torn.flush()
+            os.fsync(torn.fileno())
+        f.truncate(end)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def repair(path, dry_run: bool = False, add_summary_row: bool = True) -> Repair:
+    """Cut a log's torn tail and, for a wide CSV, add a missing SESSION_END row."""
+    path = Path(path)
+    if path.name.endswith("_header.json"):
+        path = path.with_name(event_log.load_header(path)["events"])
+    result = Repair(path, dry_run=dry_run)
+
+    if path.suffix == columnar_log.SUFFIX:
+        with columnar_log.ColumnarLog(path) as log:
+            result.rows, result.torn_bytes = log.rows, log.torn_bytes
+            end = path.stat().st_size - log.torn_bytes
+            result.summary = summarize(log.fieldnames, (dict(zip(log.fieldnames, row)) for row in log.text_rows()))
+        if result.torn_bytes and not dry_run:
+            _cut(path, end)
+        return result
+
+    data = path.read_bytes()
+    end, header = complete_csv(data)
+    if header is None:
+        raise ValueError(f"{path}: no complete header row")
+    result.torn_bytes = len(data) - end
+    reader = csv.reader(io.StringIO(data[:end].decode("utf-8"), newline=""))
+    next(reader)
+    rows = [dict(zip(header, values)) for values in reader]
+    result.rows = len(rows)
+    result.summary = summarize(header, rows)
+    wide = "event" in header and event_log.OVERRIDES not in header
+    result.summary_row_added = add_summary_row and wide and not result.summary["session_end"]
+    if dry_run:
+        return result
+
+    if result.torn_bytes:
+        _cut(path, end)
+    if result.summary_row_added:
+        with path.open("a", newline="", encoding="utf-8") as f:
+            csv.DictWriter(f, fieldnames=header).writerow(summary_row(header, rows, result.summary))
+            f.flush()
+            os.fsync(f.fileno())
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Repair task logs and rebuild their session summary")
+    sub = p.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("repair", help="cut a torn tail; add a SESSION_END row to a wide CSV without one")
+    r.add_argument("log", nargs="+")
+    r.add_argument("--dry-run", action="store_true", help="report what would be done")
+    r.add_argument("--no-summary-row", action="store_true", help="do not add a reconstructed SESSION_END row")
+    s = sub.add_parser("summary", help="end-of-session counts recomputed from the event rows")
+    s.add_argument("log", nargs="+")
+    s.add_argument("--json", action="store_true", help="one JSON object per log")
+    args = p.parse_args(argv)
+
+    status = 0
+    for path in args.log:
+        try:
+            if args.command == "repair":
+                result = repair(path, dry_run=args.dry_run, add_summary_row=not args.no_summary_row)
+                print(f"[INFO] {result.describe()}")
+                if result.summary:
+                    print(f"[INFO]   {describe_summary(result.summary)}")
+            else:
+                summary = summarize(*read_rows(path))
+                if args.json:
+                    print(json.dumps({"log": str(path), **summary}))
+                else:
+                    print(f"[INFO] {path}: {describe_summary(summary)}")
+                if not summary["session_end"]:
+                    print(f"[WARN] {path}: no SESSION_END row; the session did not end cleanly", file=sys.stderr)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[ERROR] {path}: {e}", file=sys.stderr)
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,390 @@
+"""
+Task CSV logs written off the render thread.
+
+``CsvLogWriter.write(row)`` (a dict) or ``write_line(line)`` (a row already
+encoded, e.g. by ``touch_task_runner.RowEncoder``) only puts the row on a
+bounded queue; a writer thread takes whatever has accumulated (up to
+``batch_rows`` rows), writes it with one ``write`` call and flushes the
+file. A slow SD card then delays the writer thread, not the next frame. When the queue is full ``write``
+blocks until there is room (rows are never dropped) and counts a stall.
+
+Queued rows are drained by ``flush`` / ``close``, at interpreter exit, and on
+SIGTERM: while a writer is open and nothing else handles SIGTERM, the signal
+raises ``SystemExit`` in the main thread so the task's ``finally`` blocks run
+and close the log. (The tasks' ``SessionControl`` replaces that handler with
+a graceful stop while the session loop runs.)
+
+Flushed rows are still only in the page cache, which a power cut loses.
+With ``fsync_s`` the writer fsyncs the file (and its directory once, when it
+is created) within ``fsync_s`` of a row arriving, right after any row written
+with ``sync=True``, and on close. A row written with ``durable=True`` is
+synced the same way, but the call only returns once it is on disk. The
+tasks use that for the row logged before a reward is sent.
+``FsyncPolicy`` picks the synced rows from the tasks' event names
+(``--log-fsync``), and ``log_recovery.py`` repairs a log whose tail was
+cut short.
+"""
+
+from __future__ import annotations
+
+import atexit
+import csv
+import io
+import os
+import queue
+import signal
+import statistics
+import sys
+import threading
+import time
+import weakref
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Deque, Dict, Mapping, Optional, Sequence
+
+_CLOSE = object()
+_open_writers: "weakref.WeakSet[CsvLogWriter]" = weakref.WeakSet()
+_sigterm_previous: Any = None
+
+FSYNC_MODES = ("off", "interval", "reward", "trial")
+REWARD_EVENT_PREFIXES = ("REWARD_PULSE", "REWARD_TTL")
+TRIAL_END_EVENTS = frozenset({"TRIAL_END", "FAIL_OUTSIDE_LIMIT", "OMISSION"})
+
+
+@dataclass(frozen=True)
+class FsyncPolicy:
+    """Which task log rows are forced to disk (``--log-fsync``).
+
+    ``interval`` fsyncs within ``interval_s`` of a row; ``reward`` also
+    right after every reward row (REWARD_PULSE* / REWARD_TTL, or a choice
+    with ``reward_delivered`` / ``reward_given`` set) and ``trial`` after
+    every trial outcome as well. Every mode but ``off`` syncs SESSION_END.
+    """
+
+    mode: str = "reward"
+    interval_s: float = 10.0
+
+    def __post_init__(self):
+        if self.mode not in FSYNC_MODES:
+            raise ValueError(f"fsync mode must be one of {FSYNC_MODES}")
+        if not self.interval_s > 0:
+            raise ValueError("fsync interval must be positive")
+
+    @property
+    def fsync_s(self) -> Optional[float]:
+        """The writer's ``fsync_s`` for this policy."""
+        return None if self.mode == "off" else self.interval_s
+
+    def syncs(self, event_name: str, fields: Optional[Mapping[str, Any]] = None) -> bool:
+        """Whether the row for ``event_name`` (with its ``fields``) is written with ``sync=True``."""
+        if self.mode == "off":
+            return False
+        if event_name == "SESSION_END":
+            return True
+        if self.mode == "interval":
+            return False
+        fields = fields or {}
+        if event_name.startswith(REWARD_EVENT_PREFIXES) or any(
+            str(fields.get(key, "")) in ("1", "True") for key in ("reward_delivered", "reward_given")
+        ):
+            return True
+        return self.mode == "trial" and (event_name in TRIAL_END_EVENTS or bool(fields.get("trial_outcome")))
+
+
+class CsvLogWriter:
+    """A ``csv.DictWriter`` log whose rows are written by a background thread.
+
+    Rows must not be changed after ``write``. Unknown keys raise
+    ``ValueError`` in ``write``, as ``DictWriter.writerow`` would; a failed
+    disk write or fsync is raised by the next ``write``, ``flush`` or
+    ``close``. ``fsync_s`` (None: never fsync) is described in the module
+    docstring.
+    """
+
+    def __init__(
+        self,
+        path: os.PathLike,
+        fieldnames: Sequence[str],
+        max_queue: int = 4096,
+        batch_rows: int = 256,
+        fsync_s: Optional[float] = None,
+    ):
+        self.path = Path(path)
+        self.fieldnames = list(fieldnames)
+        self.max_queue = max(1, int(max_queue))
+        self.batch_rows = max(1, int(batch_rows))
+        self.rows_written = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.stalls = 0
+        self.error: Optional[BaseException] = None
+        # Seconds per batch (write + flush), and from the oldest row's
+        # write() to the end of its batch.
+        self.write_s: Deque[float] = deque(maxlen=4096)
+        self.max_lag_s = 0.0
+        self.fsync_s = fsync_s
+        self.fsyncs = 0
+        self.fsync_wait_s: Deque[float] = deque(maxlen=4096)
+        # When the oldest row not yet fsync'd reached the writer thread.
+        self._unsynced_since: Optional[float] = None
+        if fsync_s is not None:
+            self._idle_s = fsync_s if self._idle_s is None else min(self._idle_s, fsync_s)
+
+        self._fields = frozenset(self.fieldnames)
+        self._queue: "queue.Queue[Any]" = queue.Queue(self.max_queue)
+        self._open()
+        if fsync_s is not None:
+            os.fsync(self._f.fileno())
+            _fsync_dir(self.path.parent)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"log-writer:{self.path.name}", daemon=True)
+        self._thread.start()
+        _opened(self)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def write(self, row: Mapping[str, Any], sync: bool = False, durable: bool = False) -> None:
+        """Queue ``row``; with ``sync`` (and ``fsync_s`` set) it is fsync'd as soon as it is written.
+
+        ``durable`` also syncs the row and returns only once it is on disk
+        (fsync'd, or just flushed without ``fsync_s``).
+        """
+        self._raise_error()
+        if not self._fields.issuperset(row):
+            extra = sorted(set(row) - self._fields)
+            raise ValueError(f"dict contains fields not in fieldnames: {', '.join(map(repr, extra))}")
+        self._put((time.perf_counter(), row, sync or durable))
+        if durable:
+            self.flush()
+
+    def write_line(self, line: str, sync: bool = False, durable: bool = False) -> None:
+        """Queue one CSV line (with its line terminator) encoded for ``fieldnames``."""
+        self._raise_error()
+        self._put((time.perf_counter(), line, sync or durable))
+        if durable:
+            self.flush()
+
+    def _put(self, item) -> None:
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.stalls += 1
+            self._queue.put(item)
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every row written so far is on disk (flushed); False on timeout."""
+        if self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        ok = done.wait(timeout)
+        self._raise_error()
+        return ok
+
+    def close(self) -> None:
+        """Drain the queue, stop the writer thread and close the file."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        _closed(self)
+        self._raise_error()
+
+    def stats(self) -> Dict[str, float]:
+        write_ms = sorted(s * 1000.0 for s in self.write_s)
+        return {
+            "rows": self.rows_written,
+            "batches": self.batches,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "stalls": self.stalls,
+            "write_ms_p50": statistics.median(write_ms) if write_ms else 0.0,
+            "write_ms_max": write_ms[-1] if write_ms else 0.0,
+            "lag_ms_max": self.max_lag_s * 1000.0,
+            "fsyncs": self.fsyncs,
+            "fsync_ms_max": max(self.fsync_wait_s, default=0.0) * 1000.0,
+        }
+
+    def describe(self) -> str:
+        s = self.stats()
+        return (
+            f"{s['rows']} rows in {s['batches']} batches; queue max {s['max_depth']}/{self.max_queue}, "
+            f"{s['stalls']} stalls; write p50 {s['write_ms_p50']:.2f}ms max {s['write_ms_max']:.2f}ms; "
+            f"lag max {s['lag_ms_max']:.1f}ms"
+            + (f"; {s['fsyncs']} fsyncs, max {s['fsync_ms_max']:.1f}ms" if self.fsync_s is not None else "")
+        )
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _open(self) -> None:
+        """Open the file and write the header (on the calling thread)."""
+        self._f = self.path.open("w", newline="", encoding="utf-8")
+        self._buf = io.StringIO()
+        self._writer = csv.DictWriter(self._buf, fieldnames=self.fieldnames)
+        self._writer.writeheader()
+        self._write_text(self._take_buffer())
+
+    # Subclasses that hold rows back (columnar_log) set ``_idle_s`` to be
+    # woken by ``_idle`` while the queue is empty, and write them out in
+    # ``_sync``, which runs before a flush() returns, before an fsync and
+    # before closing.
+    _idle_s: Optional[float] = None
+
+    def _idle(self) -> None:
+        self._fsync_if_due()
+
+    def _sync(self) -> None:
+        pass
+
+    def _fsync_if_due(self) -> None:
+        if (
+            self.fsync_s is not None
+            and self._unsynced_since is not None
+            and time.perf_counter() - self._unsynced_since >= self.fsync_s
+        ):
+            self._sync()
+            self._fsync()
+
+    def _fsync(self) -> None:
+        if self._unsynced_since is None:
+            return
+        t = time.perf_counter()
+        try:
+            os.fsync(self._f.fileno())
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+                print(f"[WARN] log writer {self.path}: fsync: {e}", file=sys.stderr)
+            return
+        self.fsyncs += 1
+        self.fsync_wait_s.append(time.perf_counter() - t)
+        self._unsynced_since = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                items = [self._queue.get(timeout=self._idle_s)]
+            except queue.Empty:
+                self._idle()
+                continue
+            while len(items) < self.batch_rows:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [item for item in items if isinstance(item, tuple)]
+            if rows:
+                if self._unsynced_since is None:
+                    self._unsynced_since = time.perf_counter()
+                self._write_batch(rows)
+            events = [item for item in items if isinstance(item, threading.Event)]
+            closing = any(item is _CLOSE for item in items)
+            sync = self.fsync_s is not None and (closing or any(item[2] for item in rows))
+            if events or closing or sync:
+                self._sync()
+            if sync:
+                self._fsync()
+            else:
+                self._fsync_if_due()
+            for event in events:
+                event.set()
+            if closing:
+                break
+        try:
+            self._f.close()
+        except OSError as e:
+            self.error = self.error or e
+
+    def _take_buffer(self) -> str:
+        text = self._buf.getvalue()
+        self._buf.seek(0)
+        self._buf.truncate()
+        return text
+
+    def _write_text(self, text: str) -> None:
+        self._f.write(text)
+        self._f.flush()
+
+    def _write_batch(self, rows) -> None:
+        t = time.perf_counter()
+        try:
+            parts = []
+            for _, row, _ in rows:
+                if isinstance(row, str):
+                    parts.append(row)
+                else:
+                    self._writer.writerow(row)
+                    parts.append(self._take_buffer())
+            self._write_text("".join(parts))
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+                print(f"[WARN] log writer {self.path}: {e}", file=sys.stderr)
+            return
+        end = time.perf_counter()
+        self.rows_written += len(rows)
+        self.batches += 1
+        self.write_s.append(end - t)
+        self.max_lag_s = max(self.max_lag_s, end - rows[0][0])
+
+
+def _opened(writer: CsvLogWriter) -> None:
+    global _sigterm_previous
+    if not _open_writers and threading.current_thread() is threading.main_thread():
+        try:
+            if signal.getsignal(signal.SIGTERM) in (signal.SIG_DFL, None):
+                _sigterm_previous = signal.signal(signal.SIGTERM, _exit_on_sigterm)
+        except (ValueError, OSError):
+            pass
+    _open_writers.add(writer)
+
+
+def _closed(writer: CsvLogWriter) -> None:
+    global _sigterm_previous
+    _open_writers.discard(writer)
+    if _open_writers or _sigterm_previous is None:
+        return
+    if threading.current_thread() is threading.main_thread():
+        try:
+            if signal.getsignal(signal.SIGTERM) is _exit_on_sigterm:
+                signal.signal(signal.SIGTERM, _sigterm_previous)
+        except (ValueError, OSError):
+            pass
+    _sigterm_previous = None
+
+
+def _fsync_dir(path: Path) -> None:
+    """fsync a directory so a file just created in it survives a power cut (POSIX only)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _exit_on_sigterm(signum, frame) -> None:
+    raise SystemExit(128 + signum)
+
+
+@atexit.register
+def _drain_all() -> None:
+    for writer in list(_open_writers):
+        try:
+            writer.close()
+        except Exception as e:
+            print(f"[WARN] log writer {writer.path}: {e}", file=sys.stderr)
@@ -3,8 +3,8 @@
 # Object Explore Task: touchscreen interaction preference measurement for macaques.
 # Session types: ERC (equal-reward choice), PEC (probe-embedded choice),
 #                FOV (free-operant validation), ABA_A/ABA_B (ABA design phases).
-# Single self-contained file -- no imports from other project files.
-import argparse, csv, sys, time, math, random, array
+# Tones come from the shared cached sound bank (sound_bank.py).
+import argparse, sys, time, math, random
 from abc import ABC, abstractmethod
 from collections import deque
 from datetime import datetime
@@ -17,6 +17,13 @@ try:
 except ImportError:
     serial = None
 
+import log_writer
+import render_backend
+import session_control
+import sound_bank
+
+TONE_DECAY_RATE = 10.0  # exp(-10 t) envelope used by make_tone(decay=True)
+
 
 # =========================
 # Arduino TTL sender
@@ -46,28 +53,16 @@ class ArduinoTTLSender:
 # Beep sound
 # =========================
 def make_beep_sound(freq=1000, duration_ms=100, volume=0.6, sample_rate=44100):
-    n = int(sample_rate * duration_ms / 1000)
-    buf = array.array("h")
-    amp = int(32767 * max(0.0, min(volume, 1.0)))
-    for i in range(n):
-        t = i / sample_rate
-        buf.append(int(amp * math.sin(2 * math.pi * freq * t)))
-    return pygame.mixer.Sound(buffer=buf.tobytes())
+    return sound_bank.default_bank().sound(freq, duration_ms, volume, sample_rate=sample_rate)
 
 
 # =========================
 # Tone with optional decay
 # =========================
 def make_tone(freq=1000, duration_ms=100, volume=0.6, sample_rate=44100, decay=False):
-    n = int(sample_rate * duration_ms / 1000)
-    buf = array.array("h")
-    amp = int(32767 * max(0.0, min(volume, 1.0)))
-    for i in range(n):
-        t = i / sample_rate
-        envelope = math.exp(-t * 10) if decay else 1.0
-        val = int(amp * envelope * math.sin(2 * math.pi * freq * t))
-        buf.append(max(-32767, min(32767, val)))
-    return pygame.mixer.Sound(buffer=buf.tobytes())
+    return sound_bank.default_bank().sound(
+        freq, duration_ms, volume, decay=TONE_DECAY_RATE if decay else 0.0, sample_rate=sample_rate
+    )
 
 
 # =========================
@@ -121,6 +116,10 @@ class Interaction(ABC):
         self.active = False
         self.needs_redraw = False
 
+    def bounds(self):
+        """Screen area the interaction draws into now (its zone by default)."""
+        return self.zone_rect.copy()
+
     def draw_dimmed(self, screen):
         temp = pygame.Surface(self.zone_rect.size, pygame.SRCALPHA)
         old_rect = self.zone_rect.copy()
@@ -334,6 +333,13 @@ class SquashBlob(Interaction, tag="squash_blob"):
             pygame.draw.circle(screen, self.base_color,
                 (int(p["x"]), int(p["y"])), 5)
 
+    def bounds(self):
+        cx, cy = self.zone_rect.center
+        r = int(self.BLOB_RADIUS * (1 + self.SQUASH_AMOUNT)) + 1
+        rects = [pygame.Rect(cx - r, cy - r, 2 * r, 2 * r)]
+        rects += [pygame.Rect(int(p["x"]) - 6, int(p["y"]) - 6, 12, 12) for p in self.particles]
+        return self.zone_rect.unionall(rects)
+
     def reset(self):
         super().reset()
         self.sx = 1.0
@@ -433,6 +439,13 @@ class SoundBallSpawn(Interaction, tag="sound_ball"):
         for b in self.balls:
             pygame.draw.circle(screen, b["color"], (int(b["x"]), int(b["y"])), b["r"])
 
+    def bounds(self):
+        # A new ball starts at the touch, which may be in the hit margin.
+        return self.zone_rect.unionall([
+            pygame.Rect(int(b["x"]) - b["r"] - 1, int(b["y"]) - b["r"] - 1, 2 * b["r"] + 2, 2 * b["r"] + 2)
+            for b in self.balls
+        ])
+
     def reset(self):
         super().reset()
         self.balls = []
@@ -548,6 +561,13 @@ class BubblePond(Interaction, tag="bubble_pond"):
             pygame.draw.ellipse(screen, f["color"],
                 (int(f["x"]) - 15, int(f["y"]) - 8, 30, 16))
 
+    def bounds(self):
+        rects = []
+        for b in self.bubbles:
+            r = max(1, int(b["r"])) + 1
+            rects.append(pygame.Rect(int(b["x"]) - r, int(b["y"]) - r, 2 * r, 2 * r))
+        return self.zone_rect.unionall(rects)
+
     def reset(self):
         super().reset()
         self.bubbles.clear()
@@ -669,6 +689,10 @@ class ParticleAttractor(Interaction, tag="particle_attractor"):
                 color = self.base_colors[i]
             pygame.draw.circle(screen, color, (int(self.px[i]), int(self.py[i])), 3)
 
+    def bounds(self):
+        # Particles are kept inside the zone; their dots overhang it by the radius.
+        return self.zone_rect.inflate(8, 8)
+
     def reset(self):
         super().reset()
         self.touch_active = False
@@ -773,6 +797,83 @@ def create_interaction(tag, zone_rect, screen_size):
 # =========================
 # Main
 # =========================
+class _TrialTimers:
+    """``perf_counter`` times the trial loop measures its timeouts from.
+
+    ``shift(dt)`` moves every set time ``dt`` seconds later, so an operator
+    pause does not count against the trial.
+    """
+
+    def __init__(self):
+        self.present_onset_t = 0.0
+        self.interact_start_t = 0.0
+        self.last_touch_interact_t = 0.0
+        self.last_reward_t = 0.0
+        self.iti_end_time = 0.0
+        self.wait_release_enter_t = None
+        self.release_clear_start_t = None
+
+    def shift(self, dt):
+        self.present_onset_t += dt
+        self.interact_start_t += dt
+        self.last_touch_interact_t += dt
+        self.last_reward_t += dt
+        self.iti_end_time += dt
+        if self.wait_release_enter_t is not None:
+            self.wait_release_enter_t += dt
+        if self.release_clear_start_t is not None:
+            self.release_clear_start_t += dt
+
+
+class _DirtyFrames:
+    """Present per-frame redraws as dirty regions instead of full frames.
+
+    ``begin()`` clears what the last frame drew (the whole screen on the
+    first frame and after ``invalidate()``), ``mark(rect)`` records what
+    this frame draws and ``present()`` updates those regions plus the last
+    frame's. Frames drawn elsewhere must call ``invalidate()``. The
+    renderer backend cannot update part of the window, so it still gets
+    whole frames.
+    """
+
+    def __init__(self, canvas, screen, bg_rgb):
+        self.canvas = canvas
+        self.screen = screen
+        self.bg_rgb = bg_rgb
+        self.partial = canvas.partial_updates
+        self._last = None
+        self._rects = []
+
+    def invalidate(self):
+        self._last = None
+
+    def begin(self):
+        self._rects = []
+        if self._last is None or not self.partial:
+            self.screen.fill(self.bg_rgb)
+        else:
+            for rect in self._last:
+                self.screen.fill(self.bg_rgb, rect)
+
+    def mark(self, rect):
+        if rect is not None:
+            self._rects.append(pygame.Rect(rect))
+
+    def present(self):
+        if self._last is None or not self.partial:
+            self.canvas.present_surface(self.screen)
+        else:
+            self.canvas.update(self._last + self._rects)
+        self._last = self._rects
+
+
+def _close_csv_log(csv_log):
+    try:
+        csv_log.close()
+    except Exception as e:
+        print(f"[WARN] closing {csv_log.path}: {e}", file=sys.stderr)
+
+
 def run(args):
     pygame.init()
     try:
@@ -808,13 +909,17 @@ def run(args):
         pygame.event.set_blocked(pygame.MOUSEMOTION)
 
     ttl = None
-    csv_f = None
+    control = None
     try:
-        flags = pygame.FULLSCREEN if args.fullscreen else pygame.NOFRAME
-        screen = pygame.display.set_mode(
-            (0, 0) if args.fullscreen else (args.window_w, args.window_h), flags
+        # Objects are drawn in software either way (pygame.draw shapes);
+        # with the renderer each finished frame goes up as one texture.
+        canvas = render_backend.open_display(
+            args.render, (args.window_w, args.window_h), args.fullscreen, "Object Explore Task"
         )
-        pygame.display.set_caption("Object Explore Task")
+        if args.kiosk and canvas.backend == "renderer":
+            canvas.window.grab = True
+        screen = canvas.frame_surface()
+        print(f"[INFO] render backend: {canvas.describe()}")
         clock = pygame.time.Clock()
         font = pygame.font.SysFont(None, 24)
         sw, sh = screen.get_size()
@@ -833,6 +938,12 @@ def run(args):
             beep = None
             print(f"[WARN] beep disabled: {e}", file=sys.stderr)
 
+        # ---- Session control (signals / socket / STOP file) ----
+        control = session_control.SessionControl(
+            socket_path=args.control_socket, stop_file=args.stop_file or None
+        )
+        print(f"[INFO] session control: {control.describe()}")
+
         # ---- Route by session type ----
         effective_type = args.session_type
         if effective_type == "ABA_A":
@@ -842,10 +953,10 @@ def run(args):
 
         if effective_type == "FOV":
             _run_fov(args, screen, sw, sh, clock, font, ttl, beep,
-                     FINGERDOWN, FINGERUP, FINGERMOTION, MOUSEWHEEL)
+                     FINGERDOWN, FINGERUP, FINGERMOTION, MOUSEWHEEL, control, canvas)
         else:
             _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
-                             ttl, beep, FINGERDOWN, FINGERUP, FINGERMOTION, MOUSEWHEEL)
+                             ttl, beep, FINGERDOWN, FINGERUP, FINGERMOTION, MOUSEWHEEL, control, canvas)
 
     finally:
         try:
@@ -854,14 +965,16 @@ def run(args):
             pass
         if ttl is not None:
             ttl.close()
+        if control is not None:
+            control.close()
 
 
 # =========================
 # FOV session (free-operant)
 # =========================
 def _run_fov(args, screen, sw, sh, clock, font, ttl, beep,
-             FINGERDOWN, FINGERUP, FINGERMOTION, MOUSEWHEEL):
-    csv_f = None
+             FINGERDOWN, FINGERUP, FINGERMOTION, MOUSEWHEEL, control, canvas):
+    csv_log = None
     try:
         # ---- Pentagon layout ----
         fov_zone_size = max(50, int(args.fov_zone_size_px))
@@ -895,12 +1008,10 @@ def _run_fov(args, screen, sw, sh, clock, font, ttl, beep,
             "fov_cumul_bubble_pond", "fov_cumul_sound_ball",
             "fov_cumul_squash_blob", "fov_cumul_peekaboo",
             "fov_cumul_particle_attractor",
-            "total_touches", "session_duration_s",
+            "total_touches", "session_duration_s", "stop_reason",
         ]
-        csv_f = out_path.open("w", newline="", encoding="utf-8")
-        csv_w = csv.DictWriter(csv_f, fieldnames=fieldnames)
-        csv_w.writeheader()
-        write_count = 0
+        fsync_policy = log_writer.FsyncPolicy(args.log_fsync, args.log_fsync_s)
+        csv_log = log_writer.CsvLogWriter(out_path, fieldnames, fsync_s=fsync_policy.fsync_s)
 
         t0 = time.perf_counter()
         touch_id = 0
@@ -911,7 +1022,6 @@ def _run_fov(args, screen, sw, sh, clock, font, ttl, beep,
         active_fingers = set()
 
         def append_log(event_name, x, y, hit_tag=""):
-            nonlocal write_count
             nowp = time.perf_counter()
             rel = nowp - t0
             iso = datetime.now().isoformat(timespec="milliseconds")
@@ -935,54 +1045,78 @@ def _run_fov(args, screen, sw, sh, clock, font, ttl, beep,
                 "total_touches": touch_id,
                 "session_duration_s": "",
             }
-            csv_w.writerow(row)
-            write_count += 1
-            if write_count % 64 == 0:
-                csv_f.flush()
+            csv_log.write(row, sync=fsync_policy.syncs(event_name, row))
 
         append_log("SESSION_START", -1, -1)
 
         # ---- Initial draw ----
+        frames = _DirtyFrames(canvas, screen, args.bg_rgb)
         screen.fill(args.bg_rgb)
         for tag in INTERACTION_TAGS:
             interactions[tag].draw_preview(screen)
         if args.show_box:
             for tag in INTERACTION_TAGS:
                 pygame.draw.rect(screen, (120, 120, 120), zone_rects[tag], 2)
-        pygame.display.flip()
+        canvas.present_surface(screen)
 
         fov_max = max(60, int(args.fov_max_duration_s))
         fov_inactivity = max(30, int(args.fov_inactivity_timeout_s))
+        info_hud = render_backend.HudLine(font, (10, 10))
         running = True
-        stop_file = Path("STOP")
+        stop_reason = ""
+        paused = False
+        paused_at = 0.0
+        force_redraw = False
 
         while running:
-            if stop_file.exists():
-                print("[INFO] STOP file detected. Exiting...")
+            # FOV has no trials, so "finish the current trial" stops at once.
+            requested = control.stop_reason or control.finish_reason
+            if requested is not None:
+                print(f"[INFO] Stop requested ({requested}). Exiting...")
+                stop_reason = requested
                 running = False
                 break
 
             for ev in pygame.event.get([pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP]):
                 if ev.type == pygame.QUIT:
+                    stop_reason = "window_closed"
                     running = False; break
                 if ev.type in (pygame.KEYDOWN, pygame.KEYUP):
                     if ev.key in (pygame.K_ESCAPE, pygame.K_q):
+                        stop_reason = "quit_key"
                         running = False; break
             if not running: break
 
             pygame.event.pump()
             keys = pygame.key.get_pressed()
             if keys[pygame.K_ESCAPE] or keys[pygame.K_q]:
+                stop_reason = "quit_key"
                 running = False; break
 
             now = time.perf_counter()
 
+            if control.paused != paused:
+                paused = control.paused
+                if paused:
+                    paused_at = now
+                    append_log("SESSION_PAUSED", -1, -1)
+                    screen.fill(args.bg_rgb)
+                    canvas.present_surface(screen)
+                    frames.invalidate()
+                else:
+                    # The inactivity timer stands still while paused.
+                    last_touch_any_t += now - paused_at
+                    append_log("SESSION_RESUMED", -1, -1)
+                    force_redraw = True
+
             # Time limits
             if now - t0 >= fov_max:
                 append_log("SESSION_TIMEOUT", -1, -1)
+                stop_reason = "max_duration"
                 running = False; break
-            if now - last_touch_any_t >= fov_inactivity:
+            if not paused and now - last_touch_any_t >= fov_inactivity:
                 append_log("FOV_INACTIVITY_END", -1, -1)
+                stop_reason = "inactivity"
                 running = False; break
 
             # ---- Touch events ----
@@ -1008,6 +1142,8 @@ def _run_fov(args, screen, sw, sh, clock, font, ttl, beep,
                         inter = interactions[tag]
                         if inter.active and isinstance(inter, ParticleAttractor):
                             inter.on_release()
+                if paused:
+                    continue
 
                 # Handle touch down
                 xy = None
@@ -1040,6 +1176,9 @@ def _run_fov(args, screen, sw, sh, clock, font, ttl, beep,
                         append_log("TOUCH_FOV_OUTSIDE", x, y, "outside")
 
             if not running: break
+            if paused:
+                clock.tick(60)
+                continue
 
             # ---- Update all interactions ----
             dt = clock.get_time() / 1000.0
@@ -1052,25 +1191,30 @@ def _run_fov(args, screen, sw, sh, clock, font, ttl, beep,
                         any_redraw = True
 
             # ---- Redraw if needed ----
-            if any_redraw:
-                screen.fill(args.bg_rgb)
+            if any_redraw or force_redraw:
+                force_redraw = False
+                frames.begin()
                 for tag in INTERACTION_TAGS:
                     inter = interactions[tag]
                     if inter.active:
                         inter.draw_active(screen)
                     else:
                         inter.draw_preview(screen)
+                    frames.mark(inter.bounds())
                 if args.show_box:
                     for tag in INTERACTION_TAGS:
                         pygame.draw.rect(screen, (120, 120, 120), zone_rects[tag], 2)
                 if args.info:
                     elapsed = now - t0
                     fps = clock.get_fps()
-                    txt = (f"FOV  elapsed={elapsed:.0f}s/{fov_max}s  "
-                           f"inact={now - last_touch_any_t:.0f}s/{fov_inactivity}s  "
-                           f"touches={touch_id}  FPS={fps:.0f}")
-                    screen.blit(font.render(txt, True, (220, 220, 220)), (10, 10))
-                pygame.display.flip()
+                    frames.mark(info_hud.draw(screen, (
+                        ("session", "FOV"),
+                        ("elapsed", f"elapsed={elapsed:.0f}s/{fov_max}s"),
+                        ("inact", f"inact={now - last_touch_any_t:.0f}s/{fov_inactivity}s"),
+                        ("touches", f"touches={touch_id}"),
+                        ("fps", f"FPS={fps:.0f}"),
+                    )))
+                frames.present()
 
             clock.tick(60)
 
@@ -1100,18 +1244,16 @@ def _run_fov(args, screen, sw, sh, clock, font, ttl, beep,
             "fov_cumul_particle_attractor": cumul["particle_attractor"],
             "total_touches": touch_id,
             "session_duration_s": f"{rel:.6f}",
+            "stop_reason": stop_reason,
         }
-        csv_w.writerow(row)
-        csv_f.flush()
-        print(f"[INFO] FOV session done. Saved CSV: {out_path}")
+        csv_log.write(row, sync=fsync_policy.syncs("SESSION_END"))
+        csv_log.flush()
+        print(f"[INFO] log writer: {csv_log.describe()}")
+        print(f"[INFO] FOV session done. stop_reason={stop_reason} Saved CSV: {out_path}")
 
     finally:
-        if csv_f is not None:
-            try:
-                csv_f.flush()
-                csv_f.close()
-            except Exception:
-                pass
+        if csv_log is not None:
+            _close_csv_log(csv_log)
 
 
 
@@ -1119,9 +1261,9 @@ def _run_fov(args, screen, sw, sh, clock, font, ttl, beep,
 # Trial-based session (ERC / PEC)
 # =========================
 def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
-                     ttl, beep, FINGERDOWN, FINGERUP, FINGERMOTION, MOUSEWHEEL):
+                     ttl, beep, FINGERDOWN, FINGERUP, FINGERMOTION, MOUSEWHEEL, control, canvas):
     """Trial-based session (ERC / PEC) -- full implementation."""
-    csv_f = None
+    csv_log = None
     try:
         screen_size = (sw, sh)
 
@@ -1194,21 +1336,15 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
         interact_touch_count = 0
         touch_id_global = 0
         trial_num = 0
-        present_onset_t = 0.0
-        interact_start_t = 0.0
-        last_touch_interact_t = 0.0
-        last_reward_t = 0.0
+        timers = _TrialTimers()
         choice_latency_ms = 0
         consecutive_omissions = 0
         omission_count = 0
 
         # ITI / wait-release
-        iti_end_time = 0.0
         iti_ms_current = 0
         touch_during_iti = False
         require_release_dwell = False
-        release_clear_start_t = None
-        wait_release_enter_t = None
 
         current_trial = None
 
@@ -1235,14 +1371,13 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
             "right_zone_x", "right_zone_y", "right_zone_w", "right_zone_h",
             "left_choices_recent", "right_choices_recent", "is_correction_trial",
             "total_trials", "total_touches", "total_rewards", "session_duration_s",
-            "omission_count",
+            "omission_count", "stop_reason",
         ]
-        csv_f = out_path.open("w", newline="", encoding="utf-8")
-        csv_w = csv.DictWriter(csv_f, fieldnames=fieldnames)
-        csv_w.writeheader()
-        write_count = 0
+        fsync_policy = log_writer.FsyncPolicy(args.log_fsync, args.log_fsync_s)
+        csv_log = log_writer.CsvLogWriter(out_path, fieldnames, fsync_s=fsync_policy.fsync_s)
 
         t0 = time.perf_counter()
+        stop_reason = ""
 
         def left_recent():
             return sum(1 for s in side_choices if s == "left")
@@ -1251,7 +1386,6 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
             return sum(1 for s in side_choices if s == "right")
 
         def append_log(event_name, x, y, iti_ms=0, extra=None):
-            nonlocal write_count
             nowp = time.perf_counter()
             rel = nowp - t0
             iso_now = datetime.now().isoformat(timespec="milliseconds")
@@ -1295,10 +1429,7 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
             }
             if extra is not None:
                 row.update(extra)
-            csv_w.writerow(row)
-            write_count += 1
-            if write_count % 64 == 0:
-                csv_f.flush()
+            csv_log.write(row, sync=fsync_policy.syncs(event_name, row))
 
         def check_bias():
             nonlocal bias_correction_active, bias_correction_remaining, bias_preferred_side
@@ -1330,7 +1461,7 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
             nonlocal current_trial, left_interaction, right_interaction
             nonlocal chosen_interaction, non_chosen_interaction, chosen_side
             nonlocal trial_is_probe, trial_reward_count, interact_touch_count
-            nonlocal trial_num, present_onset_t, state
+            nonlocal trial_num, state
 
             trial = sequencer.next_trial()
             if trial is None:
@@ -1358,17 +1489,28 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
             right_interaction = create_interaction(right_tag, right_zone, screen_size)
 
             state = STATE_PRESENT
-            present_onset_t = time.perf_counter()
+            timers.present_onset_t = time.perf_counter()
             return True
 
         def advance_trial():
+            nonlocal stop_reason
+            if control.finish_reason is not None:
+                stop_reason = control.finish_reason
+                return False
             if place_trial():
                 append_log("TRIAL_START", -1, -1)
                 return True
+            stop_reason = "trials_done"
             return False
 
         # ---- Drawing ----
+        preview_hud = render_backend.HudLine(font, (10, 10))
+        interact_hud = render_backend.HudLine(font, (10, 10))
+        blank_hud = render_backend.HudLine(font, (10, 10))
+        frames = _DirtyFrames(canvas, screen, args.bg_rgb)
+
         def draw_both_preview():
+            frames.invalidate()
             screen.fill(args.bg_rgb)
             if left_interaction:
                 left_interaction.draw_preview(screen)
@@ -1383,39 +1525,73 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
                 fps = clock.get_fps()
                 probe_str = " PROBE" if trial_is_probe else ""
                 corr_str = " CORR" if bias_correction_active else ""
-                txt = (f"{state_names[state]}  trial={trial_num}/{args.target_trials}  "
-                       f"elapsed={elapsed:.0f}s  rewards={session_reward_count}  "
-                       f"omit={omission_count}  FPS={fps:.0f}{probe_str}{corr_str}")
-                screen.blit(font.render(txt, True, (220, 220, 220)), (10, 10))
-            pygame.display.flip()
+                preview_hud.draw(screen, (
+                    ("state", state_names[state]),
+                    ("trial", f"trial={trial_num}/{args.target_trials}"),
+                    ("elapsed", f"elapsed={elapsed:.0f}s"),
+                    ("rewards", f"rewards={session_reward_count}"),
+                    ("omit", f"omit={omission_count}"),
+                    ("fps", f"FPS={fps:.0f}{probe_str}{corr_str}"),
+                ))
+            canvas.present_surface(screen)
 
         def draw_interact():
-            screen.fill(args.bg_rgb)
+            # Redrawn every frame while animating: only the two objects and
+            # the HUD are cleared and pushed (whole frames on the renderer).
+            frames.begin()
             if chosen_interaction:
                 chosen_interaction.draw_active(screen)
+                frames.mark(chosen_interaction.bounds())
             if non_chosen_interaction:
                 non_chosen_interaction.draw_dimmed(screen)
+                frames.mark(non_chosen_interaction.zone_rect)
             if args.show_box:
                 pygame.draw.rect(screen, (120, 120, 120), left_zone, 2)
                 pygame.draw.rect(screen, (120, 120, 120), right_zone, 2)
             if args.info:
                 now_t = time.perf_counter()
                 fps = clock.get_fps()
-                txt = (f"INTERACT  trial={trial_num}  side={chosen_side}  "
-                       f"touches={interact_touch_count}  rewards={trial_reward_count}  "
-                       f"FPS={fps:.0f}")
-                screen.blit(font.render(txt, True, (220, 220, 220)), (10, 10))
-            pygame.display.flip()
+                frames.mark(interact_hud.draw(screen, (
+                    ("state", "INTERACT"),
+                    ("trial", f"trial={trial_num}"),
+                    ("side", f"side={chosen_side}"),
+                    ("touches", f"touches={interact_touch_count}"),
+                    ("rewards", f"rewards={trial_reward_count}"),
+                    ("fps", f"FPS={fps:.0f}"),
+                )))
+            frames.present()
 
         def draw_blank():
+            frames.invalidate()
             screen.fill(args.bg_rgb)
             if args.info:
                 now_t = time.perf_counter()
                 elapsed = now_t - t0
-                txt = (f"{state_names[state]}  trial={trial_num}  "
-                       f"elapsed={elapsed:.0f}s")
-                screen.blit(font.render(txt, True, (220, 220, 220)), (10, 10))
-            pygame.display.flip()
+                blank_hud.draw(screen, (
+                    ("state", state_names[state]),
+                    ("trial", f"trial={trial_num}"),
+                    ("elapsed", f"elapsed={elapsed:.0f}s"),
+                ))
+            canvas.present_surface(screen)
+
+        def draw_omission_pause():
+            frames.invalidate()
+            screen.fill((20, 20, 20))
+            if args.info:
+                txt = "PAUSED -- touch to resume"
+                screen.blit(font.render(txt, True, (150, 150, 150)),
+                            (sw // 2 - 100, sh // 2))
+            canvas.present_surface(screen)
+
+        def redraw_state():
+            if state in (STATE_PRESENT, STATE_CHOOSE):
+                draw_both_preview()
+            elif state == STATE_INTERACT:
+                draw_interact()
+            elif state == STATE_PAUSED:
+                draw_omission_pause()
+            else:
+                draw_blank()
 
         # ---- Start session ----
         append_log("SESSION_START", -1, -1)
@@ -1429,37 +1605,60 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
         draw_both_preview()
 
         running = True
-        stop_file = Path("STOP")
+        # Operator pause (session_control: SIGUSR2 / control socket), not the
+        # omission pause (STATE_PAUSED) that a touch ends.
+        paused = False
+        paused_at = 0.0
 
         # ------- Main loop -------
         while running:
-            if stop_file.exists():
-                print("[INFO] STOP file detected. Exiting...")
+            requested = control.stop_reason
+            if requested is not None:
+                print(f"[INFO] Stop requested ({requested}). Exiting...")
+                stop_reason = requested
                 running = False
                 break
 
             now = time.perf_counter()
             if now - t0 >= max_duration_s:
                 append_log("SESSION_TIMEOUT", -1, -1)
+                stop_reason = "max_duration"
                 running = False
                 break
 
             # Quit events
             for ev in pygame.event.get([pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP]):
                 if ev.type == pygame.QUIT:
+                    stop_reason = "window_closed"
                     running = False; break
                 if ev.type in (pygame.KEYDOWN, pygame.KEYUP):
                     if ev.key in (pygame.K_ESCAPE, pygame.K_q):
+                        stop_reason = "quit_key"
                         running = False; break
             if not running: break
 
             pygame.event.pump()
             keys_pressed = pygame.key.get_pressed()
             if keys_pressed[pygame.K_ESCAPE] or keys_pressed[pygame.K_q]:
+                stop_reason = "quit_key"
                 running = False; break
 
             now = time.perf_counter()
 
+            if control.paused != paused:
+                paused = control.paused
+                if paused:
+                    paused_at = now
+                    append_log("SESSION_PAUSED", -1, -1)
+                    screen.fill(args.bg_rgb)
+                    canvas.present_surface(screen)
+                    frames.invalidate()
+                else:
+                    # Trial timers stand still while paused (max_duration_s does not).
+                    timers.shift(now - paused_at)
+                    append_log("SESSION_RESUMED", -1, -1)
+                    redraw_state()
+
             # ---- Input events ----
             want = [pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP]
             if FINGERDOWN is not None: want.append(FINGERDOWN)
@@ -1479,6 +1678,8 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
                     active_fingers.discard(ev.finger_id)
                     if state == STATE_INTERACT and chosen_interaction and isinstance(chosen_interaction, ParticleAttractor):
                         chosen_interaction.on_release()
+                if paused:
+                    continue
 
                 def _get_xy(e):
                     if e.type == pygame.MOUSEBUTTONDOWN and e.button == 1:
@@ -1512,7 +1713,7 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
                                 chosen_interaction = right_interaction
                                 non_chosen_interaction = left_interaction
 
-                            choice_latency_ms = int((time.perf_counter() - present_onset_t) * 1000)
+                            choice_latency_ms = int((time.perf_counter() - timers.present_onset_t) * 1000)
                             consecutive_omissions = 0
                             side_choices.append(chosen_side)
 
@@ -1524,7 +1725,7 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
                                     reward_given = 1
                                     trial_reward_count += 1
                                     session_reward_count += 1
-                                    last_reward_t = now
+                                    timers.last_reward_t = now
                                 except Exception as e:
                                     print(f"[ERROR] TTL failed: {e}", file=sys.stderr)
                                 try:
@@ -1544,8 +1745,8 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
                                 append_log("REWARD_TTL", x, y, extra={"reward_given": 1})
 
                             chosen_interaction.activate(x, y, now)
-                            interact_start_t = now
-                            last_touch_interact_t = now
+                            timers.interact_start_t = now
+                            timers.last_touch_interact_t = now
                             interact_touch_count = 1
                             state = STATE_INTERACT
                             draw_interact()
@@ -1562,7 +1763,7 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
                         x, y = xy
                         touch_id_global += 1
                         interact_touch_count += 1
-                        last_touch_interact_t = now
+                        timers.last_touch_interact_t = now
 
                         chosen_zone = left_zone if chosen_side == "left" else right_zone
                         if chosen_zone.inflate(2 * hit_margin_px, 2 * hit_margin_px).collidepoint(x, y):
@@ -1572,14 +1773,14 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
                                 "interaction_hit": chosen_tag,
                             })
 
-                            if not trial_is_probe and (now - last_reward_t >= reward_cooldown_s):
+                            if not trial_is_probe and (now - timers.last_reward_t >= reward_cooldown_s):
                                 if trial_reward_count < max_rewards_per_trial and session_reward_count < max_rewards_per_session:
                                     try:
                                         if ttl is not None:
                                             ttl.pulse()
                                         trial_reward_count += 1
                                         session_reward_count += 1
-                                        last_reward_t = now
+                                        timers.last_reward_t = now
                                         append_log("REWARD_TTL", x, y, extra={"reward_given": 1})
                                     except Exception as e:
                                         print(f"[ERROR] TTL failed: {e}", file=sys.stderr)
@@ -1622,17 +1823,20 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
                                 running = False
 
             if not running: break
+            if paused:
+                clock.tick(60)
+                continue
 
             # ---- Time-based transitions ----
             now = time.perf_counter()
 
             if state == STATE_PRESENT:
-                if now - present_onset_t >= present_duration_s:
+                if now - timers.present_onset_t >= present_duration_s:
                     state = STATE_CHOOSE
                     append_log("CHOOSE_ENABLED", -1, -1)
 
             elif state == STATE_CHOOSE:
-                if now - present_onset_t >= choose_timeout_s:
+                if now - timers.present_onset_t >= choose_timeout_s:
                     omission_count += 1
                     consecutive_omissions += 1
                     append_log("OMISSION", -1, -1)
@@ -1640,15 +1844,10 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
                     if consecutive_omissions >= max_consecutive_omissions:
                         state = STATE_PAUSED
                         append_log("SESSION_PAUSE", -1, -1)
-                        screen.fill((20, 20, 20))
-                        if args.info:
-                            txt = "PAUSED -- touch to resume"
-                            screen.blit(font.render(txt, True, (150, 150, 150)),
-                                        (sw // 2 - 100, sh // 2))
-                        pygame.display.flip()
+                        draw_omission_pause()
                     else:
                         iti_ms_current = random.randint(iti_min_ms, iti_max_ms)
-                        iti_end_time = now + iti_ms_current / 1000.0
+                        timers.iti_end_time = now + iti_ms_current / 1000.0
                         state = STATE_ITI
                         touch_during_iti = mouse_down or bool(active_fingers)
                         append_log("ITI_START", -1, -1, iti_ms=iti_ms_current)
@@ -1661,38 +1860,38 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
                     if chosen_interaction.needs_redraw:
                         draw_interact()
 
-                if now - interact_start_t >= interact_max_s:
-                    interact_dur_ms = int((now - interact_start_t) * 1000)
+                if now - timers.interact_start_t >= interact_max_s:
+                    interact_dur_ms = int((now - timers.interact_start_t) * 1000)
                     if chosen_interaction:
                         chosen_interaction.deactivate()
                     append_log("INTERACT_TIMEOUT", -1, -1, extra={
                         "interact_duration_ms": interact_dur_ms,
                     })
                     iti_ms_current = random.randint(iti_min_ms, iti_max_ms)
-                    iti_end_time = now + iti_ms_current / 1000.0
+                    timers.iti_end_time = now + iti_ms_current / 1000.0
                     state = STATE_ITI
                     touch_during_iti = mouse_down or bool(active_fingers)
                     append_log("ITI_START", -1, -1, iti_ms=iti_ms_current)
                     draw_blank()
-                elif now - last_touch_interact_t >= interact_disengage_s:
-                    interact_dur_ms = int((now - interact_start_t) * 1000)
+                elif now - timers.last_touch_interact_t >= interact_disengage_s:
+                    interact_dur_ms = int((now - timers.interact_start_t) * 1000)
                     if chosen_interaction:
                         chosen_interaction.deactivate()
                     append_log("INTERACT_DISENGAGE", -1, -1, extra={
                         "interact_duration_ms": interact_dur_ms,
                     })
                     iti_ms_current = random.randint(iti_min_ms, iti_max_ms)
-                    iti_end_time = now + iti_ms_current / 1000.0
+                    timers.iti_end_time = now + iti_ms_current / 1000.0
                     state = STATE_ITI
                     touch_during_iti = mouse_down or bool(active_fingers)
                     append_log("ITI_START", -1, -1, iti_ms=iti_ms_current)
                     draw_blank()
 
             elif state == STATE_ITI:
-                if now >= iti_end_time:
+                if now >= timers.iti_end_time:
                     state = STATE_WAIT_RELEASE
-                    wait_release_enter_t = now
-                    release_clear_start_t = None
+                    timers.wait_release_enter_t = now
+                    timers.release_clear_start_t = None
                     require_release_dwell = touch_during_iti and (min_release_after_iti_s > 0)
                     append_log("WAIT_RELEASE_START", -1, -1)
                     if require_release_dwell:
@@ -1703,11 +1902,11 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
 
                 if require_release_dwell:
                     if no_touch_now:
-                        if release_clear_start_t is None:
-                            release_clear_start_t = now
+                        if timers.release_clear_start_t is None:
+                            timers.release_clear_start_t = now
                             append_log("RELEASE_DWELL_START", -1, -1)
                         else:
-                            elapsed_dwell = now - release_clear_start_t
+                            elapsed_dwell = now - timers.release_clear_start_t
                             if elapsed_dwell >= min_release_after_iti_s:
                                 append_log("RELEASE_DWELL_OK", -1, -1)
                                 append_log("TRIAL_END", -1, -1)
@@ -1719,9 +1918,9 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
                                 else:
                                     running = False
                     else:
-                        if release_clear_start_t is not None:
+                        if timers.release_clear_start_t is not None:
                             append_log("RELEASE_DWELL_RESET", -1, -1)
-                        release_clear_start_t = None
+                        timers.release_clear_start_t = None
                 else:
                     if no_touch_now:
                         append_log("TRIAL_END", -1, -1)
@@ -1733,12 +1932,12 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
                             running = False
 
                 # Timeout failsafe
-                if state == STATE_WAIT_RELEASE and wait_release_enter_t is not None and (now - wait_release_enter_t) >= wait_release_timeout_s:
+                if state == STATE_WAIT_RELEASE and timers.wait_release_enter_t is not None and (now - timers.wait_release_enter_t) >= wait_release_timeout_s:
                     if mouse_down or active_fingers:
                         active_fingers.clear()
                         mouse_down = False
-                        if require_release_dwell and release_clear_start_t is None:
-                            release_clear_start_t = now
+                        if require_release_dwell and timers.release_clear_start_t is None:
+                            timers.release_clear_start_t = now
                             append_log("RELEASE_DWELL_START_FORCED", -1, -1)
                         elif not require_release_dwell:
                             append_log("TRIAL_END", -1, -1)
@@ -1789,18 +1988,17 @@ def _run_trial_based(args, effective_type, screen, sw, sh, clock, font,
             "total_rewards": session_reward_count,
             "session_duration_s": f"{rel:.6f}",
             "omission_count": omission_count,
+            "stop_reason": stop_reason,
         }
-        csv_w.writerow(summary_row)
-        csv_f.flush()
-        print(f"[INFO] Session done. Trials={trial_num} Rewards={session_reward_count} Saved CSV: {out_path}")
+        csv_log.write(summary_row, sync=fsync_policy.syncs("SESSION_END"))
+        csv_log.flush()
+        print(f"[INFO] log writer: {csv_log.describe()}")
+        print(f"[INFO] Session done. Trials={trial_num} Rewards={session_reward_count} "
+              f"stop_reason={stop_reason} Saved CSV: {out_path}")
 
     finally:
-        if csv_f is not None:
-            try:
-                csv_f.flush()
-                csv_f.close()
-            except Exception:
-                pass
+        if csv_log is not None:
+            _close_csv_log(csv_log)
 
 # =========================
 # Argument parser
@@ -1831,11 +2029,19 @@ def parse_args():
     p.add_argument("--kiosk", action="store_true",
         help="Fullscreen + hide cursor + grab input")
     p.add_argument("--bg-rgb", type=int, nargs=3, default=[0, 0, 0])
+    p.add_argument("--render", type=str, default="software", choices=["software", "renderer"],
+        help="Show frames directly, or through an SDL Renderer texture (falls back to software)")
 
     # ====== Input ======
     p.add_argument("--touch-only", action="store_true",
         help="Block mouse events, accept only touch (FINGER*)")
 
+    # ====== Session control ======
+    p.add_argument("--control-socket", type=str, default=None,
+        help="Unix datagram socket accepting stop/finish/pause/resume (see session_control.py).")
+    p.add_argument("--stop-file", type=str, default="STOP",
+        help="Legacy stop file. Empty string disables it.")
+
     # ====== Layout (ERC/PEC) ======
     p.add_argument("--zone-size-px", type=int, default=280,
         help="Width and height of each interaction zone (px). Default 280.")
@@ -1900,6 +2106,11 @@ def parse_args():
 
     # ====== Output ======
     p.add_argument("--out-dir", type=str, default="logs")
+    p.add_argument("--log-fsync", choices=["off", "interval", "reward", "trial"], default="reward",
+        help="When the log is fsync'd: every --log-fsync-s, plus after reward rows, "
+             "plus after every trial end (see log_writer.py).")
+    p.add_argument("--log-fsync-s", type=float, default=10.0,
+        help="Longest time a logged row waits for an fsync (unless --log-fsync off).")
     p.add_argument("--info", action="store_true",
         help="Show debug overlay on screen.")
     p.add_argument("--show-box", action="store_true",
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
 import argparse
-import csv
 import re
+import statistics
 import sys
 import time
 from datetime import datetime
@@ -11,13 +11,35 @@ from typing import Dict, List, Optional, Tuple
 
 import task_common
 import touch_task_runner as ttr
+from arduino_link import (
+    LINK_DOWN,
+    MARKER_CODES,
+    ArduinoTTLSender,
+    EventMarkerQueue,
+    marker_table_path,
+    photodiode_table_path,
+    write_marker_table,
+    write_photodiode_table,
+)
+from clock_sync import SessionClock, sync_table_path, write_sync_table
+from render_backend import HudLine
+from event_log import open_event_log
+from log_writer import FsyncPolicy
+from session_control import SessionControl
+from sound_bank import ReservedAudioChannels
 from schedules import ReversalSchedule, validate_reversal_schedule
-from task_common import ArduinoTTLSender, deliver_reward, derive_rng, get_xy, make_beep_sound
+from task_common import (
+    RewardLedger,
+    RewardScheduler,
+    derive_rng,
+    get_xy,
+    make_beep_sound,
+)
 
 STATE_NAMES = ["SHOW", "ITI", "WAIT_RELEASE"]
 
 CSV_FIELDNAMES = [
-    "start_iso", "iso", "rel_s", "state",
+    "start_iso", "iso", "rel_s", "sdl_ts_ms", "input_rel_s", "state",
     "x", "y",
     "left_x", "left_y", "left_w", "left_h",
     "right_x", "right_y", "right_w", "right_h",
@@ -27,7 +49,7 @@ CSV_FIELDNAMES = [
     "event",
     "iti_ms", "iti_kind",
     "outside_in_trial", "max_outside_before_fail",
-    "trial_outcome", "fail_reason",
+    "trial_outcome", "fail_reason", "stop_reason",
     "stim_set", "left_label", "right_label",
     "left_image", "right_image", "target_image", "non_target_image",
     "trial_index_global", "trial_index_in_set",
@@ -36,6 +58,12 @@ CSV_FIELDNAMES = [
     "block_index", "trial_in_block", "scheduled_reversal_trial", "is_post_reversal",
     "high_label", "p_high", "p_low", "chosen_label", "is_correct",
     "p_chosen", "reward_draw", "reward_won", "reward_delivered",
+    "reward_train_id", "reward_pulse_index",
+    "reward_scheduled_rel_s", "reward_emitted_rel_s", "reward_arduino_us",
+    "marker_code", "marker_seq", "marker_queued_rel_s",
+    "onset_flip_rel_s", "onset_frame", "onset_flip_index",
+    "ttl_link", "ttl_link_epoch",
+    "beep_queued_rel_s", "beep_busy_rel_s",
 ]
 
 
@@ -44,8 +72,6 @@ class StimPair:
         self.idx_num = idx_num
         self.r_path = r_path
         self.nr_path = nr_path
-        self.r_surf = None
-        self.nr_surf = None
 
     @property
     def label(self):
@@ -181,14 +207,6 @@ def simulate(sched, seed: int, sim_choices: str, total_trials: int) -> List[Dict
     return rows
 
 
-def _empty_csv_row() -> Dict:
-    return ttr.empty_csv_row(CSV_FIELDNAMES)
-
-
-def _complete_csv_row(row: Dict) -> Dict:
-    return ttr.complete_csv_row(row, CSV_FIELDNAMES)
-
-
 def write_rows_csv(rows: List[Dict], out_path: Path) -> Path:
     return ttr.write_rows_csv(rows, out_path, CSV_FIELDNAMES)
 
@@ -242,7 +260,16 @@ def run(args):
     iti_rng = derive_rng(args.seed, "iti")
 
     ttl = None
-    csv_f = None
+    reward_scheduler = None
+    event_markers = None
+    audio_channels = None
+    control = None
+    stimuli = None
+    csv_log = None
+
+    audio_buffer = args.audio_buffer
+    if args.low_latency_audio and audio_buffer is None:
+        audio_buffer = 256
 
     try:
         session = ttr.init_two_choice_session(
@@ -252,9 +279,12 @@ def run(args):
             window_h=args.window_h,
             kiosk=args.kiosk,
             touch_only=args.touch_only,
+            audio_buffer=audio_buffer,
+            render=args.render,
         )
         args.fullscreen = session.fullscreen
-        screen = session.screen
+        canvas = session.canvas
+        print(f"[INFO] render backend: {canvas.describe()}")
         clock = session.clock
         font = session.font
         sw, sh = session.sw, session.sh
@@ -309,15 +339,15 @@ def run(args):
                 pygame_rect(rect_specs.right_plate),
             )
 
-        for sp in stim_pairs:
-            r_img = pygame.image.load(str(sp.r_path)).convert_alpha()
-            nr_img = pygame.image.load(str(sp.nr_path)).convert_alpha()
-            if r_img.get_width() != stim_w or r_img.get_height() != stim_h:
-                r_img = pygame.transform.smoothscale(r_img, (stim_w, stim_h))
-            if nr_img.get_width() != stim_w or nr_img.get_height() != stim_h:
-                nr_img = pygame.transform.smoothscale(nr_img, (stim_w, stim_h))
-            sp.r_surf = r_img
-            sp.nr_surf = nr_img
+        stimuli = ttr.open_stimulus_provider(
+            canvas,
+            {sp.label: (sp.r_path, sp.nr_path) for sp in stim_pairs},
+            (stim_w, stim_h),
+            cache_dir=args.stim_cache_dir,
+            no_cache=args.no_stim_cache,
+            workers=args.stim_workers,
+            resident=args.stim_resident,
+        )
 
         base_min = max(0, int(args.iti_min_ms))
         base_max = max(base_min, int(args.iti_max_ms))
@@ -353,7 +383,27 @@ def run(args):
 
         if not args.dry_run_ttl and not args.serial_port:
             raise RuntimeError("--serial-port is required unless --dry-run-ttl is used")
-        ttl = ArduinoTTLSender(args.serial_port, args.serial_baud, dry_run=args.dry_run_ttl)
+        ttl = ArduinoTTLSender(
+            args.serial_port,
+            args.serial_baud,
+            dry_run=args.dry_run_ttl,
+            protocol=args.ttl_protocol,
+            pulse_width_ms=args.pulse_width_ms,
+            pulse_expiry_s=max(0, int(args.pulse_expiry_ms)) / 1000.0,
+            max_queued_trains=args.max_queued_trains,
+        )
+        print(f"[INFO] TTL protocol: {ttl.protocol}")
+        if args.clock_sync_interval_s > 0:
+            ttl.start_clock_sync(args.clock_sync_interval_s)
+        if args.photodiode_input:
+            if ttl.enable_photodiode():
+                print("[INFO] photodiode edge reports on")
+            else:
+                print("[WARN] photodiode input not available (dry run, legacy link or old firmware)", file=sys.stderr)
+        reward_scheduler = RewardScheduler(ttl)
+        if args.event_markers:
+            event_markers = EventMarkerQueue(ttl, maxsize=args.marker_queue_size)
+        pulse_interval_s = max(0, int(args.pulse_interval_ms)) / 1000.0
 
         try:
             beep = make_beep_sound(args.beep_freq, args.beep_ms, args.beep_volume)
@@ -361,22 +411,58 @@ def run(args):
             beep = None
             print(f"[WARN] beep disabled: {e}", file=sys.stderr)
 
+        if beep is not None and args.low_latency_audio:
+            try:
+                audio_channels = ReservedAudioChannels()
+                audio_channels.prewarm()
+                beep = audio_channels.bind("reward", beep)
+                print(f"[INFO] low-latency audio: mixer={pygame.mixer.get_init()} buffer={audio_buffer}")
+            except Exception as e:
+                if audio_channels is not None:
+                    audio_channels.close()
+                    audio_channels = None
+                print(f"[WARN] low-latency audio disabled: {e}", file=sys.stderr)
+
         out_dir = Path(args.out_dir)
         out_dir.mkdir(parents=True, exist_ok=True)
-        start_dt = datetime.now()
-        start_iso = start_dt.isoformat(timespec="milliseconds")
+        session_clock = SessionClock.start(pygame.time.get_ticks())
+        start_dt = session_clock.start_datetime()
+        start_iso = session_clock.start_iso()
         out_path = out_dir / f"prl_log_{start_dt.strftime('%Y%m%d_%H%M%S')}.csv"
 
-        csv_f = out_path.open("w", newline="", encoding="utf-8")
-        csv_w = csv.DictWriter(csv_f, fieldnames=CSV_FIELDNAMES)
-        csv_w.writeheader()
-        write_count = 0
+        fsync_policy = FsyncPolicy(args.log_fsync, args.log_fsync_s)
+        csv_log, row_encoder = open_event_log(
+            args.log_layout,
+            out_path,
+            CSV_FIELDNAMES,
+            static={
+                "start_iso": start_iso,
+                "hit_margin_px": hit_margin_px,
+                "max_outside_before_fail": max_outside_before_fail,
+                "correction_mode": 1 if args.correction_mode else 0,
+                "seed": args.seed,
+                "schedule_hash": schedule_hash,
+            },
+            steady=dict(zip(ttr.RECT_CSV_FIELDS, (v for rect in compute_rects() for v in rect))),
+            info={"task": "prl"},
+            fsync_s=fsync_policy.fsync_s,
+        )
+        set_event_fields = row_encoder.setter(
+            "iso", "rel_s", "state", "x", "y", *ttr.RECT_CSV_FIELDS,
+            "ttl_link", "ttl_link_epoch", "event", "iti_ms", "outside_in_trial", "is_correction_trial",
+        )
+        set_trial_fields = row_encoder.setter(
+            "stim_set", "left_label", "right_label", "left_image", "right_image", "target_image", "non_target_image",
+            "trial_index_global", "trial_index_in_set", "block_index", "trial_in_block",
+            "scheduled_reversal_trial", "is_post_reversal", "high_label", "p_high", "p_low",
+        )
+        set_marker_fields = row_encoder.setter("marker_code", "marker_seq", "marker_queued_rel_s")
 
-        t0 = time.perf_counter()
+        t0 = session_clock.t0
         choices = 0
         correct_choices = 0
         incorrect_choices = 0
-        reward_count = 0
+        rewards = RewardLedger(reward_scheduler)
         outside_failures = 0
         schedule_trial_index = 0
 
@@ -390,6 +476,9 @@ def run(args):
         left_surf = None
         right_surf = None
         current_context = None
+        current_plan = None
+        pending_plan = None
+        show_frame = None
         
 
         def pair_for_block(block_index: int):
@@ -397,46 +486,33 @@ def run(args):
                 return stim_pairs[0]
             return stim_pairs[block_index % len(stim_pairs)]
 
-        def append_log(event_name, x, y, iti_ms, extra=None):
-            nonlocal write_count
+        def upcoming_pairs(global_trial: int):
+            # The pair of the trial's block and of the next
+            # --stim-lookahead-blocks blocks, so a block's pair is loaded
+            # long before its first trial is placed.
+            if global_trial >= total_trials:
+                return []
+            first = sched.lookup(global_trial)["block_index"]
+            last = min(sched.lookup(total_trials - 1)["block_index"], first + max(0, args.stim_lookahead_blocks))
+            return [pair_for_block(b).label for b in range(first, last + 1)]
+
+        if total_trials > 0:
+            t = time.perf_counter()
+            stimuli.request(upcoming_pairs(0), wait=True)
+            print(f"[INFO] stimuli: first blocks ready in {time.perf_counter() - t:.2f}s; {stimuli.describe()}")
+
+        def append_log(event_name, x, y, iti_ms, extra=None, touch=None, durable=False):
             nowp = time.perf_counter()
             rel = nowp - t0
-            iso = datetime.now().isoformat(timespec="milliseconds")
-
-            row = _empty_csv_row()
-            row.update({
-                "start_iso": start_iso,
-                "iso": iso,
-                "rel_s": f"{rel:.6f}",
-                "state": STATE_NAMES[state],
-                "x": x,
-                "y": y,
-                "left_x": left_rect.x,
-                "left_y": left_rect.y,
-                "left_w": left_rect.w,
-                "left_h": left_rect.h,
-                "right_x": right_rect.x,
-                "right_y": right_rect.y,
-                "right_w": right_rect.w,
-                "right_h": right_rect.h,
-                "left_plate_x": left_plate_rect.x,
-                "left_plate_y": left_plate_rect.y,
-                "left_plate_w": left_plate_rect.w,
-                "left_plate_h": left_plate_rect.h,
-                "right_plate_x": right_plate_rect.x,
-                "right_plate_y": right_plate_rect.y,
-                "right_plate_w": right_plate_rect.w,
-                "right_plate_h": right_plate_rect.h,
-                "hit_margin_px": hit_margin_px,
-                "event": event_name,
-                "iti_ms": iti_ms,
-                "outside_in_trial": outside_touches_in_trial,
-                "max_outside_before_fail": max_outside_before_fail,
-                "correction_mode": 1 if correction_mode_enabled else 0,
-                "is_correction_trial": 1 if current_trial_is_correction else 0,
-                "seed": args.seed,
-                "schedule_hash": schedule_hash,
-            })
+            iso = session_clock.iso(nowp)
+
+            row = row_encoder.row()
+            set_event_fields(
+                row, iso, f"{rel:.6f}", STATE_NAMES[state], x, y,
+                *left_rect, *right_rect, *left_plate_rect, *right_plate_rect,
+                ttl.link_state, ttl.link_epoch, event_name, iti_ms, outside_touches_in_trial,
+                1 if current_trial_is_correction else 0,
+            )
 
             if current_context is not None:
                 info = current_context["info"]
@@ -444,47 +520,129 @@ def run(args):
                 high_label = info["high_label"]
                 target_image = cur_pair.r_path.name if high_label == "r" else cur_pair.nr_path.name
                 non_target_image = cur_pair.nr_path.name if high_label == "r" else cur_pair.r_path.name
-                row.update({
-                    "stim_set": cur_pair.label,
-                    "left_label": current_context["left_label"],
-                    "right_label": current_context["right_label"],
-                    "left_image": current_context["left_image"],
-                    "right_image": current_context["right_image"],
-                    "target_image": target_image,
-                    "non_target_image": non_target_image,
-                    "trial_index_global": current_context["global_trial"],
-                    "trial_index_in_set": info["trial_in_block"],
-                    "block_index": info["block_index"],
-                    "trial_in_block": info["trial_in_block"],
-                    "scheduled_reversal_trial": info["scheduled_reversal_trial"],
-                    "is_post_reversal": info["is_post_reversal"],
-                    "high_label": high_label,
-                    "p_high": info["p_high"],
-                    "p_low": info["p_low"],
-                })
+                set_trial_fields(
+                    row,
+                    cur_pair.label,
+                    current_context["left_label"],
+                    current_context["right_label"],
+                    current_context["left_image"],
+                    current_context["right_image"],
+                    target_image,
+                    non_target_image,
+                    current_context["global_trial"],
+                    info["trial_in_block"],
+                    info["block_index"],
+                    info["trial_in_block"],
+                    info["scheduled_reversal_trial"],
+                    info["is_post_reversal"],
+                    high_label,
+                    info["p_high"],
+                    info["p_low"],
+                )
 
+            if touch is not None:
+                row_encoder.update(row, touch)
             if extra is not None:
-                row.update(extra)
+                row_encoder.update(row, extra)
+
+            if event_markers is not None:
+                # Besides the event name only hit_area / reward_pulse_index matter,
+                # and both come in extra.
+                marker_name = ttr.marker_name_for_event(event_name, extra or {})
+                if marker_name is not None:
+                    marker = event_markers.emit(MARKER_CODES[marker_name])
+                    set_marker_fields(row, marker.code, marker.seq, f"{marker.queued_t - t0:.6f}")
+
+            csv_log.write_line(row_encoder.encode(row), sync=fsync_policy.syncs(event_name, extra), durable=durable)
+
+        def log_reward_pulses():
+            records = reward_scheduler.poll()
+            for rec in records:
+                if rec.ok:
+                    event_name = "REWARD_PULSE"
+                elif rec.unacked:
+                    event_name = "REWARD_PULSE_UNACKED"
+                elif rec.expired:
+                    event_name = "REWARD_PULSE_EXPIRED"
+                else:
+                    event_name = "REWARD_PULSE_TTL_FAIL"
+                append_log(
+                    event_name,
+                    -1,
+                    -1,
+                    0,
+                    extra={
+                        "reward_train_id": rec.train_id,
+                        "reward_pulse_index": rec.pulse_index,
+                        "reward_scheduled_rel_s": f"{rec.scheduled_t - t0:.6f}",
+                        "reward_emitted_rel_s": f"{rec.emitted_t - t0:.6f}",
+                        "reward_arduino_us": "" if rec.arduino_us is None else rec.arduino_us,
+                    },
+                )
 
-            csv_w.writerow(_complete_csv_row(row))
-            write_count += 1
-            if write_count % 64 == 0:
-                csv_f.flush()
+            # No pulse of the train reached the port (expired or the write
+            # failed): the choice row with this reward_train_id did not
+            # deliver its reward after all. Unacked pulses still count.
+            for train_id in rewards.settle(records):
+                append_log("REWARD_TTL_FAIL", -1, -1, 0, extra={"reward_train_id": train_id, "reward_delivered": 0})
+
+            for train in reward_scheduler.poll_beeps():
+                rec = train.beep_record
+                append_log(
+                    "REWARD_BEEP",
+                    -1,
+                    -1,
+                    0,
+                    extra={
+                        "reward_train_id": train.train_id,
+                        "beep_queued_rel_s": f"{rec.queued_t - t0:.6f}",
+                        "beep_busy_rel_s": "" if rec.busy_t is None else f"{rec.busy_t - t0:.6f}",
+                    },
+                )
 
-        def draw(stim_on: bool):
-            screen.fill(args.bg_rgb)
+        def log_link_events():
+            for ev in ttl.poll_link_events():
+                if ev.state == LINK_DOWN:
+                    print(f"[WARN] TTL link down: {ev.detail}", file=sys.stderr)
+                else:
+                    print(f"[INFO] TTL link up (epoch {ev.epoch}, {ev.detail})")
+                append_log(f"TTL_LINK_{ev.state.upper()}", -1, -1, 0)
+
+        flip_timing = ttr.FlipTiming()
+        patch_box = None
+        if args.photodiode_patch_px > 0:
+            patch_box = ttr.photodiode_box(sw, sh, args.photodiode_patch_px, args.photodiode_corner)
+        presenter = ttr.FramePresenter(canvas, args.bg_rgb, args.present, timing=flip_timing, patch_box=patch_box)
+        hud = HudLine(font, (20, 20)) if args.info else None
+
+        def paint_stimuli(target, dx, dy, l_surf, r_surf):
+            lp, rp = left_plate_rect.move(dx, dy), right_plate_rect.move(dx, dy)
+            lr, rr = left_rect.move(dx, dy), right_rect.move(dx, dy)
+            target.draw_rect(args.plate_rgb, lp)
+            target.draw_rect(args.plate_rgb, rp)
+            if l_surf is not None:
+                target.blit(l_surf, lr)
+            if r_surf is not None:
+                target.blit(r_surf, rr)
+            if args.show_box:
+                target.draw_rect((120, 120, 120), lp, 2)
+                target.draw_rect((120, 120, 120), rp, 2)
+                target.draw_rect((200, 200, 200), lr, 1)
+                target.draw_rect((200, 200, 200), rr, 1)
+
+        def draw(stim_on: bool) -> str:
+            presenter.begin()
+            source = ""
             if stim_on:
-                pygame.draw.rect(screen, args.plate_rgb, left_plate_rect)
-                pygame.draw.rect(screen, args.plate_rgb, right_plate_rect)
-                if left_surf is not None:
-                    screen.blit(left_surf, left_rect)
-                if right_surf is not None:
-                    screen.blit(right_surf, right_rect)
-                if args.show_box:
-                    pygame.draw.rect(screen, (120, 120, 120), left_plate_rect, 2)
-                    pygame.draw.rect(screen, (120, 120, 120), right_plate_rect, 2)
-                    pygame.draw.rect(screen, (200, 200, 200), left_rect, 1)
-                    pygame.draw.rect(screen, (200, 200, 200), right_rect, 1)
+                if show_frame is not None and show_frame.key is current_plan:
+                    presenter.mark(canvas.blit(show_frame.surface, show_frame.rect))
+                    source = "precomposed"
+                else:
+                    paint_stimuli(canvas, 0, 0, left_surf, right_surf)
+                    presenter.mark(left_plate_rect.union(left_rect))
+                    presenter.mark(right_plate_rect.union(right_rect))
+                    source = "drawn"
+            presenter.patch(stim_on)
 
             if args.info:
                 high_label = ""
@@ -495,27 +653,39 @@ def run(args):
                     high_label = info["high_label"]
                     block_index = info["block_index"]
                     trial_in_block = info["trial_in_block"]
-                txt1 = (
-                    f"State={STATE_NAMES[state]}  "
-                    f"Trial={schedule_trial_index}/{total_trials}  "
-                    f"Block={block_index}  InBlock={trial_in_block}  "
-                    f"High={high_label}  "
-                    f"Choices={choices}  Correct={correct_choices}  Incorrect={incorrect_choices}  "
-                    f"Rewards={reward_count}  Outside={outside_touches_in_trial}/{max_outside_before_fail}  "
-                    f"Corr={'ON' if current_trial_is_correction else 'OFF'}  "
-                    f"HIT=plate(+margin {hit_margin_px}px)"
+                fields = (
+                    ("state", f"State={STATE_NAMES[state]}"),
+                    ("trial", f"Trial={schedule_trial_index}/{total_trials}"),
+                    ("block", f"Block={block_index}"),
+                    ("in_block", f"InBlock={trial_in_block}"),
+                    ("high", f"High={high_label}"),
+                    ("choices", f"Choices={choices}"),
+                    ("correct", f"Correct={correct_choices}"),
+                    ("incorrect", f"Incorrect={incorrect_choices}"),
+                    ("rewards", f"Rewards={rewards.count}"),
+                    ("outside", f"Outside={outside_touches_in_trial}/{max_outside_before_fail}"),
+                    ("corr", f"Corr={'ON' if current_trial_is_correction else 'OFF'}"),
+                    ("hit", f"HIT=plate(+margin {hit_margin_px}px)"),
                 )
-                screen.blit(font.render(txt1, True, (220, 220, 220)), (20, 20))
-            pygame.display.flip()
-
-        def place_new_trial():
-            
-            nonlocal left_is_r, left_surf, right_surf
-            nonlocal left_rect, right_rect, left_plate_rect, right_plate_rect
-            nonlocal current_context, current_trial_is_correction
+                presenter.mark(hud.draw(canvas, fields))
+            presenter.present()
+            return source
+
+        def show_stimulus():
+            source = draw(stim_on=True)
+            append_log("STIM_ONSET", -1, -1, 0, extra={
+                "onset_flip_rel_s": f"{presenter.last_present_t - t0:.6f}",
+                "onset_frame": source,
+                "onset_flip_index": presenter.frames - 1,
+            })
 
+        def plan_trial():
+            # Everything about the next trial that place_new_trial needs,
+            # including its one layout_rng draw. Nothing here changes between
+            # the end of a trial and the next placement, so it can run at
+            # ITI start without altering the random sequence.
             if schedule_trial_index >= total_trials:
-                return False
+                return None
 
             info = dict(sched.lookup(schedule_trial_index))
             
@@ -530,27 +700,68 @@ def run(args):
             )
             
             cur_pair = pair_for_block(info["block_index"])
-            current_trial_is_correction = correction_mode_enabled and correction_active
+            stimuli.request(upcoming_pairs(schedule_trial_index))
+            r_surf, nr_surf = stimuli.get(cur_pair.label)
+            is_correction = correction_mode_enabled and correction_active
 
-            if current_trial_is_correction and correction_left_is_r is not None:
-                left_is_r = bool(correction_left_is_r)
+            if is_correction and correction_left_is_r is not None:
+                plan_left_is_r = bool(correction_left_is_r)
             else:
-                left_is_r = bool(layout_rng.getrandbits(1))
+                plan_left_is_r = bool(layout_rng.getrandbits(1))
+
+            return {
+                "is_correction": is_correction,
+                "left_is_r": plan_left_is_r,
+                "left_surf": r_surf if plan_left_is_r else nr_surf,
+                "right_surf": nr_surf if plan_left_is_r else r_surf,
+                "context": {
+                    "global_trial": schedule_trial_index,
+                    "info": info,
+                    "pair": cur_pair,
+                    "reverse_high": reverse_high,
+                    "left_label": "r" if plan_left_is_r else "nr",
+                    "right_label": "nr" if plan_left_is_r else "r",
+                    "left_image": cur_pair.r_path.name if plan_left_is_r else cur_pair.nr_path.name,
+                    "right_image": cur_pair.nr_path.name if plan_left_is_r else cur_pair.r_path.name,
+                },
+            }
 
-            left_surf = cur_pair.r_surf if left_is_r else cur_pair.nr_surf
-            right_surf = cur_pair.nr_surf if left_is_r else cur_pair.r_surf
-            left_rect, right_rect, left_plate_rect, right_plate_rect = compute_rects()
+        def prepare_show_frame():
+            """Plan the next trial and compose its SHOW frame off-screen (runs during the ITI)."""
+            nonlocal pending_plan, show_frame
+            pending_plan = plan_trial()
+            show_frame = None
+            if pending_plan is not None:
+                show_frame = ttr.compose_frame(
+                    canvas,
+                    left_plate_rect.union(left_rect).union(right_plate_rect.union(right_rect)),
+                    args.bg_rgb,
+                    lambda target, dx, dy: paint_stimuli(
+                        target, dx, dy, pending_plan["left_surf"], pending_plan["right_surf"]
+                    ),
+                    key=pending_plan,
+                )
 
-            current_context = {
-                "global_trial": schedule_trial_index,
-                "info": info,
-                "pair": cur_pair,
-                "reverse_high": reverse_high,
-                "left_label": "r" if left_is_r else "nr",
-                "right_label": "nr" if left_is_r else "r",
-                "left_image": cur_pair.r_path.name if left_is_r else cur_pair.nr_path.name,
-                "right_image": cur_pair.nr_path.name if left_is_r else cur_pair.r_path.name,
-            }
+        def place_new_trial():
+            nonlocal left_is_r, left_surf, right_surf
+            nonlocal left_rect, right_rect, left_plate_rect, right_plate_rect
+            nonlocal current_context, current_trial_is_correction
+            nonlocal current_plan, pending_plan
+
+            plan = pending_plan
+            pending_plan = None
+            if plan is None or plan["context"]["global_trial"] != schedule_trial_index:
+                plan = plan_trial()
+            if plan is None:
+                return False
+
+            current_plan = plan
+            current_trial_is_correction = plan["is_correction"]
+            left_is_r = plan["left_is_r"]
+            left_surf = plan["left_surf"]
+            right_surf = plan["right_surf"]
+            left_rect, right_rect, left_plate_rect, right_plate_rect = compute_rects()
+            current_context = plan["context"]
 
             append_log("TRIAL_PLACED", -1, -1, 0)
             return True
@@ -564,41 +775,88 @@ def run(args):
                 schedule_trial_index += 1
 
         def stop_limits_reached() -> bool:
+            nonlocal stop_reason
             if schedule_trial_index >= total_trials:
+                stop_reason = "n_trials"
                 return True
-            if args.max_rewards is not None and reward_count >= max(0, int(args.max_rewards)):
+            if args.max_rewards is not None and rewards.count >= max(0, int(args.max_rewards)):
+                stop_reason = "max_rewards"
                 return True
             if args.max_session_min is not None:
                 elapsed_min = (time.perf_counter() - t0) / 60.0
                 if elapsed_min >= float(args.max_session_min):
+                    stop_reason = "max_session_min"
                     return True
             return False
 
+        def finish_requested() -> bool:
+            nonlocal stop_reason
+            if control.finish_reason is None:
+                return False
+            stop_reason = control.finish_reason
+            return True
+
+        control = SessionControl(socket_path=args.control_socket, stop_file=args.stop_file or None)
+        print(f"[INFO] session control: {control.describe()}")
+        stop_reason = ""
+        prepare_show_frame()
         if not place_new_trial():
             print("[INFO] No trials to run")
             return
-        draw(stim_on=True)
+        show_stimulus()
 
         running = True
         iti_end_time = 0.0
-        stop_file = Path("STOP")
+        event_pump = ttr.EventPump(args.loop, clock)
+        session_deadline = None
+        if args.max_session_min is not None:
+            session_deadline = t0 + float(args.max_session_min) * 60.0
+        paused = False
+        paused_at = 0.0
 
         while running:
-            if stop_file.exists():
-                print("[INFO] STOP file detected. Exiting...")
+            if control.stop_reason is not None:
+                print(f"[INFO] Stop requested ({control.stop_reason}). Exiting...")
+                stop_reason = control.stop_reason
                 running = False
                 break
 
+            log_reward_pulses()
+            log_link_events()
+
+            if control.paused != paused:
+                paused = control.paused
+                now = time.perf_counter()
+                if paused:
+                    paused_at = now
+                    append_log("SESSION_PAUSED", -1, -1, 0)
+                    draw(stim_on=False)
+                else:
+                    # Timers stand still while paused.
+                    shift = now - paused_at
+                    iti_end_time += shift
+                    if wait_release_enter_t is not None:
+                        wait_release_enter_t += shift
+                    if release_clear_start_t is not None:
+                        release_clear_start_t += shift
+                    append_log("SESSION_RESUMED", -1, -1, 0)
+                    if state == STATE_SHOW:
+                        show_stimulus()
+                    else:
+                        draw(stim_on=False)
+
             if stop_limits_reached():
                 running = False
                 break
 
-            for ev in pygame.event.get([pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP]):
+            for ev in event_pump.get([pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP]):
                 if ev.type == pygame.QUIT:
+                    stop_reason = "window_closed"
                     running = False
                     break
                 if ev.type in (pygame.KEYDOWN, pygame.KEYUP):
                     if ev.key in (pygame.K_ESCAPE, pygame.K_q):
+                        stop_reason = "quit_key"
                         running = False
                         break
             if not running:
@@ -607,6 +865,7 @@ def run(args):
             pygame.event.pump()
             keys = pygame.key.get_pressed()
             if keys[pygame.K_ESCAPE] or keys[pygame.K_q]:
+                stop_reason = "quit_key"
                 running = False
                 break
 
@@ -616,7 +875,9 @@ def run(args):
             if FINGERUP is not None:
                 want.append(FINGERUP)
 
-            for ev in pygame.event.get(want):
+            events = event_pump.get(want)
+            received_t = time.perf_counter()
+            for ev in events:
                 if ev.type == pygame.MOUSEBUTTONDOWN and ev.button == 1:
                     mouse_down = True
                 elif ev.type == pygame.MOUSEBUTTONUP and ev.button == 1:
@@ -627,12 +888,15 @@ def run(args):
                     active_fingers.discard(ev.finger_id)
 
                 is_down = (ev.type == pygame.MOUSEBUTTONDOWN) or (FINGERDOWN is not None and ev.type == FINGERDOWN)
+                if paused:
+                    continue
 
                 if state == STATE_SHOW:
                     if is_down:
                         if ev.type == pygame.MOUSEBUTTONDOWN and ev.button != 1:
                             continue
                         x, y = get_xy(ev, sw, sh)
+                        touch = session_clock.input_fields(ev, received_t)
 
                         left_hit = left_plate_rect.inflate(2 * hit_margin_px, 2 * hit_margin_px).collidepoint((x, y))
                         right_hit = right_plate_rect.inflate(2 * hit_margin_px, 2 * hit_margin_px).collidepoint((x, y))
@@ -656,11 +920,20 @@ def run(args):
                             reward_won = bool(result["reward_won"])
                             reward_delivered = 0
                             ttl_ok = True
+                            reward_train_id = ""
 
                             if reward_won:
-                                screen.fill((0,0,0))
-                                pygame.display.flip()
-                                ttl_ok, _beep_ok = deliver_reward(ttl, beep, pulsecount=args.pulsecount)
+                                presenter.blank((0, 0, 0))
+                                # Water intake is accounted from the log: the reward
+                                # is on disk before its pulses can go out.
+                                append_log(
+                                    "REWARD_INTENT", x, y, 0, extra=dict(result, hit_area=hit_area), touch=touch, durable=True
+                                )
+                                try:
+                                    train = rewards.submit(args.pulsecount, pulse_interval_s, beep)
+                                    reward_train_id = train.train_id
+                                except Exception:
+                                    ttl_ok = False
                                 reward_delivered = 1 if ttl_ok else 0
 
                             iti_kind = "rewarded" if reward_won else "unrewarded"
@@ -681,17 +954,15 @@ def run(args):
                                     correction_active = True
                                     correction_left_is_r = left_is_r
 
-                            if reward_delivered:
-                                reward_count += 1
-
                             extra = dict(result)
                             extra.update({
                                 "hit_area": hit_area,
                                 "iti_kind": iti_kind,
                                 "trial_outcome": "correct" if result["is_correct"] else "incorrect",
                                 "reward_delivered": reward_delivered,
+                                "reward_train_id": reward_train_id,
                             })
-                            append_log(event_name, x, y, iti_ms, extra=extra)
+                            append_log(event_name, x, y, iti_ms, extra=extra, touch=touch)
 
                             advance_after_trial(bool(result["is_correct"]))
 
@@ -699,10 +970,12 @@ def run(args):
                             touch_during_iti = mouse_down or bool(active_fingers)
                             iti_end_time = time.perf_counter() + iti_ms / 1000.0
                             draw(stim_on=False)
+                            append_log("ITI_START", -1, -1, iti_ms)
+                            prepare_show_frame()
 
                         else:
                             outside_touches_in_trial += 1
-                            append_log("TOUCH_OUTSIDE", x, y, 0, extra={"hit_area": "outside"})
+                            append_log("TOUCH_OUTSIDE", x, y, 0, extra={"hit_area": "outside"}, touch=touch)
                             if outside_touches_in_trial >= max_outside_before_fail:
                                 outside_failures += 1
                                 if correction_mode_enabled:
@@ -724,6 +997,7 @@ def run(args):
                                         "reward_won": 0,
                                         "reward_delivered": 0,
                                     },
+                                    touch=touch,
                                 )
 
                                 advance_after_trial(False)
@@ -732,6 +1006,8 @@ def run(args):
                                 touch_during_iti = mouse_down or bool(active_fingers)
                                 iti_end_time = time.perf_counter() + iti_ms / 1000.0
                                 draw(stim_on=False)
+                                append_log("ITI_START", -1, -1, iti_ms)
+                                prepare_show_frame()
 
                 elif state == STATE_ITI:
                     if is_down:
@@ -739,14 +1015,15 @@ def run(args):
                             continue
                         touch_during_iti = True
                         x, y = get_xy(ev, sw, sh)
+                        touch = session_clock.input_fields(ev, received_t)
                         if left_plate_rect.inflate(2 * hit_margin_px, 2 * hit_margin_px).collidepoint((x, y)):
                             hit_area = "left_core" if left_plate_rect.collidepoint((x, y)) else "left_margin"
-                            append_log("TOUCH_ITI_LEFT", x, y, 0, extra={"hit_area": hit_area})
+                            append_log("TOUCH_ITI_LEFT", x, y, 0, extra={"hit_area": hit_area}, touch=touch)
                         elif right_plate_rect.inflate(2 * hit_margin_px, 2 * hit_margin_px).collidepoint((x, y)):
                             hit_area = "right_core" if right_plate_rect.collidepoint((x, y)) else "right_margin"
-                            append_log("TOUCH_ITI_RIGHT", x, y, 0, extra={"hit_area": hit_area})
+                            append_log("TOUCH_ITI_RIGHT", x, y, 0, extra={"hit_area": hit_area}, touch=touch)
                         else:
-                            append_log("TOUCH_ITI_OUTSIDE", x, y, 0, extra={"hit_area": "outside"})
+                            append_log("TOUCH_ITI_OUTSIDE", x, y, 0, extra={"hit_area": "outside"}, touch=touch)
                         draw(stim_on=False)
 
                 elif state == STATE_WAIT_RELEASE:
@@ -757,7 +1034,7 @@ def run(args):
 
             now = time.perf_counter()
 
-            if state == STATE_ITI:
+            if state == STATE_ITI and not paused:
                 if now >= iti_end_time:
                     state = STATE_WAIT_RELEASE
                     wait_release_enter_t = now
@@ -766,7 +1043,7 @@ def run(args):
                     if require_release_dwell:
                         append_log("RELEASE_DWELL_WILL_REQUIRE", -1, -1, 0)
 
-            if state == STATE_WAIT_RELEASE:
+            if state == STATE_WAIT_RELEASE and not paused:
                 no_touch_now = (not mouse_down and not active_fingers)
 
                 if require_release_dwell:
@@ -782,10 +1059,10 @@ def run(args):
                                 require_release_dwell = False
                                 touch_during_iti = False
                                 outside_touches_in_trial = 0
-                                if stop_limits_reached() or not place_new_trial():
+                                if stop_limits_reached() or finish_requested() or not place_new_trial():
                                     running = False
                                 else:
-                                    draw(stim_on=True)
+                                    show_stimulus()
                     else:
                         if release_clear_start_t is not None:
                             append_log("RELEASE_DWELL_RESET", -1, -1, 0)
@@ -795,10 +1072,10 @@ def run(args):
                         state = STATE_SHOW
                         touch_during_iti = False
                         outside_touches_in_trial = 0
-                        if stop_limits_reached() or not place_new_trial():
+                        if stop_limits_reached() or finish_requested() or not place_new_trial():
                             running = False
                         else:
-                            draw(stim_on=True)
+                            show_stimulus()
 
                 if wait_release_enter_t is not None and (now - wait_release_enter_t) >= wait_release_timeout:
                     if mouse_down or active_fingers:
@@ -811,32 +1088,81 @@ def run(args):
                             state = STATE_SHOW
                             touch_during_iti = False
                             outside_touches_in_trial = 0
-                            if stop_limits_reached() or not place_new_trial():
+                            if stop_limits_reached() or finish_requested() or not place_new_trial():
                                 running = False
                             else:
-                                draw(stim_on=True)
-
-            clock.tick(240)
-
-        if csv_f is not None:
-            csv_f.flush()
+                                show_stimulus()
+
+            dwell_end = None
+            if require_release_dwell and release_clear_start_t is not None:
+                dwell_end = release_clear_start_t + min_release_after_iti_touch_s
+            release_timeout_end = None
+            if state == STATE_WAIT_RELEASE and wait_release_enter_t is not None:
+                release_timeout_end = wait_release_enter_t + wait_release_timeout
+            deadlines = [
+                iti_end_time if state == STATE_ITI else None,
+                dwell_end if state == STATE_WAIT_RELEASE else None,
+                release_timeout_end,
+                session_deadline,
+            ]
+            event_pump.wait([session_deadline] if paused else deadlines, now)
+
+        reward_scheduler.close()
+        log_reward_pulses()
+        log_link_events()
+        append_log("SESSION_END", -1, -1, 0, extra={"stop_reason": stop_reason})
+        if event_markers is not None:
+            event_markers.close()
+            write_marker_table(marker_table_path(out_path), event_markers.records, ttl.marker_acks, t0)
+        for epoch, sync in enumerate(ttl.clock_sync_epochs + [ttl.clock_sync]):
+            if sync.samples:
+                write_sync_table(sync_table_path(out_path, epoch), sync, t0)
+        flip_timing.write(ttr.flip_timing_path(out_path), t0)
+        pd_summary = ""
+        if patch_box is not None:
+            latencies = write_photodiode_table(
+                photodiode_table_path(out_path),
+                flip_timing.transitions(),
+                ttl.photodiode_edges,
+                ttl.clock_sync_epochs + [ttl.clock_sync],
+                t0,
+            )
+            pd_summary = f"; photodiode_matched={len(latencies)}/{len(flip_timing.transitions())}"
+            if latencies:
+                pd_summary += f"; photodiode_latency_p50_ms={statistics.median(latencies) * 1000.0:.2f}"
+        csv_log.flush()
+        print(f"[INFO] log writer: {csv_log.describe()}")
         print(
-            f"[INFO] Saved CSV: {out_path}; choices={choices}; correct={correct_choices}; "
-            f"incorrect={incorrect_choices}; outside_failures={outside_failures}; rewards={reward_count}"
+            f"[INFO] Saved CSV: {csv_log.path}; choices={choices}; correct={correct_choices}; "
+            f"incorrect={incorrect_choices}; outside_failures={outside_failures}; rewards={rewards.count}; "
+            f"ttl_reconnects={ttl.reconnects}; expired_trains={ttl.expired_trains}; "
+            f"loop={event_pump.mode}; loop_iterations={event_pump.iterations}; stop_reason={stop_reason}; "
+            f"flips={len(flip_timing)}; flips_over_frame={flip_timing.over_frame(args.refresh_hz)}{pd_summary}"
         )
+        print(f"[INFO] stimuli: {stimuli.describe()}")
 
     finally:
+        if stimuli is not None:
+            stimuli.close()
         try:
             pygame.quit()
         except Exception:
             pass
+        if reward_scheduler is not None:
+            reward_scheduler.close()
+        if event_markers is not None:
+            event_markers.close()
+        if audio_channels is not None:
+            audio_channels.close()
+        if control is not None:
+            control.close()
         if ttl is not None:
             ttl.close()
-        if csv_f is not None:
+        if csv_log is not None:
             try:
-                csv_f.close()
-            except Exception:
-                pass
+                csv_log.close()
+            except Exception as e:
+                print(f"[WARN] closing {csv_log.path}: {e}", file=sys.stderr)
 
 
 def parse_args(argv: Optional[List[str]] = None):
@@ -862,7 +1188,12 @@ def parse_args(argv: Optional[List[str]] = None):
     p.add_argument("--stim-px", type=int, default=None)
     p.add_argument("--stim-w", type=int, default=None)
     p.add_argument("--stim-h", type=int, default=None)
+    p.add_argument("--stim-cache-dir", type=str, default=None, help="pre-scaled stimulus cache (default ~/.cache/hc-task/stimuli)")
+    p.add_argument("--no-stim-cache", action="store_true", help="decode and scale stimuli without the on-disk cache")
+    p.add_argument("--stim-workers", type=int, default=0, help="threads decoding uncached stimuli (0 = one per CPU)")
     p.add_argument("--stim-per-block", choices=["cycle", "fixed"], default="cycle")
+    p.add_argument("--stim-lookahead-blocks", type=int, default=1, help="blocks ahead whose stimulus pair is loaded in the background")
+    p.add_argument("--stim-resident", type=int, default=16, help="stimulus pairs kept loaded, least recently used evicted first (0 = all)")
 
     p.add_argument("--plate-px", type=int, default=None)
     p.add_argument("--plate-w", type=int, default=None)
@@ -875,6 +1206,13 @@ def parse_args(argv: Optional[List[str]] = None):
     p.add_argument("--serial-port", type=str, default=None)
     p.add_argument("--serial-baud", type=int, default=115200)
     p.add_argument("--dry-run-ttl", action="store_true")
+    p.add_argument("--ttl-protocol", choices=["auto", "v2", "legacy"], default="auto")
+    p.add_argument("--pulse-width-ms", type=float, default=5.0)
+    p.add_argument("--pulse-expiry-ms", type=int, default=2000, help="drop rewards queued longer than this while the Arduino link is down; 0 never queues")
+    p.add_argument("--max-queued-trains", type=int, default=16)
+    p.add_argument("--event-markers", action="store_true", help="emit typed event markers on the Arduino marker pins")
+    p.add_argument("--marker-queue-size", type=int, default=64)
+    p.add_argument("--clock-sync-interval-s", type=float, default=2.0, help="Arduino ping/pong period; 0 disables")
 
     p.add_argument("--iti-min-ms", type=int, default=1000)
     p.add_argument("--iti-max-ms", type=int, default=1000)
@@ -888,6 +1226,18 @@ def parse_args(argv: Optional[List[str]] = None):
     p.add_argument("--beep-freq", type=int, default=1000)
     p.add_argument("--beep-ms", type=int, default=100)
     p.add_argument("--beep-volume", type=float, default=0.6)
+    p.add_argument("--low-latency-audio", action="store_true", help="small mixer buffer and a reserved, pre-warmed reward channel")
+    p.add_argument("--audio-buffer", type=int, default=None, help="mixer buffer in samples (256 with --low-latency-audio)")
+
+    p.add_argument("--loop", choices=["poll", "event"], default="poll", help="poll at 240 Hz, or block on input and timers")
+    p.add_argument("--present", choices=["flip", "dirty"], default="flip", help="full-screen flip, or push only changed regions")
+    p.add_argument("--render", choices=["software", "renderer"], default="software", help="draw with Surface blits, or an SDL Renderer with stimuli as textures (falls back to software)")
+    p.add_argument("--refresh-hz", type=float, default=60.0, help="display refresh rate, for counting flips that missed a frame")
+    p.add_argument("--photodiode-patch-px", type=int, default=0, help="corner patch, white while the stimulus is shown; 0 disables")
+    p.add_argument("--photodiode-corner", choices=["bl", "br", "tl", "tr"], default="bl")
+    p.add_argument("--photodiode-input", action="store_true", help="ask the Arduino to report photodiode edges (pd_ttl PD_PIN)")
+    p.add_argument("--control-socket", type=str, default=None, help="Unix datagram socket accepting stop/finish/pause/resume")
+    p.add_argument("--stop-file", type=str, default="STOP", help="legacy stop file, checked once a second; empty disables")
 
     p.add_argument("--wait-release-timeout-ms", type=int, default=2000)
     p.add_argument("--min-release-ms-after-iti-touch", type=int, default=2000)
@@ -906,9 +1256,13 @@ def parse_args(argv: Optional[List[str]] = None):
     p.add_argument("--max-session-min", type=float, default=None)
 
     p.add_argument("--out-dir", type=str, default="logs")
+    p.add_argument("--log-layout", choices=["wide", "delta", "columnar"], default="wide", help="wide CSV; a session header plus varying columns per event; or binary columnar chunks (see event_log.py, columnar_log.py)")
+    p.add_argument("--log-fsync", choices=["off", "interval", "reward", "trial"], default="reward", help="when the log is fsync'd: every --log-fsync-s, plus after reward rows, plus after every trial outcome (see log_writer.py)")
+    p.add_argument("--log-fsync-s", type=float, default=10.0, help="longest time a logged row waits for an fsync (unless --log-fsync off)")
     p.add_argument("--show-box", action="store_true")
     p.add_argument("--info", action="store_true")
     p.add_argument("--pulsecount", type=int, default=1)
+    p.add_argument("--pulse-interval-ms", type=int, default=280)
     p.add_argument("--sth", type=float,default=0)
     
     p.add_argument("--reverse-high-with-block", action="store_true", default=False, help="Reverse which image is HIGH whenever a new block starts.")
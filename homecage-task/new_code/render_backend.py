@@ -0,0 +1,387 @@
+"""
+Where the tasks draw: a pygame display Surface or an SDL Renderer.
+
+``software`` is the original path: everything is drawn with ``Surface.fill``,
+``pygame.draw`` and ``blit`` on the display surface, then ``display.flip`` /
+``display.update``. ``renderer`` draws with ``pygame._sdl2.video.Renderer``:
+stimuli are uploaded once as textures, fills and copies run on the GPU and
+``present`` shows the frame. If ``pygame._sdl2`` is missing or the renderer
+cannot be created, ``open_display`` prints a warning and falls back to
+``software``.
+
+Both canvases take the same calls (``fill``, ``draw_rect``, ``blit``,
+``compose``, ``flip``/``update``), so the task draw code does not care which
+one it has. Rects may be ``pygame.Rect`` or ``(x, y, w, h)`` tuples.
+"""
+
+from __future__ import annotations
+
+import sys
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+RENDER_BACKENDS = ("software", "renderer")
+
+
+class SoftwareCanvas:
+    """Draws on a pygame Surface; ``flip``/``update`` push the display."""
+
+    backend = "software"
+    # The display keeps its pixels between frames, so regions can be redrawn.
+    partial_updates = True
+
+    def __init__(self, surface: Any):
+        self.surface = surface
+
+    def get_size(self) -> Tuple[int, int]:
+        return self.surface.get_size()
+
+    def describe(self) -> str:
+        return "software"
+
+    def fill(self, rgb, rect=None) -> None:
+        self.surface.fill(rgb, rect)
+
+    def draw_rect(self, rgb, rect, width: int = 0):
+        import pygame
+
+        return pygame.draw.rect(self.surface, rgb, rect, width)
+
+    def blit(self, image, dest):
+        return self.surface.blit(image, dest)
+
+    def convert(self, surface):
+        """Per-pixel-alpha copy in the fastest format for ``blit``."""
+        import pygame
+
+        if pygame.display.get_surface() is None:
+            # Off-screen only (no display mode to match): plain 32-bit RGBA.
+            return surface.convert(pygame.Surface((1, 1), pygame.SRCALPHA, 32))
+        return surface.convert_alpha()
+
+    def byte_order(self) -> str:
+        """Pixel byte order of the display, for ``pygame.image.frombuffer``."""
+        return masks_byte_order(self.surface.get_masks())
+
+    def upload(self, surface):
+        return surface
+
+    def compose(self, size, bg_rgb, paint: Callable[["SoftwareCanvas"], None]):
+        import pygame
+
+        surface = pygame.Surface(size, 0, self.surface)
+        surface.fill(bg_rgb)
+        paint(SoftwareCanvas(surface))
+        return surface
+
+    def frame_surface(self):
+        return self.surface
+
+    def present_surface(self, surface) -> None:
+        import pygame
+
+        pygame.display.flip()
+
+    def flip(self) -> None:
+        import pygame
+
+        pygame.display.flip()
+
+    def update(self, boxes: Sequence) -> None:
+        import pygame
+
+        pygame.display.update(boxes)
+
+    def read_pixels(self):
+        return self.surface
+
+    def close(self) -> None:
+        pass
+
+
+class RendererCanvas:
+    """Draws with an SDL Renderer; images are textures, ``flip`` is ``present``.
+
+    The back buffer is undefined after ``present``, so every frame must be
+    drawn in full (``partial_updates`` is False; FramePresenter then always
+    redraws the whole frame).
+    """
+
+    backend = "renderer"
+    partial_updates = False
+
+    def __init__(self, window: Any, renderer: Any, accelerated: bool = True):
+        import pygame
+
+        self.window = window
+        self.renderer = renderer
+        self.accelerated = accelerated
+        self._rgba = pygame.Surface((1, 1), pygame.SRCALPHA, 32)
+        self._frame = None
+        self._frame_texture = None
+
+    def get_size(self) -> Tuple[int, int]:
+        return tuple(self.window.size)
+
+    def describe(self) -> str:
+        return "renderer (accelerated)" if self.accelerated else "renderer (software)"
+
+    def fill(self, rgb, rect=None) -> None:
+        self.renderer.draw_color = _rgba(rgb)
+        if rect is None:
+            self.renderer.clear()
+        else:
+            self.renderer.fill_rect(_rect(rect))
+
+    def draw_rect(self, rgb, rect, width: int = 0):
+        rect = _rect(rect)
+        self.renderer.draw_color = _rgba(rgb)
+        if width <= 0:
+            self.renderer.fill_rect(rect)
+        else:
+            # pygame.draw.rect puts the border inside the rect.
+            for i in range(min(width, (min(rect.w, rect.h) + 1) // 2)):
+                self.renderer.draw_rect(rect.inflate(-2 * i, -2 * i))
+        return rect
+
+    def blit(self, image, dest):
+        import pygame
+        from pygame._sdl2 import video
+
+        if not isinstance(image, video.Texture):
+            # One-off surfaces (HUD text) are uploaded per call.
+            image = video.Texture.from_surface(self.renderer, image)
+        rect = pygame.Rect(dest[0], dest[1], image.width, image.height)
+        image.draw(dstrect=rect)
+        return rect
+
+    def convert(self, surface):
+        # No display mode is set, so convert_alpha is unavailable; any
+        # 32-bit RGBA surface uploads without conversion.
+        return surface.convert(self._rgba)
+
+    def byte_order(self) -> str:
+        # Textures are converted on upload anyway.
+        return "RGBA"
+
+    def upload(self, surface):
+        from pygame._sdl2 import video
+
+        return video.Texture.from_surface(self.renderer, surface)
+
+    def compose(self, size, bg_rgb, paint: Callable[["RendererCanvas"], None]):
+        from pygame._sdl2 import video
+
+        texture = video.Texture(self.renderer, tuple(size), target=True)
+        previous = self.renderer.target
+        self.renderer.target = texture
+        try:
+            self.fill(bg_rgb)
+            paint(self)
+        finally:
+            self.renderer.target = previous
+        return texture
+
+    def frame_surface(self):
+        """Off-screen surface for code that can only draw in software (see ``present_surface``)."""
+        import pygame
+
+        if self._frame is None:
+            self._frame = pygame.Surface(self.get_size(), 0, 32)
+        return self._frame
+
+    def present_surface(self, surface) -> None:
+        """Show a software-drawn frame through a streaming texture."""
+        from pygame._sdl2 import video
+
+        if self._frame_texture is None or (self._frame_texture.width, self._frame_texture.height) != surface.get_size():
+            self._frame_texture = video.Texture(self.renderer, surface.get_size(), streaming=True)
+        self._frame_texture.update(surface)
+        self._frame_texture.draw()
+        self.renderer.present()
+
+    def flip(self) -> None:
+        self.renderer.present()
+
+    def update(self, boxes: Sequence) -> None:
+        self.renderer.present()
+
+    def read_pixels(self):
+        return self.renderer.to_surface()
+
+    def close(self) -> None:
+        self._frame_texture = None
+        try:
+            self.window.destroy()
+        except Exception:
+            pass
+
+
+def _rect(rect):
+    import pygame
+
+    return rect if isinstance(rect, pygame.Rect) else pygame.Rect(rect)
+
+
+def _rgba(rgb) -> Tuple[int, int, int, int]:
+    rgb = tuple(rgb)
+    return rgb if len(rgb) == 4 else (rgb[0], rgb[1], rgb[2], 255)
+
+
+def masks_byte_order(masks: Sequence[int]) -> str:
+    """The frombuffer byte order matching a 32-bit surface's ``get_masks()``.
+
+    An image in the display's own order blits through SDL's same-format
+    path; other layouts are converted on every blit, an order of magnitude
+    slower. Falls back to ``RGBA`` for layouts frombuffer cannot express.
+    """
+    letters = ["A"] * 4
+    for letter, mask in zip("RGBA", masks):
+        if mask == 0:
+            continue
+        shift = (mask & -mask).bit_length() - 1
+        if shift % 8 != 0 or mask >> shift != 0xFF:
+            return "RGBA"
+        letters[shift // 8 if sys.byteorder == "little" else 3 - shift // 8] = letter
+    order = "".join(letters)
+    return order if order in ("RGBA", "BGRA", "ARGB") and len(set(order)) == 4 else "RGBA"
+
+
+def as_canvas(target: Any):
+    """``target`` if it is already a canvas, else a SoftwareCanvas drawing on it."""
+    return target if hasattr(target, "backend") else SoftwareCanvas(target)
+
+
+class HudLine:
+    """The ``--info`` text line, cached per field.
+
+    ``draw(target, fields)`` takes ``(name, text)`` pairs in display order.
+    Only fields whose text changed since the last draw are rasterised again.
+    The line is kept as one layer: a changed field of the same width is
+    patched in place, anything else rebuilds the layer; an unchanged HUD
+    costs one blit. On a renderer canvas the layer is re-uploaded as a
+    texture only when it changed. The rect returned is the HUD's own dirty
+    region.
+    """
+
+    def __init__(self, font: Any, pos: Tuple[int, int], color=(220, 220, 220), sep: str = "  "):
+        self.font = font
+        self.pos = tuple(pos)
+        self.color = tuple(color)
+        self.sep_w = font.size(sep)[0]
+        self.renders = 0
+        self._fields: Dict[str, Tuple[str, Any]] = {}
+        self._order: List[str] = []
+        self._x: Dict[str, int] = {}
+        self._layer = None
+        self._image = None
+        self._image_target = None
+
+    def update(self, fields: Sequence[Tuple[str, str]]) -> bool:
+        """Re-render changed fields; True if the layer changed."""
+        order = [name for name, _text in fields]
+        rebuild = self._layer is None or order != self._order
+        patch = []
+        for name, text in fields:
+            cached = self._fields.get(name)
+            if cached is not None and cached[0] == text:
+                continue
+            surface = self.font.render(text, True, self.color)
+            self.renders += 1
+            if cached is None or cached[1].get_size() != surface.get_size():
+                rebuild = True
+            patch.append(name)
+            self._fields[name] = (text, surface)
+        self._order = order
+        if rebuild:
+            self._compose()
+        else:
+            self._patch(patch)
+        if rebuild or patch:
+            self._image = None
+        return rebuild or bool(patch)
+
+    def _compose(self) -> None:
+        import pygame
+
+        surfaces = [self._fields[name][1] for name in self._order]
+        w = sum(s.get_width() for s in surfaces) + self.sep_w * max(0, len(surfaces) - 1)
+        h = max((s.get_height() for s in surfaces), default=0)
+        self._layer = pygame.Surface((max(1, w), max(1, h)), pygame.SRCALPHA, 32)
+        x = 0
+        for name in self._order:
+            self._x[name] = x
+            x += self._fields[name][1].get_width() + self.sep_w
+        self._patch(self._order)
+
+    def _patch(self, names: Sequence[str]) -> None:
+        import pygame
+
+        for name in names:
+            surface = self._fields[name][1]
+            x = self._x[name]
+            self._layer.fill((0, 0, 0, 0), (x, 0, surface.get_width(), surface.get_height()))
+            # Fields do not overlap: copy the glyph alpha instead of blending
+            # it onto the transparent layer (which would darken the edges).
+            self._layer.blit(surface, (x, 0), special_flags=pygame.BLEND_RGBA_MAX)
+
+    def draw(self, target: Any, fields: Sequence[Tuple[str, str]]):
+        self.update(fields)
+        if self._image is None or self._image_target is not target:
+            upload = getattr(target, "upload", None)
+            self._image = upload(self._layer) if upload is not None else self._layer
+            self._image_target = target
+        return target.blit(self._image, self.pos)
+
+
+def open_renderer(
+    size: Tuple[int, int],
+    fullscreen: bool,
+    title: str,
+    accelerated: bool = True,
+    vsync: bool = False,
+) -> RendererCanvas:
+    from pygame._sdl2 import video
+
+    if fullscreen:
+        window = video.Window(title, fullscreen_desktop=True)
+    else:
+        window = video.Window(title, size=tuple(size), borderless=True)
+    try:
+        renderer = video.Renderer(window, accelerated=1 if accelerated else 0, vsync=vsync)
+    except Exception:
+        window.destroy()
+        raise
+    return RendererCanvas(window, renderer, accelerated=accelerated)
+
+
+def open_display(
+    backend: str,
+    size: Tuple[int, int],
+    fullscreen: bool,
+    title: str,
+    accelerated: bool = True,
+):
+    """Open the task window; ``renderer`` falls back to ``software`` on any failure."""
+    if backend not in RENDER_BACKENDS:
+        raise ValueError(f"render backend must be one of {RENDER_BACKENDS}")
+    import pygame
+
+    if backend == "renderer":
+        try:
+            return open_renderer(size, fullscreen, title, accelerated=accelerated)
+        except Exception as e:
+            print(f"[WARN] renderer backend unavailable, using software drawing: {e}", file=sys.stderr)
+
+    flags = pygame.FULLSCREEN if fullscreen else pygame.NOFRAME
+    screen = pygame.display.set_mode((0, 0) if fullscreen else tuple(size), flags)
+    pygame.display.set_caption(title)
+    return SoftwareCanvas(screen)
+
+
+def renderer_drivers() -> List[str]:
+    """Names of the SDL render drivers in this build (empty without ``pygame._sdl2``)."""
+    try:
+        from pygame._sdl2 import video
+    except Exception:
+        return []
+    return [d.name for d in video.get_drivers()]
@@ -0,0 +1,226 @@
+"""
+Out-of-band control of a running task session.
+
+Commands reach the task without it touching the filesystem per frame:
+
+  SIGTERM           stop
+  SIGUSR1           finish the current trial, then stop
+  SIGUSR2           toggle pause
+  control socket    one command per datagram: stop | finish | pause | resume
+  STOP file         stop (legacy; checked once a second by the watcher thread)
+
+The task loop only reads attributes (``stop_reason``, ``finish_reason``,
+``paused``), so checking for commands costs nothing per iteration.
+
+Send a command to a task started with ``--control-socket``:
+  python session_control.py --socket /tmp/hc-task.sock pause
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import signal
+import socket
+import stat
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Deque, List, Optional
+
+CMD_STOP = "stop"
+CMD_FINISH = "finish"
+CMD_PAUSE = "pause"
+CMD_RESUME = "resume"
+COMMANDS = (CMD_STOP, CMD_FINISH, CMD_PAUSE, CMD_RESUME)
+
+
+@dataclass(frozen=True)
+class ControlCommand:
+    t: float
+    command: str
+    source: str
+
+
+class SessionControl:
+    """Collects stop / finish / pause commands from signals, a socket and the STOP file.
+
+    ``stop_reason`` and ``finish_reason`` are set once (first request wins)
+    to a short tag naming the source, e.g. ``"sigterm"``, ``"socket_stop"``
+    or ``"stop_file"``. Signal handlers are only installed from the main
+    thread and the previous handlers are restored by ``close``.
+    """
+
+    def __init__(
+        self,
+        socket_path: Optional[os.PathLike] = None,
+        stop_file: Optional[os.PathLike] = "STOP",
+        stop_file_interval_s: float = 1.0,
+        install_signals: bool = True,
+    ):
+        self.stop_reason: Optional[str] = None
+        self.finish_reason: Optional[str] = None
+        self.paused = False
+        self.commands: Deque[ControlCommand] = deque(maxlen=256)
+        # Resolved once so a later chdir cannot move it.
+        self.stop_file = Path(stop_file).resolve() if stop_file else None
+        self.socket_path = Path(socket_path) if socket_path else None
+        self.stop_file_interval_s = stop_file_interval_s
+
+        # Re-entrant: a signal handler may run while the main thread holds it.
+        self._lock = threading.RLock()
+        self._closed = threading.Event()
+        self._sock: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._old_handlers = {}
+
+        if install_signals:
+            self._install_signals()
+        if self.socket_path is not None:
+            self._sock = self._bind(self.socket_path)
+            if self._sock is not None:
+                self._sock.settimeout(stop_file_interval_s)
+        if self._sock is not None or self.stop_file is not None:
+            self._thread = threading.Thread(target=self._watch, name="session-control", daemon=True)
+            self._thread.start()
+
+    def request(self, command: str, source: str) -> None:
+        command = command.strip().lower()
+        if command not in COMMANDS:
+            print(f"[WARN] unknown control command {command!r} from {source}", file=sys.stderr)
+            return
+        reason = f"socket_{command}" if source == "socket" else source
+        with self._lock:
+            self.commands.append(ControlCommand(time.perf_counter(), command, source))
+            if command == CMD_STOP:
+                if self.stop_reason is None:
+                    self.stop_reason = reason
+            elif command == CMD_FINISH:
+                if self.finish_reason is None:
+                    self.finish_reason = reason
+            elif command == CMD_PAUSE:
+                self.paused = True
+            elif command == CMD_RESUME:
+                self.paused = False
+
+    def poll_commands(self) -> List[ControlCommand]:
+        out = []
+        while self.commands:
+            out.append(self.commands.popleft())
+        return out
+
+    def describe(self) -> str:
+        parts = ["signals" if self._old_handlers else "no signals"]
+        if self._sock is not None:
+            parts.append(f"socket {self.socket_path}")
+        if self.stop_file is not None:
+            parts.append(f"stop file {self.stop_file}")
+        return ", ".join(parts)
+
+    def close(self) -> None:
+        self._closed.set()
+        for signum, handler in self._old_handlers.items():
+            try:
+                signal.signal(signum, handler)
+            except (ValueError, OSError):
+                pass
+        self._old_handlers = {}
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+            try:
+                self.socket_path.unlink()
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    # -- signals ----------------------------------------------------------
+
+    def _install_signals(self) -> None:
+        if threading.current_thread() is not threading.main_thread():
+            return
+        handlers = {
+            signal.SIGTERM: lambda signum, frame: self.request(CMD_STOP, "sigterm"),
+            signal.SIGUSR1: lambda signum, frame: self.request(CMD_FINISH, "sigusr1"),
+            signal.SIGUSR2: lambda signum, frame: self.request(CMD_RESUME if self.paused else CMD_PAUSE, "sigusr2"),
+        }
+        for signum, handler in handlers.items():
+            try:
+                self._old_handlers[signum] = signal.signal(signum, handler)
+            except (ValueError, OSError) as e:
+                print(f"[WARN] cannot handle signal {signum}: {e}", file=sys.stderr)
+
+    # -- socket / STOP file -------------------------------------------------
+
+    @staticmethod
+    def _bind(path: Path) -> Optional[socket.socket]:
+        try:
+            # Remove a socket left behind by a crashed session, never a file.
+            if stat.S_ISSOCK(path.lstat().st_mode):
+                path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[WARN] control socket disabled: {e}", file=sys.stderr)
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.bind(str(path))
+        except OSError as e:
+            sock.close()
+            print(f"[WARN] control socket disabled ({path}): {e}", file=sys.stderr)
+            return None
+        return sock
+
+    def _watch(self) -> None:
+        sock = self._sock
+        while not self._closed.is_set():
+            if sock is not None:
+                try:
+                    data = sock.recv(256)
+                except socket.timeout:
+                    data = None
+                except OSError:
+                    if self._closed.is_set():
+                        return
+                    data = None
+                    self._closed.wait(self.stop_file_interval_s)
+                if data:
+                    self.request(data.decode("utf-8", "replace"), "socket")
+            else:
+                self._closed.wait(self.stop_file_interval_s)
+            if self.stop_file is not None and self.stop_reason is None and self.stop_file.exists():
+                print(f"[INFO] STOP file detected: {self.stop_file}")
+                self.request(CMD_STOP, "stop_file")
+
+
+def send_command(socket_path: os.PathLike, command: str) -> None:
+    if command not in COMMANDS:
+        raise ValueError(f"command must be one of {COMMANDS}")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.sendto(command.encode("utf-8"), str(socket_path))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Send a control command to a running task")
+    p.add_argument("--socket", type=str, required=True, help="the task's --control-socket path")
+    p.add_argument("command", choices=list(COMMANDS))
+    args = p.parse_args(argv)
+    try:
+        send_command(args.socket, args.command)
+    except OSError as e:
+        print(f"[ERROR] {args.socket}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
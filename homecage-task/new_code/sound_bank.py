@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import queue
+import sys
+import threading
+import time
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    import numpy
+except Exception:
+    numpy = None
+
+DEFAULT_SAMPLE_RATE = 44100
+CACHE_ENV = "HC_TASK_SOUND_CACHE"
+# Version of the synthesis recipe; bump it when synthesize_pcm changes so
+# stale on-disk PCM is not reused.
+PCM_FORMAT = 1
+
+
+@dataclass(frozen=True)
+class ToneKey:
+    """Everything that determines a tone's samples.
+
+    ``decay`` is the rate of an ``exp(-decay * t)`` envelope (0 = flat).
+    """
+
+    freq_hz: float
+    duration_ms: float
+    volume: float
+    decay: float = 0.0
+    sample_rate: int = DEFAULT_SAMPLE_RATE
+
+    @classmethod
+    def make(cls, freq_hz, duration_ms, volume, decay=0.0, sample_rate=DEFAULT_SAMPLE_RATE) -> "ToneKey":
+        return cls(
+            float(freq_hz),
+            float(duration_ms),
+            max(0.0, min(1.0, float(volume))),
+            max(0.0, float(decay)),
+            int(sample_rate),
+        )
+
+    @property
+    def n_samples(self) -> int:
+        return int(self.sample_rate * self.duration_ms / 1000.0)
+
+    def file_name(self) -> str:
+        text = f"v{PCM_FORMAT}:{self.freq_hz!r}:{self.duration_ms!r}:{self.volume!r}:{self.decay!r}:{self.sample_rate}"
+        return hashlib.sha1(text.encode()).hexdigest()[:20] + ".pcm"
+
+
+def synthesize_pcm(key: ToneKey) -> bytes:
+    """Mono signed 16-bit little-endian PCM for ``key``."""
+    n = key.n_samples
+    amp = 32767.0 * key.volume
+    w = 2.0 * math.pi * key.freq_hz / key.sample_rate
+
+    if numpy is not None:
+        i = numpy.arange(n, dtype=numpy.float64)
+        wave = numpy.sin(w * i) * amp
+        if key.decay > 0:
+            wave *= numpy.exp(-key.decay * i / key.sample_rate)
+        return numpy.clip(wave, -32767, 32767).astype("<i2").tobytes()
+
+    buf = array("h")
+    for i in range(n):
+        val = amp * math.sin(w * i)
+        if key.decay > 0:
+            val *= math.exp(-key.decay * i / key.sample_rate)
+        buf.append(max(-32767, min(32767, int(val))))
+    if sys.byteorder != "little":
+        buf.byteswap()
+    return buf.tobytes()
+
+
+def default_cache_dir() -> Path:
+    env = os.environ.get(CACHE_ENV)
+    if env:
+        return Path(env)
+    return Path.home() / ".cache" / "hc-task" / "sounds"
+
+
+class SoundBank:
+    """Tones synthesised once, kept as ``pygame.mixer.Sound`` and as PCM on disk.
+
+    Lookups go memory -> ``cache_dir`` -> synthesis. ``cache_dir=None`` keeps
+    the bank in memory only. Sounds are cached per mixer format, so a bank
+    survives ``pygame.mixer`` being re-initialised between sessions.
+    """
+
+    def __init__(self, cache_dir: Optional[os.PathLike] = None):
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.synthesized = 0
+        self.disk_hits = 0
+        self._pcm: Dict[ToneKey, bytes] = {}
+        self._sounds: Dict[Tuple[ToneKey, Tuple], object] = {}
+        self._lock = threading.Lock()
+        self._disk_warned = False
+
+    def pcm(self, key: ToneKey) -> bytes:
+        with self._lock:
+            data = self._pcm.get(key)
+            if data is None:
+                data = self._load(key)
+                if data is None:
+                    data = synthesize_pcm(key)
+                    self.synthesized += 1
+                    self._store(key, data)
+                else:
+                    self.disk_hits += 1
+                self._pcm[key] = data
+            return data
+
+    def sound(self, freq_hz, duration_ms, volume, decay=0.0, sample_rate: Optional[int] = None):
+        """A ``pygame.mixer.Sound`` for the tone; the mixer must be initialised."""
+        import pygame
+
+        mixer_format = pygame.mixer.get_init()
+        if mixer_format is None:
+            raise RuntimeError("pygame.mixer is not initialised")
+        if sample_rate is None:
+            sample_rate = mixer_format[0]
+        key = ToneKey.make(freq_hz, duration_ms, volume, decay, sample_rate)
+
+        cache_key = (key, mixer_format)
+        snd = self._sounds.get(cache_key)
+        if snd is None:
+            snd = pygame.mixer.Sound(buffer=self._frames(self.pcm(key), mixer_format))
+            self._sounds[cache_key] = snd
+        return snd
+
+    def preload(self, keys) -> None:
+        for key in keys:
+            self.pcm(key)
+
+    @staticmethod
+    def _frames(mono: bytes, mixer_format) -> bytes:
+        # The tasks all run the mixer at signed 16-bit, so only the channel
+        # count has to be adapted: duplicate each mono sample per channel.
+        channels = mixer_format[2]
+        if channels <= 1:
+            return mono
+        if numpy is not None:
+            samples = numpy.frombuffer(mono, dtype="<i2")
+            return numpy.repeat(samples, channels).astype("<i2").tobytes()
+        src = array("h", mono)
+        out = array("h", bytes(len(mono) * channels))
+        for c in range(channels):
+            out[c::channels] = src
+        return out.tobytes()
+
+    def _path(self, key: ToneKey) -> Optional[Path]:
+        return None if self.cache_dir is None else self.cache_dir / key.file_name()
+
+    def _load(self, key: ToneKey) -> Optional[bytes]:
+        path = self._path(key)
+        if path is None:
+            return None
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        return data if len(data) == 2 * key.n_samples else None
+
+    def _store(self, key: ToneKey, data: bytes) -> None:
+        path = self._path(key)
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".tmp{os.getpid()}")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            if not self._disk_warned:
+                self._disk_warned = True
+                print(f"[WARN] sound cache not writable ({e}); keeping tones in memory only", file=sys.stderr)
+
+
+_default_bank: Optional[SoundBank] = None
+
+
+def default_bank() -> SoundBank:
+    global _default_bank
+    if _default_bank is None:
+        _default_bank = SoundBank(default_cache_dir())
+    return _default_bank
+
+
+AUDIO_CHANNEL_NAMES = ("reward", "feedback")
+
+
+@dataclass
+class AudioPlayRecord:
+    """When a sound was handed to its channel and when the channel reported busy."""
+
+    channel: str
+    queued_t: float
+    returned_t: Optional[float] = None
+    busy_t: Optional[float] = None
+    done: threading.Event = field(default_factory=threading.Event)
+
+
+class ChannelSound:
+    """A Sound bound to a reserved channel; ``play()`` is a drop-in for ``Sound.play``."""
+
+    def __init__(self, audio: "ReservedAudioChannels", channel: str, sound):
+        self.audio = audio
+        self.channel = channel
+        self.sound = sound
+
+    def play(self) -> AudioPlayRecord:
+        return self.audio.play(self.channel, self.sound)
+
+
+class ReservedAudioChannels:
+    """Dedicated, pre-warmed mixer channels for reward and feedback sounds."""
+
+    def __init__(self, names=AUDIO_CHANNEL_NAMES, busy_timeout_s: float = 0.1, clock=time.perf_counter):
+        import pygame
+
+        if pygame.mixer.get_init() is None:
+            raise RuntimeError("pygame.mixer is not initialised")
+        self.clock = clock
+        self.busy_timeout_s = float(busy_timeout_s)
+        pygame.mixer.set_reserved(len(names))
+        self.channels = {name: pygame.mixer.Channel(i) for i, name in enumerate(names)}
+        self._watch: "queue.Queue[Optional[AudioPlayRecord]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._watcher, name="audio-busy-watch", daemon=True)
+        self._thread.start()
+
+    def bind(self, channel: str, sound) -> ChannelSound:
+        if channel not in self.channels:
+            raise KeyError(f"no reserved audio channel named {channel!r}")
+        return ChannelSound(self, channel, sound)
+
+    def prewarm(self, ms: int = 20, timeout_s: float = 1.0) -> None:
+        import pygame
+
+        mixer_format = pygame.mixer.get_init()
+        n_bytes = int(mixer_format[0] * ms / 1000.0) * abs(mixer_format[1]) // 8 * mixer_format[2]
+        silence = pygame.mixer.Sound(buffer=bytes(n_bytes))
+        for ch in self.channels.values():
+            ch.play(silence)
+        deadline = time.perf_counter() + timeout_s
+        while any(ch.get_busy() for ch in self.channels.values()) and time.perf_counter() < deadline:
+            time.sleep(0.002)
+
+    def play(self, channel: str, sound) -> AudioPlayRecord:
+        ch = self.channels[channel]
+        rec = AudioPlayRecord(channel, self.clock())
+        ch.play(sound)
+        rec.returned_t = self.clock()
+        if ch.get_busy():
+            rec.busy_t = rec.returned_t
+            rec.done.set()
+        else:
+            self._watch.put(rec)
+        return rec
+
+    def close(self) -> None:
+        self._watch.put(None)
+        self._thread.join(1.0)
+
+    def _watcher(self) -> None:
+        while True:
+            rec = self._watch.get()
+            if rec is None:
+                return
+            ch = self.channels[rec.channel]
+            deadline = rec.queued_t + self.busy_timeout_s
+            while self.clock() < deadline:
+                if ch.get_busy():
+                    rec.busy_t = self.clock()
+                    break
+                time.sleep(0.0005)
+            rec.done.set()
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import mmap
+import os
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+CACHE_ENV = "HC_TASK_STIM_CACHE"
+# Version of the decode/scale recipe and of the file layout; bump it when
+# either changes so stale pixels are not reused.
+PIXEL_FORMAT = 1
+# magic, format, byte order, width, height; the pixels follow.
+_HEADER = struct.Struct("<4sH4sII")
+_MAGIC = b"STIM"
+# Byte orders pygame.image.frombuffer can wrap without converting.
+BYTE_ORDERS = ("RGBA", "BGRA", "ARGB")
+
+
+@dataclass(frozen=True)
+class StimKey:
+    """Everything that determines a cached stimulus's pixels.
+
+    ``digest`` is the SHA-256 of the image file, so renamed or re-saved
+    stimuli are recognised by content. ``scaler`` is the pygame version,
+    whose ``smoothscale`` produced the pixels.
+    """
+
+    digest: str
+    size: Tuple[int, int]
+    byte_order: str
+    scaler: str
+
+    def file_name(self) -> str:
+        w, h = self.size
+        text = f"v{PIXEL_FORMAT}:{self.digest}:{w}x{h}:{self.byte_order}:{self.scaler}"
+        return hashlib.sha1(text.encode()).hexdigest()[:24] + ".px"
+
+
+def default_cache_dir() -> Path:
+    env = os.environ.get(CACHE_ENV)
+    if env:
+        return Path(env)
+    return Path.home() / ".cache" / "hc-task" / "stimuli"
+
+
+def decode_scaled(data: bytes, name: str, size: Tuple[int, int], byte_order: str = "RGBA") -> bytes:
+    """Decode an image file and smoothscale it to ``size``; 32-bit pixels in ``byte_order``.
+
+    Needs no display, so it can run on worker threads (pygame releases the
+    GIL while decoding and scaling).
+    """
+    import pygame
+
+    image = pygame.image.load(io.BytesIO(data), name)
+    if image.get_bitsize() != 32 or not image.get_flags() & pygame.SRCALPHA:
+        # Palette / RGB files: onto per-pixel alpha, as convert_alpha would.
+        rgba = pygame.Surface(image.get_size(), pygame.SRCALPHA, 32)
+        rgba.blit(image, (0, 0))
+        image = rgba
+    if image.get_size() != tuple(size):
+        image = pygame.transform.smoothscale(image, tuple(size))
+    return pygame.image.tobytes(image, byte_order)
+
+
+class StimulusCache:
+    """Pre-scaled stimulus pixels on disk, loaded as zero-copy surfaces.
+
+    ``load(paths, size, byte_order)`` hashes every file, then maps each one
+    that is cached (``<cache_dir>/<key>.px``) and wraps the mapping with
+    ``pygame.image.frombuffer``: no decode, no scale, no copy; the surface
+    keeps the mapping alive. Misses are decoded and scaled on a thread pool
+    of ``workers`` threads, written atomically, and mapped the same way.
+    ``cache_dir=None`` skips the disk and wraps the decoded bytes.
+    """
+
+    def __init__(self, cache_dir: Optional[os.PathLike] = None, workers: Optional[int] = None):
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self.decoded = 0
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+        self._disk_warned = False
+
+    def load(self, paths: Sequence[os.PathLike], size: Tuple[int, int], byte_order: str = "RGBA") -> List[Any]:
+        """One surface of ``size`` per path, in order."""
+        if byte_order not in BYTE_ORDERS:
+            raise ValueError(f"byte order must be one of {BYTE_ORDERS}")
+        import pygame
+
+        size = (int(size[0]), int(size[1]))
+        jobs = [(Path(p), size, byte_order, pygame.version.ver) for p in paths]
+        if len(jobs) <= 1 or self.workers == 1:
+            return [self._load_one(*job) for job in jobs]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(jobs)), thread_name_prefix="stim-decode") as pool:
+            return list(pool.map(lambda job: self._load_one(*job), jobs))
+
+    def _load_one(self, path: Path, size: Tuple[int, int], byte_order: str, scaler: str):
+        import pygame
+
+        data = path.read_bytes()
+        key = StimKey(hashlib.sha256(data).hexdigest(), size, byte_order, scaler)
+        pixels = self._map(key)
+        if pixels is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            pixels = decode_scaled(data, path.name, size, byte_order)
+            with self._lock:
+                self.decoded += 1
+            if self._store(key, pixels):
+                pixels = self._map(key) or pixels
+        return pygame.image.frombuffer(pixels, size, byte_order)
+
+    def _path(self, key: StimKey) -> Optional[Path]:
+        return None if self.cache_dir is None else self.cache_dir / key.file_name()
+
+    def _map(self, key: StimKey):
+        """The cached pixels as a read-only memoryview of the mapped file, or None."""
+        path = self._path(key)
+        if path is None:
+            return None
+        w, h = key.size
+        try:
+            with path.open("rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(mapped) != _HEADER.size + 4 * w * h:
+            mapped.close()
+            return None
+        magic, fmt, order, fw, fh = _HEADER.unpack_from(mapped)
+        if magic != _MAGIC or fmt != PIXEL_FORMAT or order != key.byte_order.encode() or (fw, fh) != (w, h):
+            mapped.close()
+            return None
+        return memoryview(mapped)[_HEADER.size:]
+
+    def _store(self, key: StimKey, pixels: bytes) -> bool:
+        path = self._path(key)
+        if path is None:
+            return False
+        w, h = key.size
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.parent / f"{path.name}.tmp{os.getpid()}-{threading.get_ident()}"
+            with tmp.open("wb") as f:
+                f.write(_HEADER.pack(_MAGIC, PIXEL_FORMAT, key.byte_order.encode(), w, h))
+                f.write(pixels)
+            os.replace(tmp, path)
+            return True
+        except OSError as e:
+            with self._lock:
+                warn = not self._disk_warned
+                self._disk_warned = True
+            if warn:
+                print(f"[WARN] stimulus cache not writable ({e}); decoding in memory only", file=sys.stderr)
+            return False
+
+    def describe(self) -> str:
+        where = str(self.cache_dir) if self.cache_dir is not None else "memory only"
+        return f"{self.disk_hits} cached, {self.decoded} decoded ({where}, {self.workers} workers)"
+
+
+class StimulusProvider:
+    """Stimulus sets loaded on demand, prefetched ahead of use, evicted least recently used.
+
+    ``sets`` maps a set id to the image paths of that set. ``request(ids)``
+    names the sets the coming trials need; those not yet resident are
+    loaded through ``cache`` on a background thread. ``get(id)`` returns a
+    set's surfaces, passed through ``upload`` on the calling thread (so
+    textures are made on the thread that owns the renderer). It only blocks
+    when the set was not requested in time, which is counted in ``waits``.
+
+    At most ``capacity`` sets stay resident (0 keeps every set loaded); the
+    sets of the latest request are never evicted.
+    """
+
+    def __init__(
+        self,
+        cache: StimulusCache,
+        sets: Mapping[Hashable, Sequence[os.PathLike]],
+        size: Tuple[int, int],
+        byte_order: str = "RGBA",
+        upload: Optional[Callable[[Any], Any]] = None,
+        capacity: int = 0,
+    ):
+        self.cache = cache
+        self.sets = {set_id: [Path(p) for p in paths] for set_id, paths in sets.items()}
+        self.size = (int(size[0]), int(size[1]))
+        self.byte_order = byte_order
+        self.upload = upload or (lambda surface: surface)
+        self.capacity = max(0, int(capacity))
+        self.loads = 0
+        self.waits = 0
+        self.evictions = 0
+        self.peak = 0
+        self._resident: "OrderedDict[Hashable, List[Any]]" = OrderedDict()
+        self._pending: Dict[Hashable, Future] = {}
+        self._wanted: Tuple[Hashable, ...] = ()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stim-prefetch")
+
+    def request(self, ids: Iterable[Hashable], wait: bool = False) -> None:
+        """Start loading ``ids`` in the background; with ``wait``, block until they are resident."""
+        self._collect()
+        self._wanted = tuple(dict.fromkeys(ids))
+        for set_id in self._wanted:
+            if set_id not in self._resident and set_id not in self._pending:
+                self._pending[set_id] = self._pool.submit(self._load, set_id)
+        if wait:
+            for set_id in self._wanted:
+                if set_id in self._pending:
+                    self._admit(set_id, self._pending.pop(set_id).result())
+
+    def get(self, set_id: Hashable) -> List[Any]:
+        """The surfaces of one set, in the order of its paths."""
+        self._collect()
+        if set_id not in self._resident:
+            future = self._pending.pop(set_id, None)
+            self.waits += 1
+            self._admit(set_id, future.result() if future is not None else self._load(set_id))
+        self._resident.move_to_end(set_id)
+        return self._resident[set_id]
+
+    def resident(self) -> List[Hashable]:
+        """Resident set ids, least recently used first."""
+        return list(self._resident)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def describe(self) -> str:
+        bound = f"at most {self.capacity}" if self.capacity else "all"
+        return (
+            f"{len(self.sets)} sets ({bound} resident, peak {self.peak}); {self.loads} loads, "
+            f"{self.evictions} evicted, {self.waits} waited; {self.cache.describe()}"
+        )
+
+    def _load(self, set_id: Hashable) -> List[Any]:
+        return self.cache.load(self.sets[set_id], self.size, self.byte_order)
+
+    def _collect(self) -> None:
+        for set_id, future in list(self._pending.items()):
+            if future.done():
+                del self._pending[set_id]
+                self._admit(set_id, future.result())
+
+    def _admit(self, set_id: Hashable, images: List[Any]) -> None:
+        self._resident[set_id] = [self.upload(image) for image in images]
+        self.loads += 1
+        if self.capacity:
+            for old in list(self._resident):
+                if len(self._resident) <= self.capacity:
+                    break
+                if old != set_id and old not in self._wanted:
+                    del self._resident[old]
+                    self.evictions += 1
+        self.peak = max(self.peak, len(self._resident))
@@ -1,16 +1,18 @@
 from __future__ import annotations
 
 import hashlib
-import math
+import itertools
+import queue
 import random
-import sys
+import threading
 import time
-from typing import Optional, Tuple
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
 
-try:
-    import serial
-except Exception:
-    serial = None
+import sound_bank
+from arduino_link import TRAIN_EXPIRED, TRAIN_SENT, TTL_PROTOCOL_V2
+from sound_bank import AudioPlayRecord
 
 
 def derive_rng(master_seed: int, stream: str) -> random.Random:
@@ -24,103 +26,244 @@ def sample_reward(rng: random.Random, p: float) -> Tuple[float, bool]:
     return (u, u < p)
 
 
-class ArduinoTTLSender:
-    def __init__(self, port: Optional[str], baud: int = 115200, dry_run: bool = False):
-        self.port = port
-        self.baud = baud
-        self.dry_run = dry_run
-        self.pulse_count = 0
-        self.ser = None
-
-        if self.dry_run:
-            return
-
-        if serial is None:
-            raise RuntimeError("pyserial is required for ArduinoTTLSender when dry_run is False")
-
-        self.ser = serial.Serial(port, baud, timeout=0, write_timeout=0.2)
-
-    def pulse(self) -> None:
-        self.pulse_count += 1
-
-        if self.dry_run:
-            print("ArduinoTTLSender dry-run: PULSE", file=sys.stderr)
-            return
-
-        if self.ser is None:
-            raise RuntimeError("Arduino serial connection is not open")
-
-        self.ser.write(b"PULSE\n")
-        self.ser.flush()
-
-    def close(self) -> None:
-        if self.ser is not None:
-            self.ser.close()
-            self.ser = None
-
-
 def make_beep_sound(freq_hz: int, ms: int, volume: float):
-    volume = max(0.0, min(1.0, float(volume)))
-
+    """Reward beep from the shared sound bank (synthesised at most once per machine)."""
     try:
-        import pygame
-    except Exception as exc:
+        return sound_bank.default_bank().sound(freq_hz, ms, volume)
+    except ImportError as exc:
         raise RuntimeError("pygame is required to synthesize beep sounds") from exc
 
-    try:
-        import numpy
-    except Exception:
-        numpy = None
-
-    sample_rate = 44100
-    n_samples = int(sample_rate * ms / 1000.0)
-
-    if numpy is not None:
-        t = numpy.arange(n_samples, dtype=numpy.float32) / float(sample_rate)
-        wave = numpy.sin(2.0 * math.pi * float(freq_hz) * t) * float(volume)
-        samples = (wave * 32767.0).astype(numpy.int16)
-        stereo = numpy.column_stack((samples, samples))
-        return pygame.sndarray.make_sound(stereo)
-
-    array_module = None
-    try:
-        from array import array as array_module
-    except Exception as exc:
-        raise RuntimeError("Python array module is required to synthesize beep sounds without numpy") from exc
-
-    samples = array_module("h")
-    amp = max(0.0, min(1.0, float(volume))) * 32767.0
-    for i in range(n_samples):
-        value = int(math.sin(2.0 * math.pi * float(freq_hz) * i / float(sample_rate)) * amp)
-        samples.append(value)
-        samples.append(value)
-
-    return pygame.mixer.Sound(buffer=samples.tobytes())
 
+@dataclass(frozen=True)
+class PulseRecord:
+    train_id: int
+    pulse_index: int
+    scheduled_t: float
+    emitted_t: float
+    ok: bool
+    arduino_us: Optional[int] = None
+    expired: bool = False
+    # Written to the port, but the board never acked this pulse.
+    unacked: bool = False
+
+    @property
+    def sent(self) -> bool:
+        return self.ok or self.unacked
+
+
+@dataclass
+class PulseTrain:
+    train_id: int
+    count: int
+    interval_s: float
+    beep: object = None
+    requested_t: float = 0.0
+    beep_t: Optional[float] = None
+    beep_ok: Optional[bool] = None
+    beep_record: Optional[AudioPlayRecord] = None
+    records: List[PulseRecord] = field(default_factory=list)
+    done: threading.Event = field(default_factory=threading.Event)
+
+    @property
+    def ok(self) -> bool:
+        return len(self.records) == self.count and all(r.ok for r in self.records)
+
+
+class RewardScheduler:
+    """Emit reward pulse trains on a background thread; ``poll`` reports each pulse once."""
+
+    def __init__(self, ttl, clock=time.perf_counter, sleep=time.sleep, ack_timeout_s: float = 0.5):
+        self.ttl = ttl
+        self.clock = clock
+        self.sleep = sleep
+        self.ack_timeout_s = float(ack_timeout_s)
+        self._ids = itertools.count(1)
+        self._pending: "queue.Queue[Optional[PulseTrain]]" = queue.Queue()
+        self._emitted: "queue.Queue[PulseRecord]" = queue.Queue()
+        self._closed = False
+        self._busy_until = 0.0
+        self._beeps: Deque[PulseTrain] = deque()
+        self._thread = threading.Thread(target=self._worker, name="reward-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, count: int = 1, interval_s: float = 0.28, beep=None) -> PulseTrain:
+        if self._closed:
+            raise RuntimeError("RewardScheduler is closed")
+        train = PulseTrain(
+            train_id=next(self._ids),
+            count=max(0, int(count)),
+            interval_s=max(0.0, float(interval_s)),
+            beep=beep,
+            requested_t=self.clock(),
+        )
+        self._pending.put(train)
+        return train
+
+    def poll(self) -> List[PulseRecord]:
+        out = []
+        while True:
+            try:
+                out.append(self._emitted.get_nowait())
+            except queue.Empty:
+                return out
+
+    def poll_beeps(self) -> List[PulseTrain]:
+        """Trains whose reserved-channel beep has a settled ``beep_record``."""
+        out = []
+        waiting = []
+        while self._beeps:
+            train = self._beeps.popleft()
+            (out if train.beep_record.done.is_set() else waiting).append(train)
+        self._beeps.extendleft(reversed(waiting))
+        return out
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._pending.put(None)
+        self._thread.join(timeout)
+
+    def _worker(self) -> None:
+        while True:
+            train = self._pending.get()
+            try:
+                if train is None:
+                    return
+                self._emit(train)
+            finally:
+                self._pending.task_done()
+
+    def _emit(self, train: PulseTrain) -> None:
+        start_t = self.clock()
+
+        if train.beep is not None:
+            try:
+                played = train.beep.play()
+                train.beep_ok = True
+            except Exception:
+                played = None
+                train.beep_ok = False
+            train.beep_t = self.clock()
+            if isinstance(played, AudioPlayRecord):
+                train.beep_record = played
+                self._beeps.append(train)
+
+        if getattr(self.ttl, "protocol", None) == TTL_PROTOCOL_V2:
+            self._emit_acked(train, start_t)
+            train.done.set()
+            return
 
-def deliver_reward(ttl, beep, pulsecount: int = 1) -> Tuple[bool, bool]:
-    ttl_ok = False
-    beep_ok = False
+        for i in range(train.count):
+            scheduled_t = start_t + i * train.interval_s
+            delay = scheduled_t - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+            expired = False
+            try:
+                seq = self.ttl.pulse()
+                ok = self._wait_sent(seq) is not None
+                expired = not ok
+            except Exception:
+                ok = False
+            rec = PulseRecord(train.train_id, i, scheduled_t, self.clock(), ok, expired=expired)
+            train.records.append(rec)
+            self._emitted.put(rec)
+
+        train.done.set()
+
+    def _wait_sent(self, seq) -> Optional[float]:
+        """When the train reached the port, or None if it expired in the sender's queue."""
+        train_state = getattr(self.ttl, "train_state", None)
+        if seq is None or train_state is None:
+            return self.clock()
+        while True:
+            state = train_state(seq)
+            if state == TRAIN_SENT:
+                sent_t = self.ttl.train_sent_t(seq)
+                return self.clock() if sent_t is None else sent_t
+            if state == TRAIN_EXPIRED:
+                return None
+            self.sleep(0.005)
+
+    def _emit_acked(self, train: PulseTrain, start_t: float) -> None:
+        def record(
+            i: int, emitted_t: float, ok: bool, arduino_us: Optional[int] = None, expired: bool = False, unacked: bool = False
+        ) -> None:
+            rec = PulseRecord(train.train_id, i, start_t + i * train.interval_s, emitted_t, ok, arduino_us, expired, unacked)
+            train.records.append(rec)
+            self._emitted.put(rec)
+
+        # pd_ttl answers BUSY while the previous train's last pulse is still
+        # high; back-to-back trains (e.g. flushed after a reconnect) wait it out.
+        delay = self._busy_until - self.clock()
+        if delay > 0:
+            self.sleep(delay)
 
-    if beep is not None:
         try:
-            beep.play()
-            beep_ok = True
+            seq = self.ttl.send_train(train.count, interval_ms=train.interval_s * 1000.0)
+            sent_t = self._wait_sent(seq)
         except Exception:
-            beep_ok = False
-
-    try:
-        for i in range(pulsecount):
-            ttl.pulse()
-            time.sleep(0.28)
-            print(pulse)
-        ttl_ok = True
-    except Exception:
-        ttl_ok = False
-
-
+            for i in range(train.count):
+                record(i, self.clock(), False)
+            return
+        if sent_t is None:
+            for i in range(train.count):
+                record(i, self.clock(), False, expired=True)
+            return
 
-    return (ttl_ok, beep_ok)
+        pending = set(range(train.count))
+        deadline = max(start_t, sent_t) + train.count * train.interval_s + self.ack_timeout_s
+        while pending and self.clock() < deadline:
+            try:
+                acks = self.ttl.poll_acks()
+            except Exception:
+                break
+            for ack in acks:
+                if ack.seq == seq and ack.pulse_index in pending:
+                    pending.discard(ack.pulse_index)
+                    record(ack.pulse_index, ack.host_t, True, ack.arduino_us)
+            if pending:
+                self.sleep(0.001)
+
+        # The train reached the port; a lost ack does not mean a lost pulse.
+        for i in sorted(pending):
+            record(i, self.clock(), False, unacked=True)
+        self._busy_until = self.clock() + getattr(self.ttl, "pulse_width_ms", 0.0) / 1000.0 + 0.001
+
+
+class RewardLedger:
+    """Rewards counted from the pulses a ``RewardScheduler`` reports; ``settle`` takes back unsent trains."""
+
+    def __init__(self, scheduler: RewardScheduler):
+        self.scheduler = scheduler
+        self.count = 0
+        self.failed_trains = 0
+        # train_id -> [pulses not yet reported, any pulse sent]
+        self._open: Dict[int, List] = {}
+
+    def submit(self, count: int = 1, interval_s: float = 0.28, beep=None) -> PulseTrain:
+        train = self.scheduler.submit(count, interval_s, beep)
+        if train.count:
+            self._open[train.train_id] = [train.count, False]
+        self.count += 1
+        return train
+
+    def settle(self, records: Iterable[PulseRecord]) -> List[int]:
+        failed = []
+        for rec in records:
+            state = self._open.get(rec.train_id)
+            if state is None:
+                continue
+            state[0] -= 1
+            state[1] = state[1] or rec.sent
+            if state[0] == 0:
+                del self._open[rec.train_id]
+                if not state[1]:
+                    self.count -= 1
+                    self.failed_trains += 1
+                    failed.append(rec.train_id)
+        return failed
 
 
 def get_xy(event, screen_w: int, screen_h: int) -> Tuple[int, int]:
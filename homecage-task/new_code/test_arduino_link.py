@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+import csv
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import arduino_link
+import clock_sync
+
+
+class FakeSerial:
+    """In-memory stand-in for pd_ttl.ino answering the v2 protocol."""
+
+    def __init__(self, v2=True, photodiode=False):
+        self.v2 = v2
+        self.photodiode = photodiode
+        self.rx = bytearray()
+        self.written = []
+        self.micros = 1000
+        self.unplugged = False
+        # Swallow pulse trains: no pulse, no ack (a bad link or a hung board).
+        self.drop_trains = False
+
+    @property
+    def in_waiting(self):
+        if self.unplugged:
+            raise OSError("device disconnected")
+        return len(self.rx)
+
+    def read(self, n):
+        out = bytes(self.rx[:n])
+        del self.rx[:n]
+        return out
+
+    def write(self, data):
+        if self.unplugged:
+            raise OSError("device disconnected")
+        self.written.append(bytes(data))
+        if not self.v2:
+            return
+        for line in bytes(data).splitlines():
+            fields = arduino_link.decode_frame(line)
+            if fields == ["V?"]:
+                self.rx.extend(arduino_link.encode_frame("V", 2))
+            elif fields is not None and fields[0] == "S":
+                self.micros += 250
+                self.rx.extend(arduino_link.encode_frame("S", fields[1], self.micros))
+            elif fields is not None and fields[0] == "D" and self.photodiode:
+                self.rx.extend(arduino_link.encode_frame("D", fields[1]))
+            elif fields is not None and fields[0] == "M":
+                self.rx.extend(arduino_link.encode_frame("K", fields[1], fields[2], self.micros))
+            elif fields is not None and fields[0] == "P" and not self.drop_trains:
+                seq, count, _width_us, interval_us = (int(f) for f in fields[1:])
+                for i in range(count):
+                    self.rx.extend(arduino_link.encode_frame("A", seq, i, self.micros + i * interval_us))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def open_fake_sender(test, fake, **kwargs):
+    fake_serial_module = SimpleNamespace(Serial=lambda *a, **k: fake)
+    with mock.patch.object(arduino_link, "serial", fake_serial_module):
+        ttl = arduino_link.ArduinoTTLSender("/dev/fake", **kwargs)
+    test.addCleanup(ttl.close)
+    return ttl
+
+
+def open_replugging_sender(test, ports, **kwargs):
+    """Sender whose reconnects open the next FakeSerial in ``ports`` (an exhausted list fails)."""
+    def open_port(*_a, **_k):
+        if not ports:
+            raise OSError("no such device")
+        return ports.pop(0)
+
+    patcher = mock.patch.object(arduino_link, "serial", SimpleNamespace(Serial=open_port))
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    kwargs.setdefault("reconnect_min_s", 0.01)
+    ttl = arduino_link.ArduinoTTLSender("/dev/fake", **kwargs)
+    test.addCleanup(ttl.close)
+    return ttl
+
+
+def wait_for(predicate, timeout_s=2.0):
+    deadline = time.perf_counter() + timeout_s
+    while not predicate() and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+class FrameTests(unittest.TestCase):
+    def test_frame_round_trip(self):
+        frame = arduino_link.encode_frame("P", 7, 3, 5000, 280000)
+        self.assertTrue(frame.startswith(b"$P,7,3,5000,280000*"))
+        self.assertTrue(frame.endswith(b"\n"))
+        self.assertEqual(arduino_link.decode_frame(frame), ["P", "7", "3", "5000", "280000"])
+
+    def test_decode_rejects_bad_checksum_and_legacy_lines(self):
+        frame = bytearray(arduino_link.encode_frame("A", 1, 0, 1234))
+        frame[3] = ord("9")
+        self.assertIsNone(arduino_link.decode_frame(bytes(frame)))
+        self.assertIsNone(arduino_link.decode_frame(b"PULSE\n"))
+
+
+class ArduinoTTLSenderTests(unittest.TestCase):
+    def test_v2_train_is_one_write_and_acks_are_exposed(self):
+        fake = FakeSerial(v2=True)
+        ttl = open_fake_sender(self, fake)
+        self.assertEqual(ttl.protocol, arduino_link.TTL_PROTOCOL_V2)
+        fake.written.clear()
+
+        seq = ttl.send_train(3, interval_ms=100.0)
+        self.assertEqual(len(fake.written), 1)
+
+        acks = ttl.poll_acks()
+        self.assertEqual([(a.seq, a.pulse_index) for a in acks], [(seq, 0), (seq, 1), (seq, 2)])
+        self.assertEqual(acks[2].arduino_us - acks[0].arduino_us, 200000)
+        self.assertEqual(list(ttl.acks), acks)
+        self.assertEqual(ttl.poll_acks(), [])
+
+    def test_auto_falls_back_to_legacy_pulse_lines(self):
+        fake = FakeSerial(v2=False)
+        ttl = open_fake_sender(self, fake, probe_timeout_s=0.05)
+        self.assertEqual(ttl.protocol, arduino_link.TTL_PROTOCOL_LEGACY)
+        fake.written.clear()
+
+        ttl.pulse()
+        self.assertEqual(fake.written, [b"PULSE\n"])
+        self.assertEqual(ttl.poll_acks(), [])
+
+    def test_forced_v2_without_firmware_support_raises(self):
+        with self.assertRaises(RuntimeError):
+            open_fake_sender(self, FakeSerial(v2=False), protocol="v2", probe_timeout_s=0.05)
+
+    def test_ping_adds_clock_sync_sample(self):
+        fake = FakeSerial(v2=True)
+        ttl = open_fake_sender(self, fake)
+
+        first = ttl.ping()
+        second = ttl.ping()
+
+        self.assertIsNotNone(first)
+        self.assertEqual(second.arduino_us - first.arduino_us, 250)
+        self.assertEqual(len(ttl.clock_sync.samples), 2)
+        self.assertIsNone(open_fake_sender(self, FakeSerial(v2=False), probe_timeout_s=0.05).ping())
+
+
+class LinkRecoveryTests(unittest.TestCase):
+    def test_train_sent_while_unplugged_is_queued_and_flushed_on_reconnect(self):
+        first, second = FakeSerial(v2=True), FakeSerial(v2=True)
+        ports = [first]
+        ttl = open_replugging_sender(self, ports)
+        first.unplugged = True
+
+        t = time.perf_counter()
+        seq = ttl.send_train(2, interval_ms=10.0)
+        self.assertLess(time.perf_counter() - t, 0.05)
+        self.assertEqual(ttl.link_state, arduino_link.LINK_DOWN)
+        self.assertEqual(ttl.train_state(seq), arduino_link.TRAIN_QUEUED)
+
+        ports.append(second)
+        self.assertTrue(wait_for(lambda: ttl.train_state(seq) == arduino_link.TRAIN_SENT))
+        self.assertEqual(arduino_link.decode_frame(second.written[-1])[:3], ["P", str(seq), "2"])
+        self.assertEqual(ttl.link_epoch, 1)
+        self.assertEqual(ttl.reconnects, 1)
+        self.assertEqual([e.state for e in ttl.poll_link_events()], [arduino_link.LINK_DOWN, arduino_link.LINK_UP])
+        self.assertEqual(ttl.poll_link_events(), [])
+
+    def test_full_queue_expires_oldest_train(self):
+        fake = FakeSerial(v2=True)
+        ttl = open_replugging_sender(self, [fake], max_queued_trains=2)
+        fake.unplugged = True
+
+        seqs = [ttl.send_train(1) for _ in range(3)]
+        self.assertEqual(
+            [ttl.train_state(s) for s in seqs],
+            [arduino_link.TRAIN_EXPIRED, arduino_link.TRAIN_QUEUED, arduino_link.TRAIN_QUEUED],
+        )
+
+    def test_finished_trains_are_forgotten(self):
+        first, second = FakeSerial(v2=True), FakeSerial(v2=True)
+        ports = [first]
+        ttl = open_replugging_sender(self, ports, max_queued_trains=2 * arduino_link.FINISHED_TRAINS_KEPT)
+        first.unplugged = True
+
+        seqs = [ttl.send_train(1) for _ in range(arduino_link.FINISHED_TRAINS_KEPT + 10)]
+        self.assertEqual(len(ttl._trains), len(seqs))
+        ports.append(second)
+        self.assertTrue(wait_for(lambda: ttl.train_state(seqs[-1]) == arduino_link.TRAIN_SENT))
+        self.assertIsNotNone(ttl.train_sent_t(seqs[-1]))
+        with ttl._io_lock:
+            self.assertEqual(len(ttl._trains), arduino_link.FINISHED_TRAINS_KEPT)
+        self.assertIsNone(ttl.train_sent_t(seqs[0]))
+
+    def test_zero_expiry_never_queues(self):
+        fake = FakeSerial(v2=True)
+        ttl = open_replugging_sender(self, [fake], pulse_expiry_s=0.0)
+        fake.unplugged = True
+        self.assertEqual(ttl.train_state(ttl.send_train(1)), arduino_link.TRAIN_EXPIRED)
+
+
+class FakeMarkerTTL:
+    def __init__(self, gate=None, supported=True):
+        self.gate = gate
+        self.supported = supported
+        self.sent = []
+
+    def send_marker(self, seq, code):
+        if self.gate is not None:
+            self.gate.wait(2.0)
+        self.sent.append((seq, code))
+        return self.supported
+
+
+class EventMarkerQueueTests(unittest.TestCase):
+    def test_markers_are_sent_in_order_off_thread(self):
+        ttl = FakeMarkerTTL()
+        markers = arduino_link.EventMarkerQueue(ttl)
+        records = [markers.emit(code) for code in (1, 3, 5)]
+        markers.close()
+
+        self.assertEqual(ttl.sent, [(r.seq, r.code) for r in records])
+        for rec in records:
+            self.assertFalse(rec.dropped)
+            self.assertGreaterEqual(rec.sent_t, rec.queued_t)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        gate = threading.Event()
+        ttl = FakeMarkerTTL(gate=gate)
+        markers = arduino_link.EventMarkerQueue(ttl, maxsize=2)
+        try:
+            t_start = time.perf_counter()
+            records = [markers.emit(2) for _ in range(10)]
+            self.assertLess(time.perf_counter() - t_start, 0.05)
+        finally:
+            gate.set()
+            markers.close()
+
+        self.assertGreater(markers.dropped, 0)
+        self.assertEqual(markers.dropped, sum(1 for r in records if r.dropped))
+        self.assertEqual(len(ttl.sent), len(records) - markers.dropped)
+
+    def test_unsupported_firmware_leaves_sent_time_empty(self):
+        markers = arduino_link.EventMarkerQueue(FakeMarkerTTL(supported=False))
+        rec = markers.emit(1)
+        markers.close()
+        self.assertIsNone(rec.sent_t)
+        self.assertFalse(rec.dropped)
+
+    def test_sender_marker_acks_and_table(self):
+        fake = FakeSerial(v2=True)
+        ttl = open_fake_sender(self, fake)
+        markers = arduino_link.EventMarkerQueue(ttl)
+        rec = markers.emit(arduino_link.MARKER_CODES["REWARD"])
+        markers.close()
+        ttl.poll_acks()
+        self.assertEqual(ttl.marker_acks, {rec.seq: fake.micros})
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log_path = Path(tmpdir) / "prl_log_x.csv"
+            table = arduino_link.write_marker_table(
+                arduino_link.marker_table_path(log_path), markers.records, ttl.marker_acks, t0=rec.queued_t
+            )
+            with open(table, newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+
+        self.assertEqual(table.name, "prl_log_x_markers.csv")
+        self.assertEqual(rows[0]["marker_code"], "5")
+        self.assertEqual(rows[0]["queued_rel_s"], "0.000000")
+        self.assertEqual(rows[0]["arduino_us"], str(fake.micros))
+        self.assertEqual(rows[0]["dropped"], "0")
+
+
+class PhotodiodeTests(unittest.TestCase):
+    def test_edges_are_reported_once_enabled(self):
+        fake = FakeSerial(v2=True, photodiode=True)
+        ttl = open_fake_sender(self, fake)
+        self.assertTrue(ttl.enable_photodiode())
+        self.assertTrue(ttl.photodiode_enabled)
+
+        fake.rx.extend(arduino_link.encode_frame("L", 0, 1, 5000) + arduino_link.encode_frame("L", 1, 0, 21000))
+        ttl.poll_acks()
+        self.assertEqual([(e.index, e.level, e.arduino_us) for e in ttl.photodiode_edges], [(0, 1, 5000), (1, 0, 21000)])
+
+    def test_old_firmware_or_dry_run_cannot_enable(self):
+        ttl = open_fake_sender(self, FakeSerial(v2=True))
+        self.assertFalse(ttl.enable_photodiode(timeout_s=0.05))
+        self.assertFalse(ttl.photodiode_enabled)
+        self.assertFalse(arduino_link.ArduinoTTLSender(None, dry_run=True).enable_photodiode())
+
+    def test_table_matches_transitions_to_edges(self):
+        # Arduino clock = host clock + 100 s, so edge times map back exactly.
+        sync = clock_sync.ClockSync()
+        for t in (1.0, 2.0):
+            sync.add(clock_sync.SyncSample(host_send_t=t, host_recv_t=t, arduino_us=int((t + 100.0) * 1e6)))
+        edges = [
+            arduino_link.PhotodiodeEdge(0, 1, int(101.015 * 1e6), 1.02, 0),
+            arduino_link.PhotodiodeEdge(1, 1, int(101.300 * 1e6), 1.31, 0),  # spurious, same level again
+            arduino_link.PhotodiodeEdge(2, 0, int(101.512 * 1e6), 1.52, 0),
+        ]
+        transitions = [(0, 1.0, 1.001, 1), (3, 1.5, 1.501, 0), (5, 2.0, 2.001, 1)]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = arduino_link.photodiode_table_path(Path(tmpdir) / "prl_log_x.csv")
+            latencies = arduino_link.write_photodiode_table(path, transitions, edges, [sync], t0=1.0)
+            with open(path, newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+
+        self.assertEqual(path.name, "prl_log_x_photodiode.csv")
+        self.assertEqual([r["edge_index"] for r in rows], ["0", "2", ""])
+        self.assertEqual(rows[0]["edge_clock"], "sync")
+        self.assertEqual([round(x, 4) for x in latencies], [0.014, 0.011])
+
+    def test_edges_fall_back_to_receive_time_without_sync(self):
+        edges = [arduino_link.PhotodiodeEdge(0, 1, 123, 5.25, 0)]
+        self.assertEqual(arduino_link.photodiode_edge_times(edges, [clock_sync.ClockSync()]), [(5.25, None, "host_rx")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import bench_common
+import bench_touch_to_ttl
+
+
+class BenchCommonTests(unittest.TestCase):
+    def test_percentile_interpolates_between_samples(self):
+        data = [0.0, 10.0, 20.0, 30.0, 40.0]
+        self.assertEqual(bench_common.percentile(data, 50), 20.0)
+        self.assertAlmostEqual(bench_common.percentile(data, 95), 38.0)
+        self.assertEqual(bench_common.percentile([7.0], 99), 7.0)
+
+    def test_summarize_reports_percentiles_with_intervals(self):
+        data = [float(i) for i in range(1000)]
+        out = bench_common.summarize(data, n_boot=50, seed=3)
+
+        self.assertEqual(out["n"], 1000)
+        self.assertAlmostEqual(out["p50"], 499.5)
+        for q in bench_common.PERCENTILES:
+            lo, hi = out[f"p{q}_ci95"]
+            self.assertLessEqual(lo, out[f"p{q}"] + 1e-9)
+            self.assertGreaterEqual(hi, out[f"p{q}"] - 1e-9)
+
+    def test_summarize_is_seeded(self):
+        data = [float(i % 17) for i in range(200)]
+        a = bench_common.summarize(data, n_boot=20, seed=9)
+        self.assertEqual(a, bench_common.summarize(data, n_boot=20, seed=9))
+
+    def test_summarize_empty_has_no_intervals(self):
+        out = bench_common.summarize([])
+        self.assertEqual(out["n"], 0)
+        self.assertNotIn("p50_ci95", out)
+
+    def test_regression_needs_both_relative_and_absolute_growth(self):
+        baseline = {"slow": {"p50": 10.0}, "tiny": {"p50": 0.01}, "gone": {"p50": 1.0}}
+        current = {"slow": {"p50": 13.0}, "tiny": {"p50": 0.03}, "new": {"p50": 5.0}}
+
+        found = bench_common.find_regressions(current, baseline, "p50", threshold_pct=25.0, min_delta=0.05)
+        self.assertEqual([r["case"] for r in found], ["slow"])
+        self.assertAlmostEqual(found[0]["change_pct"], 30.0)
+
+        loose = bench_common.find_regressions(current, baseline, "p50", threshold_pct=50.0)
+        self.assertEqual([r["case"] for r in loose], ["tiny"])
+
+
+class FindEventLogTests(unittest.TestCase):
+    def test_side_tables_are_never_taken_for_the_event_log(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_dir = Path(tmpdir)
+            for name in (
+                "prl_log_20260101_100000.csv", "prl_log_20260101_100000_photodiode.csv",
+                "prl_log_20260101_100000_sync_e0.csv", "prl_log_20260101_100000_sync_e1.csv",
+                "prl_log_20260101_100000_markers.csv", "prl_log_20260101_100000_flips.npy",
+                "prl_log_20260101_110000_header.json", "prl_log_20260101_110000_events.csv",
+                "prl_log_20260101_110000_sync_e0.csv", "prl_log_20260101_120000.hclog",
+                "prl_log_notes.csv", "restless_bandit_log_20260101_130000.csv",
+            ):
+                (out_dir / name).touch()
+            find = bench_touch_to_ttl.find_event_log
+            self.assertEqual(find(out_dir, "prl").name, "prl_log_20260101_100000.csv")
+            self.assertEqual(find(out_dir, "prl", "delta").name, "prl_log_20260101_110000_header.json")
+            self.assertEqual(find(out_dir, "prl", "columnar").name, "prl_log_20260101_120000.hclog")
+            with self.assertRaises(RuntimeError):
+                find(out_dir, "restless_bandit", "delta")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import os
+import random
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import clock_sync
+
+
+def synthetic_samples(offset_s, drift_ppm, n=200, seed=1):
+    rng = random.Random(seed)
+    slope = 1.0 + drift_ppm * 1e-6
+    samples = []
+    for i in range(n):
+        arduino_us = 1_000_000 + i * 2_000_000
+        true_host = offset_s + slope * arduino_us / 1e6
+        up = 0.0002 + rng.expovariate(1 / 0.002)
+        down = 0.0002 + rng.expovariate(1 / 0.002)
+        samples.append(clock_sync.SyncSample(true_host - up, true_host + down, arduino_us))
+    return samples
+
+
+class ClockSyncTests(unittest.TestCase):
+    def test_unwrapper_handles_micros_overflow(self):
+        unwrap = clock_sync.MicrosUnwrapper()
+        wrap = clock_sync.MICROS_WRAP
+
+        self.assertEqual(unwrap(wrap - 10), wrap - 10)
+        self.assertEqual(unwrap(5), wrap + 5)
+        self.assertEqual(unwrap(100), wrap + 100)
+        self.assertEqual(unwrap(wrap - 1), 2 * wrap - 1)
+        self.assertEqual(unwrap(3), 2 * wrap + 3)
+
+    def test_fit_recovers_offset_and_drift_within_error_bound(self):
+        sync = clock_sync.ClockSync()
+        for s in synthetic_samples(offset_s=12.5, drift_ppm=40.0):
+            sync.add(s)
+
+        fit = sync.fit()
+        self.assertAlmostEqual(fit.drift_ppm, 40.0, delta=5.0)
+
+        arduino_us = 200_000_000
+        mapped, err = sync.to_host(arduino_us)
+        truth = 12.5 + (1.0 + 40e-6) * arduino_us / 1e6
+        self.assertLessEqual(abs(mapped - truth), err)
+        self.assertLess(err, 0.01)
+
+    def test_single_sample_maps_with_offset_only(self):
+        sync = clock_sync.ClockSync()
+        sync.add(clock_sync.SyncSample(10.0, 10.002, 5_000_000))
+
+        mapped, err = sync.to_host(6_000_000)
+        self.assertAlmostEqual(mapped, 11.001)
+        self.assertAlmostEqual(err, 0.001)
+
+    def test_to_host_without_samples_raises(self):
+        with self.assertRaises(ValueError):
+            clock_sync.ClockSync().to_host(0)
+
+    def test_sync_table_round_trip_is_in_rel_s_domain(self):
+        t0 = 100.0
+        sync = clock_sync.ClockSync()
+        for s in synthetic_samples(offset_s=t0 + 3.0, drift_ppm=-20.0, n=50):
+            sync.add(s)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log_path = Path(tmpdir) / "prl_log_20250101_000000.csv"
+            table = clock_sync.write_sync_table(clock_sync.sync_table_path(log_path), sync, t0)
+            self.assertEqual(table.name, "prl_log_20250101_000000_sync.csv")
+            loaded = clock_sync.load_sync_table(table)
+
+        rel, err = loaded.to_host(20_000_000)
+        host, _ = sync.to_host(20_000_000)
+        self.assertAlmostEqual(rel, host - t0, places=4)
+        self.assertGreater(err, 0.0)
+
+    def test_later_link_epochs_get_their_own_sync_table(self):
+        log_path = Path("logs") / "prl_log_20250101_000000.csv"
+        self.assertEqual(clock_sync.sync_table_path(log_path, 0).name, "prl_log_20250101_000000_sync.csv")
+        self.assertEqual(clock_sync.sync_table_path(log_path, 2).name, "prl_log_20250101_000000_sync_e2.csv")
+
+
+class SessionClockTests(unittest.TestCase):
+    def test_iso_is_derived_from_the_anchor(self):
+        wall0 = datetime(2024, 5, 1, 12, 0, 59, 999000).timestamp()
+        clock = clock_sync.SessionClock(wall0, 100.0)
+
+        self.assertEqual(clock.start_iso(), "2024-05-01T12:00:59.999")
+        self.assertEqual(clock.iso(100.0015), "2024-05-01T12:01:00.000")
+        self.assertEqual(clock.iso(160.25), "2024-05-01T12:02:00.249")
+        self.assertAlmostEqual(clock.rel(160.25), 60.25)
+
+    def test_iso_matches_datetime_formatting(self):
+        clock = clock_sync.SessionClock.start()
+        for dt in (0.0, 0.4567, 1.0, 3599.9999):
+            t = clock.t0 + dt
+            expected = datetime.fromtimestamp(clock.wall(t)).isoformat(timespec="milliseconds")
+            self.assertEqual(clock.iso(t), expected)
+
+    def test_input_fields_map_sdl_timestamps(self):
+        clock = clock_sync.SessionClock(0.0, 50.0, sdl_ticks0=1000)
+
+        fields = clock.input_fields(SimpleNamespace(timestamp=3500), received_t=52.6)
+        self.assertEqual(fields, {"sdl_ts_ms": 3500, "input_rel_s": "2.500000"})
+
+    def test_input_fields_fall_back_to_receive_time(self):
+        clock = clock_sync.SessionClock(0.0, 50.0, sdl_ticks0=1000)
+
+        no_ts = clock.input_fields(SimpleNamespace(), received_t=51.0)
+        self.assertEqual(no_ts, {"sdl_ts_ms": "", "input_rel_s": "1.000000"})
+        # A timestamp that maps after the dequeue time is clamped to it.
+        late = clock.input_fields(SimpleNamespace(timestamp=9000), received_t=51.0)
+        self.assertEqual(late["input_rel_s"], "1.000000")
+
+
+if __name__ == "__main__":
+    unittest.main()
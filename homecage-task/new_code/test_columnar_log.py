@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import columnar_log
+from log_writer import CsvLogWriter
+from touch_task_runner import RowEncoder
+
+FIELDS = ["start_iso", "iso", "rel_s", "state", "x", "event", "p_chosen", "is_correct", "reward_train_id", "seed"]
+STATIC = {"start_iso": "2026-01-01T10:00:00.000", "seed": 7}
+
+
+def rows(n):
+    out = []
+    for i in range(n):
+        rel = i * 0.25
+        out.append({
+            "iso": f"2026-01-01T10:00:{rel:06.3f}",
+            "rel_s": f"{rel:.6f}",
+            "state": "SHOW" if i % 2 else "ITI",
+            "x": i * 3 - 1,
+            "event": f"EVENT_{i % 5}",
+            "p_chosen": 0.1 * i if i % 3 else "",
+            "is_correct": bool(i % 2) if i % 4 else "",
+            "reward_train_id": i if i % 2 else None,
+        })
+    # Values that do not fit their column's kind are kept as text.
+    out[3].update(x="n/a", rel_s="-0.000000", p_chosen="0.50", is_correct=1, event='a "quoted",\nname')
+    out[5].update(iso="yesterday", reward_train_id=2 ** 64, p_chosen=float("nan"))
+    return out
+
+
+def log_rows(csv_log, encoder, values):
+    for extra in values:
+        row = encoder.row()
+        encoder.update(row, extra)
+        csv_log.write_line(encoder.encode(row))
+    csv_log.close()
+
+
+class ColumnarLogTests(unittest.TestCase):
+    def write_pair(self, tmpdir, n=40, chunk_rows=16):
+        wide = Path(tmpdir) / "log.csv"
+        binary = Path(tmpdir) / "log.hclog"
+        log_rows(CsvLogWriter(wide, FIELDS), RowEncoder(FIELDS, STATIC), rows(n))
+        writer = columnar_log.ColumnarLogWriter(binary, FIELDS, info={"task": "t"}, chunk_rows=chunk_rows)
+        log_rows(writer, columnar_log.ColumnarRowEncoder(FIELDS, STATIC), rows(n))
+        return wide, binary, writer
+
+    def test_csv_conversion_matches_the_wide_log(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            wide, binary, writer = self.write_pair(tmpdir)
+            self.assertEqual(writer.batches, 3)
+            with columnar_log.ColumnarLog(binary) as log:
+                self.assertEqual((log.rows, len(log.chunks), log.torn_bytes), (40, 3, 0))
+                self.assertEqual(log.info, {"task": "t"})
+                self.assertEqual(log.kind("iso"), "iso")
+                self.assertEqual(log.kind("rel_s"), "us")
+                self.assertEqual(log.kind("event"), "dict")
+                self.assertEqual(log.exceptions("x"), {3: "n/a"})
+                self.assertEqual(log.exceptions("reward_train_id"), {5: str(2 ** 64)})
+                self.assertEqual(log.dictionary("state"), ["", "ITI", "SHOW"])
+                converted = log.to_csv(Path(tmpdir) / "converted.csv")
+            self.assertEqual(converted.read_bytes(), wide.read_bytes())
+            self.assertLess(binary.stat().st_size, wide.stat().st_size)
+
+    def test_torn_or_corrupt_last_chunk_is_skipped(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, binary, _ = self.write_pair(tmpdir)
+            data = binary.read_bytes()
+            binary.write_bytes(data[:-10])
+            with columnar_log.ColumnarLog(binary) as log:
+                self.assertEqual((log.rows, len(log.chunks)), (32, 2))
+                last = log.chunks[-1]
+                self.assertGreater(log.torn_bytes, 0)
+            flipped = bytearray(data)
+            flipped[-10] ^= 0xFF
+            binary.write_bytes(bytes(flipped))
+            with columnar_log.ColumnarLog(binary) as log:
+                self.assertEqual(log.rows, 32)
+                self.assertEqual(log.chunks[-1].start, last.start)
+                self.assertEqual(len(list(log.text_rows())), 32)
+
+    def test_rows_are_written_after_chunk_s_without_a_flush(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.hclog"
+            writer = columnar_log.ColumnarLogWriter(path, FIELDS, chunk_rows=100, chunk_s=0.1)
+            writer.write({"event": "E", "x": 1})
+            deadline = time.monotonic() + 5.0
+            while writer.rows_written == 0 and time.monotonic() < deadline:
+                time.sleep(0.02)
+            with columnar_log.ColumnarLog(path) as log:
+                self.assertEqual([row[5] for row in log.text_rows()], ["E"])
+            writer.close()
+
+    def test_row_length_is_checked(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            writer = columnar_log.ColumnarLogWriter(Path(tmpdir) / "log.hclog", FIELDS)
+            with self.assertRaises(ValueError):
+                writer.write_line(("a", "b"))
+            writer.close()
+
+    def test_not_a_columnar_log(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.csv"
+            path.write_text("event,x\n" * 8, encoding="utf-8")
+            with self.assertRaises(ValueError):
+                columnar_log.ColumnarLog(path)
+
+    @unittest.skipUnless(columnar_log.numpy is not None, "numpy is not installed")
+    def test_arrays_are_views_into_the_file(self):
+        import numpy
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            _, binary, _ = self.write_pair(tmpdir, n=10, chunk_rows=100)
+            log = columnar_log.ColumnarLog(binary)
+            rel_s = log.column("rel_s")
+            self.assertFalse(rel_s.flags.owndata)
+            self.assertEqual(rel_s.dtype, numpy.dtype("<i8"))
+            self.assertEqual(rel_s[[0, 1, 3]].tolist(), [0, 250000, columnar_log.NULLS["us"]])
+            self.assertEqual(log.exceptions("rel_s"), {3: "-0.000000"})
+            x = log.column("x")
+            self.assertEqual(x.dtype, numpy.dtype("<i4"))
+            self.assertEqual(x[3], columnar_log.NULLS["int"])
+            self.assertEqual(x[4], 11)
+            seed = log.column("seed")
+            self.assertEqual(seed.strides, (0,))
+            self.assertEqual(seed.tolist(), [7] * 10)
+            events = numpy.asarray(log.dictionary("event"), dtype=object)[log.column("event")]
+            self.assertEqual(events[4], "EVENT_4")
+            self.assertTrue(numpy.isnan(log.column("p_chosen")[0]))
+            self.assertEqual(log.column("is_correct").tolist()[:4], [-1, 1, 0, columnar_log.NULLS["bool"]])
+            self.assertEqual(log.exceptions("is_correct"), {3: "1"})
+            del rel_s, x, seed
+            log.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
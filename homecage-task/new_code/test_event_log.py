@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from contextlib import redirect_stdout
+from pathlib import Path
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import event_log
+
+FIELDS = ["start_iso", "iso", "rel_s", "x", "left_x", "left_w", "event", "note", "seed"]
+STATIC = {"start_iso": "2026-01-01T10:00:00.000", "seed": 7}
+STEADY = {"left_x": 220, "left_w": 240}
+
+
+def log_events(csv_log, encoder):
+    set_event = encoder.setter("iso", "rel_s", "x", "left_x", "left_w", "event")
+    events = [
+        ("t0", "0.000100", -1, 220, 240, "SESSION_START", None),
+        ("t1", "0.500000", 340, 220, 240, "TOUCH_LEFT", {"note": 'say "hi", twice\nplease'}),
+        ("t2", "0.750000", -1, 200, 240, "MOVED", None),
+        ("t3", "1.000000", -1, 220, 240, "RESEEDED", {"seed": 8}),
+        ("t4", "1.250000", "", 220, 240, "", {"note": ""}),
+    ]
+    for iso, rel, x, left_x, left_w, name, extra in events:
+        row = encoder.row()
+        set_event(row, iso, rel, x, left_x, left_w, name)
+        if extra:
+            encoder.update(row, extra)
+        csv_log.write_line(encoder.encode(row))
+    csv_log.close()
+
+
+class DeltaLayoutTests(unittest.TestCase):
+    def test_expanded_delta_log_matches_the_wide_log(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            wide_path = Path(tmpdir) / "wide" / "task_log.csv"
+            delta_path = Path(tmpdir) / "delta" / "task_log.csv"
+            wide_path.parent.mkdir()
+            delta_path.parent.mkdir()
+            for layout, path in (("wide", wide_path), ("delta", delta_path)):
+                log_events(*event_log.open_event_log(layout, path, FIELDS, STATIC, STEADY, info={"task": "t"}))
+
+            self.assertFalse(delta_path.exists())
+            header = json.loads(event_log.header_path(delta_path).read_text(encoding="utf-8"))
+            self.assertEqual(header["constants"], {
+                "start_iso": "2026-01-01T10:00:00.000", "left_x": "220", "left_w": "240", "seed": "7",
+            })
+            self.assertEqual(header["columns"], ["iso", "rel_s", "x", "event", "note", "_overrides"])
+            self.assertEqual(header["info"], {"task": "t"})
+            with event_log.events_path(delta_path).open(newline="", encoding="utf-8") as f:
+                overrides = [row[-1] for row in csv.reader(f)][1:]
+            self.assertEqual(overrides, ["", "", '{"left_x":"200"}', '{"seed":"8"}', ""])
+
+            expanded = event_log.expand(event_log.header_path(delta_path))
+            self.assertEqual(expanded, delta_path)
+            self.assertEqual(expanded.read_bytes(), wide_path.read_bytes())
+
+    def test_expand_cli_rejects_a_foreign_header(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            bogus = Path(tmpdir) / "x_header.json"
+            bogus.write_text('{"format": "other"}', encoding="utf-8")
+            with redirect_stdout(io.StringIO()), mock.patch("sys.stderr", io.StringIO()) as err:
+                self.assertEqual(event_log.main(["expand", str(bogus)]), 1)
+        self.assertIn("not a hc-task-delta/1", err.getvalue())
+
+    def test_unknown_layout_is_rejected(self):
+        with self.assertRaises(ValueError):
+            event_log.open_event_log("parquet", "x.csv", FIELDS, STATIC, STEADY)
+
+
+if __name__ == "__main__":
+    unittest.main()
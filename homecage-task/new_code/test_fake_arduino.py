@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import os
+import select
+import sys
+import tempfile
+import time
+import unittest
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import arduino_link
+import fake_arduino
+import task_common
+
+HAVE_PTY = fake_arduino.tty is not None and hasattr(os, "openpty")
+HAVE_SERIAL = arduino_link.serial is not None
+
+
+def read_frames(fd, n_frames, timeout_s=1.0):
+    buf = b""
+    deadline = time.perf_counter() + timeout_s
+    while buf.count(b"\n") < n_frames and time.perf_counter() < deadline:
+        readable, _, _ = select.select([fd], [], [], 0.01)
+        if readable:
+            buf += os.read(fd, 4096)
+    return [arduino_link.decode_frame(line) for line in buf.splitlines()]
+
+
+def wait_for(predicate, timeout_s=1.0):
+    deadline = time.perf_counter() + timeout_s
+    while not predicate() and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    return predicate()
+
+
+@unittest.skipUnless(HAVE_PTY, "pseudo-terminals are not available")
+class FakeArduinoRawTests(unittest.TestCase):
+    def open_port(self, fake):
+        fd = os.open(fake.port, os.O_RDWR | os.O_NOCTTY)
+        self.addCleanup(lambda: _close_quietly(fd))
+        return fd
+
+    def test_v2_train_emits_pulses_and_acks(self):
+        with fake_arduino.FakeArduino(latency_s=0.0) as fake:
+            fd = self.open_port(fake)
+            os.write(fd, arduino_link.encode_frame("P", 9, 3, 5000, 10000))
+            frames = read_frames(fd, 3)
+
+        self.assertEqual([f[:3] for f in frames], [["A", "9", "0"], ["A", "9", "1"], ["A", "9", "2"]])
+        self.assertEqual([p.pulse_index for p in fake.pulses], [0, 1, 2])
+        self.assertGreaterEqual(fake.pulses[2].host_t - fake.pulses[0].host_t, 0.019)
+
+    def test_legacy_firmware_pulses_but_ignores_frames(self):
+        with fake_arduino.FakeArduino(firmware="legacy") as fake:
+            fd = self.open_port(fake)
+            os.write(fd, arduino_link.encode_frame("V?") + b"PULSE\n")
+            self.assertTrue(wait_for(lambda: len(fake.pulses) == 1))
+            self.assertEqual(read_frames(fd, 1, timeout_s=0.1), [])
+
+    def test_drop_rate_one_swallows_every_reply(self):
+        with fake_arduino.FakeArduino(drop_rate=1.0) as fake:
+            fd = self.open_port(fake)
+            os.write(fd, arduino_link.encode_frame("S", 1))
+            self.assertEqual(read_frames(fd, 1, timeout_s=0.1), [])
+
+    def test_disconnect_breaks_host_io_and_reconnect_repoints_link(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            link = os.path.join(tmpdir, "ttyFAKE")
+            with fake_arduino.FakeArduino(link_path=link) as fake:
+                fd = self.open_port(fake)
+                old_target = os.readlink(link)
+                fake.disconnect()
+                with self.assertRaises(OSError):
+                    os.write(fd, b"PULSE\n")
+                    os.read(fd, 1)
+
+                fake.reconnect()
+                self.assertNotEqual(os.readlink(link), old_target)
+                fd2 = self.open_port(fake)
+                os.write(fd2, arduino_link.encode_frame("S", 4))
+                self.assertEqual(read_frames(fd2, 1)[0][:2], ["S", "4"])
+
+    def test_photodiode_edges_are_reported_only_when_enabled(self):
+        with fake_arduino.FakeArduino(latency_s=0.0) as fake:
+            fd = self.open_port(fake)
+            fake.set_light(1)
+            os.write(fd, arduino_link.encode_frame("D", 1))
+            self.assertEqual(read_frames(fd, 1), [["D", "1"]])
+
+            fake.set_light(0)
+            fake.set_light(0)
+            fake.set_light(1)
+            frames = read_frames(fd, 2)
+
+        self.assertEqual([f[:3] for f in frames], [["L", "0", "0"], ["L", "1", "1"]])
+        self.assertEqual([e.level for e in fake.edges], [0, 1])
+
+    def test_jitter_sequence_is_seeded(self):
+        a = fake_arduino.FakeArduino(latency_s=0.001, jitter_s=0.002, seed=5)
+        b = fake_arduino.FakeArduino(latency_s=0.001, jitter_s=0.002, seed=5)
+        delays_a = [a._delay() for _ in range(20)]
+        self.assertEqual(delays_a, [b._delay() for _ in range(20)])
+        self.assertTrue(all(0.001 <= d < 0.003 for d in delays_a))
+
+
+@unittest.skipUnless(HAVE_PTY and HAVE_SERIAL, "pseudo-terminals or pyserial are not available")
+class FakeArduinoSenderTests(unittest.TestCase):
+    def test_sender_negotiates_v2_and_syncs_clock(self):
+        with fake_arduino.FakeArduino(latency_s=0.0002, drift_ppm=50.0) as fake:
+            ttl = arduino_link.ArduinoTTLSender(fake.port)
+            try:
+                self.assertEqual(ttl.protocol, arduino_link.TTL_PROTOCOL_V2)
+                for _ in range(5):
+                    self.assertIsNotNone(ttl.ping())
+                scheduler = task_common.RewardScheduler(ttl)
+                train = scheduler.submit(2, 0.01)
+                self.assertTrue(train.done.wait(2.0))
+                scheduler.close()
+            finally:
+                ttl.close()
+
+        self.assertTrue(train.ok)
+        self.assertEqual(len(fake.pulses), 2)
+
+    def test_lost_acks_still_count_the_reward(self):
+        with fake_arduino.FakeArduino() as fake:
+            ttl = arduino_link.ArduinoTTLSender(fake.port)
+            try:
+                fake.drop_rate = 1.0
+                scheduler = task_common.RewardScheduler(ttl, ack_timeout_s=0.1)
+                rewards = task_common.RewardLedger(scheduler)
+                train = rewards.submit(1, 0.0)
+                self.assertTrue(train.done.wait(2.0))
+                scheduler.close()
+            finally:
+                ttl.close()
+
+        self.assertEqual(len(fake.pulses), 1)
+        records = scheduler.poll()
+        self.assertEqual([r.unacked for r in records], [True])
+        self.assertEqual(rewards.settle(records), [])
+        self.assertEqual(rewards.count, 1)
+
+    def test_sender_reconnects_after_usb_reset(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            link = os.path.join(tmpdir, "ttyFAKE")
+            with fake_arduino.FakeArduino(link_path=link, disconnect_after_pulses=1) as fake:
+                ttl = arduino_link.ArduinoTTLSender(fake.port, reconnect_min_s=0.02)
+                try:
+                    ttl.send_train(1)
+                    self.assertTrue(wait_for(lambda: ttl.link_state == arduino_link.LINK_DOWN))
+                    seq = ttl.send_train(1)
+                    fake.reconnect()
+                    self.assertTrue(wait_for(lambda: ttl.train_state(seq) == arduino_link.TRAIN_SENT, 3.0))
+                    self.assertTrue(wait_for(lambda: len(fake.pulses) == 2))
+                finally:
+                    ttl.close()
+
+        self.assertEqual(ttl.link_epoch, 1)
+        self.assertEqual(fake.pulses[1].seq, seq)
+
+    def test_sender_falls_back_on_legacy_firmware(self):
+        with fake_arduino.FakeArduino(firmware="legacy") as fake:
+            ttl = arduino_link.ArduinoTTLSender(fake.port, probe_timeout_s=0.2)
+            try:
+                self.assertEqual(ttl.protocol, arduino_link.TTL_PROTOCOL_LEGACY)
+                ttl.pulse()
+                self.assertTrue(wait_for(lambda: len(fake.pulses) == 1))
+            finally:
+                ttl.close()
+
+
+def _close_quietly(fd):
+    try:
+        os.close(fd)
+    except OSError:
+        pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import columnar_log
+import event_log
+import log_recovery
+from log_writer import CsvLogWriter
+
+PRL_FIELDS = ["start_iso", "iso", "rel_s", "event", "trial_outcome", "is_correct", "reward_delivered", "stop_reason", "note", "seed"]
+PRL_EVENTS = [
+    ("SESSION_START", "", "", ""),
+    ("TOUCH_LEFT", "correct", "1", "1"),
+    ("REWARD_PULSE", "", "", ""),
+    ("TOUCH_RIGHT", "incorrect", "0", "0"),
+    ("TOUCH_OUTSIDE", "outside", "", ""),
+    ("TOUCH_LEFT", "correct", "1", "1"),
+    ("REWARD_PULSE_TTL_FAIL", "", "", ""),
+]
+ERC_FIELDS = ["start_iso", "iso", "rel_s", "event", "trial_num", "touch_id", "reward_given",
+              "total_trials", "total_touches", "total_rewards", "omission_count", "session_duration_s", "stop_reason"]
+
+
+def prl_rows():
+    return [
+        {"start_iso": "2026-01-01T10:00:00.000", "iso": f"2026-01-01T10:00:0{i}.000", "rel_s": f"{i:.6f}",
+         "event": name, "trial_outcome": outcome, "is_correct": correct, "reward_delivered": reward,
+         "note": 'a "b",\nc' if i == 3 else "", "seed": 7}
+        for i, (name, outcome, correct, reward) in enumerate(PRL_EVENTS)
+    ]
+
+
+def erc_rows():
+    events = [("SESSION_START", 0, 0, ""), ("TOUCH", 1, 1, ""), ("REWARD_TTL", 1, 1, 1), ("TRIAL_END", 1, 1, ""),
+              ("OMISSION", 2, 1, ""), ("TRIAL_END", 2, 1, ""), ("TOUCH", 3, 2, "")]
+    return [
+        {"start_iso": "2026-01-01T10:00:00.000", "iso": f"t{i}", "rel_s": f"{i * 1.5:.6f}", "event": name,
+         "trial_num": trial, "touch_id": touch, "reward_given": reward}
+        for i, (name, trial, touch, reward) in enumerate(events)
+    ]
+
+
+def write_csv(path, fields, rows):
+    log = CsvLogWriter(path, fields)
+    for row in rows:
+        log.write(row)
+    log.close()
+    return path
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+class CompleteCsvTests(unittest.TestCase):
+    def test_stops_before_a_torn_row(self):
+        data = b'a,b\r\n1,"x\r\ny"\r\n2,3\r\n'
+        self.assertEqual(log_recovery.complete_csv(data), (len(data), ["a", "b"]))
+        for tail in (b"4,", b'4,"open\r\nquote', b"4\r\n", b"\0" * 16, b"4,\xff\r\n"):
+            self.assertEqual(log_recovery.complete_csv(data + tail)[0], len(data), tail)
+        self.assertEqual(log_recovery.complete_csv(b"a,b"), (0, None))
+
+
+class RepairTests(unittest.TestCase):
+    def test_torn_tail_is_cut_and_a_summary_row_added(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = write_csv(Path(tmpdir) / "prl_log.csv", PRL_FIELDS, prl_rows())
+            intact = path.read_bytes()
+            tail = b'2026-01-01T10:00:00.000,t7,7.0,TOUCH_LEFT,correct,1,1,,"half\r\n' + b"\0" * 32
+            with path.open("ab") as f:
+                f.write(tail)
+
+            result = log_recovery.repair(path)
+            self.assertEqual(result.rows, 7)
+            self.assertEqual(result.torn_bytes, len(tail))
+            self.assertEqual(log_recovery.torn_path(path).read_bytes(), tail)
+            self.assertTrue(path.read_bytes().startswith(intact))
+            rows = read_csv(path)
+            self.assertEqual(len(rows), 8)
+            last = rows[-1]
+            self.assertEqual((last["event"], last["iso"], last["rel_s"]), ("SESSION_END", "2026-01-01T10:00:06.000", "6.000000"))
+            self.assertEqual((last["start_iso"], last["seed"], last["note"]), ("2026-01-01T10:00:00.000", "7", ""))
+            summary = result.summary
+            self.assertEqual(
+                {k: summary[k] for k in ("choices", "correct", "incorrect", "outside_failures", "rewards",
+                                         "reward_pulses", "reward_pulse_failures", "session_end")},
+                {"choices": 3, "correct": 2, "incorrect": 1, "outside_failures": 1, "rewards": 2,
+                 "reward_pulses": 1, "reward_pulse_failures": 1, "session_end": False},
+            )
+
+            again = log_recovery.repair(path)
+            self.assertEqual((again.torn_bytes, again.summary_row_added), (0, False))
+            self.assertEqual(again.summary["stop_reason"], log_recovery.RECOVERED)
+            self.assertIn("intact", again.describe())
+
+    def test_dry_run_changes_nothing(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = write_csv(Path(tmpdir) / "prl_log.csv", PRL_FIELDS, prl_rows())
+            with path.open("ab") as f:
+                f.write(b"2026")
+            data = path.read_bytes()
+            result = log_recovery.repair(path, dry_run=True)
+            self.assertEqual((result.torn_bytes, result.summary_row_added), (4, True))
+            self.assertIn("would cut 4 torn bytes", result.describe())
+            self.assertEqual(path.read_bytes(), data)
+            self.assertFalse(log_recovery.torn_path(path).exists())
+
+    def test_summary_row_carries_object_explore_totals(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = write_csv(Path(tmpdir) / "erc_log.csv", ERC_FIELDS, erc_rows())
+            result = log_recovery.repair(path)
+            self.assertEqual(
+                {k: result.summary[k] for k in ("trials", "rewards", "omissions", "touches")},
+                {"trials": 3, "rewards": 1, "omissions": 1, "touches": 2},
+            )
+            last = read_csv(path)[-1]
+        self.assertEqual(
+            {k: last[k] for k in ERC_FIELDS[3:]},
+            {"event": "SESSION_END", "trial_num": "3", "touch_id": "2", "reward_given": "", "total_trials": "3",
+             "total_touches": "2", "total_rewards": "1", "omission_count": "1", "session_duration_s": "9.000000",
+             "stop_reason": "recovered"},
+        )
+
+    def test_columnar_log_is_cut_after_its_last_intact_chunk(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "prl_log.hclog"
+            writer = columnar_log.ColumnarLogWriter(path, PRL_FIELDS, chunk_rows=4)
+            for row in prl_rows():
+                writer.write(row)
+            writer.close()
+            path.write_bytes(path.read_bytes()[:-5])
+
+            result = log_recovery.repair(path)
+            self.assertEqual((result.rows, result.summary["choices"]), (4, 2))
+            self.assertGreater(result.torn_bytes, 0)
+            with columnar_log.ColumnarLog(path) as log:
+                self.assertEqual((log.rows, log.torn_bytes), (4, 0))
+            self.assertEqual(log_recovery.torn_path(path).stat().st_size, result.torn_bytes)
+
+
+class SummaryTests(unittest.TestCase):
+    def test_delta_log_is_read_through_its_header(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "prl_log.csv"
+            static = {"start_iso": "2026-01-01T10:00:00.000", "seed": 7}
+            csv_log, encoder = event_log.open_event_log("delta", path, PRL_FIELDS, static, {})
+            for row in prl_rows():
+                values = encoder.row()
+                encoder.update(values, {k: v for k, v in row.items() if k not in static})
+                csv_log.write_line(encoder.encode(values))
+            csv_log.close()
+
+            fieldnames, rows = log_recovery.read_rows(event_log.events_path(path))
+            self.assertEqual(fieldnames, PRL_FIELDS)
+            self.assertEqual(log_recovery.summarize(fieldnames, rows)["choices"], 3)
+
+            out = io.StringIO()
+            with redirect_stdout(out), redirect_stderr(io.StringIO()) as err:
+                status = log_recovery.main(["summary", "--json", str(event_log.header_path(path))])
+        self.assertEqual(status, 0)
+        self.assertEqual(json.loads(out.getvalue())["rewards"], 2)
+        self.assertIn("no SESSION_END", err.getvalue())
+
+    def test_failed_reward_train_is_not_counted(self):
+        rows = prl_rows() + [
+            {"event": "REWARD_PULSE_UNACKED", "reward_train_id": "1"},
+            {"event": "REWARD_TTL_FAIL", "reward_train_id": "2", "reward_delivered": "0"},
+        ]
+        rows = [{k: str(v) for k, v in row.items()} for row in rows]
+        summary = log_recovery.summarize(PRL_FIELDS, rows)
+        self.assertEqual((summary["choices"], summary["rewards"]), (3, 1))
+        self.assertEqual((summary["reward_pulses_unacked"], summary["reward_pulse_failures"]), (1, 1))
+
+    def test_reward_whose_choice_row_was_cut_off_still_counts(self):
+        rows = [{k: str(v) for k, v in row.items()} for row in prl_rows()]
+        intent = {"event": "REWARD_INTENT", "reward_won": "1"}
+        self.assertEqual(log_recovery.summarize(PRL_FIELDS, rows + [intent])["rewards"], 3)
+        self.assertEqual(log_recovery.summarize(PRL_FIELDS, rows[:1] + [intent] + rows[1:])["rewards"], 2)
+
+    def test_cli_reports_unreadable_logs(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            good = write_csv(Path(tmpdir) / "prl_log.csv", PRL_FIELDS, prl_rows())
+            with redirect_stdout(io.StringIO()) as out, redirect_stderr(io.StringIO()) as err:
+                status = log_recovery.main(["repair", str(good), str(Path(tmpdir) / "missing.csv")])
+        self.assertEqual(status, 1)
+        self.assertIn("add a SESSION_END row", out.getvalue())
+        self.assertIn("[ERROR]", err.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import csv
+import io
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import unittest
+from contextlib import redirect_stderr
+from pathlib import Path
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import log_writer
+
+FIELDS = ["event", "rel_s", "x"]
+
+
+def rows(n):
+    return [{"event": f"E{i}", "rel_s": f"{i * 0.5:.6f}", "x": i} for i in range(n)]
+
+
+class CsvLogWriterTests(unittest.TestCase):
+    def test_output_matches_dict_writer(self):
+        expected = io.StringIO(newline="")
+        w = csv.DictWriter(expected, fieldnames=FIELDS)
+        w.writeheader()
+        w.writerows(rows(300))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.csv"
+            log = log_writer.CsvLogWriter(path, FIELDS, batch_rows=16)
+            for row in rows(300):
+                log.write(row)
+            self.assertTrue(log.flush(5.0))
+            self.assertEqual(log.rows_written, 300)
+            log.close()
+            self.assertEqual(path.read_bytes(), expected.getvalue().encode("utf-8"))
+        self.assertGreater(log.batches, 1)
+
+    def test_encoded_lines_and_dicts_keep_their_order(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.csv"
+            log = log_writer.CsvLogWriter(path, FIELDS)
+            log.write({"event": "A"})
+            log.write_line('B,"1,5",2\r\n')
+            log.write({"event": "C", "x": 3})
+            log.close()
+            self.assertEqual(path.read_bytes(), b'event,rel_s,x\r\nA,,\r\nB,"1,5",2\r\nC,,3\r\n')
+
+    def test_unknown_field_is_rejected_by_write(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log = log_writer.CsvLogWriter(Path(tmpdir) / "log.csv", FIELDS)
+            with self.assertRaises(ValueError):
+                log.write({"event": "E", "y": 1})
+            log.close()
+
+    def test_full_queue_blocks_write_until_the_writer_catches_up(self):
+        gate = threading.Event()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log = log_writer.CsvLogWriter(Path(tmpdir) / "log.csv", FIELDS, max_queue=2, batch_rows=1)
+            write_text = log._write_text
+            log._write_text = lambda text: gate.wait(5.0) and write_text(text)
+            threading.Timer(0.1, gate.set).start()
+            for row in rows(6):
+                log.write(row)
+            log.close()
+
+        self.assertEqual(log.rows_written, 6)
+        self.assertGreater(log.stalls, 0)
+        self.assertLessEqual(log.max_depth, 2)
+        self.assertGreater(log.stats()["lag_ms_max"], 50.0)
+
+    def test_write_error_is_raised_on_flush(self):
+        def fail(text):
+            raise OSError("disk full")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log = log_writer.CsvLogWriter(Path(tmpdir) / "log.csv", FIELDS)
+            log._write_text = fail
+            log.write(rows(1)[0])
+            with redirect_stderr(io.StringIO()), self.assertRaises(OSError):
+                log.flush(5.0)
+            log.close()
+
+    def test_sync_rows_and_close_are_fsynced(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log = log_writer.CsvLogWriter(Path(tmpdir) / "log.csv", FIELDS, fsync_s=60.0)
+            log.write({"event": "A"})
+            self.assertTrue(log.flush(5.0))
+            self.assertEqual(log.fsyncs, 0)
+            log.write({"event": "REWARD_PULSE"}, sync=True)
+            self.assertTrue(log.flush(5.0))
+            self.assertEqual(log.fsyncs, 1)
+            log.write({"event": "B"})
+            log.close()
+            self.assertEqual(log.fsyncs, 2)
+            self.assertIn("2 fsyncs", log.describe())
+
+    def test_durable_write_returns_once_the_row_is_fsynced(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.csv"
+            log = log_writer.CsvLogWriter(path, FIELDS, fsync_s=60.0)
+            log.write({"event": "A"})
+            log.write_line("REWARD_INTENT,,\r\n", durable=True)
+            self.assertEqual(log.fsyncs, 1)
+            self.assertTrue(path.read_bytes().endswith(b"A,,\r\nREWARD_INTENT,,\r\n"))
+            log.close()
+
+    def test_rows_are_fsynced_within_fsync_s(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log = log_writer.CsvLogWriter(Path(tmpdir) / "log.csv", FIELDS, fsync_s=0.05)
+            log.write({"event": "A"})
+            deadline = time.monotonic() + 5.0
+            while log.fsyncs == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(log.fsyncs, 1)
+            time.sleep(0.15)
+            self.assertEqual(log.fsyncs, 1)
+            log.close()
+
+    def test_no_fsync_without_fsync_s(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log = log_writer.CsvLogWriter(Path(tmpdir) / "log.csv", FIELDS)
+            log.write({"event": "REWARD_PULSE"}, sync=True)
+            log.close()
+        self.assertEqual(log.fsyncs, 0)
+        self.assertNotIn("fsync", log.describe())
+
+    def test_sigterm_drains_queued_rows(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "log.csv"
+            script = textwrap.dedent(f"""
+                import sys, time
+                sys.path.insert(0, {CODE_DIR!r})
+                import log_writer
+                log = log_writer.CsvLogWriter({str(path)!r}, ["i"])
+                write_text = log._write_text
+                log._write_text = lambda text: (time.sleep(0.05), write_text(text))
+                try:
+                    for i in range(200):
+                        log.write({{"i": i}})
+                    print("ready", flush=True)
+                    time.sleep(30)
+                finally:
+                    log.close()
+            """)
+            proc = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, text=True)
+            self.assertEqual(proc.stdout.readline().strip(), "ready")
+            proc.send_signal(signal.SIGTERM)
+            self.assertEqual(proc.wait(10), 128 + signal.SIGTERM)
+            proc.stdout.close()
+            lines = path.read_text(encoding="utf-8").splitlines()
+
+        self.assertEqual(lines, ["i"] + [str(i) for i in range(200)])
+
+    def test_sigterm_handler_is_restored_after_the_last_close(self):
+        if signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL:
+            self.skipTest("SIGTERM is already handled")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            first = log_writer.CsvLogWriter(Path(tmpdir) / "a.csv", FIELDS)
+            second = log_writer.CsvLogWriter(Path(tmpdir) / "b.csv", FIELDS)
+            self.assertIs(signal.getsignal(signal.SIGTERM), log_writer._exit_on_sigterm)
+            first.close()
+            self.assertIs(signal.getsignal(signal.SIGTERM), log_writer._exit_on_sigterm)
+            second.close()
+        self.assertIs(signal.getsignal(signal.SIGTERM), signal.SIG_DFL)
+
+
+class FsyncPolicyTests(unittest.TestCase):
+    def test_rows_each_mode_syncs(self):
+        cases = [
+            ("SESSION_END", {}),
+            ("REWARD_PULSE", {}),
+            ("REWARD_TTL", {"reward_given": 1}),
+            ("TOUCH_LEFT", {"reward_delivered": "1", "trial_outcome": "choice"}),
+            ("TOUCH_RIGHT", {"reward_delivered": 0, "trial_outcome": "incorrect"}),
+            ("OMISSION", {}),
+            ("TOUCH", {"reward_delivered": 0}),
+        ]
+        expected = {
+            "off": [False] * 7,
+            "interval": [True, False, False, False, False, False, False],
+            "reward": [True, True, True, True, False, False, False],
+            "trial": [True, True, True, True, True, True, False],
+        }
+        for mode, syncs in expected.items():
+            policy = log_writer.FsyncPolicy(mode)
+            self.assertEqual([policy.syncs(name, fields) for name, fields in cases], syncs, mode)
+
+    def test_fsync_s_and_validation(self):
+        self.assertIsNone(log_writer.FsyncPolicy("off").fsync_s)
+        self.assertEqual(log_writer.FsyncPolicy("trial", 2.5).fsync_s, 2.5)
+        with self.assertRaises(ValueError):
+            log_writer.FsyncPolicy("always")
+        with self.assertRaises(ValueError):
+            log_writer.FsyncPolicy("reward", 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import os
+import random
+import sys
+import unittest
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+try:
+    import pygame
+except ImportError:
+    pygame = None
+else:
+    import object_explore
+
+
+@unittest.skipUnless(pygame is not None, "pygame is not installed")
+class TrialTimersTests(unittest.TestCase):
+    def test_pause_does_not_count_against_the_trial(self):
+        timers = object_explore._TrialTimers()
+        timers.present_onset_t = 9.0
+        timers.interact_start_t = 10.0
+        timers.last_touch_interact_t = 11.5
+        timers.last_reward_t = 11.0
+        timers.iti_end_time = 20.0
+        paused_at, resumed_at = 12.0, 42.0
+        before = {name: paused_at - t for name, t in vars(timers).items() if t is not None}
+
+        timers.shift(resumed_at - paused_at)
+
+        after = {name: resumed_at - t for name, t in vars(timers).items() if t is not None}
+        for name, elapsed in before.items():
+            self.assertAlmostEqual(after[name], elapsed, msg=name)
+        self.assertIsNone(timers.wait_release_enter_t)
+        self.assertIsNone(timers.release_clear_start_t)
+
+    def test_release_wait_timers_shift_once_set(self):
+        timers = object_explore._TrialTimers()
+        timers.wait_release_enter_t = 5.0
+        timers.release_clear_start_t = 5.25
+
+        timers.shift(2.0)
+
+        self.assertEqual((timers.wait_release_enter_t, timers.release_clear_start_t), (7.0, 7.25))
+
+
+@unittest.skipUnless(pygame is not None, "pygame is not installed")
+class DirtyFramesTests(unittest.TestCase):
+    SIZE = (480, 320)
+    BG = (30, 30, 30)
+
+    def setUp(self):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        pygame.display.init()
+        self.addCleanup(pygame.display.quit)
+        pygame.font.init()
+        self.addCleanup(pygame.font.quit)
+        try:
+            pygame.mixer.init(frequency=44100, size=-16, channels=1)
+        except pygame.error as e:
+            self.skipTest(f"no audio device for the interaction sounds: {e}")
+        self.addCleanup(pygame.mixer.quit)
+        self.screen = pygame.display.set_mode(self.SIZE)
+        self.canvas = object_explore.render_backend.SoftwareCanvas(self.screen)
+        self.font = pygame.font.Font(None, 20)
+
+    def test_dirty_regions_match_a_full_redraw(self):
+        active_zone = pygame.Rect(280, 90, 150, 150)
+        dimmed_zone = pygame.Rect(50, 90, 150, 150)
+        for tag in object_explore.INTERACTION_TAGS:
+            with self.subTest(tag=tag):
+                random.seed(1)
+                active = object_explore.create_interaction(tag, active_zone, self.SIZE)
+                dimmed = object_explore.create_interaction(tag, dimmed_zone, self.SIZE)
+                frames = object_explore._DirtyFrames(self.canvas, self.screen, self.BG)
+                hud = object_explore.render_backend.HudLine(self.font, (10, 10))
+                # A touch on the zone's corner starts effects that reach past it.
+                active.activate(active_zone.right - 5, active_zone.top + 5, 0.0)
+                for i in range(90):
+                    now = i / 60
+                    if i % 30 == 0:
+                        active.on_touch(active_zone.x + random.randint(-10, 160),
+                                        active_zone.y + random.randint(0, 150), now)
+                    active.update(1 / 60, now)
+                    fields = (("frame", f"Frame={i}"), ("pad", "x" * (i % 7)))
+                    frames.begin()
+                    active.draw_active(self.screen)
+                    frames.mark(active.bounds())
+                    dimmed.draw_dimmed(self.screen)
+                    frames.mark(dimmed.zone_rect)
+                    frames.mark(hud.draw(self.screen, fields))
+                    frames.present()
+
+                    full = pygame.Surface(self.SIZE, 0, self.screen)
+                    full.fill(self.BG)
+                    active.draw_active(full)
+                    dimmed.draw_dimmed(full)
+                    object_explore.render_backend.HudLine(self.font, (10, 10)).draw(full, fields)
+                    self.assertEqual(pygame.image.tobytes(self.screen, "RGB"), pygame.image.tobytes(full, "RGB"),
+                                     f"{tag} frame {i}")
+
+
+if __name__ == "__main__":
+    unittest.main()
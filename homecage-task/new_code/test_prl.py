@@ -251,53 +251,25 @@ class TestPRL(unittest.TestCase):
         self.assertEqual(captured["args"].plate_w, 300)
         self.assertEqual(captured["args"].plate_h, 200)
 
-    def test_make_beep_sound_clamps_numpy_volume(self):
-        import task_common
-
-        def first_wave_multiplier(volume):
-            captured = {"multipliers": []}
-
-            class FakeArray:
-                def __truediv__(self, _other):
-                    return self
-
-                def __rmul__(self, _other):
-                    return self
-
-            class FakeWave:
-                def __mul__(self, value):
-                    captured["multipliers"].append(value)
-                    return self
+    def test_make_beep_sound_clamps_volume(self):
+        from array import array
 
-                def astype(self, _dtype):
-                    return [0]
-
-            class FakeNumpy:
-                float32 = "float32"
-                int16 = "int16"
-
-                @staticmethod
-                def arange(_n_samples, dtype=None):
-                    return FakeArray()
-
-                @staticmethod
-                def sin(_values):
-                    return FakeWave()
-
-                @staticmethod
-                def column_stack(values):
-                    return values
+        import sound_bank
+        import task_common
 
+        def peak_amplitude(volume):
             fake_pygame = mock.Mock()
-            fake_pygame.sndarray.make_sound.return_value = "sound"
+            fake_pygame.mixer.get_init.return_value = (44100, -16, 2)
+            fake_pygame.mixer.Sound.side_effect = lambda buffer: array("h", buffer)
 
-            with mock.patch.dict(sys.modules, {"pygame": fake_pygame, "numpy": FakeNumpy()}):
-                self.assertEqual(task_common.make_beep_sound(1000, 1, volume), "sound")
+            with mock.patch.dict(sys.modules, {"pygame": fake_pygame}), \
+                    mock.patch.object(sound_bank, "_default_bank", sound_bank.SoundBank(None)):
+                samples = task_common.make_beep_sound(1000, 1, volume)
 
-            return captured["multipliers"][0]
+            return max(abs(v) for v in samples)
 
-        self.assertEqual(first_wave_multiplier(2.5), 1.0)
-        self.assertEqual(first_wave_multiplier(-2.5), 0.0)
+        self.assertGreater(peak_amplitude(2.5), 32000)
+        self.assertEqual(peak_amplitude(-2.5), 0)
 
 
 if __name__ == "__main__":
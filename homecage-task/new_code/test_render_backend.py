@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import io
+import os
+import sys
+import unittest
+from contextlib import redirect_stderr
+from unittest import mock
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import render_backend
+
+try:
+    import pygame
+except ImportError:
+    pygame = None
+
+
+class OpenDisplayTests(unittest.TestCase):
+    def test_bare_surface_is_wrapped_and_canvases_pass_through(self):
+        surface = mock.Mock(spec=["get_size", "fill", "blit"])
+        canvas = render_backend.as_canvas(surface)
+        self.assertIsInstance(canvas, render_backend.SoftwareCanvas)
+        self.assertIs(canvas.surface, surface)
+        self.assertIs(render_backend.as_canvas(canvas), canvas)
+
+    def test_renderer_failure_falls_back_to_software(self):
+        pg = mock.Mock()
+        err = io.StringIO()
+        with mock.patch.dict(sys.modules, {"pygame": pg}), mock.patch.object(
+            render_backend, "open_renderer", side_effect=RuntimeError("no render driver")
+        ), redirect_stderr(err):
+            canvas = render_backend.open_display("renderer", (640, 480), False, "t")
+
+        self.assertEqual(canvas.backend, "software")
+        self.assertIs(canvas.surface, pg.display.set_mode.return_value)
+        pg.display.set_mode.assert_called_once_with((640, 480), pg.NOFRAME)
+        self.assertIn("no render driver", err.getvalue())
+
+    @unittest.skipUnless(sys.byteorder == "little", "masks below are little-endian layouts")
+    def test_byte_order_follows_the_surface_masks(self):
+        self.assertEqual(render_backend.masks_byte_order((0xFF0000, 0xFF00, 0xFF, 0xFF000000)), "BGRA")
+        self.assertEqual(render_backend.masks_byte_order((0xFF0000, 0xFF00, 0xFF, 0)), "BGRA")
+        self.assertEqual(render_backend.masks_byte_order((0xFF, 0xFF00, 0xFF0000, 0xFF000000)), "RGBA")
+        self.assertEqual(render_backend.masks_byte_order((0xFF00, 0xFF0000, 0xFF000000, 0xFF)), "ARGB")
+        self.assertEqual(render_backend.masks_byte_order((0xF800, 0x7E0, 0x1F, 0)), "RGBA")
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ValueError):
+            render_backend.open_display("opengl", (640, 480), False, "t")
+
+
+class FakeFont:
+    def __init__(self):
+        self.rendered = []
+
+    def size(self, text):
+        return (len(text) * 5, 10)
+
+    def render(self, text, antialias, color):
+        self.rendered.append(text)
+        w = len(text) * 5
+        return mock.Mock(
+            get_width=mock.Mock(return_value=w),
+            get_height=mock.Mock(return_value=10),
+            get_size=mock.Mock(return_value=(w, 10)),
+        )
+
+
+class HudLineTests(unittest.TestCase):
+    def test_only_changed_fields_are_rendered_again(self):
+        font = FakeFont()
+        target = mock.Mock(spec=["blit"])
+        pg = mock.Mock()
+        with mock.patch.dict(sys.modules, {"pygame": pg}):
+            hud = render_backend.HudLine(font, (20, 20))
+            hud.draw(target, (("state", "State=ITI"), ("fps", "FPS=60")))
+            hud.draw(target, (("state", "State=ITI"), ("fps", "FPS=60")))
+            self.assertEqual(pg.Surface.call_count, 1)
+            hud.draw(target, (("state", "State=ITI"), ("fps", "FPS=59")))
+            self.assertEqual(pg.Surface.call_count, 1)  # same width: patched in place
+            hud.draw(target, (("state", "State=ITI"), ("fps", "FPS=100")))
+
+        self.assertEqual(font.rendered, ["State=ITI", "FPS=60", "FPS=59", "FPS=100"])
+        self.assertEqual(pg.Surface.call_count, 2)
+        self.assertEqual(target.blit.call_count, 4)
+        target.blit.assert_called_with(hud._image, (20, 20))
+
+    def test_image_is_uploaded_once_per_change_on_a_canvas(self):
+        canvas = mock.Mock(spec=["blit", "upload"])
+        with mock.patch.dict(sys.modules, {"pygame": mock.Mock()}):
+            hud = render_backend.HudLine(FakeFont(), (0, 0))
+            for fps in ("FPS=60", "FPS=60", "FPS=61"):
+                hud.draw(canvas, (("fps", fps),))
+
+        self.assertEqual(canvas.upload.call_count, 2)
+        canvas.blit.assert_called_with(canvas.upload.return_value, (0, 0))
+
+
+@unittest.skipUnless(pygame is not None, "pygame is not installed")
+class RendererCanvasTests(unittest.TestCase):
+    def test_bordered_rect_is_drawn_inside_like_pygame_draw(self):
+        canvas = render_backend.RendererCanvas.__new__(render_backend.RendererCanvas)
+        canvas.renderer = mock.Mock()
+        canvas.draw_rect((255, 0, 0), (10, 10, 20, 8), 3)
+
+        self.assertEqual(canvas.renderer.draw_color, (255, 0, 0, 255))
+        drawn = [tuple(c.args[0]) for c in canvas.renderer.draw_rect.call_args_list]
+        self.assertEqual(drawn, [(10, 10, 20, 8), (11, 11, 18, 6), (12, 12, 16, 4)])
+
+    def test_hud_layer_keeps_glyph_alpha(self):
+        pygame.font.init()
+        self.addCleanup(pygame.font.quit)
+        font = pygame.font.Font(None, 28)
+        direct = pygame.Surface((200, 40), 0, 32)
+        direct.blit(font.render("Trial=3/300", True, (220, 220, 220)), (5, 5))
+        cached = pygame.Surface((200, 40), 0, 32)
+        render_backend.HudLine(font, (5, 5)).draw(cached, (("trial", "Trial=3/300"),))
+
+        self.assertEqual(pygame.image.tobytes(cached, "RGB"), pygame.image.tobytes(direct, "RGB"))
+
+    def test_patched_field_matches_a_rebuilt_line(self):
+        pygame.font.init()
+        self.addCleanup(pygame.font.quit)
+        font = pygame.font.Font(None, 28)
+        patched = render_backend.HudLine(font, (0, 0))
+        patched.update((("trial", "Trial=3"), ("fps", "FPS=10")))
+        patched.update((("trial", "Trial=3"), ("fps", "FPS=20")))
+        fresh = render_backend.HudLine(font, (0, 0))
+        fresh.update((("trial", "Trial=3"), ("fps", "FPS=20")))
+
+        self.assertEqual(patched._layer.get_size(), fresh._layer.get_size())
+        self.assertEqual(pygame.image.tobytes(patched._layer, "RGBA"), pygame.image.tobytes(fresh._layer, "RGBA"))
+
+    def test_software_renderer_matches_software_drawing(self):
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        pygame.display.init()
+        self.addCleanup(pygame.display.quit)
+        try:
+            canvas = render_backend.open_renderer((64, 48), False, "t", accelerated=False)
+        except Exception as e:
+            self.skipTest(f"SDL software renderer unavailable: {e}")
+        self.addCleanup(canvas.close)
+        reference = render_backend.SoftwareCanvas(pygame.Surface((64, 48), 0, 32))
+        image = pygame.Surface((8, 8), pygame.SRCALPHA, 32)
+        image.fill((0, 200, 0, 255))
+
+        for target in (canvas, reference):
+            target.fill((0, 0, 0))
+            target.draw_rect((96, 96, 96), (4, 4, 30, 20))
+            target.draw_rect((255, 255, 255), (40, 4, 20, 20), 2)
+            target.blit(target.upload(target.convert(image)), (10, 30))
+            frame = target.compose((16, 16), (50, 0, 0), lambda t: t.draw_rect((0, 0, 255), (4, 4, 8, 8)))
+            target.blit(frame, (44, 28))
+
+        self.assertEqual(
+            pygame.image.tobytes(canvas.read_pixels(), "RGB"),
+            pygame.image.tobytes(reference.read_pixels(), "RGB"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
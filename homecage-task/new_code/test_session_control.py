@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import os
+import signal
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import session_control
+
+
+def wait_for(predicate, timeout_s=2.0):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.005)
+    return predicate()
+
+
+class SessionControlTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmpdir = Path(tmp.name)
+
+    def open_control(self, **kw):
+        kw.setdefault("stop_file", None)
+        kw.setdefault("install_signals", False)
+        kw.setdefault("stop_file_interval_s", 0.02)
+        control = session_control.SessionControl(**kw)
+        self.addCleanup(control.close)
+        return control
+
+    def test_socket_commands_pause_resume_and_finish(self):
+        sock = self.tmpdir / "ctl.sock"
+        control = self.open_control(socket_path=sock)
+
+        session_control.send_command(sock, "pause")
+        self.assertTrue(wait_for(lambda: control.paused))
+        session_control.send_command(sock, "resume")
+        self.assertTrue(wait_for(lambda: not control.paused))
+        session_control.send_command(sock, "finish")
+        self.assertTrue(wait_for(lambda: control.finish_reason == "socket_finish"))
+        self.assertIsNone(control.stop_reason)
+        self.assertEqual([c.command for c in control.poll_commands()], ["pause", "resume", "finish"])
+
+    def test_first_stop_reason_wins(self):
+        control = self.open_control()
+        control.request("stop", "sigterm")
+        control.request("stop", "stop_file")
+        control.request("bogus", "socket")
+        self.assertEqual(control.stop_reason, "sigterm")
+
+    def test_stop_file_is_resolved_at_start_and_checked_off_thread(self):
+        stop_file = self.tmpdir / "STOP"
+        control = self.open_control(stop_file=stop_file, stop_file_interval_s=0.01)
+        self.assertTrue(control.stop_file.is_absolute())
+        self.assertIsNone(control.stop_reason)
+
+        stop_file.touch()
+        self.assertTrue(wait_for(lambda: control.stop_reason == "stop_file"))
+
+    @unittest.skipUnless(hasattr(signal, "SIGUSR1"), "POSIX signals only")
+    def test_signals_map_to_commands_and_handlers_are_restored(self):
+        before = signal.getsignal(signal.SIGUSR2)
+        control = self.open_control(install_signals=True)
+
+        os.kill(os.getpid(), signal.SIGUSR2)
+        self.assertTrue(wait_for(lambda: control.paused))
+        os.kill(os.getpid(), signal.SIGUSR2)
+        self.assertTrue(wait_for(lambda: not control.paused))
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.assertTrue(wait_for(lambda: control.finish_reason == "sigusr1"))
+
+        control.close()
+        self.assertIs(signal.getsignal(signal.SIGUSR2), before)
+
+    def test_stale_socket_is_replaced_but_regular_file_is_kept(self):
+        sock = self.tmpdir / "ctl.sock"
+        self.open_control(socket_path=sock).close()
+        first = session_control.SessionControl(
+            socket_path=sock, stop_file=None, stop_file_interval_s=0.02, install_signals=False
+        )
+        # Simulate a crash: the socket file is left behind.
+        first._sock.close()
+        first._sock = None
+        first.close()
+        self.assertTrue(sock.exists())
+        self.assertIn("socket", self.open_control(socket_path=sock).describe())
+
+        regular = self.tmpdir / "not-a-socket"
+        regular.write_text("keep")
+        control = self.open_control(socket_path=regular)
+        self.assertNotIn("socket", control.describe())
+        self.assertEqual(regular.read_text(), "keep")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import math
+import os
+import sys
+import tempfile
+import unittest
+from array import array
+from unittest import mock
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import sound_bank
+
+
+def fake_pygame(mixer_format=(44100, -16, 2)):
+    pg = mock.Mock()
+    pg.mixer.get_init.return_value = mixer_format
+    pg.mixer.Sound.side_effect = lambda buffer: ("sound", bytes(buffer))
+    return pg
+
+
+class SynthesisTests(unittest.TestCase):
+    def test_pcm_is_mono_int16_with_expected_length_and_peak(self):
+        key = sound_bank.ToneKey.make(1000, 100, 0.5)
+        samples = array("h", sound_bank.synthesize_pcm(key))
+
+        self.assertEqual(len(samples), 4410)
+        self.assertAlmostEqual(max(samples), 0.5 * 32767, delta=20)
+
+    def test_decay_envelope_attenuates_the_tail(self):
+        key = sound_bank.ToneKey.make(1000, 300, 1.0, decay=10.0)
+        samples = array("h", sound_bank.synthesize_pcm(key))
+
+        tail_peak = max(abs(v) for v in samples[-441:])
+        self.assertLess(tail_peak, 32767 * math.exp(-10 * 0.29) * 1.01)
+
+    def test_numpy_and_pure_python_paths_agree(self):
+        if sound_bank.numpy is None:
+            self.skipTest("numpy is not installed")
+        key = sound_bank.ToneKey.make(1500, 50, 0.3, decay=10.0)
+        fast = array("h", sound_bank.synthesize_pcm(key))
+        with mock.patch.object(sound_bank, "numpy", None):
+            slow = array("h", sound_bank.synthesize_pcm(key))
+        self.assertLessEqual(max(abs(a - b) for a, b in zip(fast, slow)), 1)
+
+    def test_key_clamps_volume_and_normalises_types(self):
+        self.assertEqual(sound_bank.ToneKey.make(1000, 100, 2.0), sound_bank.ToneKey(1000.0, 100.0, 1.0, 0.0, 44100))
+
+
+class SoundBankTests(unittest.TestCase):
+    def test_disk_cache_is_reused_by_a_fresh_bank(self):
+        key = sound_bank.ToneKey.make(880, 200, 0.4, decay=10.0)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            first = sound_bank.SoundBank(tmpdir)
+            pcm = first.pcm(key)
+            self.assertEqual(first.synthesized, 1)
+
+            second = sound_bank.SoundBank(tmpdir)
+            with mock.patch.object(sound_bank, "synthesize_pcm", side_effect=AssertionError("synthesised twice")):
+                self.assertEqual(second.pcm(key), pcm)
+            self.assertEqual(second.disk_hits, 1)
+
+    def test_truncated_cache_file_is_resynthesised(self):
+        key = sound_bank.ToneKey.make(600, 50, 0.5)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, key.file_name()), "wb") as f:
+                f.write(b"\x00\x01")
+            bank = sound_bank.SoundBank(tmpdir)
+            self.assertEqual(len(bank.pcm(key)), 2 * key.n_samples)
+            self.assertEqual(bank.synthesized, 1)
+
+    def test_sound_objects_are_cached_and_match_mixer_channels(self):
+        bank = sound_bank.SoundBank(None)
+        pg = fake_pygame((22050, -16, 2))
+        with mock.patch.dict(sys.modules, {"pygame": pg}):
+            a = bank.sound(1000, 100, 0.6)
+            b = bank.sound(1000, 100, 0.6)
+
+        self.assertIs(a, b)
+        self.assertEqual(pg.mixer.Sound.call_count, 1)
+        # Sample rate follows the mixer: 2205 frames x 2 channels x 2 bytes.
+        self.assertEqual(len(a[1]), 2205 * 2 * 2)
+        stereo = array("h", a[1])
+        self.assertEqual(stereo[0::2], stereo[1::2])
+
+    def test_sound_requires_initialised_mixer(self):
+        with mock.patch.dict(sys.modules, {"pygame": fake_pygame(None)}):
+            with self.assertRaises(RuntimeError):
+                sound_bank.SoundBank(None).sound(1000, 100, 0.6)
+
+
+class FakeChannel:
+    def __init__(self, busy_after_polls=0):
+        self.played = []
+        self.busy_after_polls = busy_after_polls
+        self.polls = 0
+
+    def play(self, sound):
+        self.played.append(sound)
+
+    def get_busy(self):
+        self.polls += 1
+        return bool(self.played) and self.polls > self.busy_after_polls
+
+
+def fake_mixer_pygame(channels):
+    pg = mock.Mock()
+    pg.mixer.get_init.return_value = (44100, -16, 2)
+    pg.mixer.Channel.side_effect = lambda i: channels[i]
+    return pg
+
+
+class ReservedAudioChannelsTests(unittest.TestCase):
+    def open_audio(self, channels):
+        pg = fake_mixer_pygame(channels)
+        with mock.patch.dict(sys.modules, {"pygame": pg}):
+            audio = sound_bank.ReservedAudioChannels()
+        self.addCleanup(audio.close)
+        return audio, pg
+
+    def test_reserves_one_channel_per_name(self):
+        audio, pg = self.open_audio([FakeChannel(), FakeChannel()])
+        pg.mixer.set_reserved.assert_called_once_with(len(sound_bank.AUDIO_CHANNEL_NAMES))
+        self.assertEqual(sorted(audio.channels), sorted(sound_bank.AUDIO_CHANNEL_NAMES))
+
+    def test_bound_sound_plays_on_its_channel_and_records_busy(self):
+        reward = FakeChannel(busy_after_polls=3)
+        audio, _pg = self.open_audio([reward, FakeChannel()])
+
+        rec = audio.bind("reward", "beep").play()
+        self.assertTrue(rec.done.wait(1.0))
+        self.assertEqual(reward.played, ["beep"])
+        self.assertLessEqual(rec.queued_t, rec.returned_t)
+        self.assertGreaterEqual(rec.busy_t, rec.returned_t)
+
+    def test_channel_that_never_starts_times_out_without_busy_time(self):
+        audio, _pg = self.open_audio([FakeChannel(busy_after_polls=10 ** 9), FakeChannel()])
+        audio.busy_timeout_s = 0.02
+        rec = audio.play("reward", "beep")
+        self.assertTrue(rec.done.wait(1.0))
+        self.assertIsNone(rec.busy_t)
+
+
+if __name__ == "__main__":
+    unittest.main()
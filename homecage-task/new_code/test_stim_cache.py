@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import io
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from contextlib import redirect_stderr
+from pathlib import Path
+from unittest import mock
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import stim_cache
+
+try:
+    import pygame
+except ImportError:
+    pygame = None
+
+
+def fake_pygame():
+    pg = mock.Mock()
+    pg.version.ver = "2.6.1"
+    pg.image.frombuffer.side_effect = lambda buffer, size, order: (bytes(buffer), size, order)
+    return pg
+
+
+def fake_decode(data, name, size, byte_order="RGBA"):
+    w, h = size
+    return (data[:4] * (w * h))[: 4 * w * h]
+
+
+def write_images(tmpdir, contents):
+    paths = []
+    for i, data in enumerate(contents):
+        path = Path(tmpdir) / f"stim_{i:02d}_r.png"
+        path.write_bytes(data)
+        paths.append(path)
+    return paths
+
+
+class StimKeyTests(unittest.TestCase):
+    def test_file_name_depends_on_every_field(self):
+        base = stim_cache.StimKey("ab" * 32, (240, 240), "BGRA", "2.6.1")
+        variants = [
+            stim_cache.StimKey("cd" * 32, (240, 240), "BGRA", "2.6.1"),
+            stim_cache.StimKey("ab" * 32, (240, 200), "BGRA", "2.6.1"),
+            stim_cache.StimKey("ab" * 32, (240, 240), "RGBA", "2.6.1"),
+            stim_cache.StimKey("ab" * 32, (240, 240), "BGRA", "2.5.0"),
+        ]
+        names = {base.file_name()} | {k.file_name() for k in variants}
+        self.assertEqual(len(names), 5)
+        self.assertEqual(base.file_name(), stim_cache.StimKey("ab" * 32, (240, 240), "BGRA", "2.6.1").file_name())
+
+
+class StimulusCacheTests(unittest.TestCase):
+    def test_disk_cache_is_reused_by_a_fresh_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir, mock.patch.dict(sys.modules, {"pygame": fake_pygame()}):
+            paths = write_images(tmpdir, [b"\x01\x02\x03\x04png", b"\x05\x06\x07\x08png"])
+            cache_dir = Path(tmpdir) / "cache"
+            with mock.patch.object(stim_cache, "decode_scaled", side_effect=fake_decode):
+                first = stim_cache.StimulusCache(cache_dir, workers=2)
+                surfaces = first.load(paths, (3, 2), "BGRA")
+            self.assertEqual(first.decoded, 2)
+            self.assertEqual(len(list(cache_dir.glob("*.px"))), 2)
+
+            second = stim_cache.StimulusCache(cache_dir, workers=2)
+            with mock.patch.object(stim_cache, "decode_scaled", side_effect=AssertionError("decoded twice")):
+                self.assertEqual(second.load(paths, (3, 2), "BGRA"), surfaces)
+            self.assertEqual(second.disk_hits, 2)
+
+        self.assertEqual(surfaces[0], (b"\x01\x02\x03\x04" * 6, (3, 2), "BGRA"))
+        self.assertEqual(surfaces[1][0][:4], b"\x05\x06\x07\x08")
+
+    def test_same_content_under_another_name_hits_the_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir, mock.patch.dict(sys.modules, {"pygame": fake_pygame()}):
+            paths = write_images(tmpdir, [b"same", b"same"])
+            cache = stim_cache.StimulusCache(Path(tmpdir) / "cache", workers=1)
+            with mock.patch.object(stim_cache, "decode_scaled", side_effect=fake_decode):
+                cache.load(paths, (2, 2))
+
+        self.assertEqual((cache.decoded, cache.disk_hits), (1, 1))
+
+    def test_truncated_or_foreign_entries_are_decoded_again(self):
+        with tempfile.TemporaryDirectory() as tmpdir, mock.patch.dict(sys.modules, {"pygame": fake_pygame()}):
+            paths = write_images(tmpdir, [b"\x09\x09\x09\x09"])
+            cache_dir = Path(tmpdir) / "cache"
+            with mock.patch.object(stim_cache, "decode_scaled", side_effect=fake_decode):
+                stim_cache.StimulusCache(cache_dir).load(paths, (2, 2))
+                entry = next(cache_dir.glob("*.px"))
+                for damaged in (entry.read_bytes()[:-1], b"JUNK" + entry.read_bytes()[4:], b""):
+                    entry.write_bytes(damaged)
+                    cache = stim_cache.StimulusCache(cache_dir)
+                    self.assertEqual(cache.load(paths, (2, 2))[0][0], b"\x09" * 16)
+                    self.assertEqual(cache.decoded, 1)
+
+    def test_unwritable_cache_warns_once_and_keeps_decoded_pixels(self):
+        with tempfile.TemporaryDirectory() as tmpdir, mock.patch.dict(sys.modules, {"pygame": fake_pygame()}):
+            paths = write_images(tmpdir, [b"aaaa", b"bbbb"])
+            blocker = Path(tmpdir) / "file"
+            blocker.write_bytes(b"")
+            err = io.StringIO()
+            cache = stim_cache.StimulusCache(blocker / "cache", workers=1)
+            with mock.patch.object(stim_cache, "decode_scaled", side_effect=fake_decode), redirect_stderr(err):
+                surfaces = cache.load(paths, (1, 1))
+
+        self.assertEqual([s[0] for s in surfaces], [b"aaaa", b"bbbb"])
+        self.assertEqual(err.getvalue().count("[WARN]"), 1)
+
+    def test_unknown_byte_order_is_rejected(self):
+        with self.assertRaises(ValueError):
+            stim_cache.StimulusCache(None).load([], (1, 1), "ABGR")
+
+
+class FakeCache:
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.loaded = []
+
+    def load(self, paths, size, byte_order="RGBA"):
+        if self.gate is not None:
+            self.gate.wait(5.0)
+        self.loaded.append([p.name for p in paths])
+        return [p.name for p in paths]
+
+    def describe(self):
+        return "fake"
+
+
+class StimulusProviderTests(unittest.TestCase):
+    def provider(self, cache, capacity=0, upload=None):
+        sets = {i: (f"stim_{i:02d}_r.png", f"stim_{i:02d}_nr.png") for i in range(6)}
+        provider = stim_cache.StimulusProvider(cache, sets, (4, 4), upload=upload, capacity=capacity)
+        self.addCleanup(provider.close)
+        return provider
+
+    def test_requested_sets_are_ready_without_waiting(self):
+        uploads = []
+        provider = self.provider(FakeCache(), upload=lambda s: uploads.append(threading.get_ident()) or s.upper())
+        provider.request([0, 1], wait=True)
+
+        self.assertEqual(provider.get(1), ["STIM_01_R.PNG", "STIM_01_NR.PNG"])
+        self.assertEqual(provider.waits, 0)
+        self.assertEqual(set(uploads), {threading.get_ident()})
+
+    def test_unrequested_or_unfinished_sets_count_as_waits(self):
+        gate = threading.Event()
+        provider = self.provider(FakeCache(gate))
+        provider.request([2])
+        threading.Timer(0.05, gate.set).start()
+        self.assertEqual(provider.get(2)[0], "stim_02_r.png")
+        self.assertEqual(provider.get(3)[1], "stim_03_nr.png")
+        self.assertEqual(provider.waits, 2)
+
+    def test_resident_sets_stay_bounded_and_the_lookahead_is_kept(self):
+        cache = FakeCache()
+        provider = self.provider(cache, capacity=3)
+        for trial in range(12):
+            window = [(trial + k) % 6 for k in range(2)]
+            provider.request(window, wait=True)
+            provider.get(window[0])
+            self.assertLessEqual(len(provider.resident()), 3)
+            self.assertTrue(set(window) <= set(provider.resident()))
+
+        self.assertEqual(provider.peak, 3)
+        self.assertEqual(provider.loads, len(cache.loaded))
+        self.assertGreater(provider.evictions, 0)
+        self.assertEqual(provider.resident()[-1], 5)
+
+    def test_capacity_zero_keeps_every_set(self):
+        cache = FakeCache()
+        provider = self.provider(cache)
+        for set_id in (0, 1, 2, 0, 1, 2):
+            provider.get(set_id)
+        self.assertEqual((len(cache.loaded), provider.evictions), (3, 0))
+
+
+@unittest.skipUnless(pygame is not None, "pygame is not installed")
+class DecodeTests(unittest.TestCase):
+    def test_cached_surface_matches_load_and_smoothscale(self):
+        image = pygame.Surface((40, 30), pygame.SRCALPHA, 32)
+        image.fill((200, 40, 10, 255))
+        pygame.draw.circle(image, (10, 200, 90, 128), (20, 15), 9)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "stim_01_r.png"
+            pygame.image.save(image, str(path))
+            expected = pygame.transform.smoothscale(pygame.image.load(str(path)), (24, 18))
+            for order in stim_cache.BYTE_ORDERS:
+                cached = stim_cache.StimulusCache(Path(tmpdir) / "cache").load([path], (24, 18), order)[0]
+                self.assertEqual(pygame.image.tobytes(cached, "RGBA"), pygame.image.tobytes(expected, "RGBA"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+if CODE_DIR not in sys.path:
+    sys.path.insert(0, CODE_DIR)
+
+import sound_bank
+import task_common
+from test_arduino_link import FakeSerial, open_fake_sender, open_replugging_sender
+from test_sound_bank import FakeChannel, fake_mixer_pygame
+
+
+class FakeTTL:
+    def __init__(self, fail_on=()):
+        self.fail_on = set(fail_on)
+        self.pulse_count = 0
+        self.pulse_times = []
+
+    def pulse(self):
+        self.pulse_count += 1
+        self.pulse_times.append(time.perf_counter())
+        if self.pulse_count in self.fail_on:
+            raise OSError("serial write failed")
+
+
+class FakeBeep:
+    def __init__(self):
+        self.plays = 0
+
+    def play(self):
+        self.plays += 1
+
+
+class RewardSchedulerTests(unittest.TestCase):
+    def test_submit_returns_before_pulses_are_emitted(self):
+        ttl = FakeTTL()
+        scheduler = task_common.RewardScheduler(ttl)
+        try:
+            t_start = time.perf_counter()
+            train = scheduler.submit(3, 0.05)
+            self.assertLess(time.perf_counter() - t_start, 0.02)
+            self.assertTrue(train.done.wait(2.0))
+        finally:
+            scheduler.close()
+
+        self.assertEqual(ttl.pulse_count, 3)
+        self.assertTrue(train.ok)
+        self.assertGreaterEqual(ttl.pulse_times[2] - ttl.pulse_times[0], 0.09)
+
+    def test_poll_reports_scheduled_and_emitted_times(self):
+        ttl = FakeTTL()
+        beep = FakeBeep()
+        scheduler = task_common.RewardScheduler(ttl)
+        try:
+            train = scheduler.submit(2, 0.02, beep=beep)
+            self.assertTrue(train.done.wait(2.0))
+        finally:
+            scheduler.close()
+
+        records = scheduler.poll()
+        self.assertEqual([r.pulse_index for r in records], [0, 1])
+        self.assertEqual({r.train_id for r in records}, {train.train_id})
+        self.assertAlmostEqual(records[1].scheduled_t - records[0].scheduled_t, 0.02, places=6)
+        for rec in records:
+            self.assertGreaterEqual(rec.emitted_t, rec.scheduled_t)
+            self.assertGreaterEqual(rec.scheduled_t, train.requested_t)
+        self.assertEqual(beep.plays, 1)
+        self.assertTrue(train.beep_ok)
+        self.assertEqual(scheduler.poll(), [])
+
+    def test_failed_pulse_is_recorded_and_train_continues(self):
+        ttl = FakeTTL(fail_on={1})
+        scheduler = task_common.RewardScheduler(ttl)
+        try:
+            train = scheduler.submit(2, 0.0)
+            self.assertTrue(train.done.wait(2.0))
+        finally:
+            scheduler.close()
+
+        self.assertEqual([r.ok for r in train.records], [False, True])
+        self.assertFalse(train.ok)
+
+    def test_close_drains_pending_trains_and_rejects_new_ones(self):
+        ttl = FakeTTL()
+        scheduler = task_common.RewardScheduler(ttl)
+        first = scheduler.submit(2, 0.01)
+        second = scheduler.submit(1, 0.0)
+        scheduler.close()
+
+        self.assertTrue(first.done.is_set())
+        self.assertTrue(second.done.is_set())
+        self.assertEqual(ttl.pulse_count, 3)
+        with self.assertRaises(RuntimeError):
+            scheduler.submit(1)
+
+
+class AckedRewardSchedulerTests(unittest.TestCase):
+    def test_scheduler_uses_acks_as_emission_times(self):
+        fake = FakeSerial(v2=True)
+        ttl = open_fake_sender(self, fake)
+        scheduler = task_common.RewardScheduler(ttl)
+        try:
+            train = scheduler.submit(2, 0.0)
+            self.assertTrue(train.done.wait(2.0))
+        finally:
+            scheduler.close()
+
+        self.assertTrue(train.ok)
+        self.assertEqual([r.arduino_us for r in train.records], [1000, 1000])
+
+    def test_scheduler_marks_missing_acks_as_failed(self):
+        fake = FakeSerial(v2=True)
+        ttl = open_fake_sender(self, fake)
+        fake.v2 = False
+        scheduler = task_common.RewardScheduler(ttl, ack_timeout_s=0.05)
+        try:
+            train = scheduler.submit(1, 0.0)
+            self.assertTrue(train.done.wait(2.0))
+        finally:
+            scheduler.close()
+
+        self.assertFalse(train.ok)
+        self.assertIsNone(train.records[0].arduino_us)
+        self.assertTrue(train.records[0].unacked)
+
+    def test_queued_train_expires_and_scheduler_reports_it(self):
+        fake = FakeSerial(v2=True)
+        ttl = open_replugging_sender(self, [fake], pulse_expiry_s=0.05)
+        fake.unplugged = True
+
+        scheduler = task_common.RewardScheduler(ttl)
+        try:
+            train = scheduler.submit(2, 0.0)
+            self.assertTrue(train.done.wait(2.0))
+        finally:
+            scheduler.close()
+
+        self.assertFalse(train.ok)
+        self.assertTrue(all(r.expired for r in train.records))
+        self.assertEqual(ttl.expired_trains, 1)
+
+
+class RewardLedgerTests(unittest.TestCase):
+    def test_expired_train_is_not_counted_as_a_reward(self):
+        fake = FakeSerial(v2=True)
+        ttl = open_replugging_sender(self, [fake], pulse_expiry_s=0.05)
+        scheduler = task_common.RewardScheduler(ttl)
+        rewards = task_common.RewardLedger(scheduler)
+        try:
+            delivered = rewards.submit(2, 0.0)
+            self.assertTrue(delivered.done.wait(2.0))
+            fake.unplugged = True
+            expired = rewards.submit(2, 0.0)
+            self.assertEqual(rewards.count, 2)
+            self.assertTrue(expired.done.wait(2.0))
+        finally:
+            scheduler.close()
+
+        records = scheduler.poll()
+        self.assertEqual([(r.ok, r.expired) for r in records], [(True, False)] * 2 + [(False, True)] * 2)
+        self.assertEqual(rewards.settle(records[:3]), [])
+        self.assertEqual(rewards.count, 2)
+        self.assertEqual(rewards.settle(records[3:]), [expired.train_id])
+        self.assertEqual((rewards.count, rewards.failed_trains), (1, 1))
+
+    def test_unacked_train_still_counts(self):
+        fake = FakeSerial(v2=True)
+        ttl = open_fake_sender(self, fake)
+        fake.drop_trains = True
+        scheduler = task_common.RewardScheduler(ttl, ack_timeout_s=0.05)
+        rewards = task_common.RewardLedger(scheduler)
+        try:
+            train = rewards.submit(2, 0.0)
+            self.assertTrue(train.done.wait(2.0))
+        finally:
+            scheduler.close()
+
+        records = scheduler.poll()
+        self.assertEqual([(r.ok, r.unacked) for r in records], [(False, True)] * 2)
+        self.assertEqual(rewards.settle(records), [])
+        self.assertEqual((rewards.count, rewards.failed_trains), (1, 0))
+
+    def test_train_whose_writes_all_failed_is_not_counted(self):
+        ttl = FakeTTL(fail_on={1, 2})
+        scheduler = task_common.RewardScheduler(ttl)
+        rewards = task_common.RewardLedger(scheduler)
+        try:
+            train = rewards.submit(2, 0.0)
+            self.assertTrue(train.done.wait(2.0))
+        finally:
+            scheduler.close()
+
+        self.assertEqual(rewards.settle(scheduler.poll()), [train.train_id])
+        self.assertEqual(rewards.count, 0)
+
+    def test_train_with_one_emitted_pulse_still_counts(self):
+        ttl = FakeTTL(fail_on={1})
+        scheduler = task_common.RewardScheduler(ttl)
+        rewards = task_common.RewardLedger(scheduler)
+        try:
+            train = rewards.submit(2, 0.0)
+            self.assertTrue(train.done.wait(2.0))
+        finally:
+            scheduler.close()
+
+        self.assertEqual(rewards.settle(scheduler.poll()), [])
+        self.assertEqual(rewards.count, 1)
+
+
+class ReservedChannelBeepTests(unittest.TestCase):
+    def test_scheduler_reports_settled_beeps_once(self):
+        pg = fake_mixer_pygame([FakeChannel(), FakeChannel()])
+        with mock.patch.dict(sys.modules, {"pygame": pg}):
+            audio = sound_bank.ReservedAudioChannels()
+        self.addCleanup(audio.close)
+        scheduler = task_common.RewardScheduler(FakeTTL())
+        try:
+            train = scheduler.submit(1, 0.0, beep=audio.bind("reward", "beep"))
+            self.assertTrue(train.done.wait(1.0))
+            self.assertTrue(train.beep_record.done.wait(1.0))
+        finally:
+            scheduler.close()
+
+        self.assertEqual(scheduler.poll_beeps(), [train])
+        self.assertEqual(scheduler.poll_beeps(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
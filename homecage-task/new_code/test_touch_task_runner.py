@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+import csv
+import io
 import os
 import sys
+import tempfile
+import time
 import unittest
+from types import SimpleNamespace
 from unittest import mock
 
 CODE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -57,6 +62,54 @@ class TouchTaskRunnerTests(unittest.TestCase):
         with self.assertRaisesRegex(ValueError, "extra"):
             ttr.complete_csv_row({"a": 1, "extra": 2}, fieldnames)
 
+    def test_row_encoder_matches_dict_writer(self):
+        fieldnames = ["start_iso", "iso", "x", "y", "note", "p", "seed", "empty", "flag"]
+        static = {"start_iso": "2026-01-01T10:00:00", "seed": 7, "empty": None}
+        events = [
+            {"iso": "t1", "x": 3, "y": -1, "p": 0.1 + 0.2},
+            {"iso": "t2", "x": 4, "note": 'a "quoted", multi\nline', "flag": True, "seed": 8},
+            {"iso": "t3", "note": "", "p": None},
+        ]
+        expected = io.StringIO()
+        w = csv.DictWriter(expected, fieldnames=fieldnames)
+        for event in events:
+            w.writerow(ttr.complete_csv_row({**static, **event}, fieldnames))
+
+        encoder = ttr.RowEncoder(fieldnames, static)
+        set_xy = encoder.setter("iso", "x", "y")
+        lines = []
+        for event in events:
+            row = encoder.row()
+            set_xy(row, event["iso"], event.get("x", ""), event.get("y", ""))
+            encoder.update(row, {k: v for k, v in event.items() if k not in ("iso", "x", "y")})
+            lines.append(encoder.encode(row))
+
+        self.assertEqual("".join(lines), expected.getvalue())
+
+    def test_row_encoder_setter_spans_gaps_and_rejects_unknown_fields(self):
+        encoder = ttr.RowEncoder(["a", "b", "c", "d", "e"], {"c": "static"})
+        set_fields = encoder.setter("a", "b", "d", "e")
+        row = encoder.row()
+        set_fields(row, 1, 2, 4, 5)
+        self.assertEqual(row, [1, 2, "static", 4, 5])
+        self.assertEqual(encoder.row(), ["", "", "static", "", ""])
+
+        with self.assertRaisesRegex(ValueError, "extra"):
+            encoder.setter("a", "extra")
+        with self.assertRaisesRegex(ValueError, "extra"):
+            encoder.update(encoder.row(), {"a": 1, "extra": 2})
+
+    def test_marker_name_for_event_maps_two_choice_events(self):
+        self.assertEqual(ttr.marker_name_for_event("TRIAL_PLACED", {}), "TRIAL_PLACED")
+        self.assertEqual(ttr.marker_name_for_event("STIM_ONSET", {}), "STIM_ONSET")
+        self.assertEqual(ttr.marker_name_for_event("ITI_START", {}), "ITI_START")
+        self.assertEqual(ttr.marker_name_for_event("TOUCH_NR_REWARDED", {"hit_area": "left_margin"}), "CHOICE_LEFT")
+        self.assertEqual(ttr.marker_name_for_event("TOUCH_RIGHT_UNREWARDED", {"hit_area": "right_core"}), "CHOICE_RIGHT")
+        self.assertEqual(ttr.marker_name_for_event("REWARD_PULSE", {"reward_pulse_index": 0}), "REWARD")
+        self.assertIsNone(ttr.marker_name_for_event("REWARD_PULSE", {"reward_pulse_index": 1}))
+        self.assertIsNone(ttr.marker_name_for_event("TOUCH_OUTSIDE", {"hit_area": "outside"}))
+        self.assertIsNone(ttr.marker_name_for_event("TOUCH_ITI_LEFT", {"hit_area": "left_core"}))
+
     def test_bounded_range_matches_existing_boundaries(self):
         self.assertEqual(ttr.bounded_range(None, None, 100, 200), (100, 200))
         self.assertEqual(ttr.bounded_range(300, 100, 100, 200), (300, 300))
@@ -97,5 +150,243 @@ class TouchTaskRunnerTests(unittest.TestCase):
                 self.assertEqual(center_offset, expected[4])
 
 
+NOEVENT, QUIT, TOUCH = 0, 1, 2
+
+
+def fake_event_pygame(wait_result=NOEVENT, queued=()):
+    pg = mock.Mock()
+    pg.NOEVENT = NOEVENT
+    pg.event.wait.return_value = SimpleNamespace(type=wait_result)
+    pg.event.get.side_effect = lambda types: [ev for ev in queued if ev.type in types]
+    return pg
+
+
+class EventPumpTests(unittest.TestCase):
+    def test_poll_mode_ticks_the_clock(self):
+        clock = mock.Mock()
+        pump = ttr.EventPump("poll", clock, fps=240)
+        pump.wait([time.perf_counter() + 10.0], time.perf_counter())
+        clock.tick.assert_called_once_with(240)
+        self.assertEqual(pump.iterations, 1)
+
+    def test_event_mode_waits_for_the_earliest_future_deadline(self):
+        pg = fake_event_pygame()
+        pump = ttr.EventPump("event", max_wait_s=1.0)
+        now = time.perf_counter()
+        with mock.patch.dict(sys.modules, {"pygame": pg}):
+            # The deadline at ``now`` was already handled by the loop body.
+            pump.wait([None, now, now + 0.5, now + 0.05], now)
+
+        (timeout_ms,), _ = pg.event.wait.call_args
+        self.assertTrue(1 <= timeout_ms <= 50, timeout_ms)
+
+    def test_event_mode_wait_is_capped(self):
+        pg = fake_event_pygame()
+        pump = ttr.EventPump("event", max_wait_s=0.25)
+        with mock.patch.dict(sys.modules, {"pygame": pg}):
+            pump.wait([None], time.perf_counter())
+        pg.event.wait.assert_called_once_with(250)
+
+    def test_overdue_deadline_skips_the_wait(self):
+        pg = fake_event_pygame()
+        pump = ttr.EventPump("event")
+        with mock.patch.dict(sys.modules, {"pygame": pg}):
+            pump.wait([time.perf_counter() - 1.0], time.perf_counter() - 2.0)
+        pg.event.wait.assert_not_called()
+
+    def test_event_that_woke_the_wait_is_returned_first(self):
+        later = SimpleNamespace(type=TOUCH)
+        pg = fake_event_pygame(wait_result=TOUCH, queued=[later])
+        pump = ttr.EventPump("event")
+        with mock.patch.dict(sys.modules, {"pygame": pg}):
+            pump.wait([], time.perf_counter())
+            self.assertEqual(pump.get([QUIT]), [])
+            events = pump.get([TOUCH])
+            self.assertEqual(len(events), 2)
+            self.assertIs(events[1], later)
+
+    def test_rejects_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            ttr.EventPump("busy")
+
+
+class FakeScreen:
+    def __init__(self, size=(1920, 1080)):
+        self.size = size
+        self.fills = []
+
+    def get_size(self):
+        return self.size
+
+    def fill(self, rgb, rect=None):
+        self.fills.append(rect)
+
+
+class FramePresenterTests(unittest.TestCase):
+    def test_clip_box_drops_offscreen_regions(self):
+        self.assertEqual(ttr.clip_box((-10, 5, 30, 10), 100, 100), (0, 5, 20, 10))
+        self.assertIsNone(ttr.clip_box((100, 0, 10, 10), 100, 100))
+
+    def test_merge_boxes_unions_overlapping_regions_only(self):
+        merged = ttr.merge_boxes([(0, 0, 10, 10), (50, 50, 5, 5), (5, 5, 10, 10), (0, 0, 10, 10)])
+        self.assertEqual(sorted(merged), [(0, 0, 15, 15), (50, 50, 5, 5)])
+        # A union can make a box overlap one that was kept separately.
+        chained = ttr.merge_boxes([(0, 0, 4, 4), (10, 0, 4, 4), (3, 0, 8, 4)])
+        self.assertEqual(chained, [(0, 0, 14, 4)])
+
+    def test_dirty_mode_clears_and_pushes_previous_and_current_regions(self):
+        pg = mock.Mock()
+        screen = FakeScreen((200, 100))
+        presenter = ttr.FramePresenter(screen, (0, 0, 0), "dirty")
+        with mock.patch.dict(sys.modules, {"pygame": pg}):
+            presenter.begin()
+            presenter.mark((10, 10, 20, 20))
+            self.assertEqual(presenter.present(), [(0, 0, 200, 100)])
+            pg.display.flip.assert_called_once()
+
+            presenter.begin()
+            presenter.mark((100, 10, 20, 20))
+            pushed = presenter.present()
+
+        self.assertEqual(screen.fills, [None, (10, 10, 20, 20)])
+        self.assertEqual(sorted(pushed), [(10, 10, 20, 20), (100, 10, 20, 20)])
+        pg.display.update.assert_called_once_with(pushed)
+        self.assertEqual(presenter.pixels_pushed, 200 * 100 + 2 * 400)
+
+    def test_flip_mode_always_redraws_everything(self):
+        pg = mock.Mock()
+        screen = FakeScreen()
+        presenter = ttr.FramePresenter(screen, (0, 0, 0), "flip")
+        with mock.patch.dict(sys.modules, {"pygame": pg}):
+            for _ in range(3):
+                presenter.begin()
+                presenter.mark((10, 10, 20, 20))
+                presenter.present()
+        self.assertEqual(screen.fills, [None, None, None])
+        self.assertEqual(pg.display.flip.call_count, 3)
+        pg.display.update.assert_not_called()
+
+    def test_blank_in_another_colour_forces_a_full_frame_next(self):
+        pg = mock.Mock()
+        screen = FakeScreen((200, 100))
+        presenter = ttr.FramePresenter(screen, (0, 0, 0), "dirty")
+        with mock.patch.dict(sys.modules, {"pygame": pg}):
+            presenter.begin()
+            presenter.present()
+            presenter.blank((255, 0, 0))
+            presenter.begin()
+            self.assertEqual(presenter.present(), [(0, 0, 200, 100)])
+        self.assertEqual(pg.display.flip.call_count, 3)
+
+    def test_present_records_when_the_frame_went_out(self):
+        presenter = ttr.FramePresenter(FakeScreen(), (0, 0, 0), "dirty")
+        with mock.patch.dict(sys.modules, {"pygame": mock.Mock()}):
+            with mock.patch.object(ttr.time, "perf_counter", return_value=12.5):
+                presenter.begin()
+                presenter.present()
+        self.assertEqual(presenter.last_present_t, 12.5)
+
+
+    def test_patch_level_is_recorded_with_each_flip(self):
+        timing = ttr.FlipTiming()
+        screen = FakeScreen((200, 100))
+        box = ttr.photodiode_box(200, 100, 10, "br")
+        presenter = ttr.FramePresenter(screen, (0, 0, 0), "dirty", timing=timing, patch_box=box)
+        with mock.patch.dict(sys.modules, {"pygame": mock.Mock()}):
+            presenter.begin()
+            presenter.patch(True)
+            presenter.present()
+            presenter.blank((40, 0, 0))
+            presenter.begin()
+            presenter.present()
+
+        self.assertEqual(box, (190, 90, 10, 10))
+        self.assertEqual(list(timing.patch), [1, 0, -1])
+        self.assertIn(box, screen.fills)
+        self.assertEqual(presenter.last_present_t, timing.end[-1])
+
+
+class FakeRendererCanvas(FakeScreen):
+    backend = "renderer"
+    partial_updates = False
+
+    def __init__(self, size=(1920, 1080)):
+        super().__init__(size)
+        self.presents = 0
+
+    def flip(self):
+        self.presents += 1
+
+    def update(self, boxes):
+        self.presents += 1
+
+
+class RendererPresentTests(unittest.TestCase):
+    def test_canvas_without_partial_updates_is_always_redrawn_in_full(self):
+        canvas = FakeRendererCanvas((200, 100))
+        presenter = ttr.FramePresenter(canvas, (0, 0, 0), "dirty")
+        self.assertEqual(presenter.mode, "flip")
+        for _ in range(3):
+            presenter.begin()
+            presenter.mark((10, 10, 20, 20))
+            self.assertEqual(presenter.present(), [(0, 0, 200, 100)])
+
+        self.assertEqual(canvas.fills, [None, None, None])
+        self.assertEqual(canvas.presents, 3)
+
+
+class FlipTimingTests(unittest.TestCase):
+    def make_timing(self):
+        timing = ttr.FlipTiming()
+        for start, end, level in [(10.0, 10.001, 0), (10.1, 10.125, 1), (10.2, 10.201, 1), (10.3, 10.302, 0)]:
+            timing.record(start, end, level)
+        return timing
+
+    def test_durations_intervals_and_missed_frames(self):
+        timing = self.make_timing()
+        self.assertEqual(len(timing), 4)
+        self.assertAlmostEqual(timing.durations()[1], 0.025)
+        self.assertAlmostEqual(timing.intervals()[2], 0.076)
+        self.assertEqual(timing.intervals()[0], 0.0)
+        self.assertEqual(timing.over_frame(60.0), 1)
+        self.assertEqual(timing.over_frame(0), 0)
+
+    def test_transitions_start_from_a_dark_patch(self):
+        self.assertEqual(
+            [(i, level) for i, _s, _e, level in self.make_timing().transitions()],
+            [(1, 1), (3, 0)],
+        )
+
+    def test_npy_file_round_trips(self):
+        timing = self.make_timing()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = timing.write(ttr.flip_timing_path(os.path.join(tmpdir, "prl_log_x.csv")), t0=10.0)
+            raw = path.read_bytes()
+            rows = ttr.load_flip_timing(path)
+
+        self.assertEqual(path.name, "prl_log_x_flips.npy")
+        self.assertEqual((10 + int.from_bytes(raw[8:10], "little")) % 64, 0)
+        self.assertEqual(len(raw), 10 + int.from_bytes(raw[8:10], "little") + 4 * 17)
+        self.assertEqual([r[3] for r in rows], [0, 1, 1, 0])
+        self.assertAlmostEqual(rows[1][0], 0.1)
+        self.assertAlmostEqual(rows[1][1], 0.025, places=6)
+
+
+class ComposeFrameTests(unittest.TestCase):
+    def test_paint_is_offset_into_the_off_screen_surface(self):
+        pg = mock.Mock()
+        pg.Rect.return_value = mock.Mock(x=40, y=30, size=(100, 50))
+        screen = object()
+        calls = []
+        with mock.patch.dict(sys.modules, {"pygame": pg}):
+            frame = ttr.compose_frame(screen, (40, 30, 100, 50), (0, 0, 0), lambda *a: calls.append(a), key="plan")
+
+        pg.Surface.assert_called_once_with((100, 50), 0, screen)
+        frame.surface.fill.assert_called_once_with((0, 0, 0))
+        self.assertEqual([(c[0].surface, c[1], c[2]) for c in calls], [(frame.surface, -40, -30)])
+        self.assertEqual(frame.key, "plan")
+        self.assertIs(frame.rect, pg.Rect.return_value)
+
+
 if __name__ == "__main__":
     unittest.main()
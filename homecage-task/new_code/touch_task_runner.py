@@ -1,10 +1,24 @@
 from __future__ import annotations
 
+import ast
 import csv
+import io
+import math
+import struct
 import sys
+import time
+from array import array
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from render_backend import as_canvas, open_display
+
+LOOP_MODES = ("poll", "event")
+PRESENT_MODES = ("flip", "dirty")
+PHOTODIODE_CORNERS = ("bl", "br", "tl", "tr")
+
+Box = Tuple[int, int, int, int]
 
 
 @dataclass(frozen=True)
@@ -23,6 +37,12 @@ class TwoChoiceRects:
     right_plate: RectSpec
 
 
+# CSV columns of the four rects, in TwoChoiceRects order, x/y/w/h each.
+RECT_CSV_FIELDS = tuple(
+    f"{rect}_{part}" for rect in ("left", "right", "left_plate", "right_plate") for part in ("x", "y", "w", "h")
+)
+
+
 @dataclass(frozen=True)
 class ItiRanges:
     rewarded: Tuple[int, int]
@@ -33,6 +53,7 @@ class ItiRanges:
 @dataclass(frozen=True)
 class TwoChoiceSessionHandles:
     screen: Any
+    canvas: Any
     clock: Any
     font: Any
     sw: int
@@ -42,6 +63,353 @@ class TwoChoiceSessionHandles:
     fullscreen: bool
 
 
+class EventPump:
+    """Where the two-choice main loops get their events and idle time.
+
+    ``poll`` is the original loop: the body runs once per
+    ``clock.tick(fps)`` whether or not anything happened. ``event`` blocks in
+    ``pygame.event.wait`` until input arrives or the earliest pending
+    deadline (ITI end, release dwell, wait-release timeout, session limit) is
+    due. The wait is capped at ``max_wait_s`` so stop requests, reward/link
+    logging and other housekeeping still run a few times per second.
+
+    ``pygame.event.wait`` consumes the event that woke it; that event is held
+    here and handed out first by the next ``get`` for its type, so the loop
+    body sees events in arrival order in both modes.
+    """
+
+    def __init__(self, mode: str = "poll", clock: Any = None, fps: int = 240, max_wait_s: float = 0.25):
+        if mode not in LOOP_MODES:
+            raise ValueError(f"loop mode must be one of {LOOP_MODES}")
+        self.mode = mode
+        self.clock = clock
+        self.fps = fps
+        self.max_wait_s = max_wait_s
+        self.iterations = 0
+        self._held: List[Any] = []
+
+    def get(self, types: Sequence[int]) -> List[Any]:
+        import pygame
+
+        events = []
+        if self._held:
+            events = [ev for ev in self._held if ev.type in types]
+            self._held = [ev for ev in self._held if ev.type not in types]
+        events.extend(pygame.event.get(types))
+        return events
+
+    def wait(self, deadlines: Iterable[Optional[float]], now: float) -> None:
+        """Idle until the next iteration is due.
+
+        ``deadlines`` are ``time.perf_counter()`` times; ones at or before
+        ``now`` (when the loop body last looked) were already acted on.
+        """
+        self.iterations += 1
+        if self.mode == "poll":
+            self.clock.tick(self.fps)
+            return
+
+        import pygame
+
+        # Anything no ``get`` asked for since the last wait is dropped, the
+        # same as it would sit unread in the queue in poll mode.
+        self._held.clear()
+        due = min((d for d in deadlines if d is not None and d > now), default=math.inf)
+        timeout_s = min(self.max_wait_s, due - time.perf_counter())
+        if timeout_s <= 0:
+            return
+        ev = pygame.event.wait(max(1, math.ceil(timeout_s * 1000.0)))
+        if ev.type != pygame.NOEVENT:
+            self._held.append(ev)
+
+
+def clip_box(box: Box, sw: int, sh: int) -> Optional[Box]:
+    x, y, w, h = (int(v) for v in box)
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(sw, x + w), min(sh, y + h)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def merge_boxes(boxes: Iterable[Box]) -> List[Box]:
+    """Union overlapping or touching boxes until none overlap.
+
+    Frames here have a handful of regions (two plates, the HUD), so the
+    quadratic merge is cheaper than anything clever.
+    """
+    out: List[Box] = []
+    for box in boxes:
+        x, y, w, h = box
+        merged = True
+        while merged:
+            merged = False
+            for i, (ox, oy, ow, oh) in enumerate(out):
+                if x <= ox + ow and ox <= x + w and y <= oy + oh and oy <= y + h:
+                    nx, ny = min(x, ox), min(y, oy)
+                    w, h = max(x + w, ox + ow) - nx, max(y + h, oy + oh) - ny
+                    x, y = nx, ny
+                    del out[i]
+                    merged = True
+                    break
+        out.append((x, y, w, h))
+    return out
+
+
+def photodiode_box(sw: int, sh: int, size: int, corner: str = "bl") -> Box:
+    """Square patch of ``size`` px in a screen corner, for a photodiode taped over it."""
+    if corner not in PHOTODIODE_CORNERS:
+        raise ValueError(f"photodiode corner must be one of {PHOTODIODE_CORNERS}")
+    size = max(1, min(int(size), sw, sh))
+    x = 0 if corner[1] == "l" else sw - size
+    y = 0 if corner[0] == "t" else sh - size
+    return (x, y, size, size)
+
+
+# One record per present in ``<log>_flips.npy``; numpy.load reads it as a
+# structured array, load_flip_timing without numpy.
+FLIP_TIMING_DTYPE = [("start_rel_s", "<f8"), ("duration_s", "<f4"), ("interval_s", "<f4"), ("patch", "|i1")]
+_FLIP_RECORD = struct.Struct("<dffb")
+
+
+class FlipTiming:
+    """Start and end time of every present, kept in flat arrays (17 bytes a flip).
+
+    ``patch`` is the photodiode patch level shown by that frame: 1 light,
+    0 dark, -1 no patch.
+    """
+
+    def __init__(self):
+        self.start = array("d")
+        self.end = array("d")
+        self.patch = array("b")
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def record(self, start_t: float, end_t: float, patch: int = -1) -> None:
+        self.start.append(start_t)
+        self.end.append(end_t)
+        self.patch.append(patch)
+
+    def durations(self) -> List[float]:
+        return [e - s for s, e in zip(self.start, self.end)]
+
+    def intervals(self) -> List[float]:
+        """Time since the previous present returned (0 for the first)."""
+        end = self.end
+        return [0.0] + [end[i] - end[i - 1] for i in range(1, len(end))]
+
+    def over_frame(self, refresh_hz: float) -> int:
+        """Presents that took longer than one refresh period, i.e. missed a vsync."""
+        if refresh_hz <= 0:
+            return 0
+        period = 1.0 / refresh_hz
+        return sum(1 for d in self.durations() if d > period)
+
+    def transitions(self) -> List[Tuple[int, float, float, int]]:
+        """``(flip_index, start_t, end_t, level)`` for every flip that changed the patch.
+
+        The patch is taken to be dark before the first frame.
+        """
+        out = []
+        prev = 0
+        for i, level in enumerate(self.patch):
+            if level >= 0 and level != prev:
+                out.append((i, self.start[i], self.end[i], level))
+            if level >= 0:
+                prev = level
+        return out
+
+    def write(self, path, t0: float) -> Path:
+        """Write a ``.npy`` file (format 1.0) without needing numpy."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        descr = repr(FLIP_TIMING_DTYPE)
+        header = f"{{'descr': {descr}, 'fortran_order': False, 'shape': ({len(self)},), }}"
+        pad = 64 - (10 + len(header) + 1) % 64
+        header = (header + " " * (pad % 64) + "\n").encode("latin1")
+        with path.open("wb") as f:
+            f.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header)
+            for s, d, iv, level in zip(self.start, self.durations(), self.intervals(), self.patch):
+                f.write(_FLIP_RECORD.pack(s - t0, d, iv, level))
+        return path
+
+
+def flip_timing_path(log_path) -> Path:
+    log_path = Path(log_path)
+    return log_path.with_name(log_path.stem + "_flips.npy")
+
+
+def load_flip_timing(path) -> List[Tuple[float, float, float, int]]:
+    """Rows of ``(start_rel_s, duration_s, interval_s, patch)`` from a ``_flips.npy`` file."""
+    data = Path(path).read_bytes()
+    if data[:6] != b"\x93NUMPY":
+        raise ValueError(f"{path}: not a .npy file")
+    (header_len,) = struct.unpack("<H", data[8:10])
+    header = ast.literal_eval(data[10:10 + header_len].decode("latin1"))
+    if header["descr"] != FLIP_TIMING_DTYPE:
+        raise ValueError(f"{path}: unexpected dtype {header['descr']}")
+    body = data[10 + header_len:]
+    return [_FLIP_RECORD.unpack_from(body, i * _FLIP_RECORD.size) for i in range(header["shape"][0])]
+
+
+class FramePresenter:
+    """Pushes two-choice frames to the display.
+
+    The task's ``draw`` calls ``begin``, draws, ``mark``s every region it
+    drew and calls ``present``. In ``flip`` mode that is the original path:
+    fill the whole screen and ``display.flip()``. In ``dirty`` mode only
+    the regions drawn in the previous frame are cleared, and only those
+    plus the regions drawn now are pushed with ``display.update(rects)``.
+    The first frame, and any frame after ``invalidate``, is a full flip.
+    ``canvas`` is a render_backend canvas (a bare Surface is drawn on in
+    software); a canvas without ``partial_updates`` is always redrawn in full.
+
+    With ``timing`` every present is recorded there. With ``patch_box`` the
+    task calls ``patch(light)`` while drawing to show a white or black
+    square for a photodiode; the level is recorded with the flip.
+    """
+
+    def __init__(
+        self,
+        canvas: Any,
+        bg_rgb,
+        mode: str = "flip",
+        timing: Optional[FlipTiming] = None,
+        patch_box: Optional[Box] = None,
+    ):
+        if mode not in PRESENT_MODES:
+            raise ValueError(f"present mode must be one of {PRESENT_MODES}")
+        self.canvas = as_canvas(canvas)
+        self.bg_rgb = tuple(bg_rgb)
+        self.mode = mode
+        self.timing = timing
+        self.patch_box = patch_box
+        self.frames = 0
+        self.pixels_pushed = 0
+        self.last_present_t = 0.0
+        self._patch_level = -1
+        self._prev: List[Box] = []
+        self._cur: List[Box] = []
+        self._full = True
+        if not self.canvas.partial_updates:
+            self.mode = "flip"
+
+    def invalidate(self) -> None:
+        self._full = True
+
+    def begin(self) -> None:
+        if self.mode == "flip" or self._full:
+            self.canvas.fill(self.bg_rgb)
+        else:
+            for box in self._prev:
+                self.canvas.fill(self.bg_rgb, box)
+        self._cur = []
+        self._patch_level = -1
+
+    def patch(self, light: bool) -> None:
+        if self.patch_box is None:
+            return
+        self.canvas.fill((255, 255, 255) if light else (0, 0, 0), self.patch_box)
+        self.mark(self.patch_box)
+        self._patch_level = 1 if light else 0
+
+    def mark(self, rect) -> None:
+        sw, sh = self.canvas.get_size()
+        box = clip_box((rect[0], rect[1], rect[2], rect[3]), sw, sh)
+        if box is not None:
+            self._cur.append(box)
+
+    def blank(self, rgb) -> None:
+        """Show a plain ``rgb`` screen now."""
+        if tuple(rgb) == self.bg_rgb:
+            self.begin()
+            self.present()
+            return
+        self.canvas.fill(rgb)
+        if self.patch_box is not None:
+            self.canvas.fill((0, 0, 0), self.patch_box)
+        start_t = time.perf_counter()
+        self.canvas.flip()
+        self._presented(start_t, 0 if self.patch_box is not None else -1)
+        sw, sh = self.canvas.get_size()
+        self.frames += 1
+        self.pixels_pushed += sw * sh
+        self._prev = []
+        self._full = True
+
+    def present(self) -> List[Box]:
+        """Push the frame; returns the boxes sent (the whole screen on a flip)."""
+        start_t = time.perf_counter()
+        if self.mode == "flip" or self._full:
+            sw, sh = self.canvas.get_size()
+            self.canvas.flip()
+            pushed = [(0, 0, sw, sh)]
+            self._full = False
+        else:
+            pushed = merge_boxes(self._prev + self._cur)
+            if pushed:
+                self.canvas.update(pushed)
+        self._presented(start_t, self._patch_level)
+        self._prev = self._cur
+        self.frames += 1
+        self.pixels_pushed += sum(w * h for _x, _y, w, h in pushed)
+        return pushed
+
+    def _presented(self, start_t: float, patch_level: int) -> None:
+        self.last_present_t = time.perf_counter()
+        if self.timing is not None:
+            self.timing.record(start_t, self.last_present_t, patch_level)
+
+
+@dataclass
+class ComposedFrame:
+    """Part of a frame rendered ahead of time; ``rect`` is where it goes on screen."""
+
+    key: Any
+    rect: Any
+    surface: Any
+
+
+def compose_frame(canvas: Any, rect, bg_rgb, paint, key: Any = None) -> ComposedFrame:
+    """Render the screen area ``rect`` off-screen.
+
+    ``paint(target, dx, dy)`` draws on the canvas ``target`` as it would on
+    the screen, with every rect moved by ``(dx, dy)``. The result has the
+    screen's pixel format (a render-target texture with the renderer
+    backend), so putting it up later is one opaque blit.
+    """
+    import pygame
+
+    rect = pygame.Rect(rect)
+    image = as_canvas(canvas).compose(rect.size, bg_rgb, lambda target: paint(target, -rect.x, -rect.y))
+    return ComposedFrame(key=key, rect=rect, surface=image)
+
+
+def open_stimulus_provider(
+    canvas: Any,
+    sets: Mapping[Any, Sequence[Path]],
+    size: Tuple[int, int],
+    cache_dir: Optional[str] = None,
+    no_cache: bool = False,
+    workers: int = 0,
+    resident: int = 0,
+):
+    """A ``stim_cache.StimulusProvider`` for ``sets``, scaled to ``size``, ready to blit on ``canvas``.
+
+    Pixels go through a ``StimulusCache`` (``cache_dir`` or the default,
+    memory only with ``no_cache``) in the canvas's byte order and are
+    uploaded on use (textures with the renderer backend). At most
+    ``resident`` sets stay loaded; 0 keeps them all.
+    """
+    from stim_cache import StimulusCache, StimulusProvider, default_cache_dir
+
+    canvas = as_canvas(canvas)
+    cache = StimulusCache(None if no_cache else (cache_dir or default_cache_dir()), workers or None)
+    return StimulusProvider(cache, sets, size, canvas.byte_order(), canvas.upload, resident)
+
+
 def empty_csv_row(fieldnames: Sequence[str]) -> Dict[str, str]:
     return {name: "" for name in fieldnames}
 
@@ -56,6 +424,91 @@ def complete_csv_row(row: Mapping[str, Any], fieldnames: Sequence[str]) -> Dict[
     return complete
 
 
+class RowEncoder:
+    """CSV lines for one ``fieldnames`` layout, compiled once per session.
+
+    Byte-identical to ``csv.DictWriter(f, fieldnames).writerow(complete_csv_row(row, fieldnames))``,
+    without building per-row dicts: ``static`` columns (seed, hashes, walk
+    parameters, ...) are serialised once into a template, ``row()`` resets a
+    reusable buffer to it, per-event columns are assigned by index (through
+    ``setter`` groups or ``update``) and ``encode`` formats the buffer.
+    """
+
+    def __init__(self, fieldnames: Sequence[str], static: Optional[Mapping[str, Any]] = None):
+        self.fieldnames = list(fieldnames)
+        self.index = {name: i for i, name in enumerate(self.fieldnames)}
+        self._template = [""] * len(self.fieldnames)
+        self._row = list(self._template)
+        self._out = io.StringIO()
+        self._writer = csv.writer(self._out)
+        for name, value in (static or {}).items():
+            # The csv module writes None as "" and everything else as str().
+            self._template[self._slot(name)] = "" if value is None else str(value)
+
+    def setter(self, *names: str) -> Callable[..., None]:
+        """``set(row, *values)`` assigning ``values`` to ``names``, in order, by slicing."""
+        runs = []
+        for k, i in enumerate(self._slot(name) for name in names):
+            if runs and runs[-1][1] == i and runs[-1][2] + (runs[-1][1] - runs[-1][0]) == k:
+                runs[-1][1] = i + 1
+            else:
+                runs.append([i, i + 1, k])
+        if len(runs) == 1:
+            (start, stop, _), = runs
+
+            def set_run(row: List[Any], *values: Any) -> None:
+                row[start:stop] = values
+
+            return set_run
+        runs = [(start, stop, k, k + stop - start) for start, stop, k in runs]
+
+        def set_runs(row: List[Any], *values: Any) -> None:
+            for start, stop, first, last in runs:
+                row[start:stop] = values[first:last]
+
+        return set_runs
+
+    def row(self) -> List[Any]:
+        """The reusable row buffer, reset to the static template."""
+        self._row[:] = self._template
+        return self._row
+
+    def update(self, row: List[Any], values: Mapping[str, Any]) -> None:
+        index = self.index
+        for name, value in values.items():
+            i = index.get(name)
+            if i is None:
+                i = self._slot(name)  # raises ValueError
+            row[i] = value
+
+    def encode(self, row: Sequence[Any]) -> str:
+        self._writer.writerow(row)
+        line = self._out.getvalue()
+        self._out.seek(0)
+        self._out.truncate()
+        return line
+
+    def _slot(self, name: str) -> int:
+        i = self.index.get(name)
+        if i is None:
+            raise ValueError("row contains keys not present in CSV_FIELDNAMES: " + name)
+        return i
+
+
+def marker_name_for_event(event_name: str, row: Mapping[str, Any]) -> Optional[str]:
+    if event_name in ("TRIAL_PLACED", "STIM_ONSET", "ITI_START"):
+        return event_name
+    if event_name == "REWARD_PULSE":
+        return "REWARD" if str(row.get("reward_pulse_index", "")) == "0" else None
+    if event_name.startswith("TOUCH_") and not event_name.startswith("TOUCH_ITI_"):
+        hit_area = str(row.get("hit_area", ""))
+        if hit_area.startswith("left"):
+            return "CHOICE_LEFT"
+        if hit_area.startswith("right"):
+            return "CHOICE_RIGHT"
+    return None
+
+
 def write_rows_csv(rows: Iterable[Mapping[str, Any]], out_path: Path, fieldnames: Sequence[str]) -> Path:
     out_path.parent.mkdir(parents=True, exist_ok=True)
     with out_path.open("w", newline="", encoding="utf-8") as f:
@@ -156,12 +609,18 @@ def init_two_choice_session(
     kiosk: bool,
     touch_only: bool,
     font_size: int = 28,
+    audio_buffer: Optional[int] = None,
+    render: str = "software",
 ) -> TwoChoiceSessionHandles:
     import pygame
 
+    # pygame.init() already opens the mixer, so its settings (notably the
+    # buffer size, which bounds beep latency) must be given to pre_init.
+    buffer = max(0, int(audio_buffer)) if audio_buffer else 0
+    pygame.mixer.pre_init(frequency=44100, size=-16, channels=2, buffer=buffer)
     pygame.init()
     try:
-        pygame.mixer.init(frequency=44100, size=-16, channels=2)
+        pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=buffer)
     except Exception as e:
         print(f"[WARN] mixer init failed: {e}", file=sys.stderr)
 
@@ -191,18 +650,16 @@ def init_two_choice_session(
         pygame.event.set_blocked(pygame.MOUSEBUTTONUP)
         pygame.event.set_blocked(pygame.MOUSEMOTION)
 
-    flags = pygame.FULLSCREEN if fullscreen else pygame.NOFRAME
-    screen = pygame.display.set_mode(
-        (0, 0) if fullscreen else (window_w, window_h),
-        flags,
-    )
-    pygame.display.set_caption(window_title)
+    canvas = open_display(render, (window_w, window_h), fullscreen, window_title)
+    if kiosk and canvas.backend == "renderer":
+        canvas.window.grab = True
     clock = pygame.time.Clock()
     font = pygame.font.SysFont(None, font_size)
-    sw, sh = screen.get_size()
+    sw, sh = canvas.get_size()
 
     return TwoChoiceSessionHandles(
-        screen=screen,
+        screen=getattr(canvas, "surface", None),
+        canvas=canvas,
         clock=clock,
         font=font,
         sw=sw,
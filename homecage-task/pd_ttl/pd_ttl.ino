@@ -1,25 +1,326 @@
 // ===== Arduino TTL Output =====
-// Python 側から "PULSE\n" を受け取ると TTL パルスを出す
-// PIN: 出力ピン番号
-// PULSE_MS: パルス幅（ミリ秒）
+// Python 側 (arduino_link.ArduinoTTLSender) からのコマンドで TTL パルスを出す
+//
+// 旧プロトコル (legacy):
+//   "PULSE\n"                         -> PULSE_MS 幅のパルスを 1 発 (ack なし)
+//
+// v2 プロトコル: "$<payload>*<XOR チェックサム 2桁 hex>\n"
+//   $V?*XX                            -> $V,2*XX   (バージョン問い合わせ)
+//   $P,<seq>,<count>,<width_us>,<interval_us>*XX
+//                                     -> パルス列を出し、各パルスの立ち上がりで
+//                                        $A,<seq>,<index>,<micros>*XX を返す
+//   $S,<n>*XX                         -> $S,<n>,<micros>*XX (時刻同期用 ping/pong)
+//   $M,<seq>,<code>*XX                -> MARKER_PINS に 4bit のイベントコードを出し
+//                                        STROBE_PIN を STROBE_US だけ High にする。
+//                                        strobe 立ち上がりで $K,<seq>,<code>,<micros>*XX
+//   $D,<0|1>*XX                       -> $D,<0|1>*XX  フォトダイオード入力の報告を off/on
+//                                        on の間、PD_PIN の明暗が変わるたびに
+//                                        $L,<n>,<level>,<micros>*XX を返す
+//                                        (n は通し番号、level 1 = 明、micros は変化を最初に見た時刻)
+//   エラー時                          -> $E,<seq>,<reason>*XX
+//
+// readStringUntil (既定 1 s タイムアウト) と delay() は使わず、
+// 受信もパルス生成も loop() の中でノンブロッキングに処理する。
 
 const int PIN = 13;      // TTL 出力に使うピン (例: 13番、必要なら変更)
-const int PULSE_MS = 5;  // パルス幅（ミリ秒）
+const int PULSE_MS = 5;  // 旧プロトコルのパルス幅（ミリ秒）
+const int PROTOCOL_VERSION = 2;
+
+// イベントマーカー (4bit ワード + strobe)。TTL 用の PIN とは別のピンを使う
+const int MARKER_PINS[4] = {2, 3, 4, 5};  // bit0..bit3
+const int STROBE_PIN = 6;
+const unsigned long STROBE_US = 500;
+const uint8_t MARKER_QUEUE_LEN = 8;
+
+// フォトダイオード (コンパレータ出力などのデジタル信号) の入力
+const int PD_PIN = 7;
+const int PD_LIGHT_LEVEL = HIGH;            // 明るいときのピンの値
+const unsigned long PD_DEBOUNCE_US = 200;   // この時間変化が続いたら edge とみなす
+
+char rxBuf[64];
+uint8_t rxLen = 0;
+bool rxOverflow = false;
+
+bool trainActive = false;
+bool trainAck = false;
+bool pinHigh = false;
+unsigned int trainSeq = 0;
+unsigned int trainCount = 0;
+unsigned int trainIdx = 0;
+unsigned long widthUs = 0;
+unsigned long intervalUs = 0;
+unsigned long nextRiseUs = 0;
+unsigned long riseUs = 0;
+unsigned int legacyPending = 0;
+
+unsigned int markerSeq[MARKER_QUEUE_LEN];
+uint8_t markerCode[MARKER_QUEUE_LEN];
+uint8_t markerHead = 0;
+uint8_t markerCount = 0;
+bool strobeHigh = false;
+unsigned long strobeRiseUs = 0;
+
+bool pdEnabled = false;
+int pdLevel = 0;
+bool pdPending = false;
+unsigned long pdChangeUs = 0;
+unsigned int pdEdgeCount = 0;
+
+uint8_t checksum(const char* s) {
+  uint8_t cs = 0;
+  while (*s) {
+    cs ^= (uint8_t)*s++;
+  }
+  return cs;
+}
+
+void sendFrame(const char* payload) {
+  uint8_t cs = checksum(payload);
+  Serial.print('$');
+  Serial.print(payload);
+  Serial.print('*');
+  if (cs < 16) {
+    Serial.print('0');
+  }
+  Serial.print(cs, HEX);
+  Serial.print('\n');
+}
+
+void sendError(unsigned int seq, const char* reason) {
+  char p[40];
+  snprintf(p, sizeof(p), "E,%u,%s", seq, reason);
+  sendFrame(p);
+}
+
+void startTrain(unsigned int seq, unsigned int count, unsigned long wUs, unsigned long iUs, bool ack) {
+  if (count == 0) {
+    return;
+  }
+  if (wUs < 100) {
+    wUs = 100;
+  }
+  if (iUs < wUs + 100) {
+    iUs = wUs + 100;  // 次の立ち上がりまで最低 100 us は Low
+  }
+  trainSeq = seq;
+  trainCount = count;
+  trainIdx = 0;
+  widthUs = wUs;
+  intervalUs = iUs;
+  trainAck = ack;
+  nextRiseUs = micros();
+  trainActive = true;
+}
+
+void handleLine(char* line) {
+  if (strcmp(line, "PULSE") == 0) {
+    if (trainActive) {
+      legacyPending++;
+    } else {
+      startTrain(0, 1, PULSE_MS * 1000UL, 0, false);
+    }
+    return;
+  }
+  if (line[0] != '$') {
+    return;
+  }
+
+  char* star = strrchr(line, '*');
+  if (star == NULL) {
+    sendError(0, "FRAME");
+    return;
+  }
+  *star = '\0';
+  char* body = line + 1;
+  if (checksum(body) != (uint8_t)strtoul(star + 1, NULL, 16)) {
+    sendError(0, "CHECKSUM");
+    return;
+  }
+
+  if (strcmp(body, "V?") == 0) {
+    char p[8];
+    snprintf(p, sizeof(p), "V,%d", PROTOCOL_VERSION);
+    sendFrame(p);
+    return;
+  }
+
+  if (body[0] == 'S' && body[1] == ',') {
+    unsigned long t = micros();
+    char p[40];
+    snprintf(p, sizeof(p), "S,%u,%lu", (unsigned int)strtoul(body + 2, NULL, 10), t);
+    sendFrame(p);
+    return;
+  }
+
+  if (body[0] == 'M' && body[1] == ',') {
+    char* cur = body + 2;
+    unsigned int seq = (unsigned int)strtoul(cur, &cur, 10);
+    uint8_t code = (uint8_t)strtoul(cur + 1, &cur, 10);
+    if (markerCount >= MARKER_QUEUE_LEN) {
+      sendError(seq, "MARKER_FULL");
+      return;
+    }
+    uint8_t slot = (markerHead + markerCount) % MARKER_QUEUE_LEN;
+    markerSeq[slot] = seq;
+    markerCode[slot] = code & 0x0F;
+    markerCount++;
+    return;
+  }
+
+  if (body[0] == 'D' && body[1] == ',') {
+    pdEnabled = strtoul(body + 2, NULL, 10) != 0;
+    pdLevel = digitalRead(PD_PIN) == PD_LIGHT_LEVEL ? 1 : 0;
+    pdPending = false;
+    char p[8];
+    snprintf(p, sizeof(p), "D,%d", pdEnabled ? 1 : 0);
+    sendFrame(p);
+    return;
+  }
+
+  if (body[0] == 'P' && body[1] == ',') {
+    char* cur = body + 2;
+    unsigned int seq = (unsigned int)strtoul(cur, &cur, 10);
+    unsigned int count = (unsigned int)strtoul(cur + 1, &cur, 10);
+    unsigned long wUs = strtoul(cur + 1, &cur, 10);
+    unsigned long iUs = strtoul(cur + 1, &cur, 10);
+    if (trainActive) {
+      sendError(seq, "BUSY");
+      return;
+    }
+    startTrain(seq, count, wUs, iUs, true);
+    return;
+  }
+
+  sendError(0, "UNKNOWN");
+}
+
+void readSerial() {
+  while (Serial.available()) {
+    char c = (char)Serial.read();
+    if (c == '\n' || c == '\r') {
+      if (rxLen > 0 && !rxOverflow) {
+        rxBuf[rxLen] = '\0';
+        handleLine(rxBuf);
+      }
+      rxLen = 0;
+      rxOverflow = false;
+    } else if (rxLen < sizeof(rxBuf) - 1) {
+      rxBuf[rxLen++] = c;
+    } else {
+      rxOverflow = true;  // 長すぎる行は改行まで捨てる
+    }
+  }
+}
+
+void serviceTrain() {
+  unsigned long now = micros();
+
+  if (pinHigh) {
+    if ((long)(now - (riseUs + widthUs)) >= 0) {
+      digitalWrite(PIN, LOW);  // 戻す
+      pinHigh = false;
+      trainIdx++;
+      if (trainIdx >= trainCount) {
+        trainActive = false;
+      } else {
+        nextRiseUs = riseUs + intervalUs;
+      }
+    }
+    return;
+  }
+
+  if (!trainActive) {
+    if (legacyPending > 0) {
+      legacyPending--;
+      startTrain(0, 1, PULSE_MS * 1000UL, 0, false);
+    }
+    return;
+  }
+
+  if ((long)(now - nextRiseUs) >= 0) {
+    digitalWrite(PIN, HIGH);  // TTL High
+    riseUs = micros();
+    pinHigh = true;
+    if (trainAck) {
+      char p[40];
+      snprintf(p, sizeof(p), "A,%u,%u,%lu", trainSeq, trainIdx, riseUs);
+      sendFrame(p);
+    }
+  }
+}
+
+void serviceMarkers() {
+  if (strobeHigh) {
+    if ((long)(micros() - (strobeRiseUs + STROBE_US)) >= 0) {
+      digitalWrite(STROBE_PIN, LOW);
+      for (int b = 0; b < 4; b++) {
+        digitalWrite(MARKER_PINS[b], LOW);
+      }
+      strobeHigh = false;
+    }
+    return;
+  }
+  if (markerCount == 0) {
+    return;
+  }
+
+  uint8_t code = markerCode[markerHead];
+  unsigned int seq = markerSeq[markerHead];
+  markerHead = (markerHead + 1) % MARKER_QUEUE_LEN;
+  markerCount--;
+
+  for (int b = 0; b < 4; b++) {
+    digitalWrite(MARKER_PINS[b], (code >> b) & 1 ? HIGH : LOW);
+  }
+  digitalWrite(STROBE_PIN, HIGH);  // ワードが揃ってから strobe
+  strobeRiseUs = micros();
+  strobeHigh = true;
+
+  char p[40];
+  snprintf(p, sizeof(p), "K,%u,%u,%lu", seq, code, strobeRiseUs);
+  sendFrame(p);
+}
+
+void servicePhotodiode() {
+  if (!pdEnabled) {
+    return;
+  }
+  int level = digitalRead(PD_PIN) == PD_LIGHT_LEVEL ? 1 : 0;
+  unsigned long now = micros();
+  if (level == pdLevel) {
+    pdPending = false;  // 短いノイズは捨てる
+    return;
+  }
+  if (!pdPending) {
+    pdPending = true;
+    pdChangeUs = now;
+    return;
+  }
+  if ((long)(now - (pdChangeUs + PD_DEBOUNCE_US)) >= 0) {
+    pdLevel = level;
+    pdPending = false;
+    char p[40];
+    snprintf(p, sizeof(p), "L,%u,%d,%lu", pdEdgeCount++, level, pdChangeUs);
+    sendFrame(p);
+  }
+}
 
 void setup() {
   pinMode(PIN, OUTPUT);
   digitalWrite(PIN, LOW);   // 初期状態は Low
+  for (int b = 0; b < 4; b++) {
+    pinMode(MARKER_PINS[b], OUTPUT);
+    digitalWrite(MARKER_PINS[b], LOW);
+  }
+  pinMode(STROBE_PIN, OUTPUT);
+  digitalWrite(STROBE_PIN, LOW);
+  pinMode(PD_PIN, INPUT);
   Serial.begin(115200);     // Python 側とボーレートを合わせる
 }
 
 void loop() {
-  if (Serial.available()) {
-    String s = Serial.readStringUntil('\n');  // 改行まで読み込み
-    s.trim();  // 前後の空白削除
-    if (s == "PULSE") {
-      digitalWrite(PIN, HIGH);   // TTL High
-      delay(PULSE_MS);
-      digitalWrite(PIN, LOW);    // 戻す
-    }
-  }
+  readSerial();
+  serviceTrain();
+  serviceMarkers();
+  servicePhotodiode();
 }